@@ -0,0 +1,144 @@
+"""
+Benchmark ModelData decoding on deep and wide expression trees.
+
+Compares the expression unions before and after discrimination on the
+`type` literal, the gain of which the unions were discriminated for, then
+the default request path (`json.loads` followed by dict validation) with the
+precompiled adapter validating raw JSON bytes.
+
+Usage:
+    uv run python benchmarks/bench_decode.py
+"""
+
+import json
+import re
+import time
+
+from pydantic import BaseModel, TypeAdapter
+
+from moai import expressions
+from moai.builders import binop, index_var, num, param, var
+from moai.expressions import ExprType
+from moai.model import ModelData, decode_model_data
+from moai.objectives import Objective
+
+# Members of the expression unions, as they were before discrimination
+_INDEX_MEMBERS = [
+    "StringExpr",
+    "NumberExpr",
+    "IndexVariableExpr",
+    "BinaryOp",
+    "UnaryOp",
+]
+_MEMBERS = [
+    "NumberExpr",
+    "StringExpr",
+    "IndexVariableExpr",
+    "VariableExpr",
+    "ParameterExpr",
+    "BinaryOp",
+    "UnaryOp",
+    "AggregationExpression",
+]
+_UNIONS = ("ExprType", "IndexExprType")
+
+
+def plain_union() -> TypeAdapter:
+    """
+    Adapter of expressions validated with the undiscriminated unions.
+
+    Every expression model is subclassed with the fields typed by the unions
+    retyped by plain unions of the subclasses, so every node of a tree tries
+    the members in turn, as before the unions were discriminated.
+    """
+    namespace: dict = {}
+    models = {
+        name: getattr(expressions, name)
+        for name in (*_MEMBERS, "IndexComparisonExpr")
+        if isinstance(getattr(expressions, name), type)
+    }
+    for name, model in models.items():
+        # Renamed so they resolve to the plain unions once defined below
+        annotations = {
+            field: re.sub(r"\b(Index)?ExprType\b", r"Plain\1ExprType", annotation)
+            for field, annotation in model.__annotations__.items()
+            if any(union in annotation for union in _UNIONS)
+        }
+        namespace[name] = type(
+            name, (model,), {"__annotations__": annotations, "__module__": __name__}
+        )
+    namespace["PlainExprType"] = eval(" | ".join(_MEMBERS), namespace)  # noqa: S307
+    namespace["PlainIndexExprType"] = eval(" | ".join(_INDEX_MEMBERS), namespace)  # noqa: S307
+    for model in models:
+        cls: type[BaseModel] = namespace[model]
+        cls.model_rebuild(_types_namespace={**vars(expressions), **namespace})
+    return TypeAdapter(namespace["PlainExprType"])
+
+
+def deep_tree(depth: int) -> ExprType:
+    """Left-deep chain: ((x[i] + 0) * p[i]) + 2 ..."""
+    expr: ExprType = var("x", [index_var("i")])
+    for k in range(depth):
+        right = param("p", [index_var("i")]) if k % 2 else num(k)
+        expr = binop(expr, right, "add" if k % 3 else "mul")
+    return expr
+
+
+def wide_tree(width: int) -> ExprType:
+    """Balanced sum of `width` terms k * x[i]"""
+    terms: list[ExprType] = [
+        binop(num(k), var("x", [index_var("i")]), "mul") for k in range(width)
+    ]
+    while len(terms) > 1:
+        terms = [
+            binop(terms[i], terms[i + 1], "add") if i + 1 < len(terms) else terms[i]
+            for i in range(0, len(terms), 2)
+        ]
+    return terms[0]
+
+
+def timeit(fn, repeat: int = 5) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    cases = {
+        "deep (60 levels)": deep_tree(60),
+        "wide (4096 terms)": wide_tree(4096),
+    }
+    plain = plain_union()
+    discriminated = TypeAdapter(ExprType)
+    print(
+        f"{'union':<20} {'plain dict':>15} {'plain JSON':>15} {'disc. dict':>15} {'disc. JSON':>15}"
+    )
+    for name, expr in cases.items():
+        raw = discriminated.dump_json(expr)
+        tree = json.loads(raw)
+        times = [
+            timeit(lambda: adapter.validate_python(tree))  # noqa: B023
+            if as_dict
+            else timeit(lambda: adapter.validate_json(raw))  # noqa: B023
+            for adapter in (plain, discriminated)
+            for as_dict in (True, False)
+        ]
+        print(f"{name:<20} " + " ".join(f"{t * 1e3:>13.2f}ms" for t in times))
+
+    print()
+    print(f"{'model data':<20} {'loads+validate':>15} {'validate_json':>15}")
+    for name, expr in cases.items():
+        raw = ModelData(
+            name="bench", objective=Objective(name="o", expr=expr)
+        ).model_dump_json()
+        raw_bytes = raw.encode()
+
+        default = timeit(lambda: ModelData.model_validate(json.loads(raw)))  # noqa: B023
+        fast = timeit(lambda: decode_model_data(raw_bytes))  # noqa: B023
+        print(f"{name:<20} {default * 1e3:>13.2f}ms {fast * 1e3:>13.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
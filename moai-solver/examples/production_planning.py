@@ -301,8 +301,8 @@ if result.solver.termination_condition == pyo.TerminationCondition.optimal:
     print("\nOptimal solution found!")
     print(f"Total Cost: ${pyo.value(model.pyomo_model.total_cost):.2f}")
 
-    produce_var = model.pyomo_model.produce
-    inventory_var = model.pyomo_model.inventory
+    produce_var = model.component("produce")
+    inventory_var = model.component("inventory")
 
     print("\nProduction Schedule:")
     for product in products:
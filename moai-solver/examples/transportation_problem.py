@@ -204,7 +204,7 @@ if result.solver.termination_condition == pyo.TerminationCondition.optimal:
     print(f"Total Cost: ${pyo.value(model.pyomo_model.total_cost):.2f}")
 
     print("\nShipment Plan:")
-    ship_var = model.pyomo_model.ship
+    ship_var = model.component("ship")
     for w_idx in warehouses:
         for c_idx in customers:
             amount = pyo.value(ship_var[w_idx, c_idx])
@@ -0,0 +1,498 @@
+"""
+Admission control and scheduling of solves.
+
+Every solve request is admitted before its model is built. The controller
+bounds the number of solves running at once and the memory they are
+expected to use, and queues the requests that do not fit yet:
+
+- the memory and duration of a solve are predicted from the size estimate
+  of its model, and from past solves of models of the same structure,
+- queued requests are ordered by priority class, then shortest predicted
+  duration first, so a long batch solve does not hold interactive requests
+  behind it,
+- waiting ages requests: every second waited counts against their predicted
+  duration, so long and low priority requests are not starved,
+- long solves run in a lane of their own, limited to part of the slots, so
+  some slots are always left to short solves,
+- requests are tagged with a tenant, and tenants share the slots by weight:
+  the next request comes from the tenant that used the least solver thread
+  seconds for its weight, and each tenant may have caps on running and queued
+  requests. Tenants idle for a while are forgotten, along with their
+  usage, so clients sending a new tenant key per request do not grow the
+  controller,
+- requests arriving when the queue is full, or waiting longer than the
+  queue timeout, are rejected with `Overloaded`, which carries how long
+  the client should wait before retrying,
+- models predicted to need more memory than the limit are rejected at once.
+
+Rejecting early keeps the latency of admitted requests bounded under load
+spikes, instead of every request slowing down as solvers compete for CPU
+and memory.
+"""
+
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from .estimate import SizeEstimate
+
+# Rough memory use of a solve: the solver process and the Pyomo model, plus
+# a share per column, row and nonzero
+BASE_MEMORY_MB = 32.0
+BYTES_PER_ELEMENT = 1024
+BYTES_PER_NONZERO = 160
+
+Priority = Literal["interactive", "batch"]
+
+_PRIORITY_RANK: dict[str, int] = {"interactive": 0, "batch": 1}
+
+
+class TenantLimits(BaseModel):
+    """Share of the solvers of a tenant"""
+
+    # Share of solver time relative to other tenants
+    weight: float = Field(default=1.0, gt=0)
+    # Solves of the tenant running at once
+    max_running: int | None = Field(default=None, ge=1)
+    # Requests of the tenant waiting for a slot; more are rejected
+    max_queued: int | None = Field(default=None, ge=0)
+
+
+class AdmissionConfig(BaseModel):
+    """Limits of the admission controller"""
+
+    # Solves running at once
+    max_concurrent: int = Field(default=os.cpu_count() or 1, ge=1)
+    # Requests waiting for a slot; more are rejected
+    max_queue: int = Field(default=64, ge=0)
+    # Predicted memory of the solves running at once
+    max_memory_mb: float = 4096.0
+    # Longest wait in the queue before a request is rejected
+    queue_timeout: float = 30.0
+    # Solves predicted to take longer run in the lane of long solves
+    long_solve_seconds: float = 10.0
+    # Slots long solves may take, by default half of them
+    long_solve_slots: int | None = Field(default=None, ge=1)
+    # Seconds of predicted duration added to batch requests when ordering
+    batch_delay: float = 60.0
+    # Seconds of predicted duration forgiven per second waited
+    aging_rate: float = 1.0
+    # Limits of tenants by key, and of tenants not listed
+    tenants: dict[str, TenantLimits] = {}
+    default_tenant: TenantLimits = TenantLimits()
+    # Seconds a tenant without running or queued solves is remembered
+    tenant_idle_seconds: float = Field(default=300.0, ge=0)
+    # Idle tenants remembered; the longest idle are forgotten first
+    max_idle_tenants: int = Field(default=1024, ge=0)
+
+
+class TenantStats(BaseModel):
+    """Current load and usage of a tenant"""
+
+    running: int
+    queued: int
+    admitted: int
+    rejected: int
+    # Seconds of the finished solves of the tenant, times their threads
+    cpu_seconds: float
+
+
+class AdmissionStats(BaseModel):
+    """Current load of the admission controller"""
+
+    running: int
+    running_long: int
+    queued: int
+    memory_mb: float
+    admitted: int
+    rejected: int
+    mean_solve_seconds: float
+    tenants: dict[str, TenantStats]
+
+
+class JobCost(BaseModel):
+    """Predicted resources of a solve"""
+
+    memory_mb: float
+    seconds: float
+    # Threads the solve runs on, set once known to account its CPU time
+    threads: int = 1
+
+
+class Overloaded(Exception):
+    """Raised when a request is rejected because the service is busy."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TooLarge(ValueError):
+    """Raised for models predicted to need more memory than the limit."""
+
+
+def predict_memory_mb(estimate: SizeEstimate) -> float:
+    """Predicted memory of a solve, in MB, from the size of its model."""
+    elements = estimate.variables + estimate.rows
+    return (
+        BASE_MEMORY_MB
+        + (elements * BYTES_PER_ELEMENT + estimate.nonzeros * BYTES_PER_NONZERO) / 2**20
+    )
+
+
+class CostModel:
+    """
+    Predicts the duration of solves from past solves.
+
+    Durations are remembered per model fingerprint, as seconds per nonzero
+    of the model they were observed on. Models of an unseen structure are
+    predicted from the mean seconds per nonzero of all solves.
+    """
+
+    def __init__(self, max_fingerprints: int = 1024):
+        self.max_fingerprints = max_fingerprints
+        # Moving averages of seconds per nonzero, per fingerprint and overall
+        self._per_nonzero: OrderedDict[str, float] = OrderedDict()
+        self.seconds_per_nonzero = 1e-5
+        # Duration of building and solving the smallest model
+        self.base_seconds = 0.05
+
+    def predict(self, estimate: SizeEstimate, fingerprint: str | None = None) -> float:
+        """Predicted seconds to build and solve a model."""
+        rate = self.seconds_per_nonzero
+        if fingerprint is not None and fingerprint in self._per_nonzero:
+            rate = self._per_nonzero[fingerprint]
+            self._per_nonzero.move_to_end(fingerprint)
+        return self.base_seconds + rate * estimate.nonzeros
+
+    def observe(self, estimate: SizeEstimate, fingerprint: str | None, seconds: float):
+        """Record the duration of a solve."""
+        rate = max(seconds - self.base_seconds, 0.0) / max(estimate.nonzeros, 1)
+        self.seconds_per_nonzero += 0.2 * (rate - self.seconds_per_nonzero)
+        if fingerprint is None:
+            return
+        previous = self._per_nonzero.pop(fingerprint, rate)
+        self._per_nonzero[fingerprint] = previous + 0.5 * (rate - previous)
+        if len(self._per_nonzero) > self.max_fingerprints:
+            self._per_nonzero.popitem(last=False)
+
+
+class _Tenant:
+    def __init__(self, name: str, limits: TenantLimits):
+        self.name = name
+        self.limits = limits
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.cpu_seconds = 0.0
+        # Solver seconds used by finished solves, and predicted for running
+        # ones, times their threads and divided by the weight of the tenant
+        self.used = 0.0
+        self.reserved = 0.0
+
+    @property
+    def usage(self) -> float:
+        return self.used + self.reserved
+
+    def stats(self) -> TenantStats:
+        return TenantStats(
+            running=self.running,
+            queued=self.queued,
+            admitted=self.admitted,
+            rejected=self.rejected,
+            cpu_seconds=self.cpu_seconds,
+        )
+
+
+class _Ticket:
+    __slots__ = (
+        "cost",
+        "tenant",
+        "rank",
+        "long",
+        "arrival",
+        "order",
+        "granted",
+        "reserved",
+    )
+
+    def __init__(
+        self,
+        cost: JobCost,
+        tenant: _Tenant,
+        priority: Priority,
+        long: bool,
+        order: int,
+    ):
+        self.cost = cost
+        self.tenant = tenant
+        self.rank = _PRIORITY_RANK[priority]
+        self.long = long
+        self.arrival = time.monotonic()
+        self.order = order
+        self.granted = asyncio.get_running_loop().create_future()
+        # Usage reserved for the tenant once admitted
+        self.reserved = 0.0
+
+
+class AdmissionController:
+    """
+    Bounded, ordered queue in front of the solvers.
+
+    Use `admit` around the work of a request. The controller is meant to be
+    used from a single event loop, so its state needs no locks.
+    """
+
+    def __init__(
+        self, config: AdmissionConfig | None = None, costs: CostModel | None = None
+    ):
+        self.config = config or AdmissionConfig()
+        self.costs = costs or CostModel()
+        self.running = 0
+        self.running_long = 0
+        self.memory_mb = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of solve durations
+        self.mean_solve_seconds = 1.0
+        self._queue: list[_Ticket] = []
+        self._arrivals = itertools.count()
+        self._tenants: dict[str, _Tenant] = {}
+        # Tenants without running or queued solves, by the time they became
+        # idle, longest idle first
+        self._idle: OrderedDict[str, float] = OrderedDict()
+
+    @property
+    def long_solve_slots(self) -> int:
+        if self.config.long_solve_slots is not None:
+            return self.config.long_solve_slots
+        return max(1, self.config.max_concurrent // 2)
+
+    def stats(self) -> AdmissionStats:
+        return AdmissionStats(
+            running=self.running,
+            running_long=self.running_long,
+            queued=len(self._queue),
+            memory_mb=self.memory_mb,
+            admitted=self.admitted,
+            rejected=self.rejected,
+            mean_solve_seconds=self.mean_solve_seconds,
+            tenants={name: t.stats() for name, t in self._tenants.items()},
+        )
+
+    def _tenant(self, name: str) -> _Tenant:
+        self._evict()
+        self._idle.pop(name, None)
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            limits = self.config.tenants.get(name, self.config.default_tenant)
+            tenant = self._tenants[name] = _Tenant(name, limits)
+        if not tenant.running and not tenant.queued:
+            # Idle time is not saved up: a tenant becoming active starts
+            # level with the active tenant that used the least
+            active = [t.used for t in self._tenants.values() if t.running or t.queued]
+            tenant.used = max(tenant.used, min(active, default=0.0))
+        return tenant
+
+    def _settle(self, tenant: _Tenant):
+        """Mark a tenant idle once its last request is done."""
+        if not tenant.running and not tenant.queued:
+            self._idle[tenant.name] = time.monotonic()
+
+    def _evict(self):
+        """Forget tenants idle for too long, or beyond the number remembered."""
+        expired = time.monotonic() - self.config.tenant_idle_seconds
+        while self._idle:
+            name, since = next(iter(self._idle.items()))
+            if since >= expired and len(self._idle) <= self.config.max_idle_tenants:
+                return
+            del self._idle[name]
+            del self._tenants[name]
+
+    def _reject(self, tenant: _Tenant):
+        self.rejected += 1
+        tenant.rejected += 1
+
+    def cost(self, estimate: SizeEstimate, fingerprint: str | None = None) -> JobCost:
+        """Predicted memory and duration of the solve of a model."""
+        return JobCost(
+            memory_mb=predict_memory_mb(estimate),
+            seconds=self.costs.predict(estimate, fingerprint),
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until the queued work is expected to have started."""
+        queued = sum(t.cost.seconds for t in self._queue)
+        seconds = (queued + self.mean_solve_seconds) / self.config.max_concurrent
+        return max(1, math.ceil(seconds))
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        estimate: SizeEstimate,
+        priority: Priority = "interactive",
+        fingerprint: str | None = None,
+        tenant: str = "default",
+    ) -> AsyncIterator[JobCost]:
+        """
+        Wait for a slot for the solve of a model.
+
+        Args:
+            estimate: Size estimate of the model
+            priority: Interactive requests run before batch requests
+            fingerprint: Structure of the model, to predict its duration from
+                past solves of the same structure
+            tenant: Key of the tenant the solve is accounted to
+
+        Yields:
+            The predicted cost of the solve
+
+        Raises:
+            TooLarge: If the solve would not fit even in an idle service
+            Overloaded: If the queue or the quota of the tenant is full, or the
+                wait exceeds the timeout
+        """
+        cost = self.cost(estimate, fingerprint)
+        account = self._tenant(tenant)
+        try:
+            if cost.memory_mb > self.config.max_memory_mb:
+                self._reject(account)
+                raise TooLarge(
+                    f"Model needs about {cost.memory_mb:.0f} MB to solve, "
+                    f"over the limit of {self.config.max_memory_mb:.0f} MB"
+                )
+            long = cost.seconds >= self.config.long_solve_seconds
+            ticket = _Ticket(cost, account, priority, long, next(self._arrivals))
+            if self._queue or not self._fits(ticket):
+                if len(self._queue) >= self.config.max_queue:
+                    self._reject(account)
+                    raise Overloaded("Solve queue is full", self.retry_after())
+                quota = account.limits.max_queued
+                if quota is not None and account.queued >= quota:
+                    self._reject(account)
+                    raise Overloaded(
+                        f"Tenant {tenant} has {quota} solves queued already",
+                        self.retry_after(),
+                    )
+            self._queue.append(ticket)
+            account.queued += 1
+            self._dispatch()
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(ticket.granted), self.config.queue_timeout
+                )
+            except (TimeoutError, asyncio.CancelledError) as e:
+                if ticket.granted.done():
+                    # Granted as the wait ended, give the slot back
+                    self._release(ticket, 0.0)
+                else:
+                    self._queue.remove(ticket)
+                    account.queued -= 1
+                    ticket.granted.cancel()
+                    self._dispatch()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self._reject(account)
+                raise Overloaded(
+                    "Timed out waiting for a solve slot", self.retry_after()
+                ) from e
+
+            self.admitted += 1
+            account.admitted += 1
+            start = time.perf_counter()
+            try:
+                yield cost
+            except BaseException:
+                self._release(ticket, time.perf_counter() - start)
+                raise
+            elapsed = time.perf_counter() - start
+            self.mean_solve_seconds += 0.2 * (elapsed - self.mean_solve_seconds)
+            self.costs.observe(estimate, fingerprint, elapsed)
+            self._release(ticket, elapsed)
+        finally:
+            self._settle(account)
+
+    def _key(self, ticket: _Ticket, now: float) -> tuple[float, int]:
+        """Order of queued requests, smallest first."""
+        waited = now - ticket.arrival
+        key = (
+            ticket.rank * self.config.batch_delay
+            + ticket.cost.seconds
+            - waited * self.config.aging_rate
+        )
+        return key, ticket.order
+
+    def _lane_full(self, ticket: _Ticket) -> bool:
+        return ticket.long and self.running_long >= self.long_solve_slots
+
+    def _eligible(self, ticket: _Ticket) -> bool:
+        """Whether the lane and the tenant of a request have room for it."""
+        cap = ticket.tenant.limits.max_running
+        return not self._lane_full(ticket) and (
+            cap is None or ticket.tenant.running < cap
+        )
+
+    def _fits(self, ticket: _Ticket) -> bool:
+        return (
+            self.running < self.config.max_concurrent
+            and self.memory_mb + ticket.cost.memory_mb <= self.config.max_memory_mb
+            and self._eligible(ticket)
+        )
+
+    def _dispatch(self):
+        """
+        Admit queued requests while the next one fits.
+
+        The next request is the first in order of the tenant that used the
+        least solver thread seconds for its weight. Requests waiting for their lane
+        or for their tenant's cap are passed over, as they would not take
+        the slot anyway. A request waiting for memory or for a slot holds
+        the requests behind it, so it is not starved by smaller ones.
+        """
+        now = time.monotonic()
+        self._queue.sort(key=lambda t: self._key(t, now))
+        while self._queue:
+            # First eligible request of every tenant, in queue order
+            heads: dict[_Tenant, _Ticket] = {}
+            for t in self._queue:
+                if t.tenant not in heads and self._eligible(t):
+                    heads[t.tenant] = t
+            if not heads:
+                return
+            ticket = min(heads.values(), key=lambda t: t.tenant.usage)
+            if not self._fits(ticket):
+                return
+            self._queue.remove(ticket)
+            tenant = ticket.tenant
+            tenant.queued -= 1
+            tenant.running += 1
+            ticket.reserved = (
+                ticket.cost.seconds * ticket.cost.threads / tenant.limits.weight
+            )
+            tenant.reserved += ticket.reserved
+            self.running += 1
+            self.running_long += ticket.long
+            self.memory_mb += ticket.cost.memory_mb
+            ticket.granted.set_result(None)
+
+    def _release(self, ticket: _Ticket, elapsed: float):
+        tenant = ticket.tenant
+        tenant.running -= 1
+        tenant.cpu_seconds += elapsed * ticket.cost.threads
+        # Charge the actual duration instead of the predicted one, for every
+        # thread the solve was granted
+        tenant.reserved -= ticket.reserved
+        tenant.used += elapsed * ticket.cost.threads / tenant.limits.weight
+        self.running -= 1
+        self.running_long -= ticket.long
+        self.memory_mb -= ticket.cost.memory_mb
+        self._dispatch()
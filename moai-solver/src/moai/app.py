@@ -1,30 +1,558 @@
-from fastapi import FastAPI, HTTPException
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Annotated, Any, Literal
 
-from moai.model import Model, ModelData
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from moai.admission import (
+    AdmissionController,
+    AdmissionStats,
+    Overloaded,
+    Priority,
+    TooLarge,
+)
+from moai.driver import PROGRESS_INTERVAL, SolverProcess
+from moai.estimate import SizeEstimate, estimate_size
+from moai.history import recommender
+from moai.jobs import JobInfo, SolveJob
+from moai.limits import SolveLimits
+from moai.model import Model, ModelData, decode_model_data
+from moai.portfolio import portfolio
 from moai.results import ModelResult
+from moai.solution import SOLUTION_READERS
+from moai.templates import (
+    DATASET_ADAPTER,
+    Dataset,
+    ModelTemplate,
+    TemplateData,
+    TemplateInfo,
+    fingerprint,
+)
+from moai.validation import (
+    ModelIssue,
+    ValidationReport,
+    issues_message,
+    validate_model_data,
+)
+from moai.writer import FragmentCache
 
 app = FastAPI(title="MOAI API", version="0.1.0")
 
+# Models of the request bodies decoded from the raw JSON bytes, see
+# `model_data_body`. FastAPI does not see these bodies, so their schemas are
+# added to the OpenAPI document, see `json_body`.
+BODY_MODELS: tuple[type[BaseModel], ...] = (ModelData, TemplateData, Dataset)
+
+# Registered templates by id. Ids are digests of the template structure, so
+# registering the same structure twice returns the compiled template. The
+# least recently registered or solved templates are dropped beyond
+# `MAX_TEMPLATES`. Their solves keep LP rows in `fragment_caches`, apart from
+# those of solves of models of the same structure.
+templates: OrderedDict[str, ModelTemplate] = OrderedDict()
+MAX_TEMPLATES = 64
+
+# Bounds the solves running at once and queues the others. Replace it with a
+# controller of other limits to configure the service.
+admission = AdmissionController()
+
+# Solve jobs by id, kept until deleted or until evicted once finished, see
+# `evict_jobs`
+jobs: dict[str, SolveJob] = {}
+
+# Seconds a finished job is kept for its result to be fetched, and finished
+# jobs kept at most, the oldest evicted first
+JOB_TTL = 3600.0
+MAX_FINISHED_JOBS = 1024
+
+# Rows of the LP files of earlier solves of a model structure, or of a
+# template, by a tenant, see `fragment_cache`. The least recently used caches
+# are dropped beyond `MAX_FRAGMENT_CACHES`, each holding
+# `FRAGMENT_CACHE_BYTES` of rows at most.
+fragment_caches: OrderedDict[tuple[str, str], FragmentCache] = OrderedDict()
+MAX_FRAGMENT_CACHES = 16
+FRAGMENT_CACHE_BYTES = 16 * 2**20
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(TooLarge)
+async def too_large_handler(request: Request, exc: TooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+# Solvers of solve requests
+Solver = Literal["cbc", "portfolio", "auto"]
+
+
+async def solve_admitted(
+    build: Callable[[], Model],
+    data: ModelData,
+    priority: Priority,
+    fingerprint: str,
+    tenant: str,
+    job: SolveJob | None = None,
+    limits: SolveLimits | None = None,
+    memory_limit_mb: int | None = None,
+    solver: Solver = "cbc",
+    cache: FragmentCache | None = None,
+    validate: Callable[[ModelData], list[ModelIssue]] = validate_model_data,
+) -> ModelResult:
+    """
+    Build and solve a model once admitted, off the event loop.
+
+    The solver runs in a subprocess, killed when the solve is cancelled.
+    Models solved from LP files written by `moai.writer` are validated and
+    written from their data instead of built, see `moai.solution`.
+
+    Args:
+        build: Builds the model, raising on invalid data
+        data: Data of the model, sized to predict the cost of the solve
+        priority: Priority class of the request
+        fingerprint: Structure of the model, to predict the cost of the solve
+            from past solves
+        tenant: Key of the tenant the solve is accounted to
+        job: Job running the solve, to stop it from other requests
+        limits: Limits of the solve, at which it stops with the best
+            solution found
+        memory_limit_mb: Megabytes of memory the solver may use
+        solver: Solver of the model, "portfolio" to race the solvers of
+            the portfolio, see `moai.portfolio`, or "auto" for the solver
+            recommended by the history of solves, see `moai.history`
+        cache: Rows of constraint families of earlier LP files to reuse,
+            see `moai.writer.FragmentCache`
+        validate: Checks the data of models written from it, such as the
+            checks of a template, see `moai.validation.StructureChecks`
+    """
+    try:
+        estimate = await run_in_threadpool(estimate_size, data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    options = (limits or SolveLimits()).model_dump()
+    solver_name: str = solver
+    solver_options: dict = {}
+    if solver == "auto":
+        try:
+            config = recommender.recommend(fingerprint, **options, executable=True)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        solver_name, solver_options = config.solver_name, config.options
+
+    async with admission.admit(estimate, priority, fingerprint, tenant) as cost:
+        model: Model | ModelData = data
+        if solver_name in SOLUTION_READERS:
+            errors = await run_in_threadpool(validate, data)
+            if errors:
+                raise HTTPException(status_code=400, detail=issues_message(errors))
+        else:
+            try:
+                model = await run_in_threadpool(build)
+            except Exception as e:
+                # TODO: improve error handling
+                raise HTTPException(status_code=400, detail=str(e)) from e
+        try:
+            if solver == "portfolio":
+                assert isinstance(model, Model)
+                process = portfolio.race(
+                    model,
+                    memory_limit_mb=memory_limit_mb,
+                    cache=cache,
+                    model_fingerprint=fingerprint,
+                    estimate=estimate,
+                    **options,
+                )
+            else:
+                process = SolverProcess(
+                    model,
+                    solver_name=solver_name,
+                    memory_limit_mb=memory_limit_mb,
+                    cache=cache,
+                    model_fingerprint=fingerprint,
+                    estimate=estimate,
+                    **options,
+                    **solver_options,
+                )
+            if job is not None:
+                result = await job.run(process)
+            else:
+                result = await process.run()
+        except ValueError as e:
+            # Invalid models are only found writing them, when not built
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except Exception as e:
+            # TODO: improve error handling
+            raise HTTPException(status_code=500, detail=str(e)) from e
+        # Charge the tenant for every thread of the solve
+        cost.threads = result.solver_info.threads or 1
+        return result
+
+
+def fragment_cache(owner: str, tenant: str) -> FragmentCache:
+    """
+    Cache of the LP rows of solves of a model structure, or of a registered
+    template, by a tenant.
+
+    Solves of edited versions of a model, e.g. with new parameter values,
+    write only the constraint families the edit changed. Tenants do not
+    share caches, and templates do not share theirs with the solves of
+    models of their structure, so that deleting a template drops its caches
+    only.
+
+    Args:
+        owner: Fingerprint of the model structure, or id of the template
+        tenant: The tenant solving
+    """
+    key = (owner, tenant)
+    cache = fragment_caches.get(key)
+    if cache is None:
+        cache = fragment_caches[key] = FragmentCache(FRAGMENT_CACHE_BYTES)
+        while len(fragment_caches) > MAX_FRAGMENT_CACHES:
+            fragment_caches.popitem(last=False)
+    else:
+        fragment_caches.move_to_end(key)
+    return cache
+
+
+def solve_limits(
+    time_limit: Annotated[float | None, Query(gt=0)] = None,
+    mip_gap: Annotated[float | None, Query(ge=0)] = None,
+    node_limit: Annotated[int | None, Query(ge=0)] = None,
+) -> SolveLimits:
+    """Limits of a solve, from the query parameters of a solve request."""
+    return SolveLimits(time_limit=time_limit, mip_gap=mip_gap, node_limit=node_limit)
+
+
+def json_body(model: type[BaseModel]) -> dict[str, Any]:
+    """OpenAPI of a required JSON request body of a model of `BODY_MODELS`."""
+    schema = {"$ref": f"#/components/schemas/{model.__name__}"}
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": schema}},
+            "required": True,
+        }
+    }
+
+
+def openapi() -> dict[str, Any]:
+    """The OpenAPI document of the API, with the schemas of `BODY_MODELS`."""
+    if app.openapi_schema is not None:
+        return app.openapi_schema
+    document = FastAPI.openapi(app)
+    schemas = document.setdefault("components", {}).setdefault("schemas", {})
+    for model in BODY_MODELS:
+        schema = model.model_json_schema(ref_template="#/components/schemas/{model}")
+        schemas.update(schema.pop("$defs", {}))
+        schemas[model.__name__] = schema
+    return document
+
+
+app.openapi = openapi  # type: ignore[method-assign]
+
+
+async def model_data_body(request: Request) -> ModelData:
+    """
+    Decode the request body straight from the raw JSON bytes.
+
+    This skips FastAPI's default `json.loads` + dict validation round trip and
+    reuses the precompiled ModelData adapter for every request.
+    """
+    try:
+        return decode_model_data(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+
+
+@app.post(
+    "/api/model/validate",
+    response_model=ValidationReport,
+    openapi_extra=json_body(ModelData),
+)
+async def validate_model(payload: Annotated[ModelData, Depends(model_data_body)]):
+    """
+    Check the references of a model without building it.
 
-@app.post("/api/model/solve", response_model=ModelResult)
-async def solve_model(payload: ModelData):
+    Returns every unknown name, wrong index arity, unbound index variable and
+    index literal outside its set at once.
+    """
+    errors = validate_model_data(payload)
+    return ValidationReport(valid=not errors, errors=errors)
+
+
+@app.post(
+    "/api/model/estimate",
+    response_model=SizeEstimate,
+    openapi_extra=json_body(ModelData),
+)
+async def estimate_model(payload: Annotated[ModelData, Depends(model_data_body)]):
+    """
+    Estimate the number of variables, rows and nonzeros of a model.
+
+    Nothing is built, so schedulers can size a model before accepting it.
+    Invalid models are a 400, as they are to /api/model/validate.
+    """
+    if errors := await run_in_threadpool(validate_model_data, payload):
+        raise HTTPException(status_code=400, detail=issues_message(errors))
+    return await run_in_threadpool(estimate_size, payload)
+
+
+@app.post(
+    "/api/model/solve",
+    response_model=ModelResult,
+    openapi_extra=json_body(ModelData),
+)
+async def solve_model(
+    payload: Annotated[ModelData, Depends(model_data_body)],
+    limits: Annotated[SolveLimits, Depends(solve_limits)],
+    priority: Priority = "interactive",
+    tenant: Annotated[str, Header(alias="X-Tenant")] = "default",
+    solver: Solver = "cbc",
+):
     """
     Solve an optimization model and return structured, typed results.
 
     The endpoint accepts a ModelData payload, builds the optimization model,
     solves it, and returns a ModelResult with typed variable and constraint values.
+    Solves wait for admission; a 429 with a Retry-After header is returned
+    when the queue is full, and a 413 for models too large to solve. Queued
+    interactive requests run before batch requests, shortest solves first,
+    and tenants given by the X-Tenant header share the solvers by weight.
+
+    The `time_limit`, `mip_gap` and `node_limit` query parameters bound the
+    solve, which stops at the first reached with the "stopped" status and the
+    best solution found. With `solver=portfolio` the installed solvers race
+    on the model, and the first to prove its result wins. With `solver=auto`
+    the model is solved by the solver fastest on past solves of models of
+    the same structure, see `moai.history`. LP files reuse the rows of
+    earlier solves of the structure by the tenant, see `fragment_cache`.
+    """
+    model_fingerprint = fingerprint(payload)
+    return await solve_admitted(
+        lambda: Model.from_data(payload).build(),
+        payload,
+        priority,
+        model_fingerprint,
+        tenant,
+        limits=limits,
+        solver=solver,
+        cache=fragment_cache(model_fingerprint, tenant),
+    )
+
+
+@app.post(
+    "/api/jobs",
+    response_model=JobInfo,
+    status_code=202,
+    openapi_extra=json_body(ModelData),
+)
+async def create_job(
+    payload: Annotated[ModelData, Depends(model_data_body)],
+    limits: Annotated[SolveLimits, Depends(solve_limits)],
+    priority: Priority = "interactive",
+    tenant: Annotated[str, Header(alias="X-Tenant")] = "default",
+    memory_limit_mb: Annotated[int | None, Query(gt=0)] = None,
+    solver: Solver = "cbc",
+):
+    """
+    Start solving a model in the background, and return the job solving it.
+
+    The job is followed at /api/jobs/{id}, and forgotten `JOB_TTL` seconds
+    after it finishes. It is admitted like other solves, and fails when
+    rejected. Limits stop the solver with the best solution
+    found, as they do for /api/model/solve, and a memory limit caps the
+    memory of the solver, or of every solver of a portfolio race.
+    """
+    evict_jobs()
+    model_fingerprint = fingerprint(payload)
+    cache = fragment_cache(model_fingerprint, tenant)
+    job = SolveJob()
+    job.start(
+        lambda job: solve_admitted(
+            lambda: Model.from_data(payload).build(),
+            payload,
+            priority,
+            model_fingerprint,
+            tenant,
+            job=job,
+            limits=limits,
+            memory_limit_mb=memory_limit_mb,
+            solver=solver,
+            cache=cache,
+        )
+    )
+    jobs[job.id] = job
+    return job.info()
+
+
+def evict_jobs():
+    """Forget finished jobs older than `JOB_TTL`, or beyond `MAX_FINISHED_JOBS`."""
+    expired = time.monotonic() - JOB_TTL
+    finished = sorted(
+        (job.finished, job.id) for job in jobs.values() if job.finished is not None
+    )
+    excess = len(finished) - MAX_FINISHED_JOBS
+    for i, (at, job_id) in enumerate(finished):
+        if i < excess or at < expired:
+            del jobs[job_id]
+
+
+def get_job(job_id: str) -> SolveJob:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobInfo)
+async def job_info(job: Annotated[SolveJob, Depends(get_job)]):
+    """Status of a solve job, with its result once done."""
+    return job.info()
+
+
+@app.get("/api/jobs/{job_id}/progress")
+async def job_progress(
+    job: Annotated[SolveJob, Depends(get_job)],
+    interval: Annotated[float, Query(ge=0.1)] = PROGRESS_INTERVAL,
+):
+    """
+    Server-Sent Events following the search of a solve job.
+
+    A `progress` event is sent on every update of the elapsed seconds, nodes,
+    best solution, best bound and gap, at most one every `interval` seconds.
+    A last `status` event is sent when the job finishes, without its result.
+    """
+
+    async def events():
+        async for progress in job.updates(interval):
+            yield f"event: progress\ndata: {progress.model_dump_json()}\n\n"
+        await job.wait()
+        info = job.info().model_dump_json(exclude={"result"})
+        yield f"event: status\ndata: {info}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/api/jobs/{job_id}/stop", response_model=JobInfo)
+async def stop_job(job: Annotated[SolveJob, Depends(get_job)]):
+    """
+    Stop a solve job, which finishes with the best solution found so far.
+
+    Jobs still queued have found nothing and are cancelled.
     """
-    # Build model
+    job.stop()
+    await job.wait()
+    return job.info()
+
+
+@app.delete("/api/jobs/{job_id}", response_model=JobInfo)
+async def delete_job(job: Annotated[SolveJob, Depends(get_job)]):
+    """Cancel a solve job, killing its solver, and forget it."""
+    job.cancel()
+    await job.wait()
+    # Concurrent deletes of the job all wait for it, and forget it once
+    jobs.pop(job.id, None)
+    return job.info()
+
+
+@app.get("/api/admission", response_model=AdmissionStats)
+async def admission_stats():
+    """
+    Current load of the solve service: running and queued solves, in total
+    and per tenant, and the solver seconds used by every tenant.
+    """
+    return admission.stats()
+
+
+@app.post(
+    "/api/templates",
+    response_model=TemplateInfo,
+    openapi_extra=json_body(TemplateData),
+)
+async def register_template(request: Request):
+    """
+    Register the structure of a model, compiled once for every dataset.
+
+    The body is a TemplateData payload: variables, constraints and objective.
+    """
+    body = await request.body()
     try:
-        model = Model.from_data(payload)
-    except Exception as e:
-        # TODO: improve error handling
+        template = ModelTemplate(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
+    template = templates.setdefault(template.id, template)
+    templates.move_to_end(template.id)
+    while len(templates) > MAX_TEMPLATES:
+        templates.popitem(last=False)
+    return template.info()
+
 
-    # Solve model using the new solve method
+def get_template(template_id: str) -> ModelTemplate:
+    template = templates.get(template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f"Template {template_id} not found")
+    templates.move_to_end(template_id)
+    return template
+
+
+@app.delete("/api/templates/{template_id}", response_model=TemplateInfo)
+async def delete_template(template: Annotated[ModelTemplate, Depends(get_template)]):
+    """Forget a registered template, and the rows of its solves."""
+    del templates[template.id]
+    for key in [key for key in fragment_caches if key[0] == template.id]:
+        del fragment_caches[key]
+    return template.info()
+
+
+@app.post(
+    "/api/templates/{template_id}/solve",
+    response_model=ModelResult,
+    openapi_extra=json_body(Dataset),
+)
+async def solve_template(
+    template: Annotated[ModelTemplate, Depends(get_template)],
+    request: Request,
+    limits: Annotated[SolveLimits, Depends(solve_limits)],
+    priority: Priority = "interactive",
+    tenant: Annotated[str, Header(alias="X-Tenant")] = "default",
+    solver: Solver = "cbc",
+):
+    """
+    Solve a registered template on a dataset of sets and parameters.
+
+    Solves are admitted, limited and raced as they are by /api/model/solve,
+    and reuse the rows of earlier solves of the template by the tenant.
+    """
+    body = await request.body()
     try:
-        result = model.solve(solver_name="cbc")
-        return result
-    except Exception as e:
-        # TODO: improve error handling
-        raise HTTPException(status_code=500, detail=str(e)) from e
+        dataset = DATASET_ADAPTER.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    try:
+        template.check(dataset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    cache = fragment_cache(template.id, tenant)
+    return await solve_admitted(
+        lambda: template.bind(dataset, fragments=cache).build(),
+        template.to_data(dataset),
+        priority,
+        template.fingerprint,
+        tenant,
+        limits=limits,
+        solver=solver,
+        cache=cache,
+        validate=template.checks.check,
+    )
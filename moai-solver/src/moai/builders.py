@@ -4,6 +4,7 @@ from .expressions import (
     ComparisonExpression,
     ExprType,
     IndexExprType,
+    IndexShiftExpr,
     IndexVariableExpr,
     NumberExpr,
     ParameterExpr,
@@ -179,3 +180,18 @@ def index_sub(left: IndexExprType, right: IndexExprType) -> BinaryOp:
 def index_negate(expr: IndexExprType) -> UnaryOp:
     """Helper function to create index negation: -expr"""
     return UnaryOp.create("sub", expr)
+
+
+def shift(index: str, over: str, offset: int, cyclic: bool = False) -> IndexShiftExpr:
+    """Helper function to create the element `offset` positions after index in set over"""
+    return IndexShiftExpr.create(index, over, offset, cyclic)
+
+
+def prev_element(index: str, over: str, cyclic: bool = False) -> IndexShiftExpr:
+    """Helper function to create the predecessor of index in the ordered set over"""
+    return IndexShiftExpr.create(index, over, -1, cyclic)
+
+
+def next_element(index: str, over: str, cyclic: bool = False) -> IndexShiftExpr:
+    """Helper function to create the successor of index in the ordered set over"""
+    return IndexShiftExpr.create(index, over, 1, cyclic)
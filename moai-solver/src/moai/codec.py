@@ -0,0 +1,149 @@
+"""
+Integer codes for set elements.
+
+Set elements (labels) may be arbitrary strings. Hashing and comparing them in
+every index tuple built while expanding constraints, looking up parameters
+and collecting results is much slower than doing the same with small ints.
+
+A `LabelCodec` maps every label of a model to a dense integer code once. The
+Pyomo model is then built entirely on codes, and labels are decoded again only
+at the API boundary (conditions and arithmetic on index values, and results).
+Components of the Pyomo model are indexed by labels again through a
+`LabeledComponent`, see `Model.component`.
+"""
+
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import pyomo.environ as pyo
+
+from .parameters import IndexValue
+
+# Attribute of the Pyomo model holding its codec
+_CODEC_ATTR = "_moai_labels"
+
+
+class LabelCodec:
+    """Dense integer codes for the labels of one model."""
+
+    __slots__ = ("labels", "_codes", "_decoded")
+
+    def __init__(self, labels: Iterable[IndexValue] = ()):
+        # code -> label
+        self.labels: list[IndexValue] = []
+        # label -> code
+        self._codes: dict[IndexValue, int] = {}
+        # Decoded index tuples, shared by every result using the same index
+        self._decoded: dict[tuple[int, ...], tuple[IndexValue, ...]] = {}
+        self.add(labels)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, label: IndexValue) -> bool:
+        return label in self._codes
+
+    def add(self, labels: Iterable[IndexValue]) -> list[int]:
+        """
+        Register labels and return their codes.
+
+        Codes are never reassigned, so components built earlier stay valid
+        when new labels are added.
+        """
+        codes = []
+        for label in labels:
+            code = self._codes.get(label)
+            if code is None:
+                code = len(self.labels)
+                self._codes[label] = code
+                self.labels.append(label)
+            codes.append(code)
+        return codes
+
+    def encode(self, label: IndexValue) -> int:
+        """Return the code of a registered label."""
+        try:
+            return self._codes[label]
+        except (KeyError, TypeError):
+            raise KeyError(f"Index '{label}' is not a known set element") from None
+
+    def encode_index(self, index: Iterable[IndexValue]) -> tuple[int, ...]:
+        """Encode an index tuple."""
+        try:
+            return tuple(map(self._codes.__getitem__, index))
+        except (KeyError, TypeError):
+            raise KeyError(f"Index {tuple(index)} is not a known set element") from None
+
+    def decode(self, code: int) -> IndexValue:
+        """Return the label of a code."""
+        return self.labels[code]
+
+    def decode_index(self, index: int | tuple[int, ...]) -> tuple[IndexValue, ...]:
+        """Decode a Pyomo component index (a code or a tuple of codes)."""
+        if not isinstance(index, tuple):
+            index = (index,)
+        decoded = self._decoded.get(index)
+        if decoded is None:
+            labels = self.labels
+            decoded = tuple(labels[code] for code in index)
+            self._decoded[index] = decoded
+        return decoded
+
+
+class LabeledComponent:
+    """
+    An indexed component of a Pyomo model built on codes, indexed by labels.
+
+    `view["a"]` and `view["a", "b"]` return the items of the labels, and
+    iterating yields the labels of the index, as tuples when it has several
+    dimensions. Other attributes are those of the component.
+    """
+
+    __slots__ = ("component", "codec")
+
+    def __init__(self, component: Any, codec: LabelCodec):
+        self.component = component
+        self.codec = codec
+
+    def _encode(self, index: Any) -> Any:
+        if isinstance(index, tuple):
+            return self.codec.encode_index(index)
+        return self.codec.encode(index)
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.component[self._encode(index)]
+
+    def __contains__(self, index: Any) -> bool:
+        try:
+            return self._encode(index) in self.component
+        except KeyError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self.component)
+
+    def _decode(self, index: Any) -> Any:
+        labels = self.codec.decode_index(index)
+        return labels if len(labels) > 1 else labels[0]
+
+    def __iter__(self) -> Iterator[Any]:
+        return map(self._decode, self.component.keys())
+
+    def keys(self) -> Iterator[Any]:
+        return iter(self)
+
+    def items(self) -> Iterator[tuple[Any, Any]]:
+        return ((self._decode(key), item) for key, item in self.component.items())
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.component, name)
+
+
+def attach_codec(model: pyo.ConcreteModel, codec: LabelCodec):
+    """Build `model` on the codes of `codec`."""
+    setattr(model, _CODEC_ATTR, codec)
+
+
+def label_codec(model: pyo.ConcreteModel) -> LabelCodec | None:
+    """Return the codec a Pyomo model is built on, if any."""
+    return getattr(model, _CODEC_ATTR, None)
@@ -0,0 +1,394 @@
+"""
+Generate Python source for constraint families and objectives.
+
+The closure compiler still pays a Python call per node of every term it
+builds. Instead, a constraint family (one quantified constraint) can be
+translated into the source of a single function taking the quantifier
+indices of a row:
+
+- aggregations become list comprehensions over the sets they bind, with
+  their conditions as comprehension filters,
+- variables and parameters are read by index from the dicts Pyomo stores
+  their data in,
+- index variables are local variables of the function.
+
+The source is compiled once per structure and cached: IR nodes are
+hash-consed, so structurally equal constraints share the generated code,
+also across models. It is bound to the components of a model when
+instantiated. Arithmetic and relations go through the same operator
+functions as the compiler and the parser, so generated rows are the same
+Pyomo expressions.
+"""
+
+import math
+import weakref
+from collections.abc import Callable
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Any
+
+import pyomo.environ as pyo
+
+from . import ir
+from .codec import LabelCodec
+from .compiler import (
+    MISSING_ATTR,
+    NotCompilable,
+    binary_op,
+    relation,
+    shift_element,
+    total,
+    unary_op,
+)
+from .ir import Node
+
+if TYPE_CHECKING:
+    from .parse import SharedExpressions
+
+# Attribute of Pyomo components holding their lookup table
+_LOOKUP_ATTR = "_moai_lookup"
+
+_OPERATORS = {"add": "+", "sub": "-", "mul": "*", "div": "/"}
+_COMPARISONS = {"le": "<=", "lt": "<", "eq": "==", "ne": "!=", "ge": ">=", "gt": ">"}
+
+
+class _Lookup:
+    """
+    Values of an indexed component by index, as read by generated code.
+
+    Reads go to the dict Pyomo keeps the component data in, without copying
+    it; indices it lacks, like defaulted parameter values, go through the
+    component.
+    """
+
+    __slots__ = ("data", "component", "zero")
+
+    def __init__(self, component: Any):
+        self.data = component._data
+        self.component = component
+        # Indices outside the support of a sparse variable read as 0
+        self.zero = getattr(component, MISSING_ATTR, None) == "zero"
+
+    def __getitem__(self, key: Any) -> Any:
+        try:
+            return self.data[key]
+        except KeyError:
+            pass
+        try:
+            return self.component[key]
+        except KeyError:
+            if self.zero:
+                return 0
+            raise
+
+
+class _Identity:
+    """Labels of a model not built on codes, where codes are the labels."""
+
+    __slots__ = ()
+
+    def __getitem__(self, value: Any) -> Any:
+        return value
+
+
+def lookup(component: Any) -> _Lookup:
+    """Return the lookup table of an indexed variable or parameter."""
+    table = getattr(component, _LOOKUP_ATTR, None)
+    if table is None:
+        table = _Lookup(component)
+        setattr(component, _LOOKUP_ATTR, table)
+    return table
+
+
+class Generated:
+    """Compiled source of one constraint family, not bound to any model."""
+
+    def __init__(
+        self,
+        source: str,
+        components: dict[str, tuple[str, str]],
+        nodes: dict[str, Node],
+    ):
+        self.source = source
+        self.code = compile(source, "<moai-codegen>", "exec")
+        # Placeholder -> (kind, name) of the components the code reads
+        self.components = components
+        # Placeholder -> IR node, for shared and memoized subexpressions
+        self.nodes = nodes
+
+
+class _Generator:
+    """Translates the nodes of one constraint family into Python source."""
+
+    def __init__(self, index_names: tuple[str, ...], shared: frozenset[Node]):
+        self.shared = shared
+        # One argument per index a row passes, the last of repeated names wins
+        self.arguments = [f"_i{k}" for k in range(len(index_names))]
+        self.scope = dict(zip(index_names, self.arguments, strict=True))
+        self.counter = len(self.arguments)
+        self.components: dict[str, tuple[str, str]] = {}
+        self.nodes: dict[str, Node] = {}
+
+    def component(self, kind: str, name: str) -> str:
+        for placeholder, component in self.components.items():
+            if component == (kind, name):
+                return placeholder
+        placeholder = f"_c{len(self.components)}"
+        self.components[placeholder] = (kind, name)
+        return placeholder
+
+    def node(self, expr: Node) -> str:
+        placeholder = f"_n{len(self.nodes)}"
+        self.nodes[placeholder] = expr
+        return placeholder
+
+    def literal(self, value: Any) -> str:
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"float({str(value)!r})"
+        return repr(value)
+
+    def expression(self, expr: Node) -> str:
+        """Source building the Pyomo expression of a node."""
+        kind = expr.kind
+        if kind in (ir.NUM, ir.STR, ir.IDX, ir.SHIFT):
+            return self.value(expr)
+        if kind == ir.VAR:
+            name, indices = expr.args
+            # Index variables referenced as variables, see _parse_variable
+            if name.startswith("_idx_") and name[5:] in self.scope:
+                return self.value(ir.index_var(name[5:]))
+            if not indices:
+                return self.component("var", name)
+            return f"{self.component('var_table', name)}[{self.key(indices)}]"
+        if kind == ir.PARAM:
+            name, indices = expr.args
+            if not indices:
+                return self.component("param", name)
+            return f"{self.component('param_table', name)}[{self.key(indices)}]"
+
+        if expr in self.shared:
+            if not expr.free <= self.scope.keys():
+                raise NotCompilable(f"expression depends on {expr.free}")
+            key = "".join(f"{self.scope[name]}, " for name in sorted(expr.free))
+            return f"_entry({self.node(expr)}, ({key}), lambda: {self.compound(expr)})"
+        if not expr.free:
+            # Compound nodes that do not depend on any index are built once
+            return f"_memo({self.node(expr)}, lambda: {self.compound(expr)})"
+        return self.compound(expr)
+
+    def compound(self, expr: Node) -> str:
+        kind = expr.kind
+        if kind == ir.BINARY:
+            op, left, right = expr.args
+            return f"_binary({op!r}, {self.expression(left)}, {self.expression(right)})"
+        if kind == ir.UNARY:
+            op, operand = expr.args
+            return f"_unary({op!r}, {self.expression(operand)})"
+        if kind == ir.AGG:
+            return self.aggregation(expr)
+        raise NotCompilable(kind)
+
+    def aggregation(self, expr: Node) -> str:
+        op, body, bindings, condition = expr.args
+        if op != "sum":
+            raise NotCompilable(f"aggregation {op}")
+        outer = self.scope
+        self.scope = dict(outer)
+        try:
+            loops = []
+            for index_var, set_name in bindings:
+                targets = []
+                for name in ir.binding_names(index_var):
+                    self.scope[name] = f"_i{self.counter}"
+                    self.counter += 1
+                    targets.append(self.scope[name])
+                target = targets[0] if len(targets) == 1 else f"({', '.join(targets)})"
+                set_ref = self.component(f"set:{len(targets)}", set_name)
+                loops.append(f"for {target} in {set_ref}")
+            if condition is not None:
+                loops.append(f"if {self.predicate(condition)}")
+            term = self.expression(body)
+        finally:
+            self.scope = outer
+        return f"_total([{term} {' '.join(loops)}])"
+
+    def predicate(self, expr: Node) -> str:
+        """Source of a condition, evaluated on labels."""
+        if expr.kind != ir.CMP:
+            raise NotCompilable(expr.kind)
+        op, left, right = expr.args
+        return f"({self.value(left)} {_COMPARISONS[op]} {self.value(right)})"
+
+    def value(self, expr: Node) -> str:
+        """Source evaluating a node to a label or a number."""
+        kind = expr.kind
+        if kind == ir.NUM or kind == ir.STR:
+            return self.literal(expr.args[0])
+        if kind == ir.IDX or kind == ir.SHIFT:
+            return f"_labels[{self.index(expr)}]"
+        if kind == ir.BINARY:
+            op, left, right = expr.args
+            return f"({self.value(left)} {_OPERATORS[op]} {self.value(right)})"
+        if kind == ir.UNARY and expr.args[0] == "sub":
+            return f"(-{self.value(expr.args[1])})"
+        if kind == ir.PARAM:
+            name, indices = expr.args
+            if not indices:
+                return f"_value({self.component('param', name)})"
+            table = self.component("param_table", name)
+            return f"_value({table}[{self.key(indices)}])"
+        raise NotCompilable(kind)
+
+    def index(self, expr: Node) -> str:
+        """Source of a component index, as held by the Pyomo model."""
+        if expr.kind == ir.IDX:
+            name = expr.args[0]
+            if name not in self.scope:
+                raise NotCompilable(f"index variable {name} is not bound")
+            return self.scope[name]
+        if expr.kind == ir.SHIFT:
+            index, set_name, offset, cyclic = expr.args
+            set_ref = self.component("set", set_name)
+            return f"_shift({set_ref}, {self.index(index)}, {offset!r}, {cyclic!r})"
+        return f"_encode({self.value(expr)})"
+
+    def key(self, indices: tuple[Node, ...]) -> str:
+        return ", ".join(self.index(i) for i in indices)
+
+
+# Code held elsewhere, e.g. by model templates, found whatever the cache evicted
+_pinned: "weakref.WeakValueDictionary[tuple, Generated]" = weakref.WeakValueDictionary()
+
+
+def generate(
+    expr: Node, index_names: tuple[str, ...], shared: frozenset[Node] = frozenset()
+) -> Generated:
+    """
+    Generate the row function of a constraint family, or of an objective.
+
+    The function takes the values of `index_names` as arguments and returns
+    the relation of a comparison node, or the expression of any other node.
+
+    Args:
+        expr: The constraint or objective expression
+        index_names: Quantifier index variables, in the order rows pass them
+        shared: Subexpressions of `expr` emitted as shared Pyomo expressions
+
+    Raises:
+        NotCompilable: If the expression uses constructs not supported here
+    """
+    generated = _pinned.get((expr, index_names, shared))
+    if generated is None:
+        generated = _generate(expr, index_names, shared)
+    return generated
+
+
+def pin(
+    expr: Node, index_names: tuple[str, ...], shared: frozenset[Node] = frozenset()
+) -> Generated:
+    """
+    Generate code that stays available while the returned object is held.
+
+    Raises:
+        NotCompilable: If the expression uses constructs not supported here
+    """
+    generated = generate(expr, index_names, shared)
+    _pinned[(expr, index_names, shared)] = generated
+    return generated
+
+
+@lru_cache(maxsize=256)
+def _generate(
+    expr: Node, index_names: tuple[str, ...], shared: frozenset[Node]
+) -> Generated:
+    generator = _Generator(index_names, shared)
+    if expr.kind == ir.CMP:
+        op, left, right = expr.args
+        body = (
+            f"_relation({op!r}, {generator.expression(left)}, "
+            f"{generator.expression(right)})"
+        )
+    else:
+        body = generator.expression(expr)
+    source = f"def _row({', '.join(generator.arguments)}):\n    return {body}\n"
+    return Generated(source, generator.components, generator.nodes)
+
+
+def instantiate(
+    generated: Generated,
+    model: pyo.ConcreteModel,
+    codec: LabelCodec | None = None,
+    memo: dict[Node, Any] | None = None,
+    shared: "SharedExpressions | None" = None,
+) -> Callable[..., Any]:
+    """
+    Bind generated code to the components of a model.
+
+    Raises:
+        NotCompilable: If a component the code reads is missing from the model
+    """
+    memo = {} if memo is None else memo
+
+    def memoized(expr: Node, build: Callable[[], Any]) -> Any:
+        result = memo.get(expr)
+        if result is None:
+            result = memo[expr] = build()
+        return result
+
+    env: dict[str, Any] = {
+        "__builtins__": {"float": float},
+        "_binary": binary_op,
+        "_unary": unary_op,
+        "_relation": relation,
+        "_total": total,
+        "_shift": shift_element,
+        "_value": pyo.value,
+        "_memo": memoized,
+        "_labels": codec.labels if codec is not None else _Identity(),
+        "_encode": codec.encode if codec is not None else (lambda label: label),
+    }
+    if shared is not None:
+        env["_entry"] = partial(shared.entry, model)
+    for placeholder, (kind, name) in generated.components.items():
+        env[placeholder] = _resolve(model, kind, name)
+    env.update(generated.nodes)
+    exec(generated.code, env)
+    return env["_row"]
+
+
+def _resolve(model: pyo.ConcreteModel, kind: str, name: str) -> Any:
+    component = model.component(name)
+    if kind.startswith("set"):
+        if not isinstance(component, pyo.Set | pyo.RangeSet):
+            raise NotCompilable(f"set {name} not found")
+        if ":" in kind and component.dimen != int(kind.split(":")[1]):
+            # Left to the compiler, which reports the index variables
+            raise NotCompilable(
+                f"set {name} has elements of dimension {component.dimen}"
+            )
+        return component
+    ctype = pyo.Var if kind.startswith("var") else pyo.Param
+    if not isinstance(component, ctype):
+        raise NotCompilable(f"{ctype.__name__} {name} not found")
+    if kind.endswith("_table"):
+        return lookup(component)
+    return component
+
+
+def row_function(
+    model: pyo.ConcreteModel,
+    expr: Node,
+    index_names: list[str],
+    codec: LabelCodec | None = None,
+    memo: dict[Node, Any] | None = None,
+    shared: "SharedExpressions | None" = None,
+) -> Callable[..., Any]:
+    """
+    Return the generated row function of a constraint family on a model.
+
+    Raises:
+        NotCompilable: If the constraint cannot be generated
+    """
+    nodes = shared.nodes if shared is not None else frozenset()
+    relevant = frozenset(n for n in ir.iter_nodes(expr) if n in nodes)
+    generated = generate(expr, tuple(index_names), relevant)
+    return instantiate(generated, model, codec, memo, shared)
@@ -0,0 +1,494 @@
+"""
+Compile IR nodes into plain Python closures over index slots.
+
+The parser walks expression nodes again for every row it builds, with the
+index values held in a dict that every aggregation copies once per term.
+Instead, expressions are compiled once into nested closures. Every index
+variable is resolved to a fixed slot of a `Row` at compile time, and a
+closure reads its index values from those slots.
+
+Constraint rows and objectives are evaluated on one preallocated list: the
+quantifier indices of a row are written to its first slots, and aggregations
+write the indices they bind to the slots after them in place while they
+iterate, so expanding nested sums allocates no context per term.
+"""
+
+import operator
+from collections.abc import Callable, Iterable, Sequence
+from itertools import product
+from typing import TYPE_CHECKING, Any
+
+import pyomo.environ as pyo
+
+from . import ir
+from .codec import LabelCodec
+from .ir import Node
+from .linear import (
+    constant,
+    linear_expression,
+    linear_sum,
+    linear_terms,
+    monomial,
+    scale,
+)
+
+if TYPE_CHECKING:
+    from .parse import SharedExpressions
+
+# Index values of one row, one slot per index variable
+Row = Sequence[Any]
+RowFn = Callable[[Row], Any]
+Predicate = Callable[[Row], bool]
+
+# Attribute of sparse Pyomo variables holding their missing index policy
+MISSING_ATTR = "_moai_missing"
+
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    "le": operator.le,
+    "lt": operator.lt,
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "ge": operator.ge,
+    "gt": operator.gt,
+}
+
+_ARITHMETIC: dict[str, Callable[[Any, Any], Any]] = {
+    "add": operator.add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "div": operator.truediv,
+}
+
+
+class NotCompilable(Exception):
+    """The expression uses a construct the closure compiler does not support."""
+
+
+def binary_op(op: str, lhs: Any, rhs: Any) -> Any:
+    """Apply a binary operator to parsed operands."""
+    # If both operands are scalars (not Pyomo expressions), perform Python arithmetic
+    # This is important for index expressions like t-1 where t is an index variable
+    if isinstance(lhs, int | float | str) and isinstance(rhs, int | float | str):
+        match op:
+            case "add":
+                result = lhs + rhs  # type: ignore
+            case "sub":
+                result = lhs - rhs  # type: ignore
+            case "mul":
+                result = lhs * rhs  # type: ignore
+            case "div":
+                return lhs / rhs  # type: ignore
+            case _:
+                raise ValueError(f"Unsupported binary operator for scalars: {op}")
+        # Ensure integer results stay as ints (important for indexing)
+        if isinstance(lhs, int) and isinstance(rhs, int):
+            return int(result)
+        return result
+
+    # Affine operands are combined into a linear expression
+    linear = _linear_op(op, lhs, rhs)
+    if linear is not None:
+        return linear
+
+    # Otherwise, create Pyomo expressions
+    match op:
+        case "add":
+            return pyo.expr.SumExpression((lhs, rhs))
+        case "sub":
+            return pyo.expr.SumExpression((lhs, pyo.expr.NegationExpression((rhs,))))
+        case "mul":
+            return pyo.expr.ProductExpression((lhs, rhs))
+        case "div":
+            return pyo.expr.DivisionExpression((lhs, rhs))
+        case _:
+            raise ValueError(f"Unsupported operator: {op}")
+
+
+def _linear_op(op: str, lhs: Any, rhs: Any) -> Any:
+    """Apply a binary operator to affine operands, or return None."""
+    if op == "add" or op == "sub":
+        left = linear_terms(lhs)
+        right = linear_terms(rhs)
+        if left is None or right is None:
+            return None
+        return linear_expression(left + (right if op == "add" else scale(right, -1)))
+    if op == "mul":
+        # Most products are a coefficient times a variable
+        term = monomial(lhs, rhs)
+        if term is None:
+            term = monomial(rhs, lhs)
+        if term is not None:
+            return term
+        factor, terms = constant(lhs), linear_terms(rhs)
+        if factor is None:
+            factor, terms = constant(rhs), linear_terms(lhs)
+        if factor is None or terms is None:
+            return None
+        return linear_expression(scale(terms, factor))
+    if op == "div":
+        factor, terms = constant(rhs), linear_terms(lhs)
+        if not factor or terms is None:
+            return None
+        return linear_expression(scale(terms, 1 / factor))
+    return None
+
+
+def unary_op(op: str, operand: Any) -> Any:
+    """Apply a unary operator to a parsed operand."""
+    match op:
+        case "sub":
+            if isinstance(operand, int | float):
+                return -operand
+            terms = linear_terms(operand)
+            if terms is not None:
+                return linear_expression(scale(terms, -1))
+            return pyo.numeric_expr.NegationExpression((operand,))
+        case "sin":
+            return pyo.sin(operand)
+        case "cos":
+            return pyo.cos(operand)
+        case "tan":
+            return pyo.tan(operand)
+        case "exp":
+            return pyo.exp(operand)
+        case "log":
+            return pyo.log(operand)
+        case _:
+            raise ValueError(f"Unsupported unary operator: {op}")
+
+
+def relation(op: str, lhs: Any, rhs: Any) -> Any:
+    """Build the Pyomo relation of a constraint from its parsed sides."""
+    match op:
+        case "le":
+            return pyo.expr.InequalityExpression((lhs, rhs), strict=False)
+        case "ge":
+            return pyo.expr.InequalityExpression((rhs, lhs), strict=False)
+        case "eq":
+            return pyo.expr.EqualityExpression((lhs, rhs))
+        case "ne":
+            # return pyo.expr.NotEqualExpression((lhs, rhs)) # throws error. Investigate more
+            return lhs != rhs
+        case "lt":
+            return pyo.expr.InequalityExpression((lhs, rhs), strict=True)
+        case "gt":
+            return pyo.expr.InequalityExpression((rhs, lhs), strict=True)
+        case _:
+            raise ValueError(f"Unsupported comparison operator: {op}")
+
+
+def total(terms: list) -> Any:
+    """Sum the terms of an aggregation, as one linear expression if all are affine."""
+    if not terms:
+        return 0
+    elif len(terms) == 1:
+        return terms[0]
+    linear = linear_sum(terms)
+    if linear is None:
+        return sum(terms)
+    return linear
+
+
+def check_dimension(set_obj: pyo.Set, index_names: Iterable[str]):
+    """Check that a set binds exactly one index variable per element component."""
+    names = list(index_names)
+    dimen = set_obj.dimen
+    if isinstance(dimen, int) and dimen != len(names):
+        raise ValueError(
+            f"Set {set_obj.name} has elements of dimension {dimen} "
+            f"but binds {len(names)} index variables {names}"
+        )
+
+
+def shift_element(
+    set_obj: pyo.Set, value: Any, offset: int, cyclic: bool, label: Any = None
+) -> Any:
+    """
+    Return the element `offset` positions after `value` in an ordered set.
+
+    Positions are looked up with `ord` and `at`, which are constant time on
+    ordered Pyomo sets.
+    """
+    position = set_obj.ord(value) + offset
+    size = len(set_obj)
+    if cyclic:
+        position = (position - 1) % size + 1
+    elif not 1 <= position <= size:
+        raise ValueError(
+            f"Index {value if label is None else label} has no element {offset} "
+            f"positions away in set {set_obj.name}"
+        )
+    return set_obj.at(position)
+
+
+class Compiler:
+    """
+    Compiles nodes of one constraint against a Pyomo model.
+
+    Args:
+        model: The Pyomo model the compiled closures read components from
+        slots: Slot of each index variable in a row
+        codec: Codec of the model, rows then hold element codes
+        memo: Results of index-free nodes, shared with the parser
+        shared: Aggregations emitted once as shared Pyomo expressions
+    """
+
+    def __init__(
+        self,
+        model: pyo.ConcreteModel,
+        slots: dict[str, int],
+        codec: LabelCodec | None = None,
+        memo: dict[Node, Any] | None = None,
+        shared: "SharedExpressions | None" = None,
+    ):
+        self.model = model
+        self.slots = slots
+        self.codec = codec
+        self.memo = memo
+        self.shared = shared
+        # Next free slot, and the number of slots rows need
+        self.size = max(slots.values(), default=-1) + 1
+        self.width = self.size
+
+    def row(self) -> list:
+        """Allocate a row the compiled expressions can be evaluated on."""
+        return [None] * self.width
+
+    def constraint(self, expr: Node) -> RowFn:
+        """Compile a comparison node into the Pyomo relation of a row."""
+        if expr.kind != ir.CMP:
+            raise NotCompilable(expr.kind)
+        op, left, right = expr.args
+        lhs = self.expression(left)
+        rhs = self.expression(right)
+        return lambda row: relation(op, lhs(row), rhs(row))
+
+    def expression(self, expr: Node) -> RowFn:
+        """Compile a node into a function building its Pyomo expression."""
+        kind = expr.kind
+        if kind in (ir.NUM, ir.STR, ir.IDX, ir.SHIFT):
+            return self.value(expr)
+        if kind == ir.VAR:
+            return self._variable(expr)
+        if kind == ir.PARAM:
+            name, indices = expr.args
+            p = self._component(name, pyo.Param)
+            if not indices:
+                return lambda row: p
+            key = self._key(indices)
+            return lambda row: p[key(row)]
+
+        if self.shared is not None and expr in self.shared.nodes:
+            return self._shared(expr)
+        build = self._compound(expr)
+        if self.memo is None or expr.free:
+            return build
+        # Compound nodes that do not depend on any index are built once
+        memo = self.memo
+
+        def memoized(row):
+            result = memo.get(expr)
+            if result is None:
+                result = memo[expr] = build(row)
+            return result
+
+        return memoized
+
+    def predicate(self, expr: Node) -> Predicate:
+        """Compile a comparison node into a predicate over rows."""
+        if expr.kind != ir.CMP:
+            raise NotCompilable(expr.kind)
+        op, left, right = expr.args
+        compare = _COMPARISONS[op]
+        lhs = self.value(left)
+        rhs = self.value(right)
+        return lambda row: compare(lhs(row), rhs(row))
+
+    def value(self, expr: Node) -> RowFn:
+        """Compile a node evaluating to a label or a number."""
+        kind = expr.kind
+        if kind == ir.NUM or kind == ir.STR:
+            constant = expr.args[0]
+            return lambda row: constant
+        if kind == ir.IDX or kind == ir.SHIFT:
+            index = self.index(expr)
+            if self.codec is None:
+                return index
+            labels = self.codec.labels
+            return lambda row: labels[index(row)]
+        if kind == ir.BINARY:
+            op, left, right = expr.args
+            arithmetic = _ARITHMETIC[op]
+            lhs = self.value(left)
+            rhs = self.value(right)
+            return lambda row: arithmetic(lhs(row), rhs(row))
+        if kind == ir.UNARY and expr.args[0] == "sub":
+            operand = self.value(expr.args[1])
+            return lambda row: -operand(row)
+        if kind == ir.PARAM:
+            return self._parameter(expr)
+        raise NotCompilable(kind)
+
+    def index(self, expr: Node) -> RowFn:
+        """Compile a node used as a component index, as held by the Pyomo model."""
+        if expr.kind == ir.IDX:
+            name = expr.args[0]
+            if name not in self.slots:
+                raise NotCompilable(f"index variable {name} is not bound")
+            slot = self.slots[name]
+            return operator.itemgetter(slot)
+        if expr.kind == ir.SHIFT:
+            index, set_name, offset, cyclic = expr.args
+            set_obj = self.model.component(set_name)
+            if set_obj is None:
+                raise NotCompilable(f"set {set_name} not found")
+            value = self.index(index)
+            return lambda row: shift_element(set_obj, value(row), offset, cyclic)
+        label = self.value(expr)
+        if self.codec is None:
+            return label
+        encode = self.codec.encode
+        return lambda row: encode(label(row))
+
+    def _compound(self, expr: Node) -> RowFn:
+        kind = expr.kind
+        if kind == ir.BINARY:
+            op, left, right = expr.args
+            lhs = self.expression(left)
+            rhs = self.expression(right)
+            return lambda row: binary_op(op, lhs(row), rhs(row))
+        if kind == ir.UNARY:
+            op, operand_node = expr.args
+            operand = self.expression(operand_node)
+            return lambda row: unary_op(op, operand(row))
+        if kind == ir.AGG:
+            return self._aggregation(expr)
+        raise NotCompilable(kind)
+
+    def _aggregation(self, expr: Node) -> RowFn:
+        """
+        Compile a sum over the Cartesian product of its binding sets.
+
+        The indices the sum binds get the slots after those in use, which are
+        free again once the sum is compiled, so sibling sums share them.
+        """
+        op, body, bindings, condition = expr.args
+        if op != "sum":
+            raise NotCompilable(f"aggregation {op}")
+
+        outer_slots, outer_size = self.slots, self.size
+        self.slots = dict(outer_slots)
+        try:
+            set_objs = []
+            # First and last slot written by each binding
+            spans: list[tuple[int, int]] = []
+            for index_var, set_name in bindings:
+                set_obj = self._component(set_name, pyo.Set, pyo.RangeSet)
+                names = ir.binding_names(index_var)
+                check_dimension(set_obj, names)
+                set_objs.append(set_obj)
+                spans.append((self.size, self.size + len(names)))
+                for name in names:
+                    self.slots[name] = self.size
+                    self.size += 1
+            self.width = max(self.width, self.size)
+            keep = self.predicate(condition) if condition is not None else None
+            term = self.expression(body)
+        finally:
+            self.slots, self.size = outer_slots, outer_size
+
+        if len(set_objs) == 1 and spans[0][1] - spans[0][0] == 1:
+            (set_obj,) = set_objs
+            slot = spans[0][0]
+
+            def sum_one(row):
+                terms = []
+                for element in set_obj:
+                    row[slot] = element
+                    if keep is None or keep(row):
+                        terms.append(term(row))
+                return total(terms)
+
+            return sum_one
+
+        flat = [stop - start == 1 for start, stop in spans]
+
+        def sum_product(row):
+            terms = []
+            for combination in product(*set_objs):
+                for (start, stop), is_flat, element in zip(
+                    spans, flat, combination, strict=True
+                ):
+                    if is_flat:
+                        row[start] = element
+                    else:
+                        # Unpack the components of a tuple set element
+                        row[start:stop] = element
+                if keep is None or keep(row):
+                    terms.append(term(row))
+            return total(terms)
+
+        return sum_product
+
+    def _shared(self, expr: Node) -> RowFn:
+        """Compile a reference to a shared aggregation."""
+        assert self.shared is not None
+        shared, model = self.shared, self.model
+        build = self._compound(expr)
+        free = sorted(expr.free)
+        if not free:
+            return lambda row: shared.entry(model, expr, (), lambda: build(row))
+        if not expr.free <= self.slots.keys():
+            raise NotCompilable(f"expression depends on {expr.free}")
+        key = operator.itemgetter(*(self.slots[name] for name in free))
+        if len(free) == 1:
+            return lambda row: shared.entry(
+                model, expr, (key(row),), lambda: build(row)
+            )
+        return lambda row: shared.entry(model, expr, key(row), lambda: build(row))
+
+    def _variable(self, expr: Node) -> RowFn:
+        name, indices = expr.args
+        # Index variables referenced as variables, see _parse_variable
+        if name.startswith("_idx_") and name[5:] in self.slots:
+            return self.value(ir.index_var(name[5:]))
+        v = self._component(name, pyo.Var)
+        if not indices:
+            return lambda row: v
+        key = self._key(indices)
+        if getattr(v, MISSING_ATTR, None) != "zero":
+            return lambda row: v[key(row)]
+
+        def sparse(row):
+            try:
+                return v[key(row)]
+            except KeyError:
+                # Indices outside the support of a sparse variable
+                return 0
+
+        return sparse
+
+    def _component(self, name: str, *ctypes: type) -> Any:
+        component = self.model.component(name)
+        if not isinstance(component, ctypes):
+            # Left to the parser, which reports it
+            raise NotCompilable(f"{ctypes[0].__name__} {name} not found")
+        return component
+
+    def _parameter(self, expr: Node) -> RowFn:
+        name, indices = expr.args
+        p = self._component(name, pyo.Param)
+        if not indices:
+            return lambda row: pyo.value(p)
+        key = self._key(indices)
+        return lambda row: pyo.value(p[key(row)])
+
+    def _key(self, indices: Sequence[Node]) -> RowFn:
+        """Compile index nodes into a function building a component index."""
+        if len(indices) == 1:
+            return self.index(indices[0])
+        if all(i.kind == ir.IDX and i.args[0] in self.slots for i in indices):
+            # Plain index variables, read in one call
+            return operator.itemgetter(*(self.slots[i.args[0]] for i in indices))
+        parts = [self.index(i) for i in indices]
+        return lambda row: tuple(part(row) for part in parts)
@@ -2,25 +2,37 @@ from typing import Literal
 
 from pydantic import BaseModel
 
-from .expressions import ComparisonExpression
+from .expressions import ComparisonExpression, index_names_to_string
 
 
 class Quantifier(BaseModel):
     """A quantifier in the optimization problem."""
 
-    index: str
+    # A list of names binds the components of a tuple set, e.g. ["i", "j"]
+    index: str | list[str]
     over: str
     condition: "ComparisonExpression | None"
 
+    @property
+    def index_names(self) -> list[str]:
+        """Names of the index variables bound by this quantifier"""
+        if isinstance(self.index, str):
+            return [self.index]
+        return self.index
+
     def display(self) -> str:
         """A string representation of the quantifier."""
+        index = index_names_to_string(self.index)
         if self.condition:
-            return f"for {self.index} in {self.over} if {self.condition.display()}"
-        return f"for {self.index} in {self.over}"
+            return f"for {index} in {self.over} if {self.condition.display()}"
+        return f"for {index} in {self.over}"
 
     @classmethod
     def create(
-        cls, index: str, over: str, condition: "ComparisonExpression | None" = None
+        cls,
+        index: str | list[str],
+        over: str,
+        condition: "ComparisonExpression | None" = None,
     ) -> "Quantifier":
         return Quantifier(index=index, over=over, condition=condition)
 
@@ -0,0 +1,159 @@
+"""
+Core budget shared by concurrent solves.
+
+Solvers either run on one thread, or default to every core of the machine,
+so concurrent multi-threaded solves oversubscribe it. The `CoreBudget`
+hands every solve a number of threads instead:
+
+- a solve asks for threads by the size of its model: LPs and small MIPs get
+  one, larger MIPs one per `NONZEROS_PER_THREAD` nonzeros,
+- it is granted at most the cores left free by the solves running, and at
+  least one,
+- the threads go back to the budget when the solve finishes.
+
+The number of threads is passed to the solver through its own option, see
+`THREAD_OPTIONS`, replacing one set by the caller. Solvers without one run
+on a single thread.
+
+Solves of LP files written by `moai.writer` write the file before the solver
+starts, so the cores of a solve are used by the processes writing its file
+first, see `writer_processes`: a solve asks for the most of the threads of
+its solver and of its writer.
+
+A solve started with every core taken still runs, on one thread, rather
+than waiting for a core: the budget is then oversubscribed by one thread
+per such solve. Admission control bounds the solves running at once, see
+`moai.admission`, so at most `AdmissionConfig.max_concurrent - 1` threads
+run beyond the budget, and only until the multi-threaded solves finish.
+"""
+
+import math
+import os
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from .estimate import SizeEstimate
+
+# Thread option of each solver
+THREAD_OPTIONS: dict[str, str] = {
+    "cbc": "threads",
+    "highs": "threads",
+    "appsi_highs": "threads",
+    "cplex": "threads",
+    "cplex_direct": "threads",
+    "gurobi": "Threads",
+    "gurobi_direct": "Threads",
+    "gurobi_persistent": "Threads",
+    "xpress": "threads",
+}
+
+# Nonzeros of a MIP worth one more thread
+NONZEROS_PER_THREAD = 50_000
+
+# Rows of a model worth one more process writing its LP file
+ROWS_PER_WRITER = 100_000
+
+
+def wanted_threads(estimate: SizeEstimate, max_threads: int) -> int:
+    """Threads a solve may use well, by the size of its model."""
+    if estimate.integer_variables == 0:
+        # Simplex and barrier gain little from threads on the models we solve
+        return 1
+    return max(1, min(max_threads, math.ceil(estimate.nonzeros / NONZEROS_PER_THREAD)))
+
+
+def writer_processes(estimate: SizeEstimate, max_processes: int) -> int:
+    """
+    Processes writing the LP file of a model well, by its number of rows.
+
+    Worker processes are started and sent the model data for every file, so
+    models of fewer than `2 * ROWS_PER_WRITER` rows are written by one.
+    """
+    return max(1, min(max_processes, estimate.rows // ROWS_PER_WRITER))
+
+
+def thread_options(solver_name: str, threads: int) -> dict[str, int]:
+    """Solver options setting the number of threads of a solver."""
+    option = THREAD_OPTIONS.get(solver_name)
+    return {option: threads} if option is not None else {}
+
+
+def requested_threads(
+    solver_name: str,
+    solver_options: dict[str, Any],
+    threads: int | None,
+    estimate: Callable[[], SizeEstimate],
+) -> int:
+    """
+    Threads to ask the budget for a solve.
+
+    Args:
+        solver_name: Solvers without a thread option run on one thread
+        solver_options: A thread option set by the caller is asked for
+        threads: Threads asked for by the caller
+        estimate: Size estimate of the model, computed only when needed
+    """
+    option = THREAD_OPTIONS.get(solver_name)
+    if option is None:
+        return 1
+    if option in solver_options:
+        return int(solver_options[option])
+    if threads is not None:
+        return threads
+    return wanted_threads(estimate(), cores.max_per_solve)
+
+
+class CoreBudget:
+    """
+    Cores of the machine, shared by the solves running in its threads.
+
+    Args:
+        total: Cores to share, all of the machine by default
+        max_per_solve: Most threads a single solve is granted
+    """
+
+    def __init__(self, total: int | None = None, max_per_solve: int | None = None):
+        self.total = total or os.cpu_count() or 1
+        self.max_per_solve = max_per_solve or self.total
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def free(self) -> int:
+        return max(self.total - self.used, 0)
+
+    @property
+    def oversubscribed(self) -> int:
+        """Threads granted beyond the cores of the budget."""
+        return max(self.used - self.total, 0)
+
+    def acquire(self, wanted: int) -> int:
+        """
+        Take up to `wanted` cores, at least one, and return how many.
+
+        Never waits: with every core taken, the one core granted
+        oversubscribes the budget, see `oversubscribed`.
+        """
+        with self._lock:
+            granted = max(1, min(wanted, self.max_per_solve, self.free))
+            self.used += granted
+            return granted
+
+    def release(self, threads: int):
+        with self._lock:
+            self.used -= threads
+
+    @contextmanager
+    def reserve(self, wanted: int) -> Iterator[int]:
+        """Hold up to `wanted` cores while solving."""
+        threads = self.acquire(wanted)
+        try:
+            yield threads
+        finally:
+            self.release(threads)
+
+
+# Budget of the solves of this process
+cores = CoreBudget()
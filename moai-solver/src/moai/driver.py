@@ -0,0 +1,521 @@
+"""
+Asynchronous solver driver.
+
+`Model.solve` blocks its thread until the solver exits, and nothing stops it
+once started. `SolverProcess` runs the solver executable as a subprocess of
+the event loop instead:
+
+- the solve is awaited without blocking the event loop,
+- `stop()` interrupts the solver, which exits with the best solution found,
+- cancelling the awaiting task kills the solver and removes its files,
+- limits are passed to the solver, see `moai.limits`. A solver past its
+  time limit by `STOP_GRACE` seconds is stopped as `stop()` does, at once
+  for solvers without a time limit option,
+- a `memory_limit_mb` caps the address space of the solver process,
+- the progress of the search is parsed from the log of solvers with a log
+  parser, as the solver writes it, and followed with `updates()`.
+
+CBC problems are written from the model data by `moai.writer`, and their
+solutions read back by the names of the LP file, see `moai.solution`, so
+models solved from `ModelData` are never built in Pyomo. Problems of other
+solvers are written and solutions read by the Pyomo plugin of the solver,
+see `PluginSolve`, so only solvers run as executables, such as cbc and
+glpk, are supported.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+from collections.abc import AsyncIterator, Callable
+from typing import Any, TypeVar
+
+import pyomo.environ as pyo
+import pyomo.version
+from pyomo.common.tempfiles import TempfileManager
+from pyomo.opt import SolverResults
+from pyomo.opt.solver import SystemCallSolver
+
+from .cores import (
+    THREAD_OPTIONS,
+    cores,
+    requested_threads,
+    thread_options,
+    writer_processes,
+)
+from .estimate import SizeEstimate, estimate_size
+from .history import SolverConfig, record_solve
+from .limits import LIMIT_OPTIONS, limit_options
+from .model import Model, ModelData
+from .progress import LOG_PARSERS, SolveProgress
+from .results import ModelResult
+from .solution import SOLUTION_READERS, LPSolve
+from .writer import FragmentCache
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Seconds given to an interrupted solver to write its solution before it is
+# killed, and to a solver past its own time limit before it is interrupted
+STOP_GRACE = 5.0
+
+# Seconds between the progress updates sent to a follower of a solve
+PROGRESS_INTERVAL = 1.0
+
+# Runs a command with its standard output line buffered. Solvers buffer their
+# log in blocks when writing to a pipe, so their progress would only be read
+# in bursts, the last at exit. Only affects solvers writing through C stdio,
+# and is skipped where stdbuf is not installed.
+_STDBUF = shutil.which("stdbuf")
+
+# Runs a command with its address space capped: the limit is set before the
+# command replaces the wrapper, so no Python code runs between the fork and
+# the exec of the subprocess, which is unsafe in a process with threads
+_LIMIT_MEMORY = (
+    "import os, resource, sys; "
+    "limit = int(sys.argv[1]); "
+    "resource.setrlimit(resource.RLIMIT_AS, (limit, limit)); "
+    "os.execvp(sys.argv[2], sys.argv[2:])"
+)
+
+
+# Held while Pyomo plugins write problems and read solutions. They go through
+# the symbol maps of the Pyomo model, shared by solves of a model such as
+# those racing on it, and the stack of contexts of the TempfileManager, shared
+# by every solve of the process.
+_PYOMO_LOCK = threading.Lock()
+
+
+async def _finish(func: Callable[..., T], *args: Any) -> T:
+    """Run `func` in a thread, letting it finish when the caller is cancelled."""
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+def _pyomo(obj: Any, name: str) -> Any:
+    """A private member of Pyomo used by `PluginSolve`."""
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        raise RuntimeError(
+            f"Pyomo {pyomo.version.version} has no {type(obj).__name__}.{name}: "
+            "solves by Pyomo plugins need a version of Pyomo supported by moai"
+        ) from None
+
+
+class PluginSolve:
+    """
+    A solve by the Pyomo plugin of a solver run as an executable.
+
+    `SystemCallSolver.solve` writes the problem, runs the solver and reads
+    its solution in one blocking call. The driver runs the solver itself, so
+    the steps around it are called apart, through private members of Pyomo
+    kept to this class: `_presolve`, `_command`, `_smap_id`, `_soln_file`,
+    `_log_file`, and `_rc` and `_log`, set as `_apply_solver` does. The
+    versions of Pyomo they are known in are pinned in pyproject.toml.
+
+    Plugins write problems and read solutions one solve at a time, so solves
+    of a model by a plugin can run at once.
+
+    Args:
+        opt: The plugin
+    """
+
+    def __init__(self, opt: SystemCallSolver):
+        self.opt = opt
+        # The Pyomo model written, and the temporary files of the solve
+        self._pyomo_model: pyo.ConcreteModel | None = None
+        self._files: list[str] = []
+
+    def write(self, model: Model) -> tuple[list[str], dict[str, str], str | None]:
+        """
+        Write the problem of a model, building it first if needed.
+
+        Returns:
+            The command running the solver, its environment and directory
+        """
+        with _PYOMO_LOCK:
+            pyomo_model = model.pyomo_model
+            # The temporary files are removed by the solve, which can end in
+            # another thread than the one writing them
+            TempfileManager.push()
+            try:
+                self._pyomo_model = pyomo_model
+                _pyomo(self.opt, "_presolve")(pyomo_model)
+            finally:
+                context = TempfileManager.context()
+                self._files = [name for _, name in context.tempfiles]
+                TempfileManager.pop(remove=False)
+        command = _pyomo(self.opt, "_command")
+        return command.cmd, command.env, command.cwd if "cwd" in command else None
+
+    def read(self, rc: int, log: str) -> SolverResults:
+        """Read the results written by the solver, given its exit code and log."""
+        assert self._pyomo_model is not None
+        opt = self.opt
+        opt._rc = rc
+        opt._log = log
+        log_file = _pyomo(opt, "_log_file")
+        if log_file is not None:
+            with open(log_file, "w") as f:
+                f.write(log)
+        with _PYOMO_LOCK:
+            solver_results = opt.process_output(rc)
+            symbol_map = self._pyomo_model.solutions.symbol_map
+            solver_results._smap = symbol_map.pop(_pyomo(opt, "_smap_id"))
+        return solver_results
+
+    def cleanup(self):
+        """Remove the files and symbol map of the solve, if it wrote a problem."""
+        if self._pyomo_model is None:
+            return
+        symbol_map = self._pyomo_model.solutions.symbol_map
+        symbol_map.pop(getattr(self.opt, "_smap_id", None), None)
+        for name in [*self._files, getattr(self.opt, "_soln_file", None)]:
+            if name is not None and os.path.exists(name):
+                os.remove(name)
+        self._files = []
+        self._pyomo_model = None
+
+
+class SolverProcess:
+    """
+    A solve of a model by a solver subprocess.
+
+    Args:
+        model: Model to solve, or its data
+        solver_name: Name of the solver executable (default: "cbc")
+        time_limit: Seconds the solver may run, unlimited by default
+        mip_gap: Relative gap at which the solver stops
+        node_limit: Nodes the solver may explore
+        memory_limit_mb: Megabytes of address space of the solver process
+        threads: Threads to ask for, see `Model.solve`
+        cache: Rows of constraint families of earlier LP files to reuse,
+            those of the model by default, see `Model.fragments`
+        model_fingerprint: Fingerprint of the model, recorded with the solve
+            in the history of solves, computed when not given
+        estimate: Size estimate of the model, likewise
+        **solver_options: Additional options to pass to the solver
+
+    Raises:
+        ValueError: If the solver does not run as an executable, has no
+            option for a limit that is set, or memory limits are not
+            supported on the platform
+
+    Example:
+        >>> process = SolverProcess(model, time_limit=60)
+        >>> task = asyncio.create_task(process.run())
+        >>> process.stop()  # keep the best solution found so far
+        >>> result = await task
+    """
+
+    def __init__(
+        self,
+        model: Model | ModelData,
+        solver_name: str = "cbc",
+        time_limit: float | None = None,
+        mip_gap: float | None = None,
+        node_limit: int | None = None,
+        memory_limit_mb: int | None = None,
+        threads: int | None = None,
+        cache: FragmentCache | None = None,
+        model_fingerprint: str | None = None,
+        estimate: SizeEstimate | None = None,
+        **solver_options,
+    ):
+        self.solver = pyo.SolverFactory(solver_name)
+        if not isinstance(self.solver, SystemCallSolver):
+            raise ValueError(f"Solver {solver_name} does not run as an executable")
+        if memory_limit_mb is not None and resource is None:
+            raise ValueError("Memory limits are not supported on this platform")
+        self.limits = limit_options(
+            solver_name,
+            node_limit=node_limit,
+            mip_gap=mip_gap,
+            time_limit=(
+                time_limit
+                if "time_limit" in LIMIT_OPTIONS.get(solver_name, {})
+                else None
+            ),
+        )
+        if isinstance(model, ModelData):
+            self.data, self._model = model, None
+        else:
+            self.data, self._model = model.to_data(), model
+            cache = cache if cache is not None else model.fragments
+        self._lp = (
+            LPSolve(solver_name, self.data, cache)
+            if solver_name in SOLUTION_READERS
+            else None
+        )
+        self._plugin = PluginSolve(self.solver) if self._lp is None else None
+        self.solver_name = solver_name
+        self.model_fingerprint = model_fingerprint
+        self.estimate = estimate
+        self.time_limit = time_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.threads = threads
+        self.solver_options = solver_options
+        self.log: list[str] = []
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.stopped = False
+        self._process: asyncio.subprocess.Process | None = None
+        self._kill: asyncio.TimerHandle | None = None
+        self.threads_used: int | None = None
+
+        parser = LOG_PARSERS.get(solver_name)
+        objective = self.data.objective
+        sense = objective.sense if objective is not None else "min"
+        self._parser = parser(sense) if parser is not None else None
+        self.progress = (
+            self._parser.progress if self._parser is not None else SolveProgress()
+        )
+        # Updates of the progress, and the event set at the next one
+        self._updates = 0
+        self._updated = asyncio.Event()
+
+    @property
+    def model(self) -> Model:
+        """The model, built from its data when solved by a Pyomo plugin."""
+        if self._model is None:
+            self._model = Model.from_data(self.data)
+        return self._model
+
+    @property
+    def elapsed(self) -> float | None:
+        """Seconds the solver has run, None before it starts."""
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    def stop(self):
+        """
+        Interrupt the solver, which exits with the best solution found.
+
+        The solver is killed when it has not exited after `STOP_GRACE`
+        seconds. Call it from the event loop running the solve.
+        """
+        self.stopped = True
+        if not self.running:
+            # Solves stopped before the solver starts stop as soon as it does
+            return
+        self._process.send_signal(signal.SIGINT)
+        if self._kill is None:
+            loop = asyncio.get_running_loop()
+            self._kill = loop.call_later(STOP_GRACE, self._terminate)
+
+    async def updates(
+        self, interval: float | None = None
+    ) -> AsyncIterator[SolveProgress]:
+        """
+        Follow the progress of the solve until the solver exits.
+
+        Every update of the progress is sent, at most one every `interval`
+        seconds, `PROGRESS_INTERVAL` by default, and the progress at exit last.
+        """
+        interval = PROGRESS_INTERVAL if interval is None else interval
+        sent = 0
+        while True:
+            updated = self._updated
+            if self._updates != sent:
+                sent = self._updates
+                yield self.progress.model_copy()
+                if self.finished is not None:
+                    return
+                await asyncio.sleep(interval)
+                continue
+            if self.finished is not None:
+                return
+            await updated.wait()
+
+    def _publish(self):
+        self.progress.elapsed = self.elapsed or 0.0
+        self._updates += 1
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def _terminate(self):
+        if self.running:
+            self._process.kill()
+
+    async def run(self) -> ModelResult:
+        """
+        Solve the model and return its results.
+
+        Solves stopped, or stopped at a limit, return the best solution found
+        with the "stopped" status. Completed solves are recorded in the
+        history of solves, see `moai.history`.
+        """
+        started = time.perf_counter()
+        result = await self.load(await self.execute())
+        config = SolverConfig(solver_name=self.solver_name, options=self.solver_options)
+        await _finish(
+            record_solve,
+            self.data,
+            config,
+            result,
+            time.perf_counter() - started,
+            self.estimate,
+            self.model_fingerprint,
+        )
+        return result
+
+    async def execute(self) -> SolverResults | ModelResult:
+        """
+        Run the solver, and return the results of the solve.
+
+        Solves of LP files written by `moai.writer` return their results.
+        Others return the Pyomo results of the solve, whose solution is not
+        loaded into the model yet, see `load`, so that solves racing on a
+        model load the solution of the winner only.
+        """
+        opt = self.solver
+        opt.available(exception_flag=True)
+        option = THREAD_OPTIONS.get(self.solver_name)
+        estimate = functools.cache(lambda: self.estimate or estimate_size(self.data))
+        wanted = requested_threads(
+            self.solver_name, self.solver_options, self.threads, estimate
+        )
+        writers = (
+            writer_processes(estimate(), cores.max_per_solve)
+            if self._lp is not None
+            else 1
+        )
+        with cores.reserve(max(wanted, writers)) as granted:
+            # The solver runs on the threads granted, whatever it was asked,
+            # after the processes writing its LP file
+            threads = min(granted, wanted)
+            options = {
+                **self.limits,
+                **self.solver_options,
+                **thread_options(self.solver_name, threads),
+            }
+            self.threads_used = threads if option is not None else 1
+
+            try:
+                if self._lp is not None:
+                    command = await _finish(
+                        self._lp.write,
+                        opt.executable(),
+                        options,
+                        min(granted, writers),
+                    )
+                    await self._execute(command)
+                    return await _finish(self._lp.read)
+                assert self._plugin is not None
+                for key, value in options.items():
+                    opt.options[key] = value
+                command, env, cwd = await _finish(self._plugin.write, self.model)
+                rc = await self._execute(command, env, cwd)
+                return await _finish(self._plugin.read, rc, "".join(self.log))
+            finally:
+                self._cleanup()
+                if self.finished is None:
+                    # Failed before the solver started, end the updates
+                    self.finished = time.monotonic()
+                    self._publish()
+
+    async def load(self, solver_results: SolverResults | ModelResult) -> ModelResult:
+        """Load the solution of results of `execute` into the model."""
+        if isinstance(solver_results, ModelResult):
+            result = solver_results
+            result.set_bound(self.progress.bound)
+            if self._parser is not None and self._parser.parsed:
+                result.solver_info.nodes = self.progress.nodes
+        else:
+            result = await _finish(
+                ModelResult.from_solver_results,
+                self.model.pyomo_model,
+                solver_results,
+                self.data,
+                self.progress.bound,
+            )
+        if result.solver_info.solve_time is None:
+            result.solver_info.solve_time = self.elapsed
+        result.solver_info.threads = self.threads_used
+        return result
+
+    async def _execute(
+        self,
+        command: list[str],
+        env: dict[str, str] | None = None,
+        cwd: str | None = None,
+    ) -> int:
+        """Run the solver until it exits, and return its exit code."""
+        if _STDBUF is not None:
+            command = [_STDBUF, "-oL", *command]
+        if self.memory_limit_mb:
+            limit = self.memory_limit_mb * 1024 * 1024
+            command = [sys.executable, "-c", _LIMIT_MEMORY, str(limit), *command]
+        self._process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env,
+            cwd=cwd,
+        )
+        self.started = time.monotonic()
+        if self.stopped:
+            self.stop()
+
+        deadline = None
+        if self.time_limit is not None:
+            delay = self.time_limit
+            if "time_limit" in LIMIT_OPTIONS.get(self.solver_name, {}):
+                delay += STOP_GRACE
+            loop = asyncio.get_running_loop()
+            deadline = loop.call_later(delay, self.stop)
+        try:
+            async for line in self._process.stdout:
+                text = line.decode(errors="replace")
+                self.log.append(text)
+                if self._parser is not None and self._parser.feed(text):
+                    self._publish()
+            return await self._process.wait()
+        except BaseException:
+            self._terminate()
+            await self._process.wait()
+            raise
+        finally:
+            self.finished = time.monotonic()
+            self._publish()
+            if deadline is not None:
+                deadline.cancel()
+            if self._kill is not None:
+                self._kill.cancel()
+
+    def _cleanup(self):
+        """
+        Remove the files of the solve, whether it completed or not.
+
+        Failures are logged, so they never replace the error of the solve.
+        """
+        try:
+            if self._lp is not None:
+                self._lp.cleanup()
+            elif self._plugin is not None:
+                self._plugin.cleanup()
+        except Exception:
+            logger.warning(
+                "Could not clean up a solve of %s", self.data.name, exc_info=True
+            )
@@ -0,0 +1,162 @@
+"""
+Estimate the size of a model from its data, without expanding it.
+
+Counts are computed from set cardinalities:
+
+- a variable has a column per element of the product of its index sets,
+  or per index of its support,
+- a constraint has a row per element of the product of its quantifier
+  sets, scaled by the selectivity of its conditions,
+- a row has a nonzero per variable reference, with sums multiplying the
+  references of their body by the size of their domain.
+
+Conditions are not evaluated. Their selectivity is estimated from the size
+of the domains of the index variables they compare: an equality keeps one
+element in `n`, an inequality `ne` all but one, and an ordering half of
+them. Row counts are exact when no quantifier has a condition and every
+set is defined. Nonzeros are an upper bound, as references to the same
+variable in a row are counted separately, with sparse variables counted by
+the density of their support.
+"""
+
+import math
+
+from pydantic import BaseModel
+
+from . import ir
+from .ir import Node
+from .model import ModelData
+
+# Selectivity of orderings, and of comparisons of values other than indices
+ORDER_SELECTIVITY = 0.5
+
+_INTEGER_DOMAINS = ("Integers", "NonNegativeIntegers", "Binary")
+
+
+class ConstraintSize(BaseModel):
+    """Estimated size of a constraint family"""
+
+    name: str
+    rows: int
+    nonzeros: int
+
+
+class SizeEstimate(BaseModel):
+    """Estimated size of a model"""
+
+    variables: int
+    integer_variables: int
+    rows: int
+    nonzeros: int
+    # Whether variables and rows are exact counts rather than estimates
+    exact: bool
+    constraints: list[ConstraintSize]
+
+
+class _Estimator:
+    def __init__(self, data: ModelData):
+        self.data = data
+        self.set_sizes = {s.name: s.size for s in data.sets}
+        self.exact = True
+        # Columns of every variable, and the share of its index product they cover
+        self.columns: dict[str, int] = {}
+        self.density: dict[str, float] = {}
+        parameters = {p.name: p for p in data.parameters}
+        for v in data.variables:
+            full = math.prod(self._size(s) for s in v.indices)
+            columns = full
+            if v.support is not None and v.support.set is not None:
+                columns = self._size(v.support.set)
+            elif v.support is not None:
+                p = parameters.get(v.support.parameter)  # type: ignore[arg-type]
+                columns = len(p.values) if p and isinstance(p.values, list) else 0
+            self.columns[v.name] = columns
+            self.density[v.name] = columns / full if full else 0.0
+
+    def _size(self, set_name: str) -> int:
+        # Missing sets are reported by the validator, count them as empty
+        if set_name not in self.set_sizes:
+            self.exact = False
+            return 0
+        return self.set_sizes[set_name]
+
+    def estimate(self) -> SizeEstimate:
+        constraints = []
+        for c in self.data.constraints:
+            scope: dict[str, int] = {}
+            rows = 1.0
+            for q in c.quantifiers or []:
+                size = self._size(q.over)
+                rows *= size
+                for name in q.index_names:
+                    scope[name] = size
+            for q in c.quantifiers or []:
+                if q.condition is not None:
+                    self.exact = False
+                    rows *= self._selectivity(ir.lower(q.condition), scope)
+            terms = self._terms(ir.lower(c.expr), scope)
+            constraints.append(
+                ConstraintSize(
+                    name=c.name, rows=round(rows), nonzeros=math.ceil(rows * terms)
+                )
+            )
+        integers = sum(
+            self.columns[v.name]
+            for v in self.data.variables
+            if v.domain in _INTEGER_DOMAINS
+        )
+        return SizeEstimate(
+            variables=sum(self.columns.values()),
+            integer_variables=integers,
+            rows=sum(c.rows for c in constraints),
+            nonzeros=sum(c.nonzeros for c in constraints),
+            exact=self.exact,
+            constraints=constraints,
+        )
+
+    def _terms(self, node: Node, scope: dict[str, int]) -> float:
+        """Expected number of variable references of a node, per row."""
+        kind = node.kind
+        if kind == ir.VAR:
+            name = node.args[0]
+            if name.startswith("_idx_") and name[5:] in scope:
+                return 0.0
+            return self.density.get(name, 1.0)
+        if kind == ir.AGG:
+            _, body, bindings, condition = node.args
+            inner = dict(scope)
+            count = 1.0
+            for index_var, set_name in bindings:
+                size = self._size(set_name)
+                count *= size
+                for name in ir.binding_names(index_var):
+                    inner[name] = size
+            if condition is not None:
+                count *= self._selectivity(condition, inner)
+            return count * self._terms(body, inner)
+        if kind in (ir.BINARY, ir.UNARY, ir.CMP):
+            return sum(
+                self._terms(arg, scope) for arg in node.args if isinstance(arg, Node)
+            )
+        return 0.0
+
+    def _selectivity(self, condition: Node, scope: dict[str, int]) -> float:
+        """Estimated share of index combinations satisfying a condition."""
+        op, left, right = condition.args
+        domains = [scope[name] for name in (left.free | right.free) if name in scope]
+        n = max(domains, default=0)
+        if op == "eq":
+            return 1 / n if n else ORDER_SELECTIVITY
+        if op == "ne":
+            return 1 - 1 / n if n else ORDER_SELECTIVITY
+        return ORDER_SELECTIVITY
+
+
+def estimate_size(data: ModelData) -> SizeEstimate:
+    """
+    Estimate the number of variables, rows and nonzeros of a model.
+
+    Nothing is expanded, so the estimate takes time proportional to the size
+    of the model description, not of the model.
+    """
+    return _Estimator(data).estimate()
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from typing import Literal
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, RootModel
+from pydantic import BaseModel, Field, RootModel
 
 
 class NumberExpr(BaseModel):
@@ -43,6 +43,34 @@ class IndexVariableExpr(BaseModel):
         return IndexVariableExpr(type="index_variable", name=name)
 
 
+class IndexShiftExpr(BaseModel):
+    """
+    Element `offset` positions away from an index value in an ordered set.
+
+    An offset of -1 is the predecessor and 1 the successor, e.g. the previous
+    period of `t` in `T`. With `cyclic` the set wraps around, otherwise
+    shifting past either end of the set is an error.
+    """
+
+    type: Literal["index_shift"]
+    index: str
+    set_name: str
+    offset: int
+    cyclic: bool = False
+
+    @classmethod
+    def create(
+        cls, index: str, over: str, offset: int, cyclic: bool = False
+    ) -> IndexShiftExpr:
+        return IndexShiftExpr(
+            type="index_shift",
+            index=index,
+            set_name=over,
+            offset=offset,
+            cyclic=cyclic,
+        )
+
+
 class VariableExpr(BaseModel):
     """Variable reference in an expression"""
 
@@ -106,7 +134,13 @@ class BinaryOp(BaseModel):
 # It includes basic expressions but excludes VariableExpr and ParameterExpr to avoid circular dependencies
 # StringExpr is included for string literals in indices
 # More complex validation can be done at parse/build time if needed
-IndexExprType = StringExpr | NumberExpr | IndexVariableExpr | BinaryOp | UnaryOp
+# Both unions are discriminated on the `type` literal so that validation and
+# serialization dispatch straight to the matching model instead of trying
+# every member at every node of the tree.
+IndexExprType = Annotated[
+    StringExpr | NumberExpr | IndexVariableExpr | IndexShiftExpr | BinaryOp | UnaryOp,
+    Field(discriminator="type"),
+]
 
 binary_op_to_symbol = {
     "add": "+",
@@ -133,6 +167,12 @@ def index_expr_to_string(expr: IndexExprType) -> str:
         return expr.value
     elif expr.type == "index_variable":
         return expr.name
+    elif expr.type == "index_shift":
+        wrap = "w" if expr.cyclic else ""
+        if expr.offset in (-1, 1):
+            name = "prev" if expr.offset == -1 else "next"
+            return f"{name}{wrap}({expr.index} in {expr.set_name})"
+        return f"shift{wrap}({expr.index} in {expr.set_name}, {expr.offset})"
     elif expr.type == "unary_op":
         # For unary ops, we need to handle the nested expr carefully
         # Since UnaryOp.expr is ExprType, we handle it recursively
@@ -216,12 +256,20 @@ def expr_to_string(expr: ExprType) -> str:
     elif expr.type == "aggregation":
         # Handle aggregation expressions
         bindings_str = ", ".join(
-            f"{b.index_var} in {b.set_name}" for b in expr.bindings
+            f"{index_names_to_string(b.index_var)} in {b.set_name}"
+            for b in expr.bindings
         )
         return f"{expr.op}({expr_to_string(expr.expr)} for {bindings_str})"
     return str(expr)  # Fallback for unexpected types
 
 
+def index_names_to_string(index: str | list[str]) -> str:
+    """Display one index name, or several bound to a tuple set as (i, j)."""
+    if isinstance(index, str):
+        return index
+    return f"({', '.join(index)})"
+
+
 ComparisonOpType = Literal["le", "lt", "eq", "gt", "ge", "ne"]
 comparison_op_to_symbol = {
     "le": "<=",
@@ -262,16 +310,28 @@ AggOpType = Literal["sum", "prod", "min", "max"]
 
 
 class IndexBinding(BaseModel):
-    """Binding of an index variable to a set in an aggregation expression."""
+    """
+    Binding of an index variable to a set in an aggregation expression.
+
+    Elements of a tuple set are bound to a list of index variables, one per
+    component, e.g. `["i", "j"]` over a set of arcs.
+    """
 
     type: Literal["index_binding"]
-    index_var: str
+    index_var: str | list[str]
     set_name: str
 
     @classmethod
-    def create(cls, index: str, over: str) -> IndexBinding:
+    def create(cls, index: str | list[str], over: str) -> IndexBinding:
         return IndexBinding(type="index_binding", index_var=index, set_name=over)
 
+    @property
+    def index_names(self) -> list[str]:
+        """Names of the index variables bound by this binding"""
+        if isinstance(self.index_var, str):
+            return [self.index_var]
+        return self.index_var
+
 
 class AggregationExpression(BaseModel):
     """An aggregation expression in the optimization problem."""
@@ -301,7 +361,7 @@ class AggregationExpression(BaseModel):
 
 # Update ExprType to include AggregationExpression now that it's defined
 # This allows aggregations to be used in binary operations and comparisons
-ExprType = (
+ExprType = Annotated[
     NumberExpr
     | StringExpr
     | IndexVariableExpr
@@ -309,8 +369,9 @@ ExprType = (
     | ParameterExpr
     | BinaryOp
     | UnaryOp
-    | AggregationExpression
-)
+    | AggregationExpression,
+    Field(discriminator="type"),
+]
 
 
 class Expression(
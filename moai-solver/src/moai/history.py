@@ -0,0 +1,480 @@
+"""
+History of solves, and the choice of solvers from it.
+
+Models built from one template on different data share a fingerprint, see
+`moai.templates.fingerprint`, and a solver fast on one of them is likely
+fast on the others. `SolveHistory` records every solve of a fingerprint in
+a SQLite database: the size of the model, the solver and options it ran
+with, its duration and its outcome. The oldest solves are deleted beyond
+`max_per_fingerprint` solves of a fingerprint and `max_records` in total.
+
+`Recommender` chooses the solver configuration of the next solve of a
+fingerprint from its history:
+
+- the fastest configuration wins, by its mean seconds per nonzero over the
+  solves it proved optimal, infeasible or unbounded, so solves of models of
+  different sizes compare,
+- with probability `exploration` another configuration is tried instead,
+  those never tried first, so a configuration that was unlucky once, or
+  was never tried, gets its chance.
+
+Every completed solve of the process is recorded in `history`: those of
+`Model.solve` and `SolverProcess.run`, so of the API, and every solver
+finishing a race of the portfolio, see `moai.portfolio`. It is kept in
+memory, or in the database file the `MOAI_HISTORY` environment variable
+names, and `persist_history` moves it to another file. Solves that cannot be recorded
+are logged, and their results returned all the same, as are
+recommendations made without a history that cannot be read.
+`Model.solve(solver_name="auto")` solves with the recommended configuration,
+and the API with `solver=auto`.
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import pyomo.environ as pyo
+from pydantic import BaseModel, Field
+from pyomo.opt.solver import SystemCallSolver
+
+from .estimate import SizeEstimate, estimate_size
+from .limits import limit_options
+from .model import ModelData
+from .results import ModelResult
+from .templates import fingerprint
+
+if TYPE_CHECKING:
+    from .model import Model
+
+logger = logging.getLogger(__name__)
+
+# Database of the history of the process, unless the environment variable
+# `HISTORY_ENV` names a file
+DEFAULT_HISTORY_PATH = ":memory:"
+HISTORY_ENV = "MOAI_HISTORY"
+
+# Solves kept per fingerprint, and in total, by default
+MAX_PER_FINGERPRINT = 1000
+MAX_RECORDS = 100_000
+
+# Most recent solves of a fingerprint a recommendation is made from
+RECENT_RECORDS = 200
+
+# Solvers recommended and raced by default, those installed are recommended,
+# and those of them run as executables are raced, see `moai.portfolio`
+DEFAULT_SOLVERS = ["cbc", "highs", "glpk", "scip", "gurobi", "cplex"]
+
+# Statuses of solves proven by the solver, the only ones timed
+_PROVEN = {"optimal", "infeasible", "unbounded"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solves (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    variables INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    nonzeros INTEGER NOT NULL,
+    solver_name TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    objective REAL,
+    solved_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS solves_fingerprint ON solves (fingerprint);
+"""
+
+
+class SolverConfig(BaseModel):
+    """A solver of a portfolio, with the options it runs with."""
+
+    solver_name: str
+    options: dict[str, Any] = Field(default_factory=dict)
+    # Name of the entry, the name of the solver by default
+    name: str | None = None
+
+    @property
+    def label(self) -> str:
+        return self.name or self.solver_name
+
+
+class SolveRecord(BaseModel):
+    """A solve of a model of a fingerprint."""
+
+    fingerprint: str
+    variables: int
+    rows: int
+    nonzeros: int
+    solver_name: str
+    options: dict
+    status: str
+    seconds: float
+    objective: float | None = None
+    # Unix time the solve finished at
+    solved_at: float
+
+    @property
+    def config(self) -> SolverConfig:
+        return SolverConfig(solver_name=self.solver_name, options=self.options)
+
+
+def _key(config: SolverConfig) -> tuple[str, str]:
+    """Identity of a configuration, whatever its name."""
+    return config.solver_name, json.dumps(config.options, sort_keys=True)
+
+
+class SolveHistory:
+    """
+    Solves recorded in a SQLite database, safe to share between threads.
+
+    Args:
+        path: Database file, created with its directory on first use, or
+            ":memory:" for a history kept in memory
+        max_per_fingerprint: Solves kept per fingerprint, the oldest
+            deleted first
+        max_records: Solves kept in total, the oldest deleted first
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ":memory:",
+        max_per_fingerprint: int = MAX_PER_FINGERPRINT,
+        max_records: int = MAX_RECORDS,
+    ):
+        self.path = path
+        self.max_per_fingerprint = max_per_fingerprint
+        self.max_records = max_records
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if str(self.path) != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def record(
+        self,
+        model_fingerprint: str,
+        estimate: SizeEstimate,
+        config: SolverConfig,
+        result: ModelResult,
+        seconds: float,
+    ) -> SolveRecord:
+        """Record a solve that took `seconds`, deleting the oldest beyond the caps."""
+        objective = result.objective.value if result.objective is not None else None
+        record = SolveRecord(
+            fingerprint=model_fingerprint,
+            variables=estimate.variables,
+            rows=estimate.rows,
+            nonzeros=estimate.nonzeros,
+            solver_name=config.solver_name,
+            options=config.options,
+            status=result.status,
+            seconds=seconds,
+            objective=objective,
+            solved_at=time.time(),
+        )
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO solves (fingerprint, variables, rows, nonzeros, "
+                    "solver_name, options, status, seconds, objective, solved_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record.fingerprint,
+                        record.variables,
+                        record.rows,
+                        record.nonzeros,
+                        record.solver_name,
+                        _key(config)[1],
+                        record.status,
+                        record.seconds,
+                        record.objective,
+                        record.solved_at,
+                    ),
+                )
+                connection.execute(
+                    "DELETE FROM solves WHERE fingerprint = ? AND id NOT IN "
+                    "(SELECT id FROM solves WHERE fingerprint = ? "
+                    "ORDER BY id DESC LIMIT ?)",
+                    (
+                        record.fingerprint,
+                        record.fingerprint,
+                        self.max_per_fingerprint,
+                    ),
+                )
+                # Ids grow with every solve, the oldest have the smallest
+                assert cursor.lastrowid is not None
+                connection.execute(
+                    "DELETE FROM solves WHERE id <= ?",
+                    (cursor.lastrowid - self.max_records,),
+                )
+        return record
+
+    def records(
+        self, model_fingerprint: str, limit: int | None = None
+    ) -> list[SolveRecord]:
+        """Solves of models of a fingerprint, the `limit` most recent, oldest first."""
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT fingerprint, variables, rows, nonzeros, solver_name, "
+                    "options, status, seconds, objective, solved_at FROM solves "
+                    "WHERE fingerprint = ? ORDER BY id DESC LIMIT ?",
+                    (model_fingerprint, limit if limit is not None else -1),
+                )
+                .fetchall()
+            )
+        rows.reverse()
+        fields = list(SolveRecord.model_fields)
+        return [
+            SolveRecord(
+                **{**dict(zip(fields, row, strict=True)), "options": json.loads(row[5])}
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def installed(configs: list[SolverConfig]) -> list[SolverConfig]:
+    """Solver configurations of installed solvers."""
+    return [
+        config
+        for config in configs
+        if pyo.SolverFactory(config.solver_name).available(exception_flag=False)
+    ]
+
+
+def _supports(
+    solver_name: str,
+    time_limit: float | None,
+    mip_gap: float | None,
+    node_limit: int | None,
+) -> bool:
+    try:
+        limit_options(solver_name, time_limit, mip_gap, node_limit)
+    except ValueError:
+        return False
+    return True
+
+
+def _rates(records: list[SolveRecord]) -> dict[tuple[str, str], float]:
+    rates: dict[tuple[str, str], list[float]] = {}
+    for record in records:
+        if record.status in _PROVEN:
+            rates.setdefault(_key(record.config), []).append(
+                record.seconds / max(record.nonzeros, 1)
+            )
+    return {key: sum(values) / len(values) for key, values in rates.items()}
+
+
+class Recommender:
+    """
+    Chooses solver configurations from the history of solves.
+
+    Args:
+        history: Solves of past models
+        configs: Configurations to choose from, along with those in the
+            history, every installed one of `DEFAULT_SOLVERS` by default
+        exploration: Probability of trying another configuration than the
+            fastest
+        seed: Seed of the choice of configurations to explore
+
+    Raises:
+        ValueError: If exploration is not a probability
+    """
+
+    def __init__(
+        self,
+        history: SolveHistory,
+        configs: list[SolverConfig] | None = None,
+        exploration: float = 0.1,
+        seed: int | None = None,
+    ):
+        if not 0 <= exploration <= 1:
+            raise ValueError("Exploration must be between 0 and 1")
+        self.history = history
+        self._configs = configs
+        self.exploration = exploration
+        self._random = random.Random(seed)
+
+    @property
+    def configs(self) -> list[SolverConfig]:
+        if self._configs is None:
+            self._configs = installed(
+                [SolverConfig(solver_name=name) for name in DEFAULT_SOLVERS]
+            )
+        return self._configs
+
+    def rates(self, model_fingerprint: str) -> dict[tuple[str, str], float]:
+        """
+        Mean seconds per nonzero of the proven solves of every configuration,
+        over the `RECENT_RECORDS` most recent solves of a fingerprint.
+        """
+        return _rates(self.history.records(model_fingerprint, RECENT_RECORDS))
+
+    def recommend(
+        self,
+        model_fingerprint: str,
+        time_limit: float | None = None,
+        mip_gap: float | None = None,
+        node_limit: int | None = None,
+        executable: bool = False,
+    ) -> SolverConfig:
+        """
+        Configuration of the next solve of a model of a fingerprint.
+
+        Only configurations of solvers with an option for every limit set
+        are chosen from, and of solvers run as executables with
+        `executable`, as `SolverProcess` requires.
+
+        Raises:
+            ValueError: If there is no configuration to choose from
+        """
+        try:
+            records = self.history.records(model_fingerprint, RECENT_RECORDS)
+        except sqlite3.Error:
+            logger.warning("Could not read the history of solves", exc_info=True)
+            records = []
+        candidates = {_key(config): config for config in self.configs}
+        for record in records:
+            candidates.setdefault(_key(record.config), record.config)
+        candidates = {
+            key: config
+            for key, config in candidates.items()
+            if _supports(config.solver_name, time_limit, mip_gap, node_limit)
+            and (
+                not executable
+                or isinstance(pyo.SolverFactory(config.solver_name), SystemCallSolver)
+            )
+        }
+        if not candidates:
+            raise ValueError("No solver to recommend")
+
+        tried = {_key(record.config) for record in records}
+        untried = [config for key, config in candidates.items() if key not in tried]
+        rates = _rates(records)
+        if not rates:
+            # Nothing proven yet, every configuration is worth trying
+            return untried[0] if untried else next(iter(candidates.values()))
+
+        fastest = min(rates, key=rates.__getitem__)
+        alternatives = untried or [
+            config for key, config in candidates.items() if key != fastest
+        ]
+        if alternatives and self._random.random() < self.exploration:
+            return self._random.choice(alternatives)
+        return candidates[fastest]
+
+    def solve(
+        self,
+        model: "Model",
+        threads: int | None = None,
+        time_limit: float | None = None,
+        mip_gap: float | None = None,
+        node_limit: int | None = None,
+        **solver_options,
+    ) -> ModelResult:
+        """
+        Solve a model with the recommended configuration.
+
+        Arguments are those of `Model.solve`, which records the solve. Solver
+        options override those of the configuration, and are recorded with
+        them.
+        """
+        model_fingerprint = fingerprint(model.to_data())
+        config = self.recommend(model_fingerprint, time_limit, mip_gap, node_limit)
+        config = SolverConfig(
+            solver_name=config.solver_name,
+            options={**config.options, **solver_options},
+        )
+        return model.solve(
+            config.solver_name,
+            threads=threads,
+            time_limit=time_limit,
+            mip_gap=mip_gap,
+            node_limit=node_limit,
+            **config.options,
+        )
+
+
+def history_path() -> str:
+    """Database file of the history of the process, see `HISTORY_ENV`."""
+    return os.environ.get(HISTORY_ENV) or DEFAULT_HISTORY_PATH
+
+
+# History and recommender of the solves of this process, see `Model.solve`
+history = SolveHistory(history_path())
+recommender = Recommender(history)
+
+
+def persist_history(path: str | Path) -> SolveHistory:
+    """
+    Keep the history of the process in another database file.
+
+    Args:
+        path: Database file, created with its directory on first use, or
+            ":memory:"
+
+    Returns:
+        The new history, the previous one is closed
+    """
+    global history
+    previous = history
+    history = SolveHistory(path)
+    previous.close()
+    recommender.history = history
+    return history
+
+
+def record_solve(
+    data: ModelData,
+    config: SolverConfig,
+    result: ModelResult,
+    seconds: float,
+    estimate: SizeEstimate | None = None,
+    model_fingerprint: str | None = None,
+) -> SolveRecord | None:
+    """
+    Record a solve of a model in the history of the process.
+
+    Failures are logged instead of raised, so they do not fail the solve.
+
+    Args:
+        data: The model solved
+        config: Solver and options the model was solved with
+        result: Results of the solve, whose status and objective are recorded
+        seconds: Duration of the solve
+        estimate: Size estimate of the model, computed when not given
+        model_fingerprint: Fingerprint of the model, computed when not given
+
+    Returns:
+        The record, or None if the solve could not be recorded
+    """
+    try:
+        return history.record(
+            model_fingerprint if model_fingerprint is not None else fingerprint(data),
+            estimate if estimate is not None else estimate_size(data),
+            config,
+            result,
+            seconds,
+        )
+    except Exception:
+        logger.warning("Could not record a solve of %s", data.name, exc_info=True)
+        return None
@@ -0,0 +1,255 @@
+"""
+Compact intermediate representation (IR) for moai expressions.
+
+The Pydantic expression models are the serialization format. Before building a
+model they are lowered into IR nodes, which the parser works on instead:
+
+- every node is a small `__slots__` object holding a kind and a flat tuple of
+  arguments,
+- names are interned,
+- nodes are hash-consed, so structurally identical subtrees are stored once
+  and any work cached on a node is shared by every place it appears.
+"""
+
+import hashlib
+import sys
+import threading
+import weakref
+from typing import Any
+
+from .expressions import (
+    AggregationExpression,
+    BinaryOp,
+    ComparisonExpression,
+    IndexComparisonExpr,
+    IndexShiftExpr,
+    IndexVariableExpr,
+    NumberExpr,
+    ParameterExpr,
+    StringExpr,
+    UnaryOp,
+    VariableExpr,
+)
+
+NUM = "number"
+STR = "string"
+IDX = "index_variable"
+SHIFT = "index_shift"
+VAR = "variable"
+PARAM = "parameter"
+UNARY = "unary_op"
+BINARY = "binary_op"
+AGG = "aggregation"
+CMP = "comparison"
+
+
+class Node:
+    """
+    A hash-consed expression node.
+
+    Nodes must be created through `make` (or `lower`), never directly, so that
+    structurally equal nodes are the same object and can be compared and
+    hashed by identity.
+
+    Arguments per kind:
+        number:         (value,)
+        string:         (value,)
+        index_variable: (name,)
+        index_shift:    (index, set_name, offset, cyclic)   index is an
+                        index_variable node
+        variable:       (name, indices)   indices is a tuple of nodes
+        parameter:      (name, indices)
+        unary_op:       (op, operand)
+        binary_op:      (op, left, right)
+        aggregation:    (op, body, bindings, condition)
+                        bindings is a tuple of (index_var, set_name) pairs,
+                        index_var is a name or a tuple of names for tuple sets,
+                        condition is a comparison node or None
+        comparison:     (op, left, right)
+    """
+
+    __slots__ = ("kind", "args", "free", "_digest", "__weakref__")
+
+    kind: str
+    args: tuple
+    free: frozenset[str]
+    _digest: str | None
+
+    def __repr__(self) -> str:
+        return f"Node({self.kind}, {self.args!r})"
+
+    def __reduce__(self):
+        # Re-intern on unpickling so nodes stay canonical across processes
+        return (make, (self.kind, *self.args))
+
+    @property
+    def digest(self) -> str:
+        """Stable structural hash of the node, identical across processes."""
+        if self._digest is None:
+            h = hashlib.sha1(self.kind.encode())
+            for arg in self.args:
+                h.update(b"\x00")
+                h.update(_digest_arg(arg).encode())
+            self._digest = h.hexdigest()
+        return self._digest
+
+
+def _digest_arg(arg: Any) -> str:
+    if isinstance(arg, Node):
+        return arg.digest
+    if isinstance(arg, tuple):
+        return "(" + ",".join(_digest_arg(a) for a in arg) + ")"
+    if arg is None:
+        return "None"
+    return f"{type(arg).__name__}:{arg!r}"
+
+
+_table: "weakref.WeakValueDictionary[tuple, Node]" = weakref.WeakValueDictionary()
+_lock = threading.Lock()
+
+
+def _key_arg(arg: Any) -> Any:
+    # 1, 1.0 and True compare equal but must not be merged into one node
+    if isinstance(arg, int | float | str):
+        return (type(arg), arg)
+    return arg
+
+
+def _free_indices(kind: str, args: tuple) -> frozenset[str]:
+    if kind == IDX:
+        return frozenset((args[0],))
+    if kind in (NUM, STR):
+        return frozenset()
+    if kind in (VAR, PARAM):
+        free = frozenset().union(*(i.free for i in args[1]))
+        # Variables named `_idx_<name>` are resolved from the index context
+        if kind == VAR and args[0].startswith("_idx_"):
+            free |= {args[0][5:]}
+        return free
+    if kind == SHIFT:
+        return args[0].free
+    if kind == UNARY:
+        return args[1].free
+    if kind in (BINARY, CMP):
+        return args[1].free | args[2].free
+    if kind == AGG:
+        _, body, bindings, condition = args
+        inner = body.free | condition.free if condition is not None else body.free
+        return inner.difference(*(binding_names(b) for b, _ in bindings))
+    raise ValueError(f"Unsupported node kind: {kind}")
+
+
+def binding_names(index_var: str | tuple[str, ...]) -> tuple[str, ...]:
+    """Names bound by the index_var of an aggregation binding."""
+    return (index_var,) if isinstance(index_var, str) else index_var
+
+
+def make(kind: str, *args: Any) -> Node:
+    """Return the canonical node for `kind` and `args`, creating it if needed."""
+    key = (kind, *(_key_arg(a) for a in args))
+    node = _table.get(key)
+    if node is not None:
+        return node
+    with _lock:
+        node = _table.get(key)
+        if node is None:
+            node = object.__new__(Node)
+            node.kind = kind
+            node.args = args
+            node.free = _free_indices(kind, args)
+            node._digest = None
+            _table[key] = node
+    return node
+
+
+def num(value: float | int) -> Node:
+    return make(NUM, value)
+
+
+def string(value: str) -> Node:
+    return make(STR, sys.intern(value))
+
+
+def index_var(name: str) -> Node:
+    return make(IDX, sys.intern(name))
+
+
+LowerableExpr = (
+    NumberExpr
+    | StringExpr
+    | IndexVariableExpr
+    | IndexShiftExpr
+    | VariableExpr
+    | ParameterExpr
+    | BinaryOp
+    | UnaryOp
+    | AggregationExpression
+    | ComparisonExpression
+    | IndexComparisonExpr
+)
+
+
+def lower(expr: LowerableExpr | Node) -> Node:
+    """Lower a moai expression model into its canonical IR node."""
+    if isinstance(expr, Node):
+        return expr
+    match expr.type:
+        case "number":
+            return num(expr.value)
+        case "string":
+            return string(expr.value)
+        case "index_variable":
+            return index_var(expr.name)
+        case "index_shift":
+            return make(
+                SHIFT,
+                index_var(expr.index),
+                sys.intern(expr.set_name),
+                expr.offset,
+                expr.cyclic,
+            )
+        case "variable" | "parameter":
+            indices = tuple(lower(i) for i in expr.index_expr or ())
+            return make(expr.type, sys.intern(expr.name), indices)
+        case "unary_op":
+            return make(UNARY, expr.op, lower(expr.expr))
+        case "binary_op":
+            return make(BINARY, expr.op, lower(expr.left), lower(expr.right))
+        case "aggregation":
+            bindings = tuple(
+                (
+                    sys.intern(b.index_var)
+                    if isinstance(b.index_var, str)
+                    else tuple(sys.intern(name) for name in b.index_var),
+                    sys.intern(b.set_name),
+                )
+                for b in expr.bindings
+            )
+            condition = lower(expr.condition) if expr.condition is not None else None
+            return make(AGG, expr.op, lower(expr.expr), bindings, condition)
+        case "comparison" | "index_comparison":
+            return make(CMP, expr.op, lower(expr.left), lower(expr.right))
+        case _:
+            raise ValueError(f"Unsupported expression type: {expr.type}")
+
+
+def iter_nodes(node: Node):
+    """Iterate over a node and all its descendants, visiting shared nodes once."""
+    seen: set[int] = set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        yield current
+        for arg in current.args:
+            if isinstance(arg, Node):
+                stack.append(arg)
+            elif isinstance(arg, tuple):
+                stack.extend(a for a in arg if isinstance(a, Node))
+
+
+def table_size() -> int:
+    """Number of live nodes in the hash-consing table."""
+    return len(_table)
@@ -0,0 +1,128 @@
+"""
+Solves run in the background of the API.
+
+A `SolveJob` is started by one request and followed by others through its
+id: polled for its status, followed as its search progresses, stopped with
+the best solution found so far, or cancelled, which kills its solver.
+"""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Literal
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from .driver import SolverProcess
+from .portfolio import Race
+from .progress import SolveProgress
+from .results import ModelResult
+
+JobStatus = Literal["queued", "running", "done", "failed", "cancelled"]
+
+
+class JobInfo(BaseModel):
+    """Status of a solve job, and its result once done."""
+
+    id: str
+    status: JobStatus
+    elapsed: float | None = None
+    progress: SolveProgress | None = None
+    result: ModelResult | None = None
+    error: str | None = None
+
+
+class SolveJob:
+    """
+    A solve running in a task of the event loop.
+
+    Jobs are queued until their solve hands its solver process to `run`.
+    """
+
+    def __init__(self):
+        self.id = uuid4().hex
+        self.status: JobStatus = "queued"
+        self.result: ModelResult | None = None
+        self.error: str | None = None
+        self.process: SolverProcess | Race | None = None
+        self.task: asyncio.Task | None = None
+        # Monotonic time the job finished at, however it ended
+        self.finished: float | None = None
+        self._started = asyncio.Event()
+
+    def start(self, solve: Callable[["SolveJob"], Awaitable[ModelResult]]):
+        """Run `solve` of the job in a task. Call it from the event loop."""
+        self.task = asyncio.create_task(self._solve(solve))
+        self.task.add_done_callback(self._done)
+
+    async def _solve(self, solve: Callable[["SolveJob"], Awaitable[ModelResult]]):
+        try:
+            self.result = await solve(self)
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(getattr(e, "detail", e))
+
+    def _done(self, task: asyncio.Task):
+        # Also covers tasks cancelled before their coroutine started
+        if task.cancelled():
+            self.status = "cancelled"
+        self.finished = time.monotonic()
+
+    async def run(self, process: SolverProcess | Race) -> ModelResult:
+        """Run the solver process, or race of solvers, of the job."""
+        self.process = process
+        self.status = "running"
+        self._started.set()
+        return await process.run()
+
+    def stop(self):
+        """
+        Stop the solver, keeping the best solution found.
+
+        Jobs without a solver running yet have found nothing, and are cancelled.
+        """
+        if self.process is not None:
+            self.process.stop()
+        else:
+            self.cancel()
+
+    def cancel(self):
+        """Cancel the job, killing its solver."""
+        if self.task is not None:
+            self.task.cancel()
+
+    async def updates(
+        self, interval: float | None = None
+    ) -> AsyncIterator[SolveProgress]:
+        """
+        Follow the progress of the solve of the job, see `SolverProcess.updates`.
+
+        Queued jobs are followed from when their solver starts.
+        """
+        if self.process is None and self.task is not None:
+            started = asyncio.ensure_future(self._started.wait())
+            await asyncio.wait(
+                [started, self.task], return_when=asyncio.FIRST_COMPLETED
+            )
+            started.cancel()
+        if self.process is not None:
+            async for progress in self.process.updates(interval):
+                yield progress
+
+    async def wait(self):
+        """Wait for the job to finish, however it ends."""
+        if self.task is not None:
+            await asyncio.wait([self.task])
+
+    def info(self) -> JobInfo:
+        process = self.process
+        return JobInfo(
+            id=self.id,
+            status=self.status,
+            elapsed=process.elapsed if process is not None else None,
+            progress=process.progress if process is not None else None,
+            result=self.result,
+            error=self.error,
+        )
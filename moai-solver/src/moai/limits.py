@@ -0,0 +1,103 @@
+"""
+Limits of a solve, mapped to the options of each solver.
+
+Solves stop at the first limit reached and return the best solution found,
+see the "stopped" status of `ModelResult`:
+
+- `time_limit`: seconds of wall-clock time,
+- `mip_gap`: relative gap between the best solution and the best bound,
+- `node_limit`: nodes of the branch and bound search.
+"""
+
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+# Option of each limit, by solver
+LIMIT_OPTIONS: dict[str, dict[str, str]] = {
+    "cbc": {"time_limit": "sec", "mip_gap": "ratioGap", "node_limit": "maxNodes"},
+    "glpk": {"time_limit": "tmlim", "mip_gap": "mipgap"},
+    "highs": {
+        "time_limit": "time_limit",
+        "mip_gap": "mip_rel_gap",
+        "node_limit": "mip_max_nodes",
+    },
+    "appsi_highs": {
+        "time_limit": "time_limit",
+        "mip_gap": "mip_rel_gap",
+        "node_limit": "mip_max_nodes",
+    },
+    "cplex": {
+        "time_limit": "timelimit",
+        "mip_gap": "mip_tolerances_mipgap",
+        "node_limit": "mip_limits_nodes",
+    },
+    "cplex_direct": {
+        "time_limit": "timelimit",
+        "mip_gap": "mip_tolerances_mipgap",
+        "node_limit": "mip_limits_nodes",
+    },
+    "gurobi": {
+        "time_limit": "TimeLimit",
+        "mip_gap": "MIPGap",
+        "node_limit": "NodeLimit",
+    },
+    "gurobi_direct": {
+        "time_limit": "TimeLimit",
+        "mip_gap": "MIPGap",
+        "node_limit": "NodeLimit",
+    },
+    "gurobi_persistent": {
+        "time_limit": "TimeLimit",
+        "mip_gap": "MIPGap",
+        "node_limit": "NodeLimit",
+    },
+    "xpress": {
+        "time_limit": "maxtime",
+        "mip_gap": "miprelstop",
+        "node_limit": "maxnode",
+    },
+}
+
+# Options set along with a limit
+LIMIT_EXTRA_OPTIONS: dict[str, dict[str, dict[str, Any]]] = {
+    # CBC limits CPU time by default, and once stopped by it writes the last
+    # LP solution it solved rather than its best integer solution
+    "cbc": {"time_limit": {"timeMode": "elapsed"}},
+}
+
+
+class SolveLimits(BaseModel):
+    """Limits of a solve, unlimited when None."""
+
+    time_limit: float | None = Field(default=None, gt=0)
+    mip_gap: float | None = Field(default=None, ge=0)
+    node_limit: int | None = Field(default=None, ge=0)
+
+
+def limit_options(
+    solver_name: str,
+    time_limit: float | None = None,
+    mip_gap: float | None = None,
+    node_limit: int | None = None,
+) -> dict[str, Any]:
+    """
+    Solver options setting the limits of a solve.
+
+    Raises:
+        ValueError: If the solver has no option for a limit that is set
+    """
+    limits = {"time_limit": time_limit, "mip_gap": mip_gap, "node_limit": node_limit}
+    names = LIMIT_OPTIONS.get(solver_name, {})
+    options: dict[str, Any] = {}
+    for limit, value in limits.items():
+        if value is None:
+            continue
+        if limit not in names:
+            raise ValueError(f"Solver {solver_name} has no {limit} option")
+        if solver_name == "glpk" and limit == "time_limit":
+            # GLPK takes whole seconds
+            value = max(1, round(value))
+        options[names[limit]] = value
+        options.update(LIMIT_EXTRA_OPTIONS.get(solver_name, {}).get(limit, {}))
+    return options
@@ -0,0 +1,93 @@
+"""
+Linear forms of Pyomo expressions.
+
+Products and sums written with the generic Pyomo expression classes hide
+their linearity: the LP writer has to walk every `SumExpression` and
+`ProductExpression` down to its leaves to recover the coefficient of each
+variable. When both operands of an operation are affine, the operation is
+instead emitted as a `LinearExpression` of `MonomialTermExpression`s
+(coefficient/variable pairs) and constants, which Pyomo reads directly.
+
+An affine operand is given by its linear terms: numbers, variables and
+monomials. Only numeric coefficients are used, so parameters are linear
+coefficients when they are immutable.
+"""
+
+from typing import Any
+
+from pyomo.core.base.param import ParamData
+from pyomo.core.base.var import VarData
+from pyomo.core.expr.numeric_expr import LinearExpression, MonomialTermExpression
+
+# Linear terms of an affine expression
+Terms = list
+
+
+def linear_terms(value: Any) -> Terms | None:
+    """Return the linear terms of an affine operand, or None if it is not affine."""
+    if isinstance(value, VarData | MonomialTermExpression | int | float):
+        return [value]
+    if type(value) is LinearExpression:
+        return value.args
+    if isinstance(value, ParamData) and not value.mutable:
+        return [value.value]
+    return None
+
+
+def constant(value: Any) -> int | float | None:
+    """Return the value of a numeric constant operand, or None."""
+    if isinstance(value, int | float):
+        return value
+    if isinstance(value, ParamData) and not value.mutable:
+        return value.value
+    return None
+
+
+def monomial(factor: Any, value: Any) -> MonomialTermExpression | None:
+    """Return `factor * value` for a number and a variable, or None."""
+    if isinstance(value, VarData) and isinstance(factor, int | float):
+        return MonomialTermExpression((factor, value))
+    return None
+
+
+def scale(terms: Terms, factor: int | float) -> Terms:
+    """Multiply linear terms by a number."""
+    scaled = []
+    for term in terms:
+        if isinstance(term, MonomialTermExpression):
+            coef, v = term.args
+            scaled.append(MonomialTermExpression((coef * factor, v)))
+        elif isinstance(term, VarData):
+            scaled.append(MonomialTermExpression((factor, term)))
+        else:
+            scaled.append(term * factor)
+    return scaled
+
+
+def linear_sum(values: list) -> Any:
+    """Return the linear expression summing affine values, or None if one is not."""
+    terms: Terms = []
+    for value in values:
+        if isinstance(value, VarData | MonomialTermExpression | int | float):
+            terms.append(value)
+        else:
+            linear = linear_terms(value)
+            if linear is None:
+                return None
+            terms += linear
+    return linear_expression(terms)
+
+
+def linear_expression(terms: Terms) -> Any:
+    """
+    Build the Pyomo expression of linear terms.
+
+    Terms without any variable are folded into a number, and a single
+    variable or monomial is returned as it is.
+    """
+    if len(terms) == 1:
+        return terms[0]
+    for term in terms:
+        if not isinstance(term, int | float):
+            return LinearExpression(terms)
+    return sum(terms)
@@ -1,14 +1,21 @@
-from typing import cast
+import time
+from collections.abc import Iterable
+from functools import cache
+from typing import TYPE_CHECKING, cast
 
 import pyomo.environ as pyo
 from openai import BaseModel
-from pydantic import ConfigDict
+from pydantic import ConfigDict, TypeAdapter
 
+from .codec import LabelCodec, LabeledComponent, attach_codec
 from .constraints import Constraint
+from .ir import Node
 from .objectives import Objective
 from .parameters import Parameter
 from .parse import (
+    SharedExpressions,
     constraint_to_pyomo,
+    find_shared_aggregations,
     objective_to_pyomo,
     parameter_to_pyomo,
     set_to_pyomo,
@@ -17,6 +24,10 @@ from .parse import (
 from .sets import Set
 from .variables import Variable
 
+if TYPE_CHECKING:
+    from .results import VariableResults
+    from .writer import FragmentCache
+
 
 # serializable model
 class ModelData(BaseModel):
@@ -31,6 +42,32 @@ class ModelData(BaseModel):
     objective: Objective | None = None
 
 
+# Compiled once at import time and reused for every request. Validating the raw
+# JSON bytes directly avoids materializing an intermediate dict tree.
+MODEL_DATA_ADAPTER: TypeAdapter[ModelData] = TypeAdapter(ModelData)
+
+
+def decode_model_data(payload: ModelData | bytes | str | dict) -> ModelData:
+    """
+    Decode a ModelData payload using the precompiled adapter.
+
+    Raw JSON is validated every time: a cache of decoded payloads would
+    have to hand out copies, which are slower to make than decoding.
+
+    Args:
+        payload: A ModelData instance, raw JSON (bytes or str) or a parsed dict
+
+    Returns:
+        The validated ModelData. Instances are already validated and are
+        returned as they are.
+    """
+    if isinstance(payload, ModelData):
+        return payload
+    if isinstance(payload, bytes | str):
+        return MODEL_DATA_ADAPTER.validate_json(payload)
+    return MODEL_DATA_ADAPTER.validate_python(payload)
+
+
 class Model:
     """Complete MOAI model"""
 
@@ -41,11 +78,25 @@ class Model:
         self._variables: list[Variable] = []
         self._constraints: list[Constraint] = []
         self._objective: Objective | None = None
-        self._model = cast(pyo.ConcreteModel, pyo.ConcreteModel(name=name))
+        # Models created from data build their Pyomo model when first used
+        self._model: pyo.ConcreteModel | None = cast(
+            pyo.ConcreteModel, pyo.ConcreteModel(name=name)
+        )
+        # The Pyomo model is indexed by integer codes of the set elements
+        self._codec = LabelCodec()
+        attach_codec(self._model, self._codec)
+        self._shared = SharedExpressions()
+        # Rows of constraint families of earlier LP files, reused by solves
+        # written by `moai.writer`, such as those of models of a template
+        self.fragments: FragmentCache | None = None
+        # Variable values of the last solve read from a solution file, loaded
+        # into the Pyomo model when it is built
+        self._solution: VariableResults | None = None
 
     def to_data(self) -> ModelData:
         """Convert to serializable model data"""
-        return ModelData(
+        # Components were validated when they were added, skip revalidation
+        return ModelData.model_construct(
             name=self.name,
             sets=self.sets,
             parameters=self.parameters,
@@ -55,9 +106,42 @@ class Model:
         )
 
     @classmethod
-    def from_data(cls, data: ModelData) -> "Model":
-        """Create a model from serializable model data"""
+    def from_data(
+        cls,
+        data: ModelData | bytes | str | dict,
+        shared: Iterable[Node] | None = None,
+        validate: bool = True,
+    ) -> "Model":
+        """
+        Create a model from serializable model data
+
+        The Pyomo model is built when first used, see `build`: solvers that
+        read LP files written from the data, see `moai.solution`, solve the
+        model without it. The references of the data are checked here, see
+        `moai.validation`, so invalid models still fail to load.
+
+        Args:
+            data: The model data, or raw JSON of it
+            shared: Shared aggregations of the constraints and objective, when
+                already found
+            validate: Whether to check the references of the data, False
+                when the caller checked them
+
+        Raises:
+            ValueError: If the data references missing or mismatched
+                components, e.g. a constraint reads a missing set
+        """
+        from .validation import issues_message, validate_model_data
+
+        data = decode_model_data(data)
+        if validate and (errors := validate_model_data(data)):
+            raise ValueError(issues_message(errors))
         model = cls(data.name)
+        model._model = None
+        if shared is None:
+            model.share_common_subexpressions(data.constraints, data.objective)
+        else:
+            model.share_expressions(shared)
         for s in data.sets:
             model.add_set(s)
         for p in data.parameters:
@@ -70,6 +154,78 @@ class Model:
             model.set_objective(data.objective)
         return model
 
+    def build(self) -> "Model":
+        """
+        Build the Pyomo model of a model created from data, if not built yet.
+
+        Raises:
+            ValueError: If a component cannot be built, e.g. a constraint
+                reads a missing set
+        """
+        if self._model is not None:
+            return self
+        # Built apart, so that a failed build leaves the model unbuilt
+        built = Model(self._name)
+        built._shared = self._shared
+        for s in self._sets:
+            built.add_set(s)
+        for p in self._parameters:
+            built.add_parameter(p)
+        for v in self._variables:
+            built.add_variable(v)
+        for c in self._constraints:
+            built.add_constraint(c)
+        if self._objective is not None:
+            built.set_objective(self._objective)
+        self._model, self._codec = built._model, built._codec
+        if self._solution is not None:
+            self._load_solution(self._solution)
+        return self
+
+    def _load_solution(self, solution: "VariableResults"):
+        """
+        Set the variables of the Pyomo model to the values of a solution.
+
+        Solvers reading LP files solve the model without the Pyomo model, see
+        `moai.solution`: their values are loaded as Pyomo plugins load theirs,
+        and variables without a value in the solution are cleared.
+        """
+        self._solution = solution
+        if self._model is None:
+            return
+        model = self._model
+        for name, scalar in solution.scalar.items():
+            # Variables removed since the solve are skipped
+            if isinstance(component := model.component(name), pyo.Var):
+                component.set_value(scalar.value, skip_validation=True)
+        for name, indexed in solution.indexed.items():
+            if isinstance(component := model.component(name), pyo.Var):
+                values = indexed.values
+                for index, data in component.items():
+                    key = self._codec.decode_index(index)
+                    data.set_value(values.get(key), skip_validation=True)
+
+    def share_common_subexpressions(
+        self, constraints: list[Constraint], objective: Objective | None = None
+    ):
+        """
+        Emit aggregations repeated across constraints and the objective once.
+
+        Repeated aggregations are built as shared `pyo.Expression` components
+        the first time they are needed and referenced afterwards. Call this
+        before adding the constraints and objective it was computed from.
+        """
+        return self.share_expressions(find_shared_aggregations(constraints, objective))
+
+    def share_expressions(self, nodes: Iterable[Node]):
+        """
+        Emit the given aggregations once, as found by `find_shared_aggregations`.
+
+        Call this before adding the constraints and objective they were found in.
+        """
+        self._shared = SharedExpressions(nodes)
+        return self
+
     @property
     def name(self) -> str:
         """Model name"""
@@ -102,8 +258,38 @@ class Model:
 
     @property
     def pyomo_model(self) -> pyo.ConcreteModel:
-        """Get the Pyomo model"""
-        return self._model
+        """
+        Get the Pyomo model.
+
+        Its components are indexed by the codes of the set elements, see
+        `codec`; `component` indexes them by the elements themselves.
+        """
+        return cast(pyo.ConcreteModel, self.build()._model)
+
+    def component(self, name: str) -> "LabeledComponent | pyo.Component":
+        """
+        A component of the Pyomo model, indexed by set elements.
+
+        Args:
+            name: Name of a variable, parameter, constraint or objective
+
+        Returns:
+            The component, indexed by labels when indexed
+
+        Raises:
+            ValueError: If the Pyomo model has no such component
+        """
+        component = self.pyomo_model.component(name)
+        if component is None:
+            raise ValueError(f"Component {name} not found")
+        if not component.is_indexed():
+            return component
+        return LabeledComponent(component, self._codec)
+
+    @property
+    def codec(self) -> LabelCodec:
+        """Codes of the set elements indexing the Pyomo model"""
+        return self.build()._codec
 
     def get_set_by_name(self, name: str) -> Set | None:
         """Get a set by name"""
@@ -164,15 +350,19 @@ class Model:
             self._sets[existing_index] = set
         else:
             self._sets.append(set)
+        if self._model is None:
+            return self
 
         # Add the variable to the model
         # remove component if exists
         if hasattr(self._model, set.name):
             self._model.del_component(set.name)
+        self._shared.reset()
         self._model.add_component(
             set.name,
             set_to_pyomo(
                 set,
+                self._codec,
             ),
         )
         return self
@@ -183,6 +373,9 @@ class Model:
         """
         # Remove from internal list
         self._sets = [s for s in self._sets if s.name != set_name]
+        self._shared.reset()
+        if self._model is None:
+            return self
 
         # Remove from Pyomo model if exists
         if hasattr(self._model, set_name):
@@ -204,10 +397,13 @@ class Model:
             self._variables[existing_index] = variable
         else:
             self._variables.append(variable)
+        if self._model is None:
+            return self
 
         # remove component if exists
         if hasattr(self._model, variable.name):
             self._model.del_component(variable.name)
+        self._shared.reset()
         self._model.add_component(
             variable.name,
             var_to_pyomo(
@@ -223,6 +419,9 @@ class Model:
         """
         # Remove from internal list
         self._variables = [v for v in self._variables if v.name != variable_name]
+        self._shared.reset()
+        if self._model is None:
+            return self
 
         # Remove from Pyomo model if exists
         if hasattr(self._model, variable_name):
@@ -244,10 +443,13 @@ class Model:
             self._parameters[existing_index] = parameter
         else:
             self._parameters.append(parameter)
+        if self._model is None:
+            return self
 
         # remove component if exists
         if hasattr(self._model, parameter.name):
             self._model.del_component(parameter.name)
+        self._shared.reset()
         self._model.add_component(
             parameter.name,
             parameter_to_pyomo(
@@ -263,6 +465,9 @@ class Model:
         """
         # Remove from internal list
         self._parameters = [p for p in self._parameters if p.name != parameter_name]
+        self._shared.reset()
+        if self._model is None:
+            return self
 
         # Remove from Pyomo model if exists
         if hasattr(self._model, parameter_name):
@@ -284,6 +489,8 @@ class Model:
             self._constraints[existing_index] = constraint
         else:
             self._constraints.append(constraint)
+        if self._model is None:
+            return self
 
         # remove component if exists
         if hasattr(self._model, constraint.name):
@@ -293,6 +500,7 @@ class Model:
             constraint_to_pyomo(
                 constraint,
                 self._model,
+                self._shared,
             ),
         )
         return self
@@ -303,6 +511,8 @@ class Model:
         """
         # Remove from internal list
         self._constraints = [c for c in self._constraints if c.name != constraint_name]
+        if self._model is None:
+            return self
 
         # Remove from Pyomo model if exists
         if hasattr(self._model, constraint_name):
@@ -314,6 +524,8 @@ class Model:
         Set the objective of the model. If an objective already exists, it will be replaced.
         """
         self._objective = objective
+        if self._model is None:
+            return self
         # remove component if exists
         if hasattr(self._model, "obj"):
             self._model.del_component("obj")
@@ -322,6 +534,7 @@ class Model:
             objective_to_pyomo(
                 objective,
                 self._model,
+                self._shared,
             ),
         )
         return self
@@ -331,21 +544,63 @@ class Model:
         Remove the objective from the model.
         """
         self._objective = None
+        if self._model is None:
+            return self
         # Remove from Pyomo model if exists
         if hasattr(self._model, "obj"):
             self._model.del_component("obj")
         return self
 
-    def solve(self, solver_name: str = "cbc", **solver_options):
+    def estimate_size(self):
+        """
+        Estimate the number of variables, rows and nonzeros of the model.
+
+        The estimate is computed from the model data, see `moai.estimate`.
+        """
+        from .estimate import estimate_size
+
+        return estimate_size(self.to_data())
+
+    def solve(
+        self,
+        solver_name: str = "cbc",
+        threads: int | None = None,
+        time_limit: float | None = None,
+        mip_gap: float | None = None,
+        node_limit: int | None = None,
+        **solver_options,
+    ):
         """
         Solve the optimization model and return structured results.
 
+        The solve takes its threads from the core budget shared by the solves
+        of the process, see `moai.cores`, and is recorded in the history of
+        its solves, see `moai.history`.
+
         Args:
-            solver_name: Name of the solver to use (default: "cbc")
+            solver_name: Name of the solver to use (default: "cbc"). The
+                solvers of the portfolio race on the model with "portfolio",
+                see `moai.portfolio`, and "auto" solves with the solver that
+                was fastest on models of the same structure, see
+                `moai.history`.
+            threads: Threads to ask for, by default by the size of the model.
+                Fewer are granted when other solves hold the cores, and a
+                thread option of the solver is capped the same way.
+            time_limit: Seconds the solve may take
+            mip_gap: Relative gap between the best solution and the best
+                bound at which the solve stops
+            node_limit: Nodes of the branch and bound search the solve may
+                explore
             **solver_options: Additional options to pass to the solver
 
         Returns:
-            Structured ModelResult with typed variable and constraint results
+            Structured ModelResult with typed variable and constraint results.
+            Solves stopped at a limit have the "stopped" status and the best
+            solution found, with the best bound and gap in its solver info.
+
+        Raises:
+            ValueError: If the solver has no option for a limit that is set,
+                or options are given to a portfolio
 
         Example:
             >>> from moai.model import Model
@@ -355,46 +610,131 @@ class Model:
             >>> print(result.summary())
             >>> x_value = result.variables["x"].value
         """
+        if solver_name == "portfolio":
+            return self._race(threads, time_limit, mip_gap, node_limit, solver_options)
+        if solver_name == "auto":
+            from .history import recommender
+
+            return recommender.solve(
+                self,
+                threads=threads,
+                time_limit=time_limit,
+                mip_gap=mip_gap,
+                node_limit=node_limit,
+                **solver_options,
+            )
+
+        from .cores import (
+            THREAD_OPTIONS,
+            cores,
+            requested_threads,
+            thread_options,
+            writer_processes,
+        )
+        from .history import SolverConfig, record_solve
+        from .limits import limit_options
+        from .progress import parse_log
         from .results import ModelResult as TypedModelResult
+        from .solution import SOLUTION_READERS, solve_lp
 
+        started = time.perf_counter()
         opt = pyo.SolverFactory(solver_name)
-
-        # Set solver options if provided
-        for key, value in solver_options.items():
-            opt.options[key] = value
-
-        solver_results = opt.solve(self._model)
-
-        # Determine status
-        if solver_results.solver.status == pyo.SolverStatus.ok:
-            if (
-                solver_results.solver.termination_condition
-                == pyo.TerminationCondition.optimal
-            ):
-                status = "optimal"
-            elif solver_results.solver.termination_condition in [
-                pyo.TerminationCondition.feasible,
-                pyo.TerminationCondition.locallyOptimal,
-            ]:
-                status = "feasible"
-            elif (
-                solver_results.solver.termination_condition
-                == pyo.TerminationCondition.infeasible
-            ):
-                status = "infeasible"
-            elif (
-                solver_results.solver.termination_condition
-                == pyo.TerminationCondition.unbounded
-            ):
-                status = "unbounded"
+        limits = limit_options(solver_name, time_limit, mip_gap, node_limit)
+
+        option = THREAD_OPTIONS.get(solver_name)
+        # Sized once, for the threads and for the history of solves
+        estimate = cache(self.estimate_size)
+        wanted = requested_threads(solver_name, solver_options, threads, estimate)
+        writers = (
+            writer_processes(estimate(), cores.max_per_solve)
+            if solver_name in SOLUTION_READERS
+            else 1
+        )
+        with cores.reserve(max(wanted, writers)) as granted:
+            # Set solver options if provided
+            # The solver runs on the threads granted, whatever it was asked
+            threads_used = min(granted, wanted)
+            options = {
+                **limits,
+                **solver_options,
+                **thread_options(solver_name, threads_used),
+            }
+            if solver_name in SOLUTION_READERS:
+                # Written from the model data, and read back by the names of
+                # the LP file, see `moai.solution`
+                opt.available(exception_flag=True)
+                result, log = solve_lp(
+                    opt.executable(),
+                    solver_name,
+                    self.to_data(),
+                    options,
+                    cache=self.fragments,
+                    processes=min(granted, writers),
+                )
+                if result.status in ("optimal", "stopped"):
+                    self._load_solution(result.variables)
             else:
-                status = "success"
+                for key, value in options.items():
+                    opt.options[key] = value
+                solver_results = opt.solve(self.pyomo_model, load_solutions=False)
+                log = getattr(opt, "_log", None)
+
+        sense = self.objective.sense if self.objective is not None else "min"
+        progress = parse_log(solver_name, log, sense)
+        bound = progress.bound if progress is not None else None
+        if solver_name in SOLUTION_READERS:
+            result.set_bound(bound)
+            if progress is not None:
+                result.solver_info.nodes = progress.nodes
         else:
-            status = "error"
-
-        return TypedModelResult.from_pyomo(
-            status=status,
-            pyomo_model=self._model,
-            model_data=self.to_data(),
-            solver_results=solver_results,
+            result = TypedModelResult.from_solver_results(
+                self.pyomo_model,
+                solver_results,
+                model_data=self.to_data(),
+                bound=bound,
+            )
+        result.solver_info.threads = threads_used if option is not None else 1
+        record_solve(
+            self.to_data(),
+            SolverConfig(solver_name=solver_name, options=solver_options),
+            result,
+            time.perf_counter() - started,
+            estimate(),
+        )
+        return result
+
+    def _race(
+        self,
+        threads: int | None,
+        time_limit: float | None,
+        mip_gap: float | None,
+        node_limit: int | None,
+        solver_options: dict,
+    ):
+        """Race the solvers of the portfolio on the model, see `Model.solve`."""
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        from .portfolio import portfolio
+
+        if solver_options:
+            raise ValueError(
+                "Options of raced solvers are set in the solver configs of "
+                "the portfolio"
+            )
+        race = portfolio.race(
+            self,
+            threads=threads,
+            time_limit=time_limit,
+            mip_gap=mip_gap,
+            node_limit=node_limit,
         )
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(race.run())
+        # Called from a coroutine: the race runs on a loop of its own in a
+        # worker thread, blocking the caller as other solves do. Async code
+        # awaits `portfolio.race(model).run()` instead.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, race.run()).result()
@@ -1,30 +1,72 @@
-from typing import Any, cast
+from collections.abc import Callable, Iterable
+from typing import Any
 
 import pyomo.environ as pyo
 from pyomo.core.base.component import ComponentData as pyoComponentData
 
-from .constraints import Constraint
+from . import codegen, ir
+from .codec import LabelCodec, label_codec
+from .compiler import (
+    MISSING_ATTR,
+    Compiler,
+    NotCompilable,
+    binary_op,
+    check_dimension,
+    relation,
+    shift_element,
+    total,
+    unary_op,
+)
+from .constraints import Constraint, Quantifier
 from .expressions import (
-    AggregationExpression,
-    BinaryOp,
     ComparisonExpression,
     ExprType,
     IndexComparisonExpr,
-    IndexVariableExpr,
-    NumberExpr,
-    ParameterExpr,
-    StringExpr,
-    UnaryOp,
-    VariableExpr,
 )
+from .ir import Node, lower
 from .objectives import Objective
 from .parameters import Parameter
-from .sets import Set
+from .sets import Set, SetRange
 from .variables import Variable
 
 
-def set_to_pyomo(set: Set) -> pyo.Set:
-    return pyo.Set(initialize=set.elements, name=set.name)
+def set_to_pyomo(set: Set, codec: LabelCodec | None = None) -> pyo.Set:
+    """
+    Convert a Moai Set to a Pyomo Set.
+
+    With a codec the Pyomo set holds the codes of the elements instead.
+    Integer ranges, and sets whose codes happen to be consecutive, become a
+    `RangeSet`, which stores no elements and finds positions arithmetically.
+    """
+    if set.is_tuple_set:
+        elements = list(set.iter_elements())
+        if codec is not None:
+            codec.add(label for element in elements for label in element)
+            elements = [codec.encode_index(element) for element in elements]
+        return pyo.Set(initialize=elements, dimen=set.dimen, name=set.name)
+
+    if codec is None:
+        if isinstance(set.elements, SetRange):
+            return _range_set(set.elements.to_range(), set.name)
+        return pyo.Set(initialize=set.elements, name=set.name)
+
+    first = len(codec)
+    codes = codec.add(set.iter_elements())
+    if (
+        codes
+        and codes[0] == first
+        and codes[-1] == len(codec) - 1 == first + len(codes) - 1
+    ):
+        # Every element got a new code, in order
+        return _range_set(range(first, len(codec)), set.name)
+    return pyo.Set(initialize=codes, name=set.name)
+
+
+def _range_set(r: range, name: str) -> pyo.Set:
+    if not r:
+        return pyo.Set(initialize=[], name=name)
+    # RangeSet bounds are inclusive
+    return pyo.RangeSet(r[0], r[-1], r.step, name=name)
 
 
 def parameter_to_pyomo(
@@ -44,7 +86,16 @@ def parameter_to_pyomo(
     if any(set_obj is None for set_obj in set_objs):
         raise ValueError(f"One or more sets {parameter.indices} not found in the model")
 
-    index_values = {tuple(element.index): element.value for element in parameter.values}
+    codec = label_codec(model)
+    if codec is not None:
+        index_values = {
+            codec.encode_index(element.index): element.value
+            for element in parameter.values
+        }
+    else:
+        index_values = {
+            tuple(element.index): element.value for element in parameter.values
+        }
 
     return pyo.Param(
         *set_objs,
@@ -91,60 +142,238 @@ def var_to_pyomo(
     if v.lb is not None or v.ub is not None:
         kwargs["bounds"] = (v.lb, v.ub)
 
+    if v.support is not None:
+        if model is None:
+            raise ValueError("Model must be provided to resolve variable support")
+        var = pyo.Var(_variable_support(v, model, indices), **kwargs)
+        setattr(var, MISSING_ATTR, v.missing)
+        return var
     return pyo.Var(*indices, **kwargs)
 
 
+def _variable_support(
+    v: Variable, model: pyo.ConcreteModel, index_sets: list[pyo.Set]
+) -> list:
+    """Indices a sparse variable is created on, as held by the Pyomo model."""
+    assert v.support is not None
+    if v.support.set is not None:
+        set_obj = model.component(v.support.set)
+        if set_obj is None:
+            raise ValueError(f"Set {v.support.set} not found in model.")
+        keys = list(set_obj)
+    else:
+        p = model.component(v.support.parameter)
+        if not isinstance(p, pyo.Param) or not p.is_indexed():
+            raise ValueError(
+                f"Support of variable {v.name} must be an indexed parameter, "
+                f"got {v.support.parameter}"
+            )
+        keys = list(p.sparse_keys())
+
+    for key in keys:
+        index = key if isinstance(key, tuple) else (key,)
+        if len(index) != len(index_sets) or not all(
+            i in s for i, s in zip(index, index_sets, strict=True)
+        ):
+            codec = label_codec(model)
+            label = codec.decode_index(key) if codec is not None else index
+            raise ValueError(
+                f"Support index {label} of variable {v.name} is not in {v.indices}"
+            )
+    return keys
+
+
 def constraint_to_pyomo(
     c: Constraint,
     model: pyo.ConcreteModel,
+    shared: "SharedExpressions | None" = None,
 ) -> pyo.Constraint:
     """Convert a moai constraint to a Pyomo constraint."""
+    expr = lower(c.expr)
+    # Shared by every row of this constraint, so subtrees that do not depend
+    # on the quantifier indices are only built once
+    state = ParseState(shared, label_codec(model))
     if not c.quantifiers:
         # Simple constraint without quantifiers
-        expr = _parse_comparison_expression(model, c.expr)
-        return pyo.Constraint(expr=expr)
+        return pyo.Constraint(
+            expr=_parse_comparison_expression(model, expr, None, state)
+        )
     else:
         set_objs = []
         for q in c.quantifiers:
             set_obj = getattr(model, q.over, None)
             if set_obj is None:
                 raise ValueError(f"Set {q.over} not found in model")
+            check_dimension(set_obj, q.index_names)
             set_objs.append(set_obj)
+        # Pyomo passes the components of tuple set elements as separate indices
+        index_names = [name for q in c.quantifiers for name in q.index_names]
+        conditions = [lower(q.condition) for q in c.quantifiers if q.condition]
+        build_row = _row_builder(model, expr, index_names, state)
+
+        if conditions:
+            try:
+                rows = _quantifier_domain(model, c.quantifiers, set_objs, state.codec)
+            except NotCompilable:
+                rows = None
+            if rows is not None:
+                # Rows failing a condition are never visited
+                def row_rule(m, *indices):
+                    return _constraint_row(build_row(indices))
+
+                return pyo.Constraint(rows, rule=row_rule)
 
         def constraint_rule(m, *indices):
-            if not c.quantifiers:
-                return _parse_comparison_expression(m, c.expr)
-            else:
-                index_context: IndexContext = {
-                    q.index: cast(str, indices[i]) for i, q in enumerate(c.quantifiers)
-                }
-                # Check all quantifier conditions - skip this combination if any condition fails
-                for q in c.quantifiers:
-                    if q.condition is not None:
-                        # Evaluate the condition with current index context
-                        condition_result = _parse_comparison_expression(
-                            m, q.condition, index_context
-                        )
-                        # For index comparisons, the result should be a Python bool or 0/1
-                        # Use pyo.value() to convert Pyomo expressions to Python values
-                        try:
-                            if not pyo.value(condition_result, exception=False):
-                                return pyo.Constraint.Skip
-                        except Exception:
-                            # If it's already a Python bool, just check it
-                            if not condition_result:
-                                return pyo.Constraint.Skip
-                return _parse_comparison_expression(m, c.expr, index_context)
-
+            return _constraint_row(build_row(indices))
+
+        def conditional_rule(m, *indices):
+            index_context: IndexContext = dict(zip(index_names, indices, strict=False))
+            # Check all quantifier conditions - skip this combination if any condition fails
+            for condition in conditions:
+                # Evaluate the condition with current index context
+                condition_result = _parse_comparison_expression(
+                    m, condition, index_context, state
+                )
+                # For index comparisons, the result should be a Python bool or 0/1
+                # Use pyo.value() to convert Pyomo expressions to Python values
+                try:
+                    if not pyo.value(condition_result, exception=False):
+                        return pyo.Constraint.Skip
+                except Exception:
+                    # If it's already a Python bool, just check it
+                    if not condition_result:
+                        return pyo.Constraint.Skip
+            return _constraint_row(build_row(indices))
+
+        if conditions:
+            return pyo.Constraint(*set_objs, rule=conditional_rule)
         return pyo.Constraint(*set_objs, rule=constraint_rule)
 
 
+def _row_builder(
+    model: pyo.ConcreteModel,
+    expr: Node,
+    index_names: list[str],
+    state: "ParseState",
+) -> Callable[[tuple], "PyomoExpression"]:
+    """
+    Return a function building the relation of a row from its quantifier indices.
+
+    The constraint family is preferably generated as Python source, else
+    compiled once into closures over a single row buffer the indices are
+    written to. It is parsed row by row with an index context only if it
+    uses constructs neither supports.
+    """
+    try:
+        generated = codegen.row_function(
+            model, expr, index_names, state.codec, state.memo, state.shared
+        )
+    except NotCompilable:
+        pass
+    else:
+        return lambda indices: generated(*indices)
+
+    slots = {name: slot for slot, name in enumerate(index_names)}
+    compiler = Compiler(model, slots, state.codec, state.memo, state.shared)
+    try:
+        build = compiler.constraint(expr)
+    except NotCompilable:
+
+        def parse_row(indices: tuple) -> PyomoExpression:
+            index_context = dict(zip(index_names, indices, strict=False))
+            return _parse_comparison_expression(model, expr, index_context, state)
+
+        return parse_row
+
+    row = compiler.row()
+    n = len(index_names)
+
+    def build_row(indices: tuple) -> PyomoExpression:
+        row[:n] = indices
+        return build(row)
+
+    return build_row
+
+
+def _constraint_row(row: "PyomoExpression"):
+    """Return the relation of a quantified constraint row, or Skip or Infeasible."""
+    if all(isinstance(arg, int | float) for arg in getattr(row, "args", ())):
+        # Nothing left to constrain, e.g. every variable referenced is
+        # outside the support of a sparse variable
+        if pyo.value(row):
+            return pyo.Constraint.Skip
+        return pyo.Constraint.Infeasible
+    return row
+
+
+def _quantifier_domain(
+    model: pyo.ConcreteModel,
+    quantifiers: list[Quantifier],
+    set_objs: list[pyo.Set],
+    codec: LabelCodec | None = None,
+) -> list:
+    """
+    Index combinations of a quantified constraint satisfying its conditions.
+
+    Conditions are compiled into Python predicates over the row being built
+    and checked as soon as the last index they depend on is bound, so e.g. a
+    condition on the first quantifier prunes before the later sets are
+    expanded.
+
+    Raises:
+        NotCompilable: If a condition cannot be compiled into a predicate
+    """
+    slots: dict[str, int] = {}
+    levels: dict[str, int] = {}
+    for level, q in enumerate(quantifiers):
+        for name in q.index_names:
+            slots[name] = len(slots)
+            levels[name] = level
+
+    compiler = Compiler(model, slots, codec)
+    checks: list[list] = [[] for _ in quantifiers]
+    for q in quantifiers:
+        if q.condition is None:
+            continue
+        condition = lower(q.condition)
+        if not condition.free <= slots.keys():
+            raise NotCompilable(f"condition depends on {condition.free}")
+        level = max((levels[name] for name in condition.free), default=0)
+        checks[level].append(compiler.predicate(condition))
+
+    rows: list[tuple] = [()]
+    for set_obj, predicates in zip(set_objs, checks, strict=True):
+        is_tuple_set = isinstance(set_obj.dimen, int) and set_obj.dimen > 1
+        expanded = []
+        for row in rows:
+            for element in set_obj:
+                candidate = row + element if is_tuple_set else row + (element,)
+                if all(predicate(candidate) for predicate in predicates):
+                    expanded.append(candidate)
+        rows = expanded
+    if len(slots) == 1:
+        return [row[0] for row in rows]
+    return rows
+
+
 def objective_to_pyomo(
     o: Objective,
     model: pyo.ConcreteModel,
+    shared: "SharedExpressions | None" = None,
 ) -> pyo.Objective:
     """Convert a moai objective to a Pyomo objective."""
-    expr = _parse_expression(model, o.expr)
+    node = lower(o.expr)
+    state = ParseState(shared, label_codec(model))
+    try:
+        expr = codegen.row_function(
+            model, node, [], state.codec, state.memo, state.shared
+        )()
+    except NotCompilable:
+        compiler = Compiler(model, {}, state.codec, state.memo, state.shared)
+        try:
+            expr = compiler.expression(node)(compiler.row())
+        except NotCompilable:
+            expr = _parse_node(model, node, None, state)
     return pyo.Objective(
         expr=expr, sense=pyo.minimize if o.sense == "min" else pyo.maximize
     )
@@ -168,226 +397,303 @@ PyomoExpression = (
     | pyo.expr.NotEqualExpression
 )
 
+IndexContext = dict[str, str | int | float]
+
+
+class SharedExpressions:
+    """
+    Aggregations repeated across the constraints and the objective of a model.
+
+    Each shared aggregation is emitted once as a `pyo.Expression` component,
+    indexed by the values of its free index variables, and every occurrence
+    references that component instead of expanding the sum again.
+    """
+
+    def __init__(self, nodes: Iterable[Node] = ()):
+        self.nodes = frozenset(nodes)
+        self._components: dict[Node, pyo.Expression] = {}
+
+    def reset(self):
+        """Forget emitted components, e.g. after the data they depend on changed."""
+        self._components.clear()
+
+    def reference(
+        self,
+        model: pyo.ConcreteModel,
+        expr: Node,
+        index_context: IndexContext | None,
+        state: "ParseState",
+    ) -> PyomoExpression:
+        """Return the shared Pyomo expression for `expr` in the current context."""
+        free = sorted(expr.free)
+        if free and index_context is None:
+            raise ValueError("Index context is required for index variables")
+        key = tuple(index_context[name] for name in free) if free else ()  # type: ignore
+        return self.entry(
+            model, expr, key, lambda: _parse_compound(model, expr, index_context, state)
+        )
+
+    def entry(
+        self,
+        model: pyo.ConcreteModel,
+        expr: Node,
+        key: tuple,
+        build: Callable[[], PyomoExpression],
+    ) -> PyomoExpression:
+        """
+        Return the shared Pyomo expression for `expr`, building it if needed.
+
+        Args:
+            model: The Pyomo model
+            expr: A shared aggregation node
+            key: Values of the free index variables of `expr`, in name order
+            build: Builds the expression for `key` when it is not emitted yet
+        """
+        component = self._components.get(expr)
+        if component is None:
+            name = _unique_component_name(model, "_cse")
+            if key:
+                component = pyo.Expression(pyo.Any)
+            else:
+                component = pyo.Expression(expr=build())
+            model.add_component(name, component)
+            self._components[expr] = component
+        if not key:
+            return component
+
+        index = key[0] if len(key) == 1 else key
+        if index not in component:
+            component[index] = build()
+        return component[index]
+
+
+class ParseState:
+    """Caches threaded through the parser while building one model."""
+
+    def __init__(
+        self,
+        shared: SharedExpressions | None = None,
+        codec: LabelCodec | None = None,
+    ):
+        # Results of index-free IR nodes. Nodes are hash-consed, so a subtree
+        # repeated anywhere in the expressions being built is parsed once.
+        self.memo: dict[Node, PyomoExpression] = {}
+        self.shared = shared
+        # Set when the model is built on label codes. Index contexts then hold
+        # codes, which are decoded wherever a label value is needed.
+        self.codec = codec
+
+
+def _unique_component_name(model: pyo.ConcreteModel, prefix: str) -> str:
+    i = 0
+    while model.component(f"{prefix}_{i}") is not None:
+        i += 1
+    return f"{prefix}_{i}"
+
+
+def find_shared_aggregations(
+    constraints: Iterable[Constraint], objective: Objective | None = None
+) -> set[Node]:
+    """
+    Find aggregations worth emitting once as shared Pyomo expressions.
+
+    An aggregation is shared when the same node (same expression, bindings and
+    condition) occurs more than once across the constraints and the objective,
+    or when it is nested under an index it does not depend on, so it would be
+    expanded again with identical free index values.
+    """
+    counts: dict[Node, int] = {}
+    shared: set[Node] = set()
+
+    def visit(node: Node, bound: frozenset[str]):
+        if node.kind == ir.AGG:
+            counts[node] = counts.get(node, 0) + 1
+            if counts[node] > 1 or not bound <= node.free:
+                shared.add(node)
+            _, body, bindings, _ = node.args
+            visit(body, bound.union(*(ir.binding_names(b) for b, _ in bindings)))
+            return
+        for arg in node.args:
+            if isinstance(arg, Node):
+                visit(arg, bound)
+            elif isinstance(arg, tuple):
+                for a in arg:
+                    if isinstance(a, Node):
+                        visit(a, bound)
+
+    for c in constraints:
+        bound = frozenset(n for q in c.quantifiers or () for n in q.index_names)
+        visit(lower(c.expr), bound)
+    if objective is not None:
+        visit(lower(objective.expr), frozenset())
+    return shared
+
 
 def _parse_binary_op(
     model: pyo.ConcreteModel,
-    expr: BinaryOp,
-    index_context: dict[str, Any] | None = None,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ) -> PyomoExpression:
-    """Convert a moai BinaryOp expression to a Pyomo expression."""
-    lhs = _parse_expression(model, expr.left, index_context)
-    rhs = _parse_expression(model, expr.right, index_context)
-
-    # If both operands are scalars (not Pyomo expressions), perform Python arithmetic
-    # This is important for index expressions like t-1 where t is an index variable
-    lhs_is_scalar = isinstance(lhs, (int, float, str))
-    rhs_is_scalar = isinstance(rhs, (int, float, str))
-
-    if lhs_is_scalar and rhs_is_scalar:
-        match expr.op:
-            case "add":
-                result = lhs + rhs  # type: ignore
-                # Ensure integer results stay as ints (important for indexing)
-                if isinstance(lhs, int) and isinstance(rhs, int):
-                    return int(result)
-                return result
-            case "sub":
-                result = lhs - rhs  # type: ignore
-                if isinstance(lhs, int) and isinstance(rhs, int):
-                    return int(result)
-                return result
-            case "mul":
-                result = lhs * rhs  # type: ignore
-                if isinstance(lhs, int) and isinstance(rhs, int):
-                    return int(result)
-                return result
-            case "div":
-                return lhs / rhs  # type: ignore
-            case _:
-                raise ValueError(f"Unsupported binary operator for scalars: {expr.op}")
-
-    # Otherwise, create Pyomo expressions
-    match expr.op:
-        case "add":
-            return pyo.expr.SumExpression((lhs, rhs))
-        case "sub":
-            return pyo.expr.SumExpression((lhs, pyo.expr.NegationExpression(rhs)))
-        case "mul":
-            return pyo.expr.ProductExpression((lhs, rhs))
-        case "div":
-            return pyo.expr.DivisionExpression((lhs, rhs))
-        # case "**" | "^":
-        #     return pyo.expr.PowExpression((lhs, rhs))
-        # case "<=":
-        #     return pyo.expr.InequalityExpression((lhs, rhs), strict=False)
-        # case ">=":
-        #     return pyo.expr.InequalityExpression((rhs, lhs), strict=False)
-        # case "==":
-        #     return pyo.expr.EqualityExpression((lhs, rhs))
-        # case "!=":
-        #     # return pyo.expr.NotEqualExpression((lhs, rhs)) # throws error. Invesigate more
-        #     return lhs != rhs
-        # case "<":
-        #     return pyo.expr.InequalityExpression((lhs, rhs), strict=True)
-        # case ">":
-        #     return pyo.expr.InequalityExpression((rhs, lhs), strict=True)
-        # case "min":
-        #     return pyo.expr.MinExpression((lhs, rhs))
-        # case "max":
-        #     return pyo.expr.MaxExpression((lhs, rhs))
-        # case "pow":
-        #     return pyo.expr.PowExpression((lhs, rhs))
-        case _:
-            raise ValueError(f"Unsupported operator: {expr.op}")
+    """Convert a binary_op node to a Pyomo expression."""
+    op, left, right = expr.args
+    lhs = _parse_node(model, left, index_context, state)
+    rhs = _parse_node(model, right, index_context, state)
+    return binary_op(op, lhs, rhs)
 
 
 def _parse_unary_op(
     model: pyo.ConcreteModel,
-    expr: UnaryOp,
-    index_context: dict[str, Any] | None = None,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ) -> PyomoExpression:
-    operand = _parse_expression(model, expr.expr, index_context)
-    match expr.op:
-        case "-":
-            return pyo.numeric_expr.NegationExpression(operand)
-        case "sin":
-            return pyo.sin(operand)
-        case "cos":
-            return pyo.cos(operand)
-        case "tan":
-            return pyo.tan(operand)
-        case "asin":
-            return pyo.asin(operand)
-        case "acos":
-            return pyo.acos(operand)
-        case "atan":
-            return pyo.atan(operand)
-        case "sinh":
-            return pyo.sinh(operand)
-        case "cosh":
-            return pyo.cosh(operand)
-        case "tanh":
-            return pyo.tanh(operand)
-        case "asinh":
-            return pyo.asinh(operand)
-        case "acosh":
-            return pyo.acosh(operand)
-        case "atanh":
-            return pyo.atanh(operand)
-        case "exp":
-            return pyo.exp(operand)
-        case "log":
-            return pyo.log(operand)
-        case "log10":
-            return pyo.log10(operand)
-        case "sqrt":
-            return pyo.sqrt(operand)
-        case "abs":
-            return pyo.numeric_expr.AbsExpression(operand)
-        case _:
-            raise ValueError(f"Unsupported unary operator: {expr.op}")
+    """Convert a unary_op node to a Pyomo expression."""
+    op, operand_node = expr.args
+    operand = _parse_node(model, operand_node, index_context, state)
+    return unary_op(op, operand)
+
+
+def _parse_index_values(
+    model: pyo.ConcreteModel,
+    indices: tuple[Node, ...],
+    index_context: IndexContext,
+    state: ParseState | None = None,
+):
+    """
+    Evaluate index nodes into a Pyomo component index.
+
+    Index variables are taken from the context as they are, so on a model built
+    on codes they need no decode/encode round trip. Any other index expression
+    is evaluated on labels and encoded afterwards.
+    """
+    codec = state.codec if state is not None else None
+    values = []
+    for index in indices:
+        if index.kind == ir.IDX:
+            index_name = index.args[0]
+            if index_name not in index_context:
+                raise ValueError(f"Index variable {index_name} not found in context")
+            values.append(index_context[index_name])
+        elif index.kind == ir.SHIFT:
+            values.append(_parse_index_shift(model, index, index_context, state))
+        elif codec is not None:
+            values.append(codec.encode(_parse_node(model, index, index_context, state)))  # type: ignore
+        else:
+            values.append(_parse_node(model, index, index_context, state))
+    return values[0] if len(values) == 1 else tuple(values)
+
+
+def _parse_index_shift(
+    model: pyo.ConcreteModel,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
+):
+    """
+    Return the element `offset` positions away in an ordered set.
+
+    The element is returned as the Pyomo set holds it, i.e. as a code on a
+    model built on codes.
+    """
+    index, set_name, offset, cyclic = expr.args
+    set_obj = model.component(set_name)
+    if set_obj is None:
+        raise ValueError(f"Set {set_name} not found in model")
+    index_name = index.args[0]
+    if index_context is None or index_name not in index_context:
+        raise ValueError(f"Index variable {index_name} not found in context")
+
+    value = index_context[index_name]
+    return shift_element(set_obj, value, offset, cyclic, _index_label(value, state))
 
 
 def _parse_variable(
     model: pyo.ConcreteModel,
-    expr: VariableExpr,
-    index_context: dict[str, Any] | None = None,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ) -> PyomoExpression:
-    """Convert a moai Variable expression to a Pyomo variable."""
+    """Convert a variable node to a Pyomo variable."""
+    name, indices = expr.args
     # Handle special case for index variables
-    if expr.name.startswith("_idx_") and index_context:
-        index_name = expr.name[5:]  # Remove "_idx_" prefix
+    if name.startswith("_idx_") and index_context:
+        index_name = name[5:]  # Remove "_idx_" prefix
         if index_name in index_context:
-            return index_context[index_name]
+            return _index_label(index_context[index_name], state)
         else:
             raise ValueError(f"Index variable {index_name} not found in context")
 
-    v = getattr(model, expr.name, None)
+    v = getattr(model, name, None)
     if v is None:
-        raise ValueError(f"Variable {expr.name} not found in model.")
+        raise ValueError(f"Variable {name} not found in model.")
     if not isinstance(v, pyo.Var):
-        raise ValueError(f"Expected variable {expr.name} to be a Pyomo Var.")
+        raise ValueError(f"Expected variable {name} to be a Pyomo Var.")
 
-    if expr.index_expr and not index_context:
+    if indices and not index_context:
         raise ValueError(
-            f"Variable {expr.name} requires index expressions but no index context provided"
+            f"Variable {name} requires index expressions but no index context provided"
         )
-    if expr.index_expr and index_context:
-        # Build index tuple from context
-        index_values = []
-        for index_expr in expr.index_expr:
-            index_values.append(_parse_expression(model, index_expr, index_context))
-        if len(index_values) == 1:
-            return v[index_values[0]]
-        else:
-            return v[tuple(index_values)]
+    if indices and index_context:
+        index = _parse_index_values(model, indices, index_context, state)
+        try:
+            return v[index]
+        except KeyError:
+            # Indices outside the support of a sparse variable
+            if getattr(v, MISSING_ATTR, None) == "zero":
+                return 0
+            raise
     return v
 
 
 def _parse_parameter(
     model: pyo.ConcreteModel,
-    expr: ParameterExpr,
-    index_context: dict[str, Any] | None = None,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ) -> PyomoExpression:
-    """Convert a moai Parameter expression to a Pyomo parameter."""
-    p = getattr(model, expr.name, None)
+    """Convert a parameter node to a Pyomo parameter."""
+    name, indices = expr.args
+    p = getattr(model, name, None)
     if p is None:
-        raise ValueError(f"Parameter {expr.name} not found in model.")
+        raise ValueError(f"Parameter {name} not found in model.")
 
     if not isinstance(p, pyo.Param):
-        raise ValueError(f"Expected parameter {expr.name} to be a Pyomo Param.")
-
-    if expr.index_expr and index_context:
-        index_values = []
-        for index_expr in expr.index_expr:
-            index_values.append(_parse_expression(model, index_expr, index_context))
-        if len(index_values) == 1:
-            return p[index_values[0]]
-        else:
-            return p[tuple(index_values)]
+        raise ValueError(f"Expected parameter {name} to be a Pyomo Param.")
+
+    if indices and index_context:
+        return p[_parse_index_values(model, indices, index_context, state)]
     return p
 
 
 def _parse_comparison_expression(
     model: pyo.ConcreteModel,
-    expr: ComparisonExpression,
-    index_context: dict[str, Any] | None = None,
+    expr: ComparisonExpression | Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ):
     """Convert a moai ComparisonExpression to a Pyomo expression."""
-    lhs: PyomoExpression = _parse_expression(model, expr.left, index_context)
-    rhs: PyomoExpression = _parse_expression(model, expr.right, index_context)
-
-    match expr.op:
-        case "le":
-            return pyo.expr.InequalityExpression((lhs, rhs), strict=False)
-        case "ge":
-            return pyo.expr.InequalityExpression((rhs, lhs), strict=False)
-        case "eq":
-            return pyo.expr.EqualityExpression((lhs, rhs))
-        case "ne":
-            # return pyo.expr.NotEqualExpression((lhs, rhs)) # throws error. Investigate more
-            return lhs != rhs
-        case "lt":
-            return pyo.expr.InequalityExpression((lhs, rhs), strict=True)
-        case "gt":
-            return pyo.expr.InequalityExpression((rhs, lhs), strict=True)
-        case _:
-            raise ValueError(f"Unsupported comparison operator: {expr.op}")
+    op, left, right = lower(expr).args
+    lhs: PyomoExpression = _parse_node(model, left, index_context, state)
+    rhs: PyomoExpression = _parse_node(model, right, index_context, state)
+    return relation(op, lhs, rhs)
 
 
 def _parse_index_comparison_expression(
     model: pyo.ConcreteModel,
-    expr: IndexComparisonExpr,
-    index_context: dict[str, Any] | None = None,
+    expr: IndexComparisonExpr | Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ):
     """Convert a moai IndexComparisonExpression to a boolean result.
 
     This is used for conditions in aggregation expressions.
     """
-    lhs = _parse_expression(model, expr.left, index_context)
-    rhs = _parse_expression(model, expr.right, index_context)
+    op, left, right = lower(expr).args
+    lhs = _parse_node(model, left, index_context, state)
+    rhs = _parse_node(model, right, index_context, state)
 
-    match expr.op:
+    match op:
         case "le":
             return lhs <= rhs  # type: ignore
         case "ge":
@@ -401,55 +707,94 @@ def _parse_index_comparison_expression(
         case "gt":
             return lhs > rhs  # type: ignore
         case _:
-            raise ValueError(f"Unsupported comparison operator: {expr.op}")
-
-
-IndexContext = dict[str, str | int | float]
+            raise ValueError(f"Unsupported comparison operator: {op}")
 
 
 def _parse_expression(
     model: pyo.ConcreteModel,
-    expr: ExprType,
+    expr: ExprType | Node,
     index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ) -> PyomoExpression:
     """Convert a moai expression to a Pyomo expression.
 
     Args:
         model: The Pyomo model
-        expr: The moai expression to convert
+        expr: The moai expression (or its IR node) to convert
         index_context: Dictionary mapping index variables to their current values
+        state: Optional caches shared across calls while building one model
     """
-    if isinstance(expr, StringExpr):
-        return expr.value
-    if isinstance(expr, NumberExpr):
-        return expr.value
-    elif isinstance(expr, IndexVariableExpr):
+    return _parse_node(model, lower(expr), index_context, state)
+
+
+def _parse_node(
+    model: pyo.ConcreteModel,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
+) -> PyomoExpression:
+    """Convert an IR node to a Pyomo expression."""
+    kind = expr.kind
+    if kind == ir.NUM or kind == ir.STR:
+        return expr.args[0]
+    if kind == ir.IDX:
         if index_context is None:
             raise ValueError("Index context is required for index variables")
-        index_name = expr.name
+        index_name = expr.args[0]
         if index_name not in index_context:
             raise ValueError(f"Index variable {index_name} not found in context")
-        return index_context[index_name]
-    elif isinstance(expr, VariableExpr):
-        return _parse_variable(model, expr, index_context)
-    elif isinstance(expr, ParameterExpr):
-        return _parse_parameter(model, expr, index_context)
-    elif isinstance(expr, BinaryOp):
-        return _parse_binary_op(model, expr, index_context)
-    elif isinstance(expr, UnaryOp):
-        return _parse_unary_op(model, expr, index_context)
-    elif isinstance(expr, AggregationExpression):
-        return _parse_aggregation(model, expr, index_context)
-    else:
-        raise ValueError(f"Unsupported expression type: {type(expr)}")
+        return _index_label(index_context[index_name], state)
+    if kind == ir.SHIFT:
+        return _index_label(
+            _parse_index_shift(model, expr, index_context, state), state
+        )
+    if kind == ir.VAR:
+        return _parse_variable(model, expr, index_context, state)
+    if kind == ir.PARAM:
+        return _parse_parameter(model, expr, index_context, state)
+
+    if state is not None:
+        if state.shared is not None and expr in state.shared.nodes:
+            return state.shared.reference(model, expr, index_context, state)
+        # Compound nodes that do not depend on any index are built once
+        if not expr.free:
+            result = state.memo.get(expr)
+            if result is None:
+                result = _parse_compound(model, expr, index_context, state)
+                state.memo[expr] = result
+            return result
+    return _parse_compound(model, expr, index_context, state)
+
+
+def _index_label(value: Any, state: ParseState | None) -> Any:
+    """Decode an index context value where it is used as a label."""
+    if state is not None and state.codec is not None:
+        return state.codec.labels[value]
+    return value
+
+
+def _parse_compound(
+    model: pyo.ConcreteModel,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
+) -> PyomoExpression:
+    if expr.kind == ir.BINARY:
+        return _parse_binary_op(model, expr, index_context, state)
+    if expr.kind == ir.UNARY:
+        return _parse_unary_op(model, expr, index_context, state)
+    if expr.kind == ir.AGG:
+        return _parse_aggregation(model, expr, index_context, state)
+    raise ValueError(f"Unsupported expression type: {expr.kind}")
 
 
 def _parse_sum(
     model: pyo.ConcreteModel,
-    expr: AggregationExpression,
-    index_context: dict[str, Any] | None = None,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ):
-    """Convert a moai Sum expression to a Pyomo sum expression.
+    """Convert a sum aggregation node to a Pyomo sum expression.
 
     This function handles multiple bindings by creating nested loops (Cartesian product)
     over all the sets. For each combination of index values, it:
@@ -458,68 +803,73 @@ def _parse_sum(
 
     Args:
         model: The Pyomo model
-        expr: The aggregation expression with bindings and optional condition
+        expr: The aggregation node with bindings and optional condition
         index_context: Existing index context (from outer scope)
+        state: Optional caches shared while building one model
 
     Returns:
         Sum of all terms that satisfy the condition
     """
     from itertools import product
 
+    _, body, bindings, condition = expr.args
+
     # Collect all sets for the bindings
     sets = []
-    for binding in expr.bindings:
-        set_obj = getattr(model, binding.set_name, None)
+    for index_var, set_name in bindings:
+        set_obj = getattr(model, set_name, None)
         if set_obj is None:
-            raise ValueError(f"Set {binding.set_name} not found in model")
+            raise ValueError(f"Set {set_name} not found in model")
+        check_dimension(set_obj, ir.binding_names(index_var))
         sets.append(set_obj)
 
     # Create the Cartesian product of all sets
     terms = []
 
+    # The outer index context (includes quantifier variables), copied once.
+    # The bindings are overwritten in place for every combination.
+    bindings_context = dict(index_context) if index_context else {}
     for combination in product(*sets):
-        # Start with the outer index context (includes quantifier variables)
-        bindings_context = index_context.copy() if index_context else {}
-
         # Map each index variable to its corresponding value in this combination
-        for i, binding in enumerate(expr.bindings):
-            bindings_context[binding.index_var] = combination[i]
+        for i, (index_var, _) in enumerate(bindings):
+            if isinstance(index_var, tuple):
+                # Unpack the components of a tuple set element
+                bindings_context.update(zip(index_var, combination[i], strict=True))
+            else:
+                bindings_context[index_var] = combination[i]
 
         # Check the condition if present
-        if expr.condition is not None:
+        if condition is not None:
             condition_result = _parse_index_comparison_expression(
-                model, expr.condition, bindings_context
+                model, condition, bindings_context, state
             )
             # Skip this term if condition is not satisfied
             if not condition_result:
                 continue
 
         # Parse the inner expression with this context
-        term = _parse_expression(model, expr.expr, bindings_context)
+        term = _parse_node(model, body, bindings_context, state)
         terms.append(term)
 
     # Return sum of all terms
-    if not terms:
-        return 0
-    elif len(terms) == 1:
-        return terms[0]
-    else:
-        return sum(terms)
+    return total(terms)
 
 
 def _parse_aggregation(
     model: pyo.ConcreteModel,
-    expr: AggregationExpression,
-    index_context: dict[str, Any] | None = None,
+    expr: Node,
+    index_context: IndexContext | None = None,
+    state: ParseState | None = None,
 ):
-    """Convert a moai aggregation expression to a Pyomo expression.
+    """Convert an aggregation node to a Pyomo expression.
 
     Routes to the appropriate aggregation function based on the operator.
     """
-    if expr.op == "sum":
-        return _parse_sum(model, expr, index_context)
+    op = expr.args[0]
+    if op == "sum":
+        return _parse_sum(model, expr, index_context, state)
     else:
-        raise ValueError(f"Unsupported aggregation operator: {expr.op}")
+        raise ValueError(f"Unsupported aggregation operator: {op}")
 
 
 # def _parse_set_operation(
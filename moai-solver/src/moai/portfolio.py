@@ -0,0 +1,279 @@
+"""
+Races of solvers on a model.
+
+No solver is fastest on every model. A `Race` runs the solvers of a
+portfolio at once on a model, in subprocesses of the event loop:
+
+- the first solver to prove its result, optimal, infeasible or unbounded,
+  wins, and the others are cancelled,
+- otherwise the best solution found at the limits of the solve wins.
+
+Every solver finishing a race is recorded in the history of solves, with
+the time it took from the start of the race, see `moai.history`. Solvers
+cancelled by the winner are not.
+"""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING
+
+import pyomo.environ as pyo
+from pyomo.opt import SolverResults
+from pyomo.opt.solver import SystemCallSolver
+
+from .driver import PROGRESS_INTERVAL, SolverProcess
+from .estimate import estimate_size
+from .history import DEFAULT_SOLVERS, SolverConfig, record_solve
+from .progress import SolveProgress
+from .results import ModelResult, ObjectiveResult, result_status
+
+if TYPE_CHECKING:
+    from .model import Model
+
+
+# Terminations of results proven by the solver
+_PROVEN = {
+    pyo.TerminationCondition.optimal,
+    pyo.TerminationCondition.infeasible,
+    pyo.TerminationCondition.unbounded,
+}
+
+
+def available(configs: list[SolverConfig]) -> list[SolverConfig]:
+    """Solvers of a portfolio installed as executables, which can be raced."""
+    found = []
+    for config in configs:
+        solver = pyo.SolverFactory(config.solver_name)
+        if isinstance(solver, SystemCallSolver) and solver.available(
+            exception_flag=False
+        ):
+            found.append(config)
+    return found
+
+
+def _proven(solver_results: SolverResults | ModelResult) -> bool:
+    if isinstance(solver_results, ModelResult):
+        return solver_results.status in ("optimal", "infeasible", "unbounded")
+    solver = solver_results.solver
+    return (
+        solver.status == pyo.SolverStatus.ok and solver.termination_condition in _PROVEN
+    )
+
+
+def _objective_value(solver_results: SolverResults | ModelResult) -> float | None:
+    """Objective value of the solution of results not loaded yet."""
+    if isinstance(solver_results, ModelResult):
+        objective = solver_results.objective
+        return objective.value if objective is not None else None
+    if len(solver_results.solution) == 0:
+        return None
+    for objective in solver_results.solution(0).objective.values():
+        value = objective.get("Value")
+        if isinstance(value, int | float):
+            return float(value)
+    return None
+
+
+class Race:
+    """
+    A race of solvers on a model.
+
+    Args:
+        model: Model to solve
+        configs: Solvers to race, at least one
+        **limits: Limits and memory limit of every solver, and the fingerprint,
+            estimate and fragment cache of the model, see `SolverProcess`
+
+    Raises:
+        ValueError: If there is no solver to race, or a solver cannot be
+            raced, see `SolverProcess`
+    """
+
+    def __init__(
+        self,
+        model: "Model",
+        configs: list[SolverConfig],
+        **limits,
+    ):
+        if not configs:
+            raise ValueError("No solver to race")
+        self.model = model
+        self.configs = configs
+        self.processes = [
+            SolverProcess(model, config.solver_name, **limits, **config.options)
+            for config in configs
+        ]
+        self.winner: SolverConfig | None = None
+
+    @property
+    def sense(self) -> str:
+        objective = self.model.objective
+        return objective.sense if objective is not None else "min"
+
+    @property
+    def elapsed(self) -> float | None:
+        times = [p.elapsed for p in self.processes if p.elapsed is not None]
+        return max(times) if times else None
+
+    @property
+    def progress(self) -> SolveProgress:
+        """Progress of the solver with the best solution so far."""
+        progresses = [p.progress for p in self.processes]
+        found = [p for p in progresses if p.incumbent is not None]
+        if not found:
+            return progresses[0]
+        if self.sense == "max":
+            return max(found, key=lambda p: p.incumbent)
+        return min(found, key=lambda p: p.incumbent)
+
+    def stop(self):
+        """Stop every solver, the best solution found wins."""
+        for process in self.processes:
+            process.stop()
+
+    async def updates(
+        self, interval: float | None = None
+    ) -> AsyncIterator[SolveProgress]:
+        """Follow the best progress of the race until every solver exits."""
+        interval = PROGRESS_INTERVAL if interval is None else interval
+        sent = None
+        while True:
+            finished = all(p.finished is not None for p in self.processes)
+            progress = self.progress.model_copy()
+            if progress != sent:
+                sent = progress
+                yield progress
+            if finished:
+                return
+            await asyncio.sleep(interval)
+
+    async def run(self) -> ModelResult:
+        """
+        Race the solvers, and return the result of the winner.
+
+        The solver info of the result is named after the winner. Solvers
+        solving through Pyomo plugins write their problems and read their
+        solutions one at a time, see `SolverProcess`.
+        """
+        if any(process._lp is None for process in self.processes):
+            # Solvers solving through Pyomo plugins share the Pyomo model,
+            # built once before they start
+            await asyncio.to_thread(self.model.build)
+        started = time.perf_counter()
+        tasks = {
+            asyncio.create_task(process.execute()): index
+            for index, process in enumerate(self.processes)
+        }
+        finished: dict[int, SolverResults | ModelResult] = {}
+        # Seconds from the start of the race to the finish of every solver
+        seconds: dict[int, float] = {}
+        errors: list[BaseException] = []
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        continue
+                    finished[tasks[task]] = task.result()
+                    seconds[tasks[task]] = time.perf_counter() - started
+                if any(_proven(results) for results in finished.values()):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+
+        if not finished:
+            raise errors[0]
+        # Recorded off the event loop, as sizing the model takes a while
+        await asyncio.to_thread(self._record, finished, seconds)
+        proven = [i for i, results in finished.items() if _proven(results)]
+        if proven:
+            finished = {proven[0]: finished[proven[0]]}
+        index = self._best(finished)
+        self.winner = self.configs[index]
+        result = await self.processes[index].load(finished[index])
+        result.solver_info.solver_name = self.winner.label
+        # Every solver of the race took its threads
+        result.solver_info.threads = sum(p.threads_used or 1 for p in self.processes)
+        return result
+
+    def _record(
+        self,
+        finished: dict[int, SolverResults | ModelResult],
+        seconds: dict[int, float],
+    ):
+        """Record every solver finishing the race in the history of solves."""
+        first = self.processes[0]
+        data = first.data
+        estimate = first.estimate if first.estimate is not None else estimate_size(data)
+        objective = self.model.objective
+        for index, results in finished.items():
+            if not isinstance(results, ModelResult):
+                # Only the solution of the winner is loaded, the others are
+                # recorded by their status and objective value
+                value = _objective_value(results)
+                results = ModelResult(
+                    status=result_status(results),
+                    objective=(
+                        ObjectiveResult(
+                            name=objective.name, value=value, sense=objective.sense
+                        )
+                        if objective is not None and value is not None
+                        else None
+                    ),
+                )
+            record_solve(
+                data,
+                self.configs[index],
+                results,
+                seconds[index],
+                estimate,
+                first.model_fingerprint,
+            )
+
+    def _best(self, finished: dict[int, SolverResults | ModelResult]) -> int:
+        """Solver with the best solution, the first to finish without one."""
+        values = {
+            index: value
+            for index, results in finished.items()
+            if (value := _objective_value(results)) is not None
+        }
+        if not values:
+            return next(iter(finished))
+        sign = -1 if self.sense == "max" else 1
+        return min(values, key=lambda index: sign * values[index])
+
+
+class Portfolio:
+    """
+    Solvers raced on models.
+
+    Args:
+        configs: Solvers to race, every one of `DEFAULT_SOLVERS` installed
+            as an executable by default
+    """
+
+    def __init__(self, configs: list[SolverConfig] | None = None):
+        self._configs = configs
+
+    @property
+    def configs(self) -> list[SolverConfig]:
+        if self._configs is None:
+            self._configs = available(
+                [SolverConfig(solver_name=name) for name in DEFAULT_SOLVERS]
+            )
+        return self._configs
+
+    def race(self, model: "Model", **limits) -> Race:
+        """A race of the solvers of the portfolio on a model, see `Race`."""
+        return Race(model, self.configs, **limits)
+
+
+# Portfolio of the solves of this process
+portfolio = Portfolio()
@@ -0,0 +1,159 @@
+"""
+Progress of running solves, parsed from the log of the solver.
+
+Solvers log their search as they go. `SolveProgress` is the state of a
+search at a point in time: nodes explored, best solution found, best bound
+and the gap between them. Log parsers update it from every line of the log,
+see `LOG_PARSERS`.
+"""
+
+import re
+from typing import Literal
+
+from pydantic import BaseModel
+
+# Objective values CBC logs for "no solution"
+_INFINITY = 1e50
+
+_NUMBER = r"-?[\d.]+(?:e[+-]?\d+)?"
+
+# Lines of the CBC log, with the fields they report
+_CBC_LINES = [
+    # Cbc0010I After 1000 nodes, 621 on tree, 35 best solution, best possible 0 (0.57 seconds)
+    re.compile(
+        rf"Cbc0010I After (?P<nodes>\d+) nodes, \d+ on tree, (?P<incumbent>{_NUMBER}) "
+        rf"best solution, best possible (?P<bound>{_NUMBER}) \([\d.]+ seconds\)"
+    ),
+    # Cbc0012I Integer solution of 35 found by feasibility pump after 0 iterations
+    # and 0 nodes (0.09 seconds), Cbc0004I Integer solution of 33 found after ...
+    re.compile(
+        rf"Cbc00(?:04|12)I Integer solution of (?P<incumbent>{_NUMBER}) found .*"
+        rf"and (?P<nodes>\d+) nodes \([\d.]+ seconds\)"
+    ),
+    # Cbc0013I At root node, 2 cuts changed objective from 0 to 0 in 100 passes
+    re.compile(rf"Cbc0013I At root node, .* to (?P<bound>{_NUMBER}) in"),
+    # Cbc0005I Partial search - best objective 35 (best possible 0), took 37620
+    # iterations and 15483 nodes (3.02 seconds)
+    re.compile(
+        rf"Cbc0005I Partial search - best objective (?P<incumbent>{_NUMBER}) "
+        rf"\(best possible (?P<bound>{_NUMBER})\), .* and (?P<nodes>\d+) nodes "
+        rf"\([\d.]+ seconds\)"
+    ),
+    # Cbc0001I Search completed - best objective -1772, took 194 iterations and
+    # 28 nodes (0.03 seconds). Also logged by searches stopped at their gap.
+    re.compile(
+        rf"Cbc0001I Search completed - best objective (?P<incumbent>{_NUMBER}), .* "
+        rf"and (?P<nodes>\d+) nodes \([\d.]+ seconds\)"
+    ),
+]
+
+# Lines of the summary CBC logs at exit, with the fields they report in the
+# sense of the model. Unlike the lines above, the summary is kept by CBC
+# versions that log their search in other layouts.
+_CBC_SUMMARY = [
+    # Objective value:                27
+    re.compile(rf"Objective value:\s+(?P<incumbent>{_NUMBER})$"),
+    # Upper bound:                    2083.507
+    re.compile(rf"(?:Lower|Upper) bound:\s+(?P<bound>{_NUMBER})$"),
+    # Enumerated nodes:               20015
+    re.compile(r"Enumerated nodes:\s+(?P<nodes>\d+)$"),
+]
+
+# Versions of CBC whose search log `_CBC_LINES` parse. Others only report
+# the progress of their summary at exit.
+CBC_LOG_VERSIONS = ("2.10",)
+
+
+class SolveProgress(BaseModel):
+    """State of the search of a running solve, at `elapsed` seconds."""
+
+    elapsed: float = 0.0
+    nodes: int = 0
+    incumbent: float | None = None
+    bound: float | None = None
+    gap: float | None = None
+
+
+def relative_gap(incumbent: float | None, bound: float | None) -> float | None:
+    """Gap between the best solution and the best bound, relative to the solution."""
+    if incumbent is None or bound is None:
+        return None
+    difference = abs(incumbent - bound)
+    if difference == 0:
+        return 0.0
+    if incumbent == 0:
+        return float("inf")
+    return difference / abs(incumbent)
+
+
+class CbcLogParser:
+    """
+    Parses the progress of a CBC solve from its log.
+
+    CBC minimizes, and logs the objective of maximized models negated.
+    Lines of unknown layouts are ignored: `parsed` stays False until a line
+    reports progress.
+
+    Args:
+        sense: Sense of the objective of the model
+    """
+
+    def __init__(self, sense: Literal["min", "max"] = "min"):
+        self.sign = -1 if sense == "max" else 1
+        self.progress = SolveProgress()
+        self.parsed = False
+
+    def feed(self, line: str) -> bool:
+        """Update the progress from a line of the log, and return whether it did."""
+        summary = not line.startswith("Cbc")
+        if summary:
+            line = line.strip()
+        for pattern in _CBC_SUMMARY if summary else _CBC_LINES:
+            match = pattern.match(line)
+            if match is not None:
+                self._update(match.groupdict(), summary)
+                self.parsed = True
+                return True
+        return False
+
+    def _update(self, fields: dict[str, str], summary: bool = False):
+        progress = self.progress
+        sign = 1 if summary else self.sign
+        if "nodes" in fields:
+            progress.nodes = int(fields["nodes"])
+        for name in ("incumbent", "bound"):
+            if name in fields:
+                value = _objective(fields[name], sign)
+                # Summaries log infinite values for searches without them
+                if value is not None or not summary:
+                    setattr(progress, name, value)
+        progress.gap = relative_gap(progress.incumbent, progress.bound)
+
+
+def _objective(value: str, sign: int) -> float | None:
+    number = float(value)
+    if abs(number) >= _INFINITY:
+        return None
+    return sign * number
+
+
+# Log parser of each solver
+LOG_PARSERS: dict[str, type[CbcLogParser]] = {
+    "cbc": CbcLogParser,
+}
+
+
+def parse_log(
+    solver_name: str, log: str | None, sense: Literal["min", "max"] = "min"
+) -> SolveProgress | None:
+    """
+    Progress of a solve at the end of its log, None without a log parser or
+    when no line of the log reports progress.
+    """
+    parser = LOG_PARSERS.get(solver_name)
+    if parser is None or not log:
+        return None
+    parser = parser(sense)
+    for line in log.splitlines():
+        parser.feed(line)
+    return parser.progress if parser.parsed else None
@@ -3,7 +3,25 @@ from typing import Any, Literal
 import pyomo.environ as pyo
 from pydantic import BaseModel, Field
 
+from moai.codec import LabelCodec, label_codec
 from moai.parameters import IndexValue
+from moai.progress import relative_gap
+
+# Status of a solve. Solves stopped at a limit, or interrupted, with a
+# feasible solution are "stopped"
+ResultStatus = Literal[
+    "success", "error", "optimal", "feasible", "stopped", "infeasible", "unbounded"
+]
+
+# Objective values solvers report for "no bound"
+_INFINITY = 1e50
+
+
+def _index_key(index: Any, codec: LabelCodec | None) -> tuple[IndexValue, ...]:
+    """Normalize a Pyomo component index to a tuple of set elements"""
+    if codec is not None:
+        return codec.decode_index(index)
+    return index if isinstance(index, tuple) else (index,)
 
 
 class ScalarVariableResult(BaseModel):
@@ -177,6 +195,17 @@ class ObjectiveResult(BaseModel):
         return f"{self.name} ({self.sense}): {self.value}"
 
 
+def _defined(value: Any, kind: type) -> Any:
+    """A value of solver results, or None where the solver left it undefined."""
+    # Pyomo reports values a solver does not set as UndefinedData
+    if isinstance(value, bool) or not isinstance(value, int | float | str):
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        return None
+
+
 class SolverInfo(BaseModel):
     """Information about the solver and solution process"""
 
@@ -185,6 +214,14 @@ class SolverInfo(BaseModel):
     solve_time: float | None = None
     iterations: int | None = None
     nodes: int | None = None
+    threads: int | None = None
+    # Best bound on the objective, and its gap to the objective value: the
+    # best solution found
+    bound: float | None = None
+    gap: float | None = None
+    # What the solver reported of a termination it was not mapped from, such
+    # as the header of a CBC solution file of an unknown layout
+    message: str | None = None
 
     def __repr__(self) -> str:
         parts = []
@@ -197,6 +234,45 @@ class SolverInfo(BaseModel):
         return f"SolverInfo({', '.join(parts)})"
 
 
+# Solver statuses of results whose solution can be loaded
+_LOADABLE_STATUSES = {
+    pyo.SolverStatus.ok,
+    pyo.SolverStatus.warning,
+    pyo.SolverStatus.aborted,
+}
+
+# Termination of solves stopped before proving optimality
+_STOPPED_CONDITIONS = {
+    pyo.TerminationCondition.maxTimeLimit,
+    pyo.TerminationCondition.maxIterations,
+    pyo.TerminationCondition.maxEvaluations,
+    pyo.TerminationCondition.userInterrupt,
+    pyo.TerminationCondition.resourceInterrupt,
+}
+
+
+def result_status(solver_results: Any) -> ResultStatus:
+    """Status of the Pyomo results of a solve, before its solution is loaded."""
+    solver = solver_results.solver
+    if solver.status == pyo.SolverStatus.ok:
+        if solver.termination_condition == pyo.TerminationCondition.optimal:
+            return "optimal"
+        if solver.termination_condition in [
+            pyo.TerminationCondition.feasible,
+            pyo.TerminationCondition.locallyOptimal,
+        ]:
+            return "feasible"
+        if solver.termination_condition == pyo.TerminationCondition.infeasible:
+            return "infeasible"
+        if solver.termination_condition == pyo.TerminationCondition.unbounded:
+            return "unbounded"
+        return "success"
+    found = len(solver_results.solution) > 0
+    if found and solver.termination_condition in _STOPPED_CONDITIONS:
+        return "stopped"
+    return "error"
+
+
 class ModelResult(BaseModel):
     """
     Structured and typed results from an optimization model.
@@ -207,20 +283,77 @@ class ModelResult(BaseModel):
 
     model_config = {"arbitrary_types_allowed": True}
 
-    status: Literal[
-        "success", "error", "optimal", "feasible", "infeasible", "unbounded"
-    ]
+    status: ResultStatus
     variables: VariableResults = Field(default_factory=VariableResults)
     constraints: ConstraintResults = Field(default_factory=ConstraintResults)
     objective: ObjectiveResult | None = None
     solver_info: SolverInfo = Field(default_factory=SolverInfo)
 
+    @classmethod
+    def from_solver_results(
+        cls,
+        pyomo_model: pyo.ConcreteModel,
+        solver_results: Any,
+        model_data: "Any" = None,
+        bound: float | None = None,
+    ) -> "ModelResult":
+        """
+        Create a ModelResult from the results of a solve, not yet loaded.
+
+        The solution of the results is loaded into the Pyomo model. Solves
+        stopped by a limit or an interrupt keep the best solution they found,
+        and are "stopped".
+
+        The status is derived from the solver status and termination condition.
+
+        Args:
+            pyomo_model: The solved Pyomo model
+            solver_results: Pyomo solver results of the solve
+            model_data: Optional ModelData object for enhanced type information
+            bound: Best bound on the objective from the log of the solver,
+                used where the solver results have none
+        """
+        status = result_status(solver_results)
+        if (
+            len(solver_results.solution) > 0
+            and solver_results.solver.status in _LOADABLE_STATUSES
+        ):
+            pyomo_model.solutions.load_from(solver_results)
+            solver_results.solution.clear()
+
+        result = cls.from_pyomo(
+            status=status,
+            pyomo_model=pyomo_model,
+            model_data=model_data,
+            solver_results=solver_results,
+        )
+        if result.objective is not None and result.objective.value is not None:
+            extracted = cls._extract_bound(
+                solver_results, result.objective.sense, result.objective.value
+            )
+            if extracted is not None:
+                bound = extracted
+        result.set_bound(bound)
+        return result
+
+    def set_bound(self, bound: float | None):
+        """
+        Set the best bound on the objective, and the gap of the solution to it.
+
+        Optimal solves without a bound are bounded by their objective value.
+        """
+        if self.objective is None or self.objective.value is None:
+            return
+        incumbent = self.objective.value
+        if bound is None and self.status == "optimal":
+            bound = incumbent
+        self.solver_info.bound = bound
+        self.solver_info.gap = relative_gap(incumbent, bound)
+
     @classmethod
     def from_pyomo(
         cls,
-        status: Literal[
-            "success", "error", "optimal", "feasible", "infeasible", "unbounded"
-        ],
+        status: ResultStatus,
         pyomo_model: pyo.ConcreteModel,
         model_data: "Any" = None,  # ModelData type to avoid circular import
         solver_results: Any = None,
@@ -262,11 +395,16 @@ class ModelResult(BaseModel):
                     else [],
                 }
 
+        # Index keys are decoded back to set elements if the model is built on codes
+        codec = label_codec(pyomo_model)
+
         # Extract variable results
-        variables = cls._extract_variable_results(pyomo_model, var_info)
+        variables = cls._extract_variable_results(pyomo_model, var_info, codec)
 
         # Extract constraint results
-        constraints = cls._extract_constraint_results(pyomo_model, constraint_info)
+        constraints = cls._extract_constraint_results(
+            pyomo_model, constraint_info, codec
+        )
 
         # Extract objective
         objective = cls._extract_objective_result(pyomo_model)
@@ -284,7 +422,9 @@ class ModelResult(BaseModel):
 
     @staticmethod
     def _extract_variable_results(
-        pyomo_model: pyo.ConcreteModel, var_info: dict
+        pyomo_model: pyo.ConcreteModel,
+        var_info: dict,
+        codec: LabelCodec | None = None,
     ) -> VariableResults:
         """Extract variable results from Pyomo model"""
         scalar_vars = {}
@@ -301,13 +441,9 @@ class ModelResult(BaseModel):
             if v.is_indexed():
                 # Indexed variable
                 values = {}
-                for idx in v:
-                    if v[idx].value is not None:
-                        # Normalize index to tuple
-                        if isinstance(idx, tuple):
-                            values[idx] = v[idx].value
-                        else:
-                            values[(idx,)] = v[idx].value
+                for idx, var_data in v.items():
+                    if var_data.value is not None:
+                        values[_index_key(idx, codec)] = var_data.value
 
                 indexed_vars[var_name] = IndexedVariableResult(
                     name=var_name,
@@ -331,7 +467,9 @@ class ModelResult(BaseModel):
 
     @staticmethod
     def _extract_constraint_results(
-        pyomo_model: pyo.ConcreteModel, constraint_info: dict
+        pyomo_model: pyo.ConcreteModel,
+        constraint_info: dict,
+        codec: LabelCodec | None = None,
     ) -> ConstraintResults:
         """Extract constraint results from Pyomo model"""
         scalar_constraints = {}
@@ -350,11 +488,7 @@ class ModelResult(BaseModel):
 
                 for idx in c:
                     if c[idx].body is not None:
-                        # Normalize index to tuple
-                        if isinstance(idx, tuple):
-                            key = idx
-                        else:
-                            key = (idx,)
+                        key = _index_key(idx, codec)
 
                         body_values[key] = pyo.value(c[idx].body)
 
@@ -423,6 +557,28 @@ class ModelResult(BaseModel):
                 return ObjectiveResult(name=obj.name, value=value, sense=sense)
         return None
 
+    @staticmethod
+    def _extract_bound(
+        solver_results: Any, sense: Literal["min", "max"], incumbent: float
+    ) -> float | None:
+        """Best bound of Pyomo solver results, None where it is not a bound."""
+        problem = getattr(solver_results, "problem", None)
+        if problem is None:
+            return None
+        if sense == "min":
+            bound = _defined(getattr(problem, "lower_bound", None), float)
+        else:
+            bound = _defined(getattr(problem, "upper_bound", None), float)
+        if bound is None or abs(bound) >= _INFINITY:
+            return None
+        # Some solvers report the bound of stopped solves negated, or none
+        tolerance = 1e-9 * max(1.0, abs(incumbent))
+        if (sense == "min" and bound > incumbent + tolerance) or (
+            sense == "max" and bound < incumbent - tolerance
+        ):
+            return None
+        return bound
+
     @staticmethod
     def _extract_solver_info(solver_results: Any) -> SolverInfo:
         """Extract solver information from Pyomo solver results"""
@@ -435,7 +591,7 @@ class ModelResult(BaseModel):
             # Extract solver name
             if hasattr(solver_results, "solver"):
                 if hasattr(solver_results.solver, "name"):
-                    info.solver_name = solver_results.solver.name
+                    info.solver_name = _defined(solver_results.solver.name, str)
 
             # Extract termination condition
             if hasattr(solver_results, "solver"):
@@ -447,17 +603,19 @@ class ModelResult(BaseModel):
             # Extract solve time
             if hasattr(solver_results, "solver"):
                 if hasattr(solver_results.solver, "time"):
-                    info.solve_time = solver_results.solver.time
+                    info.solve_time = _defined(solver_results.solver.time, float)
 
             # Extract iteration count
             if hasattr(solver_results, "problem"):
                 if hasattr(solver_results.problem, "number_of_iterations"):
-                    info.iterations = solver_results.problem.number_of_iterations
+                    info.iterations = _defined(
+                        solver_results.problem.number_of_iterations, int
+                    )
 
             # Extract node count (for MIP solvers)
             if hasattr(solver_results, "problem"):
                 if hasattr(solver_results.problem, "number_of_nodes"):
-                    info.nodes = solver_results.problem.number_of_nodes
+                    info.nodes = _defined(solver_results.problem.number_of_nodes, int)
 
         except Exception:
             # Silently fail if we can't extract solver info
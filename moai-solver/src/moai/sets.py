@@ -1,14 +1,57 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
-SetElements = list[str] | list[int]
+from .parameters import IndexValue
+
+
+class SetRange(BaseModel):
+    """
+    Integer range of set elements, with the semantics of Python's `range`.
+
+    `stop` is exclusive, so `SetRange(start=1, stop=4)` holds 1, 2 and 3.
+    """
+
+    start: int
+    stop: int
+    step: int = 1
+
+    @field_validator("step")
+    @classmethod
+    def _nonzero_step(cls, step: int) -> int:
+        if step == 0:
+            raise ValueError("step must not be zero")
+        return step
+
+    def to_range(self) -> range:
+        return range(self.start, self.stop, self.step)
+
+
+# Explicit elements of a multi-dimensional set, e.g. [["a", "b"], ["b", "c"]]
+TupleElements = list[list[IndexValue]]
+
+SetElements = list[str] | list[int] | TupleElements | SetRange
 
 
 class Set(BaseModel):
-    """Definition of a set in the MILP model"""
+    """
+    Definition of a set in the MILP model.
+
+    Elements are either an explicit list, an integer range or an explicit
+    list of tuples for sparse multi-dimensional sets such as arcs. Sets are
+    ordered: elements keep the order they are declared in.
+    """
 
     name: str
     elements: SetElements
 
+    @field_validator("elements")
+    @classmethod
+    def _same_dimension(cls, elements: SetElements) -> SetElements:
+        if isinstance(elements, list) and elements and isinstance(elements[0], list):
+            dimen = len(elements[0])
+            if any(len(e) != dimen for e in elements):  # type: ignore
+                raise ValueError("All tuple elements must have the same length")
+        return elements
+
     @classmethod
     def create(cls, name: str, elements: SetElements):
         return Set(
@@ -16,6 +59,39 @@ class Set(BaseModel):
             elements=elements,
         )
 
+    @classmethod
+    def create_range(cls, name: str, start: int, stop: int, step: int = 1):
+        """Create a set of the integers in range(start, stop, step)"""
+        return Set(
+            name=name,
+            elements=SetRange(start=start, stop=stop, step=step),
+        )
+
+    @property
+    def is_tuple_set(self) -> bool:
+        """Whether elements are tuples"""
+        return (
+            isinstance(self.elements, list)
+            and bool(self.elements)
+            and isinstance(self.elements[0], list)
+        )
+
+    @property
+    def dimen(self) -> int:
+        """Number of components of every element"""
+        return len(self.elements[0]) if self.is_tuple_set else 1  # type: ignore
+
+    @property
+    def size(self) -> int:
+        """Number of elements, without materializing ranges"""
+        if isinstance(self.elements, SetRange):
+            return len(self.elements.to_range())
+        return len(self.elements)
+
     def iter_elements(self):
-        """Iterate over set elements"""
+        """Iterate over set elements. Elements of tuple sets are tuples."""
+        if isinstance(self.elements, SetRange):
+            return iter(self.elements.to_range())
+        if self.is_tuple_set:
+            return (tuple(e) for e in self.elements)  # type: ignore
         return iter(self.elements)
@@ -0,0 +1,353 @@
+"""
+Solutions of LP files written by `moai.writer`, read back into results.
+
+Solvers name the rows and columns of a solution after those of the LP file,
+c{n} and x{n}. `LPNames` maps them back to the constraints and variables of
+the model and their indices, so results are built from `ModelData` alone,
+without the Pyomo model:
+
+- the body value of a row is its body as Pyomo builds it: its activity, the
+  variable terms, with the constants Pyomo keeps in the body added back,
+- its slack is the distance from the activity to the right-hand side,
+  positive when the row holds, as Pyomo computes slacks,
+- duals are not read.
+
+Only CBC solution files are read, see `SOLUTION_READERS`. `LPSolve` holds
+the files of a solve, and `solve_lp` runs one in the calling thread.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from .model import ModelData
+from .results import (
+    ConstraintResults,
+    IndexedConstraintResult,
+    IndexedVariableResult,
+    ModelResult,
+    ObjectiveResult,
+    ResultStatus,
+    ScalarConstraintResult,
+    ScalarVariableResult,
+    SolverInfo,
+    VariableResults,
+)
+from .writer import FragmentCache, LPNames, write_lp
+
+# Objective values CBC writes for "no solution"
+_INFINITY = 1e50
+
+# Terminations of CBC solves stopped at a limit, by the word after "Stopped on"
+_CBC_STOPPED = {
+    "time": "maxTimeLimit",
+    "iterations": "maxIterations",
+    "nodes": "maxEvaluations",
+    "ctrl-c": "userInterrupt",
+}
+
+
+def cbc_command(
+    executable: str, problem: str, solution: str, options: dict[str, Any]
+) -> list[str]:
+    """Command solving an LP file with CBC, and writing its solution file."""
+    command = [executable]
+    for key, value in options.items():
+        command += [f"-{key}", str(value)]
+    return [
+        *command,
+        "-printingOptions",
+        "all",
+        "-import",
+        problem,
+        "-stat=1",
+        "-solve",
+        "-solu",
+        solution,
+    ]
+
+
+def _cbc_status(header: str) -> tuple[ResultStatus, str]:
+    """Status and termination of a CBC solve, from its solution file."""
+    words = header.split()
+    if words[:1] == ["Optimal"]:
+        return "optimal", "optimal"
+    if words[:1] in (["Infeasible"], ["PrimalInfeasible"]) or words[:2] == [
+        "Integer",
+        "infeasible",
+    ]:
+        return "infeasible", "infeasible"
+    if (
+        words[:1] == ["Unbounded"]
+        or words[:2] == ["Dual", "infeasible"]
+        or (len(words) > 2 and words[0] == "Problem" and words[2] == "unbounded")
+    ):
+        return "unbounded", "unbounded"
+    if words[:2] == ["Stopped", "on"] and len(words) > 2:
+        if "(no integer solution" in header:
+            return "error", "intermediateNonInteger"
+        condition = _CBC_STOPPED.get(words[2])
+        if condition is not None:
+            return "stopped", condition
+        if words[2] == "difficulties":
+            return "error", "solverFailure"
+    return "error", "unknown"
+
+
+def _cbc_objective(header: str) -> float | None:
+    """Objective value of the header of a CBC solution file, if it ends with one."""
+    words = header.split()
+    try:
+        return float(words[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _flat(index: tuple) -> tuple:
+    """Index of a result, with elements of multi-dimensional sets spread."""
+    if not any(isinstance(e, tuple) for e in index):
+        return index
+    return tuple(x for e in index for x in (e if isinstance(e, tuple) else (e,)))
+
+
+def _slack(relation: str, activity: float, rhs: float) -> float:
+    if relation == "<=":
+        return rhs - activity
+    if relation == ">=":
+        return activity - rhs
+    return -abs(activity - rhs)
+
+
+def read_cbc_solution(path: str | Path, names: LPNames, data: ModelData) -> ModelResult:
+    """
+    Read the solution file CBC wrote for an LP file written by `write_lp`.
+
+    The objective value is read from the header, in the sense of the model
+    as CBC 2.10.2 and later write it. Solves without a solution file, such
+    as those killed, are errors. So are headers of unknown layouts, with the
+    "unknown" termination condition and the header as message.
+
+    Args:
+        path: The solution file
+        names: Names of the rows and columns of the LP file
+        data: The model written to the LP file
+    """
+    try:
+        f = open(path)
+    except FileNotFoundError:
+        return ModelResult(status="error", solver_info=SolverInfo(solver_name="cbc"))
+    with f:
+        header = f.readline()
+        status, condition = _cbc_status(header)
+        objective = _cbc_objective(header) if status != "error" else None
+        if status != "error" and objective is None:
+            status, condition = "error", "unknown"
+        info = SolverInfo(solver_name="cbc", termination_condition=condition)
+        if condition == "unknown":
+            info.message = header.strip()
+        if status == "stopped" and abs(objective) >= _INFINITY:  # type: ignore[arg-type]
+            # Stopped before finding a solution
+            status = "error"
+        if status not in ("optimal", "stopped"):
+            return ModelResult(status=status, solver_info=info)
+
+        values: list[float | None] = [None] * names.size
+        activities: list[float | None] = [None] * names.row_count
+        for line in f:
+            tokens = line.split()
+            if tokens[0] == "**":
+                # Rows and columns out of their bounds
+                tokens = tokens[1:]
+            name, value = tokens[1], float(tokens[2])
+            if name[0] == "x":
+                values[int(name[1:])] = value
+            elif name[0] == "c":
+                activities[int(name[1:])] = value
+
+    return ModelResult(
+        status=status,
+        variables=_variables(data, names, values),
+        constraints=_constraints(data, names, activities),
+        objective=(
+            ObjectiveResult(
+                name=data.objective.name,
+                value=objective,
+                sense=data.objective.sense,
+            )
+            if data.objective is not None
+            else None
+        ),
+        solver_info=info,
+    )
+
+
+def _variables(
+    data: ModelData, names: LPNames, values: list[float | None]
+) -> VariableResults:
+    results = VariableResults()
+    for v in data.variables:
+        columns = names.columns(v.name)
+        if not v.indices:
+            results.scalar[v.name] = ScalarVariableResult(
+                name=v.name,
+                value=values[columns.start] if columns else None,
+                domain=v.domain,
+                lb=v.lb,
+                ub=v.ub,
+            )
+            continue
+        indexed = {}
+        for column in columns:
+            value = values[column]
+            if value is not None:
+                indexed[_flat(names.index(column)[1])] = value
+        results.indexed[v.name] = IndexedVariableResult(
+            name=v.name,
+            indices=v.indices,
+            values=indexed,
+            domain=v.domain,
+            lb=v.lb,
+            ub=v.ub,
+        )
+    return results
+
+
+def _constraints(
+    data: ModelData, names: LPNames, activities: list[float | None]
+) -> ConstraintResults:
+    results = ConstraintResults()
+    for c in data.constraints:
+        relation = names.relations[c.name]
+        body_values: dict[tuple, float] = {}
+        slacks: dict[tuple, float | None] = {}
+        for row in names.rows[c.name]:
+            activity = activities[row]
+            if activity is None:
+                continue
+            index, rhs = names.row(row)
+            key = _flat(index)
+            body_values[key] = names.body(row, activity)
+            slacks[key] = _slack(relation, activity, rhs)
+        if not c.quantifiers:
+            results.scalar[c.name] = ScalarConstraintResult(
+                name=c.name,
+                body_value=body_values.get(()),
+                slack=slacks.get(()),
+            )
+            continue
+        results.indexed[c.name] = IndexedConstraintResult(
+            name=c.name,
+            indices=[q.over for q in c.quantifiers],
+            body_values=body_values,
+            slacks=slacks,
+            duals=dict.fromkeys(body_values),
+        )
+    return results
+
+
+# Reader of the solution files of every solver solving LP files written by
+# `write_lp`, and the command running it
+SOLUTION_READERS: dict[str, Callable[[str | Path, LPNames, ModelData], ModelResult]] = {
+    "cbc": read_cbc_solution,
+}
+
+COMMANDS: dict[str, Callable[[str, str, str, dict[str, Any]], list[str]]] = {
+    "cbc": cbc_command,
+}
+
+
+class LPSolve:
+    """
+    The files of a solve of a model written by `write_lp`.
+
+    Args:
+        solver_name: A solver of `SOLUTION_READERS`
+        data: The model
+        cache: Rows of constraint families of earlier writes to reuse
+    """
+
+    def __init__(
+        self, solver_name: str, data: ModelData, cache: FragmentCache | None = None
+    ):
+        self.solver_name = solver_name
+        self.data = data
+        self.cache = cache
+        self.directory: str | None = None
+        self.names: LPNames | None = None
+
+    def write(
+        self, executable: str, options: dict[str, Any], processes: int = 1
+    ) -> list[str]:
+        """
+        Write the model to a directory of its own, and return the command
+        solving it.
+
+        Args:
+            executable: The solver executable
+            options: Options of the solver
+            processes: Processes writing the LP file, see `write_lp`
+        """
+        self.directory = tempfile.mkdtemp(prefix="moai_")
+        problem = os.path.join(self.directory, "model.lp")
+        self.names = write_lp(
+            self.data,
+            problem,
+            processes=processes if processes > 1 else None,
+            cache=self.cache,
+        )
+        return COMMANDS[self.solver_name](
+            executable, problem, os.path.join(self.directory, "model.soln"), options
+        )
+
+    def read(self) -> ModelResult:
+        """Read the solution written by the solver."""
+        assert self.directory is not None and self.names is not None
+        solution = os.path.join(self.directory, "model.soln")
+        return SOLUTION_READERS[self.solver_name](solution, self.names, self.data)
+
+    def cleanup(self):
+        """Remove the files of the solve, whether it completed or not."""
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+def solve_lp(
+    executable: str,
+    solver_name: str,
+    data: ModelData,
+    options: dict[str, Any],
+    cache: FragmentCache | None = None,
+    processes: int = 1,
+) -> tuple[ModelResult, str]:
+    """
+    Solve a model written by `write_lp`, blocking until the solver exits.
+
+    Args:
+        executable: The solver executable
+        solver_name: A solver of `SOLUTION_READERS`
+        data: The model
+        options: Options of the solver
+        cache: Rows of constraint families of earlier writes to reuse
+        processes: Processes writing the LP file, see `write_lp`
+
+    Returns:
+        The results of the solve, and the log of the solver
+    """
+    solve = LPSolve(solver_name, data, cache)
+    try:
+        command = solve.write(executable, options, processes)
+        started = time.perf_counter()
+        completed = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        result = solve.read()
+    finally:
+        solve.cleanup()
+    result.solver_info.solve_time = time.perf_counter() - started
+    return result, completed.stdout
@@ -0,0 +1,251 @@
+"""
+Model templates: the structure of a model, bound to many datasets.
+
+A template holds the variables, constraints and objective of a model, while
+its sets and parameters come with each dataset it is bound to. The
+structure is validated, lowered and compiled once when the template is
+created:
+
+- expressions are lowered to IR nodes, which the template keeps alive so
+  every bind finds the same hash-consed nodes and their cached work,
+- the code of every constraint family is generated,
+- shared aggregations are found,
+- the sets and parameters the structure reads are collected, so a dataset
+  missing any of them is rejected before anything is built,
+- the references of the constraints and objective are walked, see
+  `moai.validation.StructureChecks`.
+
+Binding a dataset then only validates the data, checks its sets and
+parameters against those references and builds the Pyomo model.
+Solves written to LP files by `moai.writer` share the `FragmentCache` of
+their template, so datasets changing some parameters only expand the
+constraint families reading them. The API solves templates with the caches
+of its tenants instead, see `moai.app.fragment_cache`.
+"""
+
+import hashlib
+
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+
+from . import codegen, ir
+from .compiler import NotCompilable
+from .constraints import Constraint
+from .ir import Node
+from .model import Model, ModelData
+from .objectives import Objective
+from .parameters import Parameter
+from .parse import find_shared_aggregations
+from .sets import Set
+from .validation import StructureChecks, issues_message
+from .variables import Variable
+from .writer import FragmentCache
+
+
+class TemplateData(BaseModel):
+    """Serializable structure of a model, without its sets and parameters"""
+
+    model_config = ConfigDict(extra="forbid")
+    name: str
+    variables: list[Variable] = []
+    constraints: list[Constraint] = []
+    objective: Objective | None = None
+
+
+class Dataset(BaseModel):
+    """Sets and parameters bound to a model template"""
+
+    model_config = ConfigDict(extra="forbid")
+    sets: list[Set] = []
+    parameters: list[Parameter] = []
+
+
+class TemplateInfo(BaseModel):
+    """Id of a registered template and the data its datasets must define"""
+
+    id: str
+    name: str
+    sets: list[str]
+    parameters: list[str]
+
+
+TEMPLATE_DATA_ADAPTER: TypeAdapter[TemplateData] = TypeAdapter(TemplateData)
+DATASET_ADAPTER: TypeAdapter[Dataset] = TypeAdapter(Dataset)
+
+
+def fingerprint(data: ModelData | TemplateData) -> str:
+    """
+    Digest of the structure of a model: its variables, constraints and
+    objective, without its name, sets and parameters.
+
+    Models built from one template on different datasets share a fingerprint.
+    """
+    digest = hashlib.sha1()
+    for component in (*data.variables, *data.constraints, data.objective):
+        digest.update(component.model_dump_json().encode() if component else b"-")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ModelTemplate:
+    """
+    Structure of a model, compiled once and bound to datasets.
+
+    Args:
+        data: The structure, as a TemplateData instance, raw JSON or a dict
+
+    Raises:
+        ValueError: If a constraint or the objective references a variable
+            the template does not declare, or an index variable no
+            quantifier or sum binds
+    """
+
+    def __init__(self, data: TemplateData | bytes | str | dict):
+        if isinstance(data, bytes | str):
+            data = TEMPLATE_DATA_ADAPTER.validate_json(data)
+        elif isinstance(data, dict):
+            data = TEMPLATE_DATA_ADAPTER.validate_python(data)
+        self.data = data
+        self.id = hashlib.sha1(data.model_dump_json().encode()).hexdigest()
+        self.fingerprint = fingerprint(data)
+        # Rows of the constraint families of the models of the template
+        self.cache = FragmentCache()
+
+        # Lowered expressions, kept so that their nodes stay in the IR table,
+        # and the code generated for them, kept for every bind
+        self._nodes: list[Node] = []
+        self._code: list[codegen.Generated] = []
+        sets: set[str] = set()
+        parameters: set[str] = set()
+        variables = {v.name for v in data.variables}
+        for v in data.variables:
+            sets.update(v.indices)
+            if v.support is not None and v.support.set is not None:
+                sets.add(v.support.set)
+            elif v.support is not None:
+                parameters.add(v.support.parameter)  # type: ignore[arg-type]
+
+        self.shared = frozenset(
+            find_shared_aggregations(data.constraints, data.objective)
+        )
+        for c in data.constraints:
+            expr = ir.lower(c.expr)
+            self._nodes.append(expr)
+            index_names = []
+            for q in c.quantifiers or []:
+                sets.add(q.over)
+                index_names += q.index_names
+                if q.condition is not None:
+                    self._nodes.append(ir.lower(q.condition))
+            relevant = frozenset(n for n in ir.iter_nodes(expr) if n in self.shared)
+            try:
+                self._code.append(codegen.pin(expr, tuple(index_names), relevant))
+            except NotCompilable:
+                # Left to the compiler and the parser when the model is built
+                pass
+        if data.objective is not None:
+            expr = ir.lower(data.objective.expr)
+            self._nodes.append(expr)
+            relevant = frozenset(n for n in ir.iter_nodes(expr) if n in self.shared)
+            try:
+                self._code.append(codegen.pin(expr, (), relevant))
+            except NotCompilable:
+                pass
+
+        for node in self._nodes:
+            for n in ir.iter_nodes(node):
+                if n.kind == ir.VAR:
+                    name = n.args[0]
+                    # Index variables may be referenced as variables
+                    if name not in variables and not name.startswith("_idx_"):
+                        raise ValueError(
+                            f"Variable {name} not found in template {data.name}"
+                        )
+                elif n.kind == ir.PARAM:
+                    parameters.add(n.args[0])
+                elif n.kind == ir.AGG:
+                    sets.update(set_name for _, set_name in n.args[2])
+                elif n.kind == ir.SHIFT:
+                    sets.add(n.args[1])
+        # Names a dataset must define
+        self.sets = frozenset(sets)
+        self.parameters = frozenset(parameters)
+
+        # References of the structure, checked against every dataset
+        self.checks = StructureChecks(self.to_data(Dataset()))
+        if self.checks.errors:
+            raise ValueError(issues_message(self.checks.errors))
+
+    @property
+    def name(self) -> str:
+        return self.data.name
+
+    def info(self) -> TemplateInfo:
+        return TemplateInfo(
+            id=self.id,
+            name=self.name,
+            sets=sorted(self.sets),
+            parameters=sorted(self.parameters),
+        )
+
+    def to_data(self, dataset: Dataset) -> ModelData:
+        """Model data of the template bound to a dataset."""
+        # Both parts were validated on their own, skip revalidation
+        return ModelData.model_construct(
+            name=self.data.name,
+            sets=dataset.sets,
+            parameters=dataset.parameters,
+            variables=self.data.variables,
+            constraints=self.data.constraints,
+            objective=self.data.objective,
+        )
+
+    def bind(
+        self,
+        dataset: Dataset | bytes | str | dict,
+        fragments: FragmentCache | None = None,
+    ) -> Model:
+        """
+        Build the model of the template on a dataset.
+
+        Args:
+            dataset: Sets and parameters of the model, or raw JSON of them
+            fragments: Rows of constraint families for LP solves of the model
+                to reuse, see `Model.fragments`, the cache of the template by
+                default
+
+        Raises:
+            ValueError: If the dataset misses a set or parameter the template
+                reads, or its sets and parameters do not match the references
+                of the template, see `moai.validation.StructureChecks`
+        """
+        if isinstance(dataset, bytes | str):
+            dataset = DATASET_ADAPTER.validate_json(dataset)
+        elif isinstance(dataset, dict):
+            dataset = DATASET_ADAPTER.validate_python(dataset)
+        self.check(dataset)
+
+        data = self.to_data(dataset)
+        if errors := self.checks.check(data):
+            raise ValueError(issues_message(errors))
+        model = Model.from_data(data, shared=self.shared, validate=False)
+        model.fragments = fragments if fragments is not None else self.cache
+        return model
+
+    def check(self, dataset: Dataset):
+        """
+        Check that a dataset defines every set and parameter the template reads.
+
+        Raises:
+            ValueError: Listing the missing sets and parameters
+        """
+        missing = []
+        set_names = {s.name for s in dataset.sets}
+        parameter_names = {p.name for p in dataset.parameters}
+        missing += [f"set {name}" for name in sorted(self.sets - set_names)]
+        missing += [
+            f"parameter {name}" for name in sorted(self.parameters - parameter_names)
+        ]
+        if missing:
+            raise ValueError(
+                f"Dataset for template {self.name} is missing {', '.join(missing)}"
+            )
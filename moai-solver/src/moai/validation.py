@@ -0,0 +1,363 @@
+"""
+Static checks of model data, without building the Pyomo model.
+
+Building a model reports the first invalid reference it meets, after the
+components before it were allocated. `validate_model_data` instead walks
+`ModelData` once against a table of its sets, parameters and variables and
+reports every problem it finds:
+
+- names used by more than one component,
+- sets, parameters and variables that are referenced but not declared,
+- index arities of variable and parameter references and parameter values,
+- index variables used outside the quantifiers and sums binding them,
+- index literals that are not elements of the set at their position,
+- quantifiers and sums binding index variables of the wrong dimension.
+
+`StructureChecks` walks the constraints and objective of models sharing a
+structure once, such as those of a template, see `moai.templates`.
+"""
+
+from collections.abc import Container
+from typing import Any
+
+from pydantic import BaseModel
+
+from . import ir
+from .constraints import Quantifier
+from .ir import Node
+from .model import ModelData
+from .sets import Set, SetRange
+
+
+class ModelIssue(BaseModel):
+    """A problem found in model data"""
+
+    location: str
+    message: str
+
+
+class ValidationReport(BaseModel):
+    """All problems found in model data"""
+
+    valid: bool
+    errors: list[ModelIssue]
+
+
+class _SetInfo:
+    """Dimension of a set and the elements at each position of its elements."""
+
+    def __init__(self, s: Set):
+        self.dimen = s.dimen
+        self.columns: list[Container[Any]]
+        if isinstance(s.elements, SetRange):
+            self.columns = [s.elements.to_range()]
+        elif s.dimen == 1:
+            self.columns = [frozenset(s.elements)]  # type: ignore[arg-type]
+        else:
+            columns = zip(*s.elements, strict=True)  # type: ignore[misc]
+            self.columns = [frozenset(column) for column in columns]
+
+
+class _Checker:
+    def __init__(self, data: ModelData):
+        self.data = data
+        self.errors: list[ModelIssue] = []
+        self._seen: set[tuple[str, str]] = set()
+        self.sets = {s.name: _SetInfo(s) for s in data.sets}
+        self.parameters = {p.name: p for p in data.parameters}
+        self.variables = {v.name: v for v in data.variables}
+
+    def error(self, location: str, message: str):
+        # Shared subexpressions are visited once per occurrence
+        if (location, message) not in self._seen:
+            self._seen.add((location, message))
+            self.errors.append(ModelIssue(location=location, message=message))
+
+    def check(self) -> list[ModelIssue]:
+        self.check_declarations()
+        self.walk()
+        return self.errors
+
+    def check_declarations(self):
+        """Check the names of the components, and the parameters and variables."""
+        self._check_names()
+        for p in self.data.parameters:
+            self._check_parameter(p.name)
+        for v in self.data.variables:
+            self._check_variable(v.name)
+
+    def walk(self):
+        """Check the references of the constraints and objective."""
+        for c in self.data.constraints:
+            location = f"constraint {c.name}"
+            scope = self._check_quantifiers(c.quantifiers or [], location)
+            self._walk(ir.lower(c.expr), scope, location)
+        if self.data.objective is not None:
+            location = f"objective {self.data.objective.name}"
+            self._walk(ir.lower(self.data.objective.expr), set(), location)
+
+    def _check_names(self):
+        """Components share the namespace of the Pyomo model."""
+        kinds: dict[str, str] = {}
+        components = [
+            *(("set", s.name) for s in self.data.sets),
+            *(("parameter", p.name) for p in self.data.parameters),
+            *(("variable", v.name) for v in self.data.variables),
+            *(("constraint", c.name) for c in self.data.constraints),
+        ]
+        if self.data.objective is not None:
+            components.append(("objective", self.data.objective.name))
+        for kind, name in components:
+            if name in kinds:
+                self.error(
+                    f"{kind} {name}", f"Name {name} is already used by a {kinds[name]}"
+                )
+            else:
+                kinds[name] = kind
+
+    def _index_sets(self, names: list[str], location: str) -> list[_SetInfo] | None:
+        """Index sets of a component, or None if one is missing."""
+        missing = [name for name in names if name not in self.sets]
+        for name in missing:
+            self.error(location, f"Set {name} not found in model")
+        return None if missing else [self.sets[name] for name in names]
+
+    def _check_parameter(self, name: str):
+        p = self.parameters[name]
+        location = f"parameter {name}"
+        if isinstance(p.values, int | float):
+            return
+        if not p.indices:
+            self.error(location, "Indexed values require index sets")
+            return
+        index_sets = self._index_sets(p.indices, location)
+        if index_sets is None:
+            return
+        columns = [column for s in index_sets for column in s.columns]
+        for element in p.values:
+            if len(element.index) != len(columns):
+                self.error(
+                    location,
+                    f"Index {element.index} has {len(element.index)} values, "
+                    f"expected {len(columns)}",
+                )
+            elif not all(
+                label in column
+                for label, column in zip(element.index, columns, strict=True)
+            ):
+                self.error(location, f"Index {element.index} is not in {p.indices}")
+
+    def _check_variable(self, name: str):
+        v = self.variables[name]
+        location = f"variable {name}"
+        index_sets = self._index_sets(v.indices, location)
+        if v.support is None:
+            return
+        if v.support.set is not None:
+            support = self.sets.get(v.support.set)
+            if support is None:
+                self.error(location, f"Set {v.support.set} not found in model")
+            elif index_sets is not None and support.dimen != self._arity(index_sets):
+                self.error(
+                    location,
+                    f"Support set {v.support.set} has elements of dimension "
+                    f"{support.dimen}, expected {self._arity(index_sets)}",
+                )
+        elif v.support.parameter not in self.parameters:
+            self.error(location, f"Parameter {v.support.parameter} not found in model")
+
+    @staticmethod
+    def _arity(index_sets: list[_SetInfo]) -> int:
+        # Components of tuple set elements are separate indices
+        return sum(s.dimen for s in index_sets)
+
+    def _check_quantifiers(
+        self, quantifiers: list[Quantifier], location: str
+    ) -> set[str]:
+        """Index variables bound by the quantifiers of a constraint."""
+        scope: set[str] = set()
+        for q in quantifiers:
+            self._bind(scope, q.index_names, q.over, location)
+        # Conditions see every quantifier index, as rows are filtered once built
+        for q in quantifiers:
+            if q.condition is not None:
+                self._walk(ir.lower(q.condition), scope, location)
+        return scope
+
+    def _bind(
+        self,
+        scope: set[str],
+        names: list[str] | tuple[str, ...],
+        set_name: str,
+        location: str,
+    ):
+        self.check_binding(location, set_name, tuple(names))
+        scope.update(names)
+
+    # Checks decided by the sets and parameters of the model, see `_Recorder`
+
+    def check_binding(self, location: str, set_name: str, names: tuple[str, ...]):
+        """Check that a set has elements of the dimension of the names it binds."""
+        s = self.sets.get(set_name)
+        if s is None:
+            self.error(location, f"Set {set_name} not found in model")
+        elif s.dimen != len(names):
+            self.error(
+                location,
+                f"Set {set_name} has elements of dimension {s.dimen} "
+                f"but binds {len(names)} index variables {list(names)}",
+            )
+
+    def check_set(self, location: str, set_name: str):
+        if set_name not in self.sets:
+            self.error(location, f"Set {set_name} not found in model")
+
+    def check_reference(
+        self,
+        location: str,
+        kind: str,
+        name: str,
+        count: int,
+        literals: tuple[tuple[int, Any], ...],
+    ):
+        """
+        Check the number of indices of a reference to a parameter or variable,
+        and the index values at the positions of `literals`.
+        """
+        if kind == "Parameter":
+            p = self.parameters.get(name)
+            if p is None:
+                self.error(location, f"Parameter {name} not found in model")
+                return
+            set_names = [] if isinstance(p.values, int | float) else p.indices
+        else:
+            set_names = self.variables[name].indices
+        index_sets = [self.sets.get(s) for s in set_names]
+        if any(s is None for s in index_sets):
+            # Missing sets are reported with the declaration
+            return
+        columns = [column for s in index_sets for column in s.columns]  # type: ignore[union-attr]
+        if count != len(columns):
+            self.error(
+                location, f"{kind} {name} takes {len(columns)} indices, got {count}"
+            )
+            return
+        for position, value in literals:
+            if value not in columns[position]:
+                self.error(location, f"{kind} {name} has no index value {value!r}")
+
+    def _walk(self, node: Node, scope: set[str], location: str):
+        kind = node.kind
+        if kind == ir.IDX:
+            if node.args[0] not in scope:
+                self.error(location, f"Index variable {node.args[0]} is not bound")
+        elif kind in (ir.VAR, ir.PARAM):
+            name, indices = node.args
+            if kind == ir.VAR and name.startswith("_idx_") and name[5:] in scope:
+                return
+            for index in indices:
+                self._walk(index, scope, location)
+            if kind == ir.VAR and name not in self.variables:
+                self.error(location, f"Variable {name} not found in model")
+                return
+            literals = tuple(
+                (position, index.args[0])
+                for position, index in enumerate(indices)
+                if index.kind in (ir.NUM, ir.STR)
+            )
+            component = "Variable" if kind == ir.VAR else "Parameter"
+            self.check_reference(location, component, name, len(indices), literals)
+        elif kind == ir.AGG:
+            _, body, bindings, condition = node.args
+            inner = set(scope)
+            for index_var, set_name in bindings:
+                self._bind(inner, ir.binding_names(index_var), set_name, location)
+            self._walk(body, inner, location)
+            if condition is not None:
+                self._walk(condition, inner, location)
+        elif kind == ir.SHIFT:
+            index, set_name, _, _ = node.args
+            self.check_set(location, set_name)
+            self._walk(index, scope, location)
+        else:
+            for arg in node.args:
+                if isinstance(arg, Node):
+                    self._walk(arg, scope, location)
+
+
+class _Recorder(_Checker):
+    """
+    Walks the constraints and objective of a model, checking what they alone
+    decide, and recording the checks decided by the sets and parameters.
+    """
+
+    def __init__(self, data: ModelData):
+        super().__init__(data)
+        # Errors and checks by method name and arguments, once each, in the
+        # order of the walk
+        self.checks: dict[tuple[str, tuple], None] = {}
+
+    def error(self, location: str, message: str):
+        super().error(location, message)
+        self.checks["error", (location, message)] = None
+
+    def check_binding(self, *args):
+        self.checks["check_binding", args] = None
+
+    def check_set(self, *args):
+        self.checks["check_set", args] = None
+
+    def check_reference(self, *args):
+        self.checks["check_reference", args] = None
+
+
+class StructureChecks:
+    """
+    Checks of the models of one structure, walked once.
+
+    Walking the constraints and objective is most of the work of
+    `validate_model_data`, and models bound from one template on different
+    datasets share them. Their references to sets and parameters are walked
+    once, and checked against the sets and parameters of every model.
+
+    Args:
+        data: Model data of the structure, whose sets and parameters are
+            ignored
+
+    Attributes:
+        errors: Problems of the structure, whatever its sets and parameters
+    """
+
+    def __init__(self, data: ModelData):
+        recorder = _Recorder(data)
+        recorder.walk()
+        self.errors = recorder.errors
+        self._checks = list(recorder.checks)
+
+    def check(self, data: ModelData) -> list[ModelIssue]:
+        """
+        Check model data of the structure, as `validate_model_data` does.
+
+        Returns:
+            Every problem found, in the order `validate_model_data` reports them
+        """
+        checker = _Checker(data)
+        checker.check_declarations()
+        for method, args in self._checks:
+            getattr(checker, method)(*args)
+        return checker.errors
+
+
+def validate_model_data(data: ModelData) -> list[ModelIssue]:
+    """
+    Check the references of model data without building it.
+
+    Returns:
+        Every problem found, empty if the model data is valid
+    """
+    return _Checker(data).check()
+
+
+def issues_message(errors: list[ModelIssue]) -> str:
+    """Problems of model data, as the message of an error."""
+    return "; ".join(f"{e.location}: {e.message}" for e in errors)
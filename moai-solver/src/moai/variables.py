@@ -1,11 +1,40 @@
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 VariableDomain = Literal[
     "Binary", "NonNegativeIntegers", "NonNegativeReals", "Reals", "Integers"
 ]
 
+# What a reference to an index outside a sparse variable's support compiles to
+MissingIndexPolicy = Literal["zero", "error"]
+
+
+class VariableSupport(BaseModel):
+    """
+    Sparse index domain of a variable.
+
+    Either the elements of a (tuple) set, or the indices a parameter declares
+    values for. Every index must belong to the variable's index sets.
+    """
+
+    set: str | None = None
+    parameter: str | None = None
+
+    @model_validator(mode="after")
+    def _exactly_one(self) -> "VariableSupport":
+        if (self.set is None) == (self.parameter is None):
+            raise ValueError("Specify exactly one of set or parameter")
+        return self
+
+    @classmethod
+    def of_set(cls, name: str) -> "VariableSupport":
+        return VariableSupport(set=name)
+
+    @classmethod
+    def of_parameter(cls, name: str) -> "VariableSupport":
+        return VariableSupport(parameter=name)
+
 
 class Variable(BaseModel):
     """Definition of a variable in the MILP model"""
@@ -17,6 +46,15 @@ class Variable(BaseModel):
     domain: VariableDomain
     lb: float | None = None
     ub: float | None = None
+    support: VariableSupport | None = Field(
+        default=None,
+        description="Only create the variable on these indices instead of the "
+        "full product of its index sets",
+    )
+    missing: MissingIndexPolicy = Field(
+        default="zero",
+        description="How references to indices outside the support are compiled",
+    )
 
     @classmethod
     def create(
@@ -26,6 +64,8 @@ class Variable(BaseModel):
         lb: float | None = None,
         ub: float | None = None,
         indices: list[str] | None = None,
+        support: VariableSupport | None = None,
+        missing: MissingIndexPolicy = "zero",
     ) -> "Variable":
         """Factory method to create a VariableDefinition"""
         if indices is None:
@@ -36,8 +76,15 @@ class Variable(BaseModel):
             domain=domain,
             lb=lb,
             ub=ub,
+            support=support,
+            missing=missing,
         )
 
+    @property
+    def is_sparse(self) -> bool:
+        """Whether the variable only exists on a sparse support"""
+        return self.support is not None
+
     @property
     def dimension(self) -> int:
         """Get the dimension of the variable (number of indices)"""
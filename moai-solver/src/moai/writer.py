@@ -0,0 +1,1099 @@
+"""
+Stream a model to an LP file without building the Pyomo model.
+
+Writing an LP file through Pyomo needs the whole model in memory first: every
+row as a Pyomo expression graph, plus the writer's own copy. `write_lp` walks
+`ModelData` instead and writes each row to the file as soon as its
+constraint family is expanded to it. Only name maps are kept in memory: the
+position of every set element and the indices of sparse variables, which
+number the LP columns, and the index and right-hand side of every row, to
+read solutions back, see `moai.solution`.
+
+Expressions are evaluated on labels into linear forms, with the semantics of
+the parser: conditions compare labels, index arithmetic is done on labels,
+index shifts follow the order of the sets, and variables outside the support
+of a sparse variable read as 0 (or fail, as their missing policy says).
+
+Constraint families only read sets and parameters, so they can be expanded
+in parallel: worker processes expand shards of the families into row text,
+which the writing process numbers and writes in order as they complete, with
+only a few shards per process expanded ahead. For the same reason
+the rows of a family can be kept in a `FragmentCache` across writes, keyed by
+its structure and the definitions it reads, so that writing an edited model
+only expands the families the edit changed.
+
+Only the CPLEX LP format is written. MPS lists the matrix column by column,
+so it cannot be written while rows are generated one after the other.
+"""
+
+import bisect
+import hashlib
+import itertools
+import math
+import operator
+import threading
+from array import array
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, TextIO
+
+from pydantic import BaseModel
+
+from . import ir
+from .constraints import Constraint, Quantifier
+from .ir import Node
+from .model import ModelData
+from .objectives import Objective
+from .sets import Set, SetRange
+from .variables import Variable
+
+# Rows per shard of a constraint family expanded by a worker process
+SHARD_ROWS = 20_000
+
+# Shards expanded ahead of the writing process, per worker process. Bounds the
+# rows held in memory while earlier shards are written.
+SHARDS_PER_PROCESS = 2
+
+# Column fixed at 1, carrying objective constants and infeasible constant rows
+ONE = "ONE_VAR_CONSTANT"
+
+# Text of a row, the index of its constraint, its right-hand side, and its
+# body as Pyomo builds it, see `_row_body`
+Row = tuple[str, tuple, float, bool, float]
+
+# Rows of a constraint family, or the text of an objective, and whether they
+# use the constant column
+Fragment = tuple[list[Row] | list[str], bool]
+
+# Bytes held besides its text by a line of an objective, and by a row: the
+# row and index tuples, the right-hand side, the body constant and the string
+# header
+_LINE_BYTES = 56
+_ROW_BYTES = 224
+
+_ARITHMETIC: dict[str, Callable[[Any, Any], Any]] = {
+    "add": operator.add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "div": operator.truediv,
+}
+
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    "le": operator.le,
+    "lt": operator.lt,
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "ge": operator.ge,
+    "gt": operator.gt,
+}
+
+_FUNCTIONS: dict[str, Callable[[float], float]] = {
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "exp": math.exp,
+    "log": math.log,
+}
+
+# LP relation of each comparison. LP files have no strict inequalities, which
+# are rejected as Pyomo does.
+_RELATIONS = {"le": "<=", "eq": "=", "ge": ">="}
+
+# Bounds implied by each variable domain
+_DOMAIN_BOUNDS = {
+    "Reals": (-math.inf, math.inf),
+    "NonNegativeReals": (0, math.inf),
+    "Integers": (-math.inf, math.inf),
+    "NonNegativeIntegers": (0, math.inf),
+    "Binary": (0, 1),
+}
+
+
+class LinearForm:
+    """Affine expression: coefficients by column, plus a constant."""
+
+    __slots__ = ("coefs", "constant")
+
+    def __init__(self, coefs: dict[int, float] | None = None, constant: float = 0):
+        self.coefs = {} if coefs is None else coefs
+        self.constant = constant
+
+    def add(self, value: "LinearForm | float", factor: float = 1):
+        """Add `factor * value` in place."""
+        if isinstance(value, LinearForm):
+            coefs = self.coefs
+            for column, coef in value.coefs.items():
+                coefs[column] = coefs.get(column, 0) + factor * coef
+            self.constant += factor * value.constant
+        else:
+            self.constant += factor * value
+
+    def scaled(self, factor: float) -> "LinearForm":
+        return LinearForm(
+            {column: factor * coef for column, coef in self.coefs.items()},
+            factor * self.constant,
+        )
+
+
+class _SetIndex:
+    """Elements of a set and their positions."""
+
+    def __init__(self, s: Set):
+        self.name = s.name
+        self.dimen = s.dimen
+        if isinstance(s.elements, SetRange):
+            self.elements: range | list = s.elements.to_range()
+            self._positions: dict | None = None
+        else:
+            self.elements = list(s.iter_elements())
+            self._positions = {e: k for k, e in enumerate(self.elements)}
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def position(self, element: Any) -> int | None:
+        """Position of an element, or None if it is not in the set."""
+        if self._positions is not None:
+            return self._positions.get(element)
+        r = self.elements
+        if isinstance(element, int) and element in r:
+            return r.index(element)
+        return None
+
+
+class LPNames:
+    """
+    Names of the rows and columns of a written LP file.
+
+    Columns are numbered variable after variable, dense variables in the
+    order of the product of their index sets. Rows are numbered constraint
+    after constraint, and keep the index of their constraint, their
+    right-hand side and how their body follows from their activity, to read
+    the activities of rows back.
+    """
+
+    def __init__(self, variables: list[Variable], sets: dict[str, _SetIndex]):
+        self.variables = {v.name: v for v in variables}
+        self._sets = sets
+        # First column of every variable, and its number of columns
+        self._offsets: dict[str, int] = {}
+        self._sizes: dict[str, int] = {}
+        self._index_sets: dict[str, list[_SetIndex]] = {}
+        # Variables in the order of their columns, and their first columns
+        self._order: list[str] = []
+        self._starts: list[int] = []
+        # Column of every index of a sparse variable, relative to its offset,
+        # and the index of every column
+        self._support: dict[str, dict[tuple, int]] = {}
+        self._support_indices: dict[str, list[tuple]] = {}
+        # Rows of every constraint, and the relation of their rows
+        self.rows: dict[str, range] = {}
+        self.relations: dict[str, str] = {}
+        # Index and right-hand side of every row, and its body: the opposite
+        # of its activity or not, plus a constant
+        self._row_indices: list[tuple] = []
+        self._rhs = array("d")
+        self._negated = bytearray()
+        self._body_constants = array("d")
+        self.size = 0
+
+    def add_variable(self, v: Variable, support: Iterable[tuple] | None = None):
+        self._offsets[v.name] = self.size
+        self._order.append(v.name)
+        self._starts.append(self.size)
+        self._index_sets[v.name] = [self._sets[s] for s in v.indices]
+        if support is not None:
+            indices = list(dict.fromkeys(support))
+            self._support[v.name] = {index: k for k, index in enumerate(indices)}
+            self._support_indices[v.name] = indices
+            size = len(indices)
+        else:
+            size = math.prod(len(s) for s in self._index_sets[v.name])
+        self._sizes[v.name] = size
+        self.size += size
+
+    def columns(self, variable: str) -> range:
+        """Columns of a variable."""
+        offset = self._offsets[variable]
+        return range(offset, offset + self._sizes[variable])
+
+    def column(self, variable: str, index: tuple) -> int | None:
+        """
+        Column of a variable at an index, or None outside its support.
+
+        Elements of multi-dimensional index sets are given as a tuple, or
+        spread as Pyomo does.
+
+        Raises:
+            KeyError: If the index is not in the variable's index sets
+        """
+        index_sets = self._index_sets[variable]
+        if len(index) != len(index_sets):
+            index = self._grouped(variable, index)
+        ordinal = 0
+        for element, set_index in zip(index, index_sets, strict=True):
+            position = set_index.position(element)
+            if position is None:
+                raise KeyError(f"Index {index} is not valid for variable {variable}")
+            ordinal = ordinal * len(set_index) + position
+        support = self._support.get(variable)
+        if support is not None:
+            local = support.get(index)
+            return None if local is None else self._offsets[variable] + local
+        return self._offsets[variable] + ordinal
+
+    def _grouped(self, variable: str, index: tuple) -> tuple:
+        """Index with the spread elements of multi-dimensional sets grouped."""
+        dimens = [s.dimen for s in self._index_sets[variable]]
+        if len(index) != sum(dimens):
+            raise KeyError(f"Index {index} is not valid for variable {variable}")
+        grouped = []
+        start = 0
+        for dimen in dimens:
+            grouped.append(index[start] if dimen == 1 else index[start : start + dimen])
+            start += dimen
+        return tuple(grouped)
+
+    @staticmethod
+    def name(column: int) -> str:
+        """Name of a column in the LP file."""
+        return f"x{column}"
+
+    def add_row(
+        self, index: tuple, rhs: float, negated: bool = False, constant: float = 0
+    ):
+        self._row_indices.append(index)
+        self._rhs.append(rhs)
+        self._negated.append(negated)
+        self._body_constants.append(constant)
+
+    def add_constraint(self, name: str, relation: str, rows: range):
+        self.rows[name] = rows
+        self.relations[name] = relation
+
+    @property
+    def row_count(self) -> int:
+        return len(self._rhs)
+
+    def row(self, row: int) -> tuple[tuple, float]:
+        """The index of the constraint of a row, and its right-hand side."""
+        return self._row_indices[row], self._rhs[row]
+
+    def body(self, row: int, activity: float) -> float:
+        """The body of a row as Pyomo builds it, from its activity."""
+        if self._negated[row]:
+            activity = -activity
+        return activity + self._body_constants[row]
+
+    def index(self, column: int) -> tuple[str, tuple]:
+        """The variable and index of a column."""
+        if not 0 <= column < self.size:
+            raise KeyError(f"Column {column} does not exist")
+        # The last variable starting at or before the column, variables
+        # without columns start where the next one does
+        variable = self._order[bisect.bisect_right(self._starts, column) - 1]
+        local = column - self._offsets[variable]
+        support = self._support_indices.get(variable)
+        if support is not None:
+            # Only dense variables are numbered arithmetically
+            return variable, support[local]
+        index = []
+        for set_index in reversed(self._index_sets[variable]):
+            local, position = divmod(local, len(set_index))
+            index.append(set_index.elements[position])
+        return variable, tuple(reversed(index))
+
+
+class _Evaluator:
+    """Evaluates IR nodes on labels into numbers, labels and linear forms."""
+
+    def __init__(
+        self,
+        sets: dict[str, _SetIndex],
+        parameters: dict[str, Any],
+        names: LPNames,
+    ):
+        self.sets = sets
+        self.parameters = parameters
+        self.names = names
+        # Index variables bound by quantifiers and sums, updated in place
+        self.context: dict[str, Any] = {}
+
+    def value(self, expr: Node) -> Any:
+        kind = expr.kind
+        if kind == ir.NUM or kind == ir.STR:
+            return expr.args[0]
+        if kind == ir.IDX:
+            name = expr.args[0]
+            if name not in self.context:
+                raise ValueError(f"Index variable {name} not found in context")
+            return self.context[name]
+        if kind == ir.SHIFT:
+            return self._shift(expr)
+        if kind == ir.VAR:
+            return self._variable(expr)
+        if kind == ir.PARAM:
+            return self._parameter(expr)
+        if kind == ir.BINARY:
+            op, left, right = expr.args
+            return self._binary(op, self.value(left), self.value(right))
+        if kind == ir.UNARY:
+            op, operand = expr.args
+            return self._unary(op, self.value(operand))
+        if kind == ir.AGG:
+            return self._sum(expr)
+        raise ValueError(f"Unsupported expression type: {kind}")
+
+    def test(self, expr: Node) -> bool:
+        """Evaluate a condition."""
+        op, left, right = expr.args
+        return _COMPARISONS[op](self.value(left), self.value(right))
+
+    def bind(
+        self,
+        bindings: list[tuple[Any, str]],
+        conditions: list[list[Node]],
+        part: tuple[int, int] | None = None,
+    ) -> Iterator[None]:
+        """
+        Bind index variables to every combination of elements of their sets.
+
+        The context holds each combination while the caller resumes. The
+        conditions of a binding are checked as soon as it is bound. `part`
+        restricts the first binding to a range of positions in its set.
+        """
+        context = self.context
+        saved = {n: context[n] for b, _ in bindings for n in _names(b) if n in context}
+
+        def expand(level: int) -> Iterator[None]:
+            if level == len(bindings):
+                yield
+                return
+            index_var, set_name = bindings[level]
+            names = _names(index_var)
+            elements = self._set(set_name, names).elements
+            if level == 0 and part is not None:
+                elements = elements[part[0] : part[1]]
+            for element in elements:
+                if len(names) == 1:
+                    context[names[0]] = element
+                else:
+                    context.update(zip(names, element, strict=True))
+                if all(self.test(c) for c in conditions[level]):
+                    yield from expand(level + 1)
+
+        try:
+            yield from expand(0)
+        finally:
+            for b, _ in bindings:
+                for n in _names(b):
+                    context.pop(n, None)
+            context.update(saved)
+
+    def _set(self, name: str, names: list[str]) -> _SetIndex:
+        set_index = self.sets.get(name)
+        if set_index is None:
+            raise ValueError(f"Set {name} not found in model")
+        if set_index.dimen != len(names):
+            raise ValueError(
+                f"Set {name} has elements of dimension {set_index.dimen} "
+                f"but binds {len(names)} index variables {names}"
+            )
+        return set_index
+
+    def _shift(self, expr: Node) -> Any:
+        index, set_name, offset, cyclic = expr.args
+        set_index = self.sets.get(set_name)
+        if set_index is None:
+            raise ValueError(f"Set {set_name} not found in model")
+        value = self.value(index)
+        position = set_index.position(value)
+        if position is None:
+            raise KeyError(f"Index '{value}' is not a known set element")
+        position += offset
+        size = len(set_index)
+        if cyclic:
+            position %= size
+        elif not 0 <= position < size:
+            raise ValueError(
+                f"Index {value} has no element {offset} positions away in set "
+                f"{set_name}"
+            )
+        return set_index.elements[position]
+
+    def _key(self, indices: tuple[Node, ...]) -> tuple:
+        context = self.context
+        return tuple(
+            context[i.args[0]]
+            if i.kind == ir.IDX and i.args[0] in context
+            else self.value(i)
+            for i in indices
+        )
+
+    def _column(self, expr: Node) -> int | None:
+        """Column of a variable node, or None outside a sparse support."""
+        name, indices = expr.args
+        v = self.names.variables.get(name)
+        if v is None:
+            raise ValueError(f"Variable {name} not found in model.")
+        key = self._key(indices)
+        column = self.names.column(name, key)
+        if column is None and v.missing != "zero":
+            raise KeyError(f"Index {key} is not in variable {name}")
+        return column
+
+    def _variable(self, expr: Node) -> Any:
+        name = expr.args[0]
+        # Index variables referenced as variables, see _parse_variable
+        if name.startswith("_idx_") and name[5:] in self.context:
+            return self.context[name[5:]]
+        column = self._column(expr)
+        # Indices outside the support of a sparse variable read as 0
+        return 0 if column is None else LinearForm({column: 1})
+
+    def _parameter(self, expr: Node) -> Any:
+        name, indices = expr.args
+        if name not in self.parameters:
+            raise ValueError(f"Parameter {name} not found in model.")
+        values = self.parameters[name]
+        if not isinstance(values, dict):
+            return values
+        key = self._key(indices)
+        if key not in values:
+            raise ValueError(f"Parameter {name} has no value at index {key}")
+        return values[key]
+
+    def _binary(self, op: str, lhs: Any, rhs: Any) -> Any:
+        lhs_form = isinstance(lhs, LinearForm)
+        rhs_form = isinstance(rhs, LinearForm)
+        if not lhs_form and not rhs_form:
+            return _ARITHMETIC[op](lhs, rhs)
+        if op == "add" or op == "sub":
+            result = LinearForm()
+            result.add(lhs)
+            result.add(rhs, 1 if op == "add" else -1)
+            return _simplify(result)
+        if op == "mul" and not (lhs_form and rhs_form):
+            form, factor = (lhs, rhs) if lhs_form else (rhs, lhs)
+            return _simplify(form.scaled(factor))
+        if op == "div" and not rhs_form:
+            return _simplify(lhs.scaled(1 / rhs))
+        raise ValueError(f"LP files hold linear models only, got a non-linear {op}")
+
+    def _unary(self, op: str, operand: Any) -> Any:
+        if isinstance(operand, LinearForm):
+            if op == "sub":
+                return operand.scaled(-1)
+            raise ValueError(f"LP files hold linear models only, got {op}")
+        if op == "sub":
+            return -operand
+        if op not in _FUNCTIONS:
+            raise ValueError(f"Unsupported unary operator: {op}")
+        return _FUNCTIONS[op](operand)
+
+    def accumulate(self, expr: Node, into: LinearForm, factor: float = 1):
+        """
+        Add `factor * expr` to a linear form in place.
+
+        Sums, sums of terms and scaled terms are added term by term, without
+        building the linear form of every term first.
+        """
+        kind = expr.kind
+        if kind == ir.VAR and not expr.args[0].startswith("_idx_"):
+            column = self._column(expr)
+            if column is not None:
+                into.coefs[column] = into.coefs.get(column, 0) + factor
+        elif kind == ir.AGG:
+            op, body, bindings, condition = expr.args
+            if op != "sum":
+                raise ValueError(f"Unsupported aggregation operator: {op}")
+            conditions: list[list[Node]] = [[] for _ in bindings]
+            if condition is not None:
+                conditions[-1].append(condition)
+            for _ in self.bind(list(bindings), conditions):
+                self.accumulate(body, into, factor)
+        elif kind == ir.BINARY and expr.args[0] in ("add", "sub"):
+            op, left, right = expr.args
+            self.accumulate(left, into, factor)
+            self.accumulate(right, into, factor if op == "add" else -factor)
+        elif kind == ir.BINARY and expr.args[0] == "mul":
+            # Coefficients usually come first, e.g. c[i, j] * x[i, j]
+            _, left, right = expr.args
+            coef = self.value(left)
+            if isinstance(coef, LinearForm):
+                into.add(self._binary("mul", coef, self.value(right)), factor)
+            else:
+                self.accumulate(right, into, factor * coef)
+        elif kind == ir.UNARY and expr.args[0] == "sub":
+            self.accumulate(expr.args[1], into, -factor)
+        else:
+            into.add(self.value(expr), factor)
+
+    def _sum(self, expr: Node) -> Any:
+        result = LinearForm()
+        self.accumulate(expr, result)
+        return _simplify(result)
+
+
+def _digest(component: BaseModel) -> str:
+    """Digest of the definition of a set, parameter or variable."""
+    return hashlib.sha1(component.model_dump_json().encode()).hexdigest()
+
+
+def _names(index_var: str | list[str] | tuple[str, ...]) -> list[str]:
+    return [index_var] if isinstance(index_var, str) else list(index_var)
+
+
+def _simplify(form: LinearForm) -> Any:
+    """Return a form without any column as its constant."""
+    return form if form.coefs else form.constant
+
+
+def _row_body(
+    op: str, row: LinearForm, left_variable: bool, right: LinearForm
+) -> tuple[bool, float]:
+    """
+    How the body of a row, as Pyomo builds it, follows from its activity.
+
+    Pyomo moves the side of a relation without variables to the bounds, and
+    keeps the other side, with its constants, as the body. Relations with
+    variables on both sides have their difference as body, `lhs - rhs` for
+    `<=` and `==`, and `rhs - lhs` for `>=`. The activity of a row is its
+    variable terms, left minus right.
+
+    Args:
+        op: The relation of the row
+        row: The row, left minus right
+        left_variable: Whether the left side has variables
+        right: The right side
+
+    Returns:
+        Whether the body is the opposite of the activity, and the constant
+        added to it
+    """
+    # The constant of the left side
+    left = row.constant + right.constant
+    if op == "ge":
+        # Pyomo builds `lhs >= rhs` as `rhs <= lhs`
+        if not left_variable:
+            return True, right.constant
+        if not right.coefs:
+            return False, left
+        return True, -row.constant
+    if not right.coefs:
+        return False, left
+    if not left_variable:
+        return True, right.constant
+    return False, row.constant
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+inf"
+    if value == -math.inf:
+        return "-inf"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _term(coef: float, column: str) -> str:
+    sign = "+" if coef >= 0 else "-"
+    return f"{sign}{_number(abs(coef))} {column}\n"
+
+
+def _relation(name: str, op: str) -> str:
+    """
+    LP relation of the comparison of a constraint.
+
+    Raises:
+        ValueError: If the comparison is a strict inequality, or not a relation
+    """
+    if op in ("lt", "gt"):
+        raise ValueError(
+            f"Constraint {name} is a strict inequality, which LP files cannot "
+            "express. Use le or ge instead"
+        )
+    if op not in _RELATIONS:
+        raise ValueError(f"Unsupported comparison operator for LP files: {op}")
+    return _RELATIONS[op]
+
+
+def _quantifier_conditions(quantifiers: list[Quantifier]) -> list[list[Node]]:
+    """Conditions of each quantifier level, checked once their indices are bound."""
+    levels = {n: k for k, q in enumerate(quantifiers) for n in q.index_names}
+    conditions: list[list[Node]] = [[] for _ in quantifiers]
+    for k, q in enumerate(quantifiers):
+        if q.condition is None:
+            continue
+        condition = ir.lower(q.condition)
+        level = max((levels.get(n, k) for n in condition.free), default=k)
+        conditions[max(level, k)].append(condition)
+    return conditions
+
+
+class LPWriter:
+    """Writes the rows of a model to an LP file as they are generated."""
+
+    def __init__(self, data: ModelData, out: TextIO | None):
+        self.data = data
+        self.out = out
+        self.sets = {s.name: _SetIndex(s) for s in data.sets}
+        self.parameters: dict[str, Any] = {}
+        for p in data.parameters:
+            if isinstance(p.values, int | float):
+                self.parameters[p.name] = p.values
+            else:
+                self.parameters[p.name] = {tuple(e.index): e.value for e in p.values}
+        # Definitions of components, and their digests, for fragment keys
+        self._set_data = {s.name: s for s in data.sets}
+        self._parameter_data = {p.name: p for p in data.parameters}
+        self._digests: dict[int, str] = {}
+        self.names = LPNames(data.variables, self.sets)
+        for v in data.variables:
+            self.names.add_variable(v, self._support(v))
+        self.evaluator = _Evaluator(self.sets, self.parameters, self.names)
+        self._rows = 0
+        self._uses_one = False
+
+    def _support(self, v: Variable) -> list[tuple] | None:
+        for set_name in v.indices:
+            if set_name not in self.sets:
+                raise ValueError(f"Set {set_name} not found in model.")
+        if v.support is None:
+            return None
+        if v.support.set is not None:
+            if v.support.set not in self.sets:
+                raise ValueError(f"Set {v.support.set} not found in model.")
+            support = [
+                e if isinstance(e, tuple) else (e,)
+                for e in self.sets[v.support.set].elements
+            ]
+        else:
+            values = self.parameters.get(v.support.parameter)  # type: ignore
+            if not isinstance(values, dict):
+                raise ValueError(
+                    f"Support of variable {v.name} must be an indexed parameter, "
+                    f"got {v.support.parameter}"
+                )
+            support = list(values)
+        for index in support:
+            if len(index) != len(v.indices) or any(
+                self.sets[s].position(e) is None
+                for e, s in zip(index, v.indices, strict=True)
+            ):
+                raise ValueError(
+                    f"Support index {index} of variable {v.name} is not in {v.indices}"
+                )
+        return support
+
+    def write(
+        self, processes: int | None = None, cache: "FragmentCache | None" = None
+    ) -> LPNames:
+        """
+        Write the model.
+
+        Args:
+            processes: Number of worker processes expanding constraints. Rows
+                are expanded in the writing process when not given.
+            cache: Rows of constraint families written before, reused while
+                the definitions they depend on are unchanged
+        """
+        out = self.out
+        out.write(f"\\* Problem: {self.data.name} *\\\n\n")
+        self._write_objective(cache)
+        out.write("\ns.t.\n\n")
+        constraints = self.data.constraints
+        for c in constraints:
+            _relation(c.name, ir.lower(c.expr).args[0])
+        keys = [self.fragment_key(c) for c in constraints] if cache is not None else []
+        cached = {}
+        for k, key in enumerate(keys):
+            fragment = cache.get(key)  # type: ignore[union-attr]
+            if fragment is not None:
+                cached[k] = fragment
+        pending = [k for k in range(len(constraints)) if k not in cached]
+        expanded = self._expand(pending, processes)
+        try:
+            self._write_constraints(expanded, cached, keys, cache)
+        finally:
+            expanded.close()
+        self._write_bounds()
+        out.write("end\n")
+        return self.names
+
+    def _write_constraints(
+        self,
+        expanded: Iterator[Iterator[Iterable[Row]]],
+        cached: dict[int, Fragment],
+        keys: list[str],
+        cache: "FragmentCache | None",
+    ):
+        for k, c in enumerate(self.data.constraints):
+            first = self._rows
+            if k in cached:
+                rows, uses_one = cached[k]
+                self._uses_one |= uses_one
+                self._write_rows(rows)  # type: ignore[arg-type]
+            else:
+                # Shards are written as they come, and only kept for the cache
+                kept: list[Row] | None = [] if cache is not None else None
+                for shard in next(expanded):
+                    if kept is not None:
+                        shard = list(shard)
+                        kept += shard
+                    self._write_rows(shard)
+                if kept is not None:
+                    uses_one = any(ONE in row[0] for row in kept)
+                    cache.put(keys[k], (kept, uses_one))  # type: ignore[union-attr]
+            relation = _relation(c.name, ir.lower(c.expr).args[0])
+            self.names.add_constraint(c.name, relation, range(first, self._rows))
+
+    def fragment_key(self, c: Constraint | Objective) -> str:
+        """
+        Key of the rows of a constraint family, or of an objective, in a
+        `FragmentCache`.
+
+        Rows depend on the structure of the constraint and on the definitions
+        of the sets, parameters and variables it reads. Variables also bring
+        their first column, which moves when a variable before them resizes.
+        """
+        expr = ir.lower(c.expr)
+        h = hashlib.sha1(expr.digest.encode())
+        nodes = [expr]
+        sets: set[str] = set()
+        quantifiers = c.quantifiers if isinstance(c, Constraint) else None
+        if isinstance(c, Objective):
+            h.update(b"objective")
+        for q in quantifiers or []:
+            h.update(repr((q.index, q.over)).encode())
+            sets.add(q.over)
+            if q.condition is not None:
+                condition = ir.lower(q.condition)
+                h.update(condition.digest.encode())
+                nodes.append(condition)
+        parameters: set[str] = set()
+        variables: set[str] = set()
+        for node in nodes:
+            for n in ir.iter_nodes(node):
+                if n.kind == ir.VAR:
+                    variables.add(n.args[0])
+                elif n.kind == ir.PARAM:
+                    parameters.add(n.args[0])
+                elif n.kind == ir.AGG:
+                    sets.update(set_name for _, set_name in n.args[2])
+                elif n.kind == ir.SHIFT:
+                    sets.add(n.args[1])
+        for name in sorted(variables):
+            v = self.names.variables.get(name)
+            if v is None:
+                continue
+            first = self.names.columns(name).start
+            h.update(f"variable {name} {first} {self._digest(v)}".encode())
+            sets.update(v.indices)
+            if v.support is not None and v.support.set is not None:
+                sets.add(v.support.set)
+            elif v.support is not None:
+                parameters.add(v.support.parameter)  # type: ignore[arg-type]
+        for kind, names, components in (
+            ("set", sets, self._set_data),
+            ("parameter", parameters, self._parameter_data),
+        ):
+            for name in sorted(names):
+                component = components.get(name)
+                digest = self._digest(component) if component is not None else None
+                h.update(f"{kind} {name} {digest}".encode())
+        return h.hexdigest()
+
+    def _digest(self, component: BaseModel) -> str:
+        digest = self._digests.get(id(component))
+        if digest is None:
+            digest = self._digests[id(component)] = _digest(component)
+        return digest
+
+    def _write_rows(self, rows: Iterable[Row]):
+        out = self.out
+        names = self.names
+        for text, index, rhs, negated, constant in rows:
+            out.write(f"c{self._rows}:\n")
+            out.write(text)
+            names.add_row(index, rhs, negated, constant)
+            self._rows += 1
+
+    def _expand(
+        self, constraints: list[int], processes: int | None
+    ) -> Iterator[Iterator[Iterable[Row]]]:
+        """
+        Shards of rows of each of the given constraints, in order.
+
+        The shards of a constraint must be consumed before those of the next.
+        """
+        if processes is None or processes <= 1 or not constraints:
+            for k in constraints:
+                yield iter([self.expand(k)])
+            return
+        shards = [
+            (k, part)
+            for k in constraints
+            for part in self._parts(self.data.constraints[k], processes)
+        ]
+        counts = Counter(k for k, _ in shards)
+        with ProcessPoolExecutor(
+            processes, initializer=_start_worker, initargs=(self.data,)
+        ) as pool:
+            rows = self._expand_shards(pool, shards, processes * SHARDS_PER_PROCESS)
+            try:
+                # Every constraint has at least one shard, in order
+                for k in constraints:
+                    yield itertools.islice(rows, counts[k])
+            finally:
+                # Writes failing midway leave no shards behind
+                pool.shutdown(cancel_futures=True)
+
+    def _expand_shards(
+        self,
+        pool: ProcessPoolExecutor,
+        shards: list[tuple[int, tuple[int, int] | None]],
+        window: int,
+    ) -> Iterator[list[Row]]:
+        """Rows of the shards in order, with at most `window` expanded ahead."""
+        remaining = iter(shards)
+        pending = deque(
+            pool.submit(_expand_shard, shard)
+            for shard in itertools.islice(remaining, window)
+        )
+        while pending:
+            rows, uses_one = pending.popleft().result()
+            shard = next(remaining, None)
+            if shard is not None:
+                pending.append(pool.submit(_expand_shard, shard))
+            self._uses_one |= uses_one
+            yield rows
+
+    def _parts(self, c: Constraint, processes: int) -> list[tuple[int, int] | None]:
+        """
+        Ranges of positions in the first quantifier set splitting a family.
+
+        Families are split into shards of about `SHARD_ROWS` rows, or fewer
+        to give every process a few shards of a single large family.
+        """
+        quantifiers = c.quantifiers or []
+        if not quantifiers or quantifiers[0].over not in self.sets:
+            return [None]
+        sizes = [len(self.sets[q.over]) for q in quantifiers if q.over in self.sets]
+        first, rows = sizes[0], math.prod(sizes)
+        target = max(min(SHARD_ROWS, rows // (4 * processes)), 1)
+        step = max(first * target // max(rows, 1), 1)
+        if step >= first:
+            return [None]
+        return [(start, min(start + step, first)) for start in range(0, first, step)]
+
+    def _write_objective(self, cache: "FragmentCache | None"):
+        objective = self.data.objective
+        sense = "max" if objective is not None and objective.sense == "max" else "min"
+        self.out.write(f"{sense}\nobj:\n")
+        if objective is None:
+            # LP files have no empty objectives
+            self._uses_one = True
+            self.out.write(_term(0, ONE))
+            return
+        key = self.fragment_key(objective) if cache is not None else ""
+        fragment = cache.get(key) if cache is not None else None
+        if fragment is None:
+            fragment = [self._objective(objective)], self._uses_one
+            if cache is not None:
+                cache.put(key, fragment)
+        self._uses_one |= fragment[1]
+        self.out.write(fragment[0][0])
+
+    def _objective(self, objective: Objective) -> str:
+        value = LinearForm()
+        self.evaluator.accumulate(ir.lower(objective.expr), value)
+        if not isinstance(value.constant, int | float):
+            raise ValueError(f"Objective must be numeric, got {value.constant!r}")
+        coefs = {column: coef for column, coef in value.coefs.items() if coef}
+        terms = "".join(_term(coef, LPNames.name(c)) for c, coef in coefs.items())
+        if value.constant or not coefs:
+            # LP files have no constant terms, nor empty objectives
+            self._uses_one = True
+            terms += _term(value.constant, ONE)
+        return terms
+
+    def expand(self, k: int, part: tuple[int, int] | None = None) -> Iterator[Row]:
+        """
+        Generate the rows of the k-th constraint, without their names.
+
+        Args:
+            k: Position of the constraint in the model
+            part: Range of positions in the first quantifier set to expand
+        """
+        c = self.data.constraints[k]
+        expr = ir.lower(c.expr)
+        op, left, right = expr.args
+        _relation(c.name, op)
+        quantifiers = c.quantifiers or []
+        bindings = [(q.index, q.over) for q in quantifiers]
+        conditions = _quantifier_conditions(quantifiers)
+        accumulate = self.evaluator.accumulate
+        context = self.evaluator.context
+        index_names = [n for q in quantifiers for n in _names(q.index)]
+        for _ in self.evaluator.bind(bindings, conditions, part):
+            row = LinearForm()
+            accumulate(left, row)
+            left_variable = bool(row.coefs)
+            rhs = LinearForm()
+            accumulate(right, rhs)
+            row.add(rhs, -1)
+            text = self._row(op, row)
+            if text is not None:
+                index = tuple(context[n] for n in index_names)
+                body = _row_body(op, row, left_variable, rhs)
+                yield text, index, -row.constant, *body
+
+    def _row(self, op: str, row: LinearForm) -> str | None:
+        """Text of a row, or None for rows that always hold."""
+        rhs = -row.constant
+        coefs = {column: coef for column, coef in row.coefs.items() if coef}
+        if not coefs:
+            # Nothing left to constrain, e.g. every variable referenced is
+            # outside the support of a sparse variable
+            if _COMPARISONS[op](0, rhs):
+                return None
+            self._uses_one = True
+            return f"{_term(0, ONE)}{_RELATIONS[op]} {_number(rhs)}\n\n"
+        terms = "".join(_term(coef, LPNames.name(c)) for c, coef in coefs.items())
+        return f"{terms}{_RELATIONS[op]} {_number(rhs)}\n\n"
+
+    def _write_bounds(self):
+        out = self.out
+        out.write("bounds\n")
+        integers = []
+        binaries = []
+        for v in self.data.variables:
+            lb, ub = _DOMAIN_BOUNDS[v.domain]
+            if v.lb is not None:
+                lb = max(lb, v.lb)
+            if v.ub is not None:
+                ub = min(ub, v.ub)
+            bounds = f"{_number(lb)} <= {{}} <= {_number(ub)}\n"
+            columns = self.names.columns(v.name)
+            for column in columns:
+                out.write("   " + bounds.format(LPNames.name(column)))
+            if v.domain == "Binary":
+                binaries.append(columns)
+            elif v.domain in ("Integers", "NonNegativeIntegers"):
+                integers.append(columns)
+        if self._uses_one:
+            out.write(f"   1 <= {ONE} <= 1\n")
+        for section, ranges in (("general", integers), ("binary", binaries)):
+            if ranges:
+                out.write(f"{section}\n")
+                for columns in ranges:
+                    for column in columns:
+                        out.write(f"  {LPNames.name(column)}\n")
+
+
+class FragmentCache:
+    """
+    Rows of constraint families, by the key of what they depend on.
+
+    Keeping the cache across writes of edited versions of a model makes a
+    write expand only the families an edit invalidated. The least recently
+    used families are dropped beyond `max_bytes` of rows, as counted by
+    `fragment_bytes`; a family larger than that is not kept.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._fragments: OrderedDict[str, tuple[Fragment, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def get(self, key: str) -> Fragment | None:
+        """Rows of a family, and whether they use the constant column."""
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, fragment: Fragment):
+        size = fragment_bytes(fragment)
+        with self._lock:
+            old = self._fragments.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._fragments[key] = (fragment, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, dropped) = self._fragments.popitem(last=False)
+                self.bytes -= dropped
+
+
+def fragment_bytes(fragment: Fragment) -> int:
+    """Approximate bytes of memory held by the rows of a fragment."""
+    rows, _ = fragment
+    return sum(
+        len(row) + _LINE_BYTES
+        if isinstance(row, str)
+        else len(row[0]) + _ROW_BYTES + 8 * len(row[1])
+        for row in rows
+    )
+
+
+# Writer of the model the worker processes expand constraints of
+_worker: LPWriter | None = None
+
+
+def _start_worker(data: ModelData):
+    global _worker
+    _worker = LPWriter(data, None)
+
+
+def _expand_shard(shard: tuple[int, tuple[int, int] | None]) -> tuple[list[Row], bool]:
+    """Rows of a shard of a constraint, and whether they use the constant column."""
+    assert _worker is not None
+    _worker._uses_one = False
+    rows = list(_worker.expand(*shard))
+    return rows, _worker._uses_one
+
+
+def write_lp(
+    data: ModelData,
+    out: str | Path | TextIO,
+    processes: int | None = None,
+    cache: FragmentCache | None = None,
+) -> LPNames:
+    """
+    Write a model to an LP file, generating its rows one at a time.
+
+    With `processes`, constraint families, and shards of large families by
+    ranges of their first quantifier set, are expanded by a pool of worker
+    processes. Their rows are written in the order of the model, so the file
+    is the same as the one written by a single process.
+
+    Args:
+        data: The model
+        out: Path of the file, or a text stream such as a pipe to a solver
+        processes: Number of worker processes, None to write in this process
+        cache: Rows of constraint families of earlier writes to reuse
+
+    Returns:
+        Names of the rows and columns, to read solutions back
+    """
+    if isinstance(out, str | Path):
+        with open(out, "w", buffering=1 << 16) as f:
+            return LPWriter(data, f).write(processes, cache)
+    return LPWriter(data, out).write(processes, cache)
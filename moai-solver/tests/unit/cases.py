@@ -0,0 +1,162 @@
+"""
+Models and constraint families shared by the tests of the code generator,
+the LP writer, the size estimate and the validator.
+
+Every family of `CASES` exercises one feature of the expression language on
+the model of `network_model`.
+"""
+
+from moai.builders import (
+    binop,
+    exp,
+    ge,
+    gt,
+    index_sub,
+    index_var,
+    le,
+    negate,
+    num,
+    param,
+    prev_element,
+    var,
+)
+from moai.constraints import Constraint, Quantifier
+from moai.expressions import (
+    AggregationExpression,
+    IndexBinding,
+    IndexComparisonExpr,
+)
+from moai.model import Model
+from moai.parameters import IndexElement, Parameter
+from moai.sets import Set
+from moai.variables import Variable, VariableSupport
+
+PLANTS = ["north", "south", "east"]
+ARCS = [["north", "south"], ["south", "east"], ["east", "north"]]
+
+
+def network_model() -> Model:
+    return (
+        Model(name="Differential")
+        .add_set(Set.create("P", PLANTS))
+        .add_set(Set.create("Q", PLANTS))
+        .add_set(Set.create("A", ARCS))
+        .add_set(Set.create_range("T", 1, 5))
+        .add_parameter(
+            Parameter.create(
+                "c",
+                [
+                    IndexElement(index=[p, q], value=float(i + 2 * j))
+                    for i, p in enumerate(PLANTS)
+                    for j, q in enumerate(PLANTS)
+                ],
+                ["P", "Q"],
+            )
+        )
+        .add_parameter(
+            Parameter.create(
+                "d",
+                [IndexElement(index=[t], value=t * 1.5) for t in range(1, 5)],
+                ["T"],
+            )
+        )
+        .add_parameter(Parameter.create("scale", 3))
+        .add_variable(Variable.create("x", indices=["P", "Q"]))
+        .add_variable(Variable.create("s", indices=["T"]))
+        .add_variable(Variable.create("z"))
+        .add_variable(
+            Variable.create(
+                "flow",
+                indices=["P", "Q"],
+                support=VariableSupport.of_set("A"),
+            )
+        )
+    )
+
+
+def sum_over(expr, bindings, condition=None) -> AggregationExpression:
+    return AggregationExpression.create(
+        "sum", expr, [IndexBinding.create(i, s) for i, s in bindings], condition
+    )
+
+
+def _x(i: str = "p", j: str = "q"):
+    return var("x", [index_var(i), index_var(j)])
+
+
+CASES = {
+    "linear sum": Constraint.create(
+        "linear_sum",
+        le(
+            sum_over(
+                binop(param("c", [index_var("p"), index_var("q")]), _x(), "mul"),
+                [("q", "Q")],
+            ),
+            num(10),
+        ),
+        [Quantifier.create("p", "P")],
+    ),
+    "nested sum with condition": Constraint.create(
+        "nested",
+        ge(
+            sum_over(
+                sum_over(_x("q", "r"), [("r", "Q")]),
+                [("q", "Q")],
+                IndexComparisonExpr.create(index_var("q"), index_var("p"), "ne"),
+            ),
+            param("scale"),
+        ),
+        [Quantifier.create("p", "P")],
+    ),
+    "shift": Constraint.create(
+        "shift",
+        le(
+            binop(
+                var("s", [index_var("t")]), var("s", [prev_element("t", "T")]), "sub"
+            ),
+            param("d", [index_var("t")]),
+        ),
+        [Quantifier.create("t", "T", gt(index_var("t"), num(1)))],
+    ),
+    "index arithmetic": Constraint.create(
+        "arithmetic",
+        le(var("s", [index_sub(index_var("t"), num(1))]), param("d", [index_var("t")])),
+        [Quantifier.create("t", "T", ge(index_var("t"), num(2)))],
+    ),
+    "tuple set": Constraint.create(
+        "tuple_set",
+        le(
+            AggregationExpression.create(
+                "sum",
+                _x("i", "j"),
+                [IndexBinding.create(["i", "j"], "A")],
+                IndexComparisonExpr.create(index_var("i"), index_var("p"), "eq"),
+            ),
+            num(1),
+        ),
+        [Quantifier.create("p", "P")],
+    ),
+    "sparse variable": Constraint.create(
+        "sparse",
+        le(
+            sum_over(var("flow", [index_var("p"), index_var("q")]), [("q", "Q")]),
+            num(4),
+        ),
+        [Quantifier.create("p", "P")],
+    ),
+    "index as value": Constraint.create(
+        "index_value",
+        le(binop(var("_idx_t"), var("s", [index_var("t")]), "mul"), var("z")),
+        [Quantifier.create("t", "T")],
+    ),
+    "non-linear": Constraint.create(
+        "non_linear",
+        le(exp(negate(binop(var("z"), _x(), "mul"))), param("scale")),
+        [Quantifier.create("p", "P"), Quantifier.create("q", "Q")],
+    ),
+    "closed subexpression": Constraint.create(
+        "closed",
+        le(_x(), sum_over(param("d", [index_var("t")]), [("t", "T")])),
+        [Quantifier.create(["p", "q"], "A")],
+    ),
+}
@@ -0,0 +1,19 @@
+"""Fixtures of every test"""
+
+import pytest
+
+from moai import app as app_module
+from moai import history as history_module
+from moai.history import Recommender, SolveHistory
+
+
+@pytest.fixture(autouse=True)
+def solve_history(monkeypatch):
+    """History of the solves of a test, kept in memory."""
+    history = SolveHistory(":memory:")
+    recommender = Recommender(history)
+    monkeypatch.setattr(history_module, "history", history)
+    monkeypatch.setattr(history_module, "recommender", recommender)
+    monkeypatch.setattr(app_module, "recommender", recommender)
+    yield history
+    history.close()
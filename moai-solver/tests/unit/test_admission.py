@@ -0,0 +1,503 @@
+"""Tests for admission control and scheduling of solves"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai.admission import (
+    AdmissionConfig,
+    AdmissionController,
+    CostModel,
+    Overloaded,
+    TenantLimits,
+    TooLarge,
+    predict_memory_mb,
+)
+from moai.estimate import SizeEstimate, estimate_size
+
+from .cases import network_model
+
+
+def _estimate(nonzeros: int = 0, variables: int = 0) -> SizeEstimate:
+    return SizeEstimate(
+        variables=variables,
+        integer_variables=0,
+        rows=0,
+        nonzeros=nonzeros,
+        exact=True,
+        constraints=[],
+    )
+
+
+# Columns taking 1 MB on top of the base memory of a solve
+ONE_MB = 2**20 // 1024
+
+
+async def _hold(
+    controller: AdmissionController,
+    events: list,
+    name: str,
+    estimate: SizeEstimate | None = None,
+    priority="interactive",
+    tenant="default",
+):
+    async with controller.admit(estimate or _estimate(), priority, tenant=tenant):
+        events.append(f"start {name}")
+        await asyncio.sleep(0.01)
+        events.append(f"end {name}")
+
+
+async def _queue_behind_running(controller: AdmissionController, *jobs):
+    """Run jobs queued while a first solve holds the only slot."""
+    events: list[str] = []
+    first = asyncio.create_task(_hold(controller, events, "first"))
+    await asyncio.sleep(0)
+    tasks = []
+    for name, estimate, priority in jobs:
+        tasks.append(
+            asyncio.create_task(_hold(controller, events, name, estimate, priority))
+        )
+        await asyncio.sleep(0.001)
+    await asyncio.gather(first, *tasks)
+    return [e.removeprefix("start ") for e in events if e.startswith("start")]
+
+
+class TestAdmissionController:
+    """Tests for queueing and rejecting solves"""
+
+    def test_concurrency_limit(self):
+        """Test that solves beyond the limit wait, and run in arrival order"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1))
+        events: list[str] = []
+
+        async def run():
+            await asyncio.gather(*(_hold(controller, events, name) for name in "abc"))
+
+        asyncio.run(run())
+        assert events == ["start a", "end a", "start b", "end b", "start c", "end c"]
+        assert controller.stats().admitted == 3
+        assert (controller.running, controller.memory_mb) == (0, 0)
+
+    def test_memory_limit(self):
+        """Test that solves wait until the memory of running solves is freed"""
+        estimate = _estimate(variables=60 * ONE_MB)
+        limit = predict_memory_mb(estimate) * 1.5
+        controller = AdmissionController(
+            AdmissionConfig(max_concurrent=4, max_memory_mb=limit)
+        )
+        events: list[str] = []
+
+        async def run():
+            await asyncio.gather(
+                _hold(controller, events, "a", estimate),
+                _hold(controller, events, "b", estimate),
+            )
+
+        asyncio.run(run())
+        assert events == ["start a", "end a", "start b", "end b"]
+
+    def test_too_large(self):
+        """Test that solves over the memory limit are rejected at once"""
+        controller = AdmissionController(AdmissionConfig(max_memory_mb=100))
+
+        async def run():
+            async with controller.admit(_estimate(variables=200 * ONE_MB)):
+                pass
+
+        with pytest.raises(TooLarge, match="about 232 MB"):
+            asyncio.run(run())
+
+    def test_full_queue(self):
+        """Test that requests beyond the queue are rejected with a retry delay"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1, max_queue=1))
+        controller.mean_solve_seconds = 4.0
+        controller.costs.base_seconds = 4.0
+
+        async def run():
+            events: list[str] = []
+            running = asyncio.create_task(_hold(controller, events, "a"))
+            queued = asyncio.create_task(_hold(controller, events, "b"))
+            await asyncio.sleep(0)
+            try:
+                async with controller.admit(_estimate()):
+                    pass
+            finally:
+                await asyncio.gather(running, queued)
+
+        with pytest.raises(Overloaded) as excinfo:
+            asyncio.run(run())
+        # 4 seconds queued ahead, and the rest of the running solve
+        assert excinfo.value.retry_after == 8
+        assert controller.stats().rejected == 1
+
+    def test_queue_timeout(self):
+        """Test that requests waiting too long are rejected and leave the queue"""
+        controller = AdmissionController(AdmissionConfig(queue_timeout=0.01))
+        # Every slot is taken
+        controller.running = controller.config.max_concurrent
+
+        async def run():
+            async with controller.admit(_estimate()):
+                pass
+
+        with pytest.raises(Overloaded, match="Timed out"):
+            asyncio.run(run())
+        assert controller.stats().queued == 0
+        assert controller.running == controller.config.max_concurrent
+
+    def test_cancelled_wait(self):
+        """Test that cancelled requests leave the queue"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1))
+        controller.running = 1
+
+        async def run():
+            task = asyncio.create_task(_hold(controller, [], "a"))
+            await asyncio.sleep(0)
+            assert controller.stats().queued == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        assert controller.stats().queued == 0
+
+    def test_failed_solve(self):
+        """Test that failed solves give their slot back"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1))
+
+        async def run():
+            async with controller.admit(_estimate()):
+                raise RuntimeError("solver crashed")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(run())
+        assert (controller.running, controller.memory_mb) == (0, 0)
+
+    def test_predicted_memory(self):
+        """Test that predicted memory grows with the size of the model"""
+        small = predict_memory_mb(estimate_size(network_model().to_data()))
+        assert small > 0
+        model = network_model()
+        model.sets[0] = model.sets[0].model_copy(
+            update={"elements": [f"p{i}" for i in range(1000)]}
+        )
+        assert predict_memory_mb(estimate_size(model.to_data())) > small
+
+
+class TestScheduling:
+    """Tests for the order queued solves run in"""
+
+    def test_shortest_first(self):
+        """Test that queued solves run shortest predicted duration first"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1))
+        order = asyncio.run(
+            _queue_behind_running(
+                controller,
+                ("large", _estimate(nonzeros=100_000), "interactive"),
+                ("small", _estimate(nonzeros=10), "interactive"),
+            )
+        )
+        assert order == ["first", "small", "large"]
+
+    def test_priority_classes(self):
+        """Test that interactive solves run before shorter batch solves"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1))
+        order = asyncio.run(
+            _queue_behind_running(
+                controller,
+                ("batch", _estimate(nonzeros=10), "batch"),
+                ("interactive", _estimate(nonzeros=100_000), "interactive"),
+            )
+        )
+        assert order == ["first", "interactive", "batch"]
+
+    def test_aging(self):
+        """Test that waiting requests overtake newer, shorter ones"""
+        controller = AdmissionController(
+            AdmissionConfig(max_concurrent=1, aging_rate=1e5)
+        )
+        order = asyncio.run(
+            _queue_behind_running(
+                controller,
+                ("old", _estimate(nonzeros=100_000), "batch"),
+                ("new", _estimate(nonzeros=10), "interactive"),
+            )
+        )
+        # Waiting the time between both arrivals makes up for class and duration
+        assert order == ["first", "old", "new"]
+
+    def test_long_solve_lane(self):
+        """Test that long solves leave slots to short solves"""
+        controller = AdmissionController(
+            AdmissionConfig(max_concurrent=2, long_solve_seconds=1.0)
+        )
+        long = _estimate(nonzeros=10_000_000)
+
+        async def run():
+            events: list[str] = []
+            tasks = [
+                asyncio.create_task(_hold(controller, events, name, long))
+                for name in ("long1", "long2")
+            ]
+            await asyncio.sleep(0)
+            assert controller.stats().running_long == 1
+            tasks.append(asyncio.create_task(_hold(controller, events, "short")))
+            await asyncio.sleep(0)
+            assert controller.running == 2
+            await asyncio.gather(*tasks)
+            return events
+
+        events = asyncio.run(run())
+        assert events.index("start short") < events.index("start long2")
+
+    def test_learned_durations(self):
+        """Test that durations are predicted from past solves per fingerprint"""
+        costs = CostModel()
+        estimate = _estimate(nonzeros=1000)
+        costs.observe(estimate, "slow", costs.base_seconds + 10.0)
+        assert costs.predict(estimate, "slow") == pytest.approx(
+            costs.base_seconds + 10.0
+        )
+        # Twice the nonzeros, twice the time
+        assert costs.predict(_estimate(nonzeros=2000), "slow") == pytest.approx(
+            costs.base_seconds + 20.0
+        )
+        assert costs.predict(estimate, "unseen") < costs.predict(estimate, "slow")
+
+
+async def _tenant_jobs(controller: AdmissionController, jobs: list[tuple[str, str]]):
+    """Run named jobs of tenants, all queued at once; return their start order."""
+    events: list[str] = []
+    tasks = []
+    for name, tenant in jobs:
+        tasks.append(
+            asyncio.create_task(
+                _hold(controller, events, name, _estimate(), tenant=tenant)
+            )
+        )
+    await asyncio.gather(*tasks)
+    return [e.removeprefix("start ") for e in events if e.startswith("start")]
+
+
+class TestFairShare:
+    """Tests for sharing the solvers between tenants"""
+
+    def test_sweep_does_not_hold_others(self):
+        """Test that a tenant queueing many solves does not delay another"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1))
+        jobs = [(f"sweep{i}", "sweep") for i in range(4)] + [("chat", "chat")]
+        order = asyncio.run(_tenant_jobs(controller, jobs))
+        assert order.index("chat") == 1
+
+    def test_weights(self):
+        """Test that tenants get solver time in proportion to their weight"""
+        controller = AdmissionController(
+            AdmissionConfig(
+                max_concurrent=1,
+                tenants={"gold": TenantLimits(weight=3.0)},
+            )
+        )
+        jobs = [(f"gold{i}", "gold") for i in range(8)]
+        jobs += [(f"free{i}", "free") for i in range(8)]
+        order = asyncio.run(_tenant_jobs(controller, jobs))
+        # 6 with exact timings, 4 with equal weights
+        assert sum(name.startswith("gold") for name in order[:8]) in (6, 7)
+
+    def test_running_cap(self):
+        """Test that a tenant at its cap leaves free slots to other tenants"""
+        controller = AdmissionController(
+            AdmissionConfig(
+                max_concurrent=3,
+                tenants={"capped": TenantLimits(max_running=1)},
+            )
+        )
+
+        async def run():
+            events: list[str] = []
+            tasks = [
+                asyncio.create_task(_hold(controller, events, name, tenant=tenant))
+                for name, tenant in [("a", "capped"), ("b", "capped"), ("c", "other")]
+            ]
+            await asyncio.sleep(0)
+            running = controller.stats().tenants
+            await asyncio.gather(*tasks)
+            return running
+
+        running = asyncio.run(run())
+        assert (running["capped"].running, running["capped"].queued) == (1, 1)
+        assert running["other"].running == 1
+
+    def test_queue_quota(self):
+        """Test that requests beyond the quota of their tenant are rejected"""
+        controller = AdmissionController(
+            AdmissionConfig(
+                max_concurrent=1,
+                tenants={"sweep": TenantLimits(max_queued=1)},
+            )
+        )
+        controller.running = 1
+
+        async def run():
+            queued = asyncio.create_task(_hold(controller, [], "a", tenant="sweep"))
+            await asyncio.sleep(0)
+            try:
+                with pytest.raises(Overloaded, match="Tenant sweep has 1 solves"):
+                    async with controller.admit(_estimate(), tenant="sweep"):
+                        pass
+                # Other tenants still queue
+                other = asyncio.create_task(_hold(controller, [], "b", tenant="chat"))
+                await asyncio.sleep(0)
+                assert controller.stats().tenants["chat"].queued == 1
+            finally:
+                controller.running = 0
+                controller._dispatch()
+            await asyncio.gather(queued, other)
+
+        asyncio.run(run())
+        assert controller.stats().tenants["sweep"].rejected == 1
+
+    def test_usage(self):
+        """Test that the solver seconds of every tenant are reported"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=2))
+        asyncio.run(_tenant_jobs(controller, [("a", "a"), ("b", "a"), ("c", "b")]))
+        tenants = controller.stats().tenants
+        assert tenants["a"].admitted == 2
+        assert tenants["a"].cpu_seconds > tenants["b"].cpu_seconds > 0
+
+    def test_threads_usage(self):
+        """Test that solves are charged for every thread they ran on"""
+        controller = AdmissionController()
+
+        async def run():
+            async with controller.admit(_estimate(), tenant="a") as cost:
+                cost.threads = 3
+                await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        assert controller.stats().tenants["a"].cpu_seconds >= 0.03
+
+    def test_threads_share(self):
+        """Test that the fair share charges the threads of a solve"""
+        controller = AdmissionController(
+            AdmissionConfig(tenants={"a": TenantLimits(weight=2)})
+        )
+
+        async def run():
+            async with controller.admit(_estimate(), tenant="a") as cost:
+                cost.threads = 4
+                await asyncio.sleep(0.01)
+            return controller._tenants["a"]
+
+        tenant = asyncio.run(run())
+        assert tenant.used == pytest.approx(tenant.cpu_seconds / 2)
+        assert tenant.used >= 0.02
+        assert tenant.reserved == pytest.approx(0)
+
+    def test_idle_tenants_forgotten(self):
+        """Test that tenants idle for longer than the limit are forgotten"""
+        controller = AdmissionController(AdmissionConfig(tenant_idle_seconds=0))
+        for tenant in ("a", "b"):
+            asyncio.run(_tenant_jobs(controller, [(tenant, tenant)]))
+        assert set(controller.stats().tenants) == {"b"}
+
+    def test_idle_tenants_capped(self):
+        """Test that only the most recently idle tenants are remembered"""
+        controller = AdmissionController(AdmissionConfig(max_idle_tenants=2))
+        for i in range(5):
+            asyncio.run(_tenant_jobs(controller, [(f"job{i}", f"tenant{i}")]))
+        assert set(controller.stats().tenants) == {"tenant2", "tenant3", "tenant4"}
+
+    def test_busy_tenants_kept(self):
+        """Test that tenants with queued or running solves are not forgotten"""
+        controller = AdmissionController(
+            AdmissionConfig(max_concurrent=1, tenant_idle_seconds=0)
+        )
+
+        async def run():
+            events: list[str] = []
+            tasks = [
+                asyncio.create_task(_hold(controller, events, name, tenant=name))
+                for name in ("a", "b", "c")
+            ]
+            await asyncio.sleep(0)
+            tenants = set(controller.stats().tenants)
+            await asyncio.gather(*tasks)
+            return tenants
+
+        assert asyncio.run(run()) == {"a", "b", "c"}
+
+
+class TestAdmissionEndpoints:
+    """Tests for admission of solves through the API"""
+
+    def test_overloaded(self, monkeypatch):
+        """Test that solves are a 429 with Retry-After when the queue is full"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1, max_queue=0))
+        controller.running = 1
+        monkeypatch.setattr(app_module, "admission", controller)
+        response = TestClient(app_module.app).post(
+            "/api/model/solve", content=network_model().to_data().model_dump_json()
+        )
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+    def test_tenant_header(self, monkeypatch):
+        """Test that solves are accounted to the tenant of their header"""
+        controller = AdmissionController(AdmissionConfig(max_concurrent=1, max_queue=0))
+        controller.running = 1
+        monkeypatch.setattr(app_module, "admission", controller)
+        client = TestClient(app_module.app)
+        client.post(
+            "/api/model/solve",
+            content=network_model().to_data().model_dump_json(),
+            headers={"X-Tenant": "acme"},
+        )
+        tenants = client.get("/api/admission").json()["tenants"]
+        assert tenants["acme"]["rejected"] == 1
+
+    def test_too_large(self, monkeypatch):
+        """Test that models over the memory limit are a 413"""
+        controller = AdmissionController(AdmissionConfig(max_memory_mb=1))
+        monkeypatch.setattr(app_module, "admission", controller)
+        response = TestClient(app_module.app).post(
+            "/api/model/solve", content=network_model().to_data().model_dump_json()
+        )
+        assert response.status_code == 413
+
+    def test_estimate_off_the_event_loop(self, monkeypatch):
+        """Test that models are sized in a worker thread, not on the event loop"""
+        loops = []
+
+        def sized(data):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return estimate_size(data)
+
+        controller = AdmissionController(AdmissionConfig(max_memory_mb=1))
+        monkeypatch.setattr(app_module, "admission", controller)
+        monkeypatch.setattr(app_module, "estimate_size", sized)
+        response = TestClient(app_module.app).post(
+            "/api/model/solve", content=network_model().to_data().model_dump_json()
+        )
+        assert response.status_code == 413
+        assert loops == [None]
+
+    def test_invalid_priority(self):
+        """Test that unknown priority classes are rejected"""
+        response = TestClient(app_module.app).post(
+            "/api/model/solve?priority=urgent",
+            content=network_model().to_data().model_dump_json(),
+        )
+        assert response.status_code == 422
+
+    def test_stats(self, monkeypatch):
+        """Test that the load of the service is reported"""
+        controller = AdmissionController()
+        monkeypatch.setattr(app_module, "admission", controller)
+        response = TestClient(app_module.app).get("/api/admission")
+        assert response.json()["running"] == 0
+        assert response.json()["queued"] == 0
@@ -0,0 +1,101 @@
+"""Tests for set element codes"""
+
+import pyomo.environ as pyo
+import pytest
+
+from moai.codec import LabelCodec, LabeledComponent, attach_codec, label_codec
+
+
+class TestLabelCodec:
+    """Tests for LabelCodec"""
+
+    def test_add_assigns_dense_codes(self):
+        """Test that labels get consecutive codes in order of registration"""
+        codec = LabelCodec()
+        assert codec.add(["NYC", "LA"]) == [0, 1]
+        assert codec.add(["LA", 3]) == [1, 2]
+        assert len(codec) == 3
+
+    def test_codes_are_stable(self):
+        """Test that registering more labels never changes existing codes"""
+        codec = LabelCodec(["a", "b"])
+        codec.add(["c", "a"])
+        assert codec.encode("a") == 0
+        assert codec.encode("c") == 2
+
+    def test_string_and_int_labels_are_distinct(self):
+        """Test that 1 and '1' get different codes"""
+        codec = LabelCodec([1, "1"])
+        assert codec.encode(1) != codec.encode("1")
+
+    def test_encode_unknown_label(self):
+        """Test that encoding an unknown label raises KeyError"""
+        codec = LabelCodec(["a"])
+        with pytest.raises(KeyError):
+            codec.encode("b")
+        with pytest.raises(KeyError):
+            codec.encode_index(("a", "b"))
+
+    def test_roundtrip(self):
+        """Test that decoding an encoded label gives it back"""
+        codec = LabelCodec(["a", "b", 7])
+        assert codec.decode(codec.encode(7)) == 7
+        assert codec.decode_index(codec.encode_index(("b", "a"))) == ("b", "a")
+
+    def test_decode_scalar_index(self):
+        """Test that a single code decodes to a one-element tuple"""
+        codec = LabelCodec(["a", "b"])
+        assert codec.decode_index(1) == ("b",)
+
+    def test_decoded_indices_are_shared(self):
+        """Test that decoding the same index twice returns the same tuple"""
+        codec = LabelCodec(["a", "b"])
+        assert codec.decode_index((0, 1)) is codec.decode_index((0, 1))
+
+
+class TestAttachCodec:
+    """Tests for attaching a codec to a Pyomo model"""
+
+    def test_attach(self):
+        """Test that an attached codec is found on the model"""
+        model = pyo.ConcreteModel()
+        codec = LabelCodec()
+        attach_codec(model, codec)
+        assert label_codec(model) is codec
+
+    def test_plain_model(self):
+        """Test that plain Pyomo models have no codec"""
+        assert label_codec(pyo.ConcreteModel()) is None
+
+
+class TestLabeledComponent:
+    """Tests for indexing components built on codes by labels"""
+
+    def _component(self) -> LabeledComponent:
+        codec = LabelCodec(["NYC", "LA", 2024])
+        model = pyo.ConcreteModel()
+        model.x = pyo.Var(
+            [codec.encode_index(("NYC", 2024)), codec.encode_index(("LA", 2024))],
+            initialize=1.0,
+        )
+        return LabeledComponent(model.x, codec)
+
+    def test_getitem(self):
+        """Test that items are looked up by their labels"""
+        x = self._component()
+        x["LA", 2024].value = 3.0
+        assert x["LA", 2024].value == 3.0
+        assert x.component[1, 2].value == 3.0
+
+    def test_keys(self):
+        """Test that iterating yields the labels of the index"""
+        x = self._component()
+        assert list(x) == [("NYC", 2024), ("LA", 2024)]
+        assert [value.value for _, value in x.items()] == [1.0, 1.0]
+        assert len(x) == 2
+        assert ("NYC", 2024) in x
+        assert ("SF", 2024) not in x
+
+    def test_attributes(self):
+        """Test that other attributes are those of the component"""
+        assert self._component().name == "x"
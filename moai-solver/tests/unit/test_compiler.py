@@ -0,0 +1,206 @@
+"""Tests for compiling IR nodes into closures over index slots"""
+
+from typing import cast
+
+import pyomo.environ as pyo
+import pytest
+
+from moai import ir
+from moai.builders import (
+    binop,
+    gt,
+    index_var,
+    lt,
+    num,
+    param,
+    prev_element,
+    string,
+    var,
+)
+from moai.codec import LabelCodec
+from moai.compiler import Compiler, NotCompilable
+from moai.expressions import (
+    AggregationExpression,
+    ComparisonExpression,
+    IndexBinding,
+    IndexComparisonExpr,
+)
+from moai.parse import ParseState, SharedExpressions, _parse_node
+
+
+def _model() -> pyo.ConcreteModel:
+    model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+    model.T = pyo.Set(initialize=[1, 2, 3])
+    model.d = pyo.Param(model.T, initialize={1: 5, 2: 0, 3: 7})
+    model.x = pyo.Var(model.T)
+    return model
+
+
+def _sum(expr, bindings, condition=None) -> AggregationExpression:
+    return AggregationExpression.create(
+        "sum", expr, [IndexBinding.create(i, s) for i, s in bindings], condition
+    )
+
+
+def _grid() -> pyo.ConcreteModel:
+    model = _model()
+    model.y = pyo.Var(model.T, model.T)
+    for (i, j), y in model.y.items():
+        y.value = 10 * i + j
+    for t, x in model.x.items():
+        x.value = t
+    return model
+
+
+class TestCompilePredicate:
+    """Tests for compiling comparisons into predicates"""
+
+    def test_index_against_literal(self):
+        """Test a condition like t > 1 read from a row slot"""
+        predicate = Compiler(_model(), {"t": 0}).predicate(
+            ir.lower(gt(index_var("t"), num(1)))
+        )
+        assert [predicate((t,)) for t in (1, 2, 3)] == [False, True, True]
+
+    def test_index_arithmetic(self):
+        """Test arithmetic on index values in a condition"""
+        predicate = Compiler(_model(), {"i": 0, "j": 1}).predicate(
+            ir.lower(lt(binop(index_var("i"), num(1), "add"), index_var("j")))
+        )
+        assert predicate((1, 3))
+        assert not predicate((2, 3))
+
+    def test_parameter_value(self):
+        """Test a condition on a parameter value such as d[t] != 0"""
+        predicate = Compiler(_model(), {"t": 0}).predicate(
+            ir.lower(
+                ComparisonExpression.create(param("d", [index_var("t")]), num(0), "ne")
+            )
+        )
+        assert [predicate((t,)) for t in (1, 2, 3)] == [True, False, True]
+
+    def test_codes_are_compared_as_labels(self):
+        """Test that coded rows are decoded before comparing"""
+        codec = LabelCodec(["b", "a"])
+        predicate = Compiler(_model(), {"i": 0}, codec).predicate(
+            ir.lower(lt(index_var("i"), string("b")))
+        )
+        assert predicate((codec.encode("a"),))
+        assert not predicate((codec.encode("b"),))
+
+    def test_shift(self):
+        """Test a condition on a parameter at the predecessor of an index"""
+        predicate = Compiler(_model(), {"t": 0}).predicate(
+            ir.lower(gt(param("d", [prev_element("t", "T")]), num(1)))
+        )
+        assert predicate((2,))
+        assert not predicate((3,))
+
+    def test_variables_are_not_compilable(self):
+        """Test that references to decision variables are rejected"""
+        with pytest.raises(NotCompilable):
+            Compiler(_model(), {"t": 0}).predicate(
+                ir.lower(gt(var("x", [index_var("t")]), num(1)))
+            )
+
+    def test_unbound_index_is_not_compilable(self):
+        """Test that index variables without a slot are rejected"""
+        with pytest.raises(NotCompilable):
+            Compiler(_model(), {"t": 0}).predicate(ir.lower(gt(index_var("s"), num(1))))
+
+
+class TestCompileExpression:
+    """Tests for compiling expressions evaluated on a row buffer"""
+
+    def test_matches_parser(self):
+        """Test that a nested sum evaluates like the parsed expression"""
+        model = _grid()
+        node = ir.lower(
+            _sum(
+                binop(
+                    param("d", [index_var("i")]),
+                    _sum(var("y", [index_var("i"), index_var("j")]), [("j", "T")]),
+                    "mul",
+                ),
+                [("i", "T")],
+            )
+        )
+        compiler = Compiler(model, {})
+        compiled = compiler.expression(node)(compiler.row())
+        assert pyo.value(compiled) == pyo.value(_parse_node(model, node))
+
+    def test_nested_sums_take_deeper_slots(self):
+        """Test that nested sums get their own slots and siblings share them"""
+        model = _grid()
+        inner = _sum(var("y", [index_var("i"), index_var("j")]), [("j", "T")])
+        node = ir.lower(
+            binop(
+                _sum(inner, [("i", "T")]),
+                _sum(var("x", [index_var("k")]), [("k", "T")]),
+                "add",
+            )
+        )
+        compiler = Compiler(model, {"t": 0})
+        build = compiler.expression(node)
+        assert compiler.width == 3
+        assert compiler.size == 1
+        row = compiler.row()
+        row[0] = 1
+        assert (
+            pyo.value(build(row))
+            == sum(10 * i + j for i in (1, 2, 3) for j in (1, 2, 3)) + 6
+        )
+
+    def test_condition_reads_outer_slot(self):
+        """Test a sum condition comparing its index with a quantifier index"""
+        model = _grid()
+        node = ir.lower(
+            _sum(
+                var("y", [index_var("t"), index_var("j")]),
+                [("j", "T")],
+                IndexComparisonExpr.create(index_var("j"), index_var("t"), "ne"),
+            )
+        )
+        compiler = Compiler(model, {"t": 0})
+        build = compiler.expression(node)
+        row = compiler.row()
+        row[0] = 2
+        assert pyo.value(build(row)) == 21 + 23
+
+    def test_tuple_binding(self):
+        """Test that tuple set elements are unpacked into consecutive slots"""
+        model = _grid()
+        model.A = pyo.Set(initialize=[(1, 2), (3, 1)], dimen=2)
+        node = ir.lower(
+            AggregationExpression.create(
+                "sum",
+                var("y", [index_var("i"), index_var("j")]),
+                [IndexBinding.create(["i", "j"], "A")],
+            )
+        )
+        compiler = Compiler(model, {})
+        assert pyo.value(compiler.expression(node)(compiler.row())) == 12 + 31
+
+    def test_shared_aggregation_is_referenced(self):
+        """Test that shared aggregations are emitted once per index value"""
+        model = _grid()
+        inner = ir.lower(_sum(var("y", [index_var("i"), index_var("j")]), [("j", "T")]))
+        shared = SharedExpressions([inner])
+        state = ParseState(shared)
+        compiler = Compiler(model, {"i": 0}, memo=state.memo, shared=shared)
+        build = compiler.expression(inner)
+        row = compiler.row()
+        row[0] = 1
+        first = build(row)
+        assert build(row) is first
+        assert pyo.value(first) == 11 + 12 + 13
+        # The parser references the same component
+        assert _parse_node(model, inner, {"i": 1}, state) is first
+
+    def test_unsupported_aggregation_is_not_compilable(self):
+        """Test that aggregations other than sums are left to the parser"""
+        node = ir.make(
+            ir.AGG, "max", ir.lower(var("x", [index_var("t")])), (("t", "T"),), None
+        )
+        with pytest.raises(NotCompilable):
+            Compiler(_model(), {}).expression(node)
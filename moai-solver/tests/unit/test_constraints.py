@@ -64,6 +64,12 @@ class TestQuantifier:
         assert q2.over == "Warehouses"
         assert q3.over == "TimePeriods"
 
+    def test_tuple_quantifier(self):
+        """Test a quantifier binding the components of a tuple set"""
+        q = Quantifier.create(index=["i", "j"], over="Arcs")
+        assert q.index_names == ["i", "j"]
+        assert q.display() == "for (i, j) in Arcs"
+
 
 class TestConstraint:
     """Tests for Constraint model"""
@@ -0,0 +1,220 @@
+"""Tests for the core budget of solves"""
+
+import asyncio
+import threading
+
+import pytest
+
+from moai import cores as cores_module
+from moai import driver as driver_module
+from moai import solution
+from moai.builders import index_var, le, num, var
+from moai.constraints import Constraint, Quantifier
+from moai.cores import CoreBudget, thread_options, wanted_threads, writer_processes
+from moai.driver import SolverProcess
+from moai.estimate import SizeEstimate
+from moai.expressions import AggregationExpression, IndexBinding
+from moai.model import Model
+from moai.objectives import Objective
+from moai.sets import Set
+from moai.variables import Variable
+
+
+def _estimate(nonzeros: int, integer_variables: int, rows: int = 0) -> SizeEstimate:
+    return SizeEstimate(
+        variables=integer_variables,
+        integer_variables=integer_variables,
+        rows=rows,
+        nonzeros=nonzeros,
+        exact=True,
+        constraints=[],
+    )
+
+
+def _knapsack() -> Model:
+    total = AggregationExpression.create(
+        "sum", var("y", [index_var("i")]), [IndexBinding.create("i", "I")]
+    )
+    return (
+        Model(name="Pick")
+        .add_set(Set.create("I", ["a", "b", "c"]))
+        .add_variable(Variable.create("y", indices=["I"], domain="Binary"))
+        .add_constraint(Constraint.create("pick", le(total, num(2))))
+        .set_objective(Objective(name="picked", sense="max", expr=total))
+    )
+
+
+def _capped() -> Model:
+    """A model of a row per element of its set."""
+    return _knapsack().add_constraint(
+        Constraint.create(
+            "cap",
+            le(var("y", [index_var("i")]), num(1)),
+            [Quantifier.create("i", "I")],
+        )
+    )
+
+
+class TestThreads:
+    """Tests for the threads wanted by a solve"""
+
+    def test_wanted_threads(self):
+        """Test that larger MIPs want more threads, and LPs one"""
+        assert wanted_threads(_estimate(200_000, 0), 8) == 1
+        assert wanted_threads(_estimate(100, 10), 8) == 1
+        assert wanted_threads(_estimate(200_000, 10), 8) == 4
+        assert wanted_threads(_estimate(10_000_000, 10), 8) == 8
+
+    def test_writer_processes(self):
+        """Test that models of more rows are written by more processes"""
+        assert writer_processes(_estimate(0, 0, rows=150_000), 8) == 1
+        assert writer_processes(_estimate(0, 0, rows=450_000), 8) == 4
+        assert writer_processes(_estimate(0, 0, rows=10_000_000), 8) == 8
+
+    def test_thread_options(self):
+        """Test that threads are set through the option of each solver"""
+        assert thread_options("cbc", 2) == {"threads": 2}
+        assert thread_options("gurobi", 2) == {"Threads": 2}
+        assert thread_options("glpk", 2) == {}
+
+
+class TestCoreBudget:
+    """Tests for sharing cores between solves"""
+
+    def test_grants_free_cores(self):
+        """Test that solves get the cores left free by the others"""
+        budget = CoreBudget(total=4)
+        assert budget.acquire(3) == 3
+        assert budget.acquire(3) == 1
+        # Solves always get a thread, even with every core taken
+        assert budget.acquire(2) == 1
+        budget.release(1)
+        budget.release(1)
+        budget.release(3)
+        assert budget.used == 0
+
+    def test_oversubscribed(self):
+        """Test that solves started with every core taken oversubscribe by one"""
+        budget = CoreBudget(total=2)
+        assert budget.acquire(2) == 2
+        assert [budget.acquire(2) for _ in range(3)] == [1, 1, 1]
+        assert (budget.free, budget.oversubscribed) == (0, 3)
+        budget.release(2)
+        assert budget.oversubscribed == 1
+        budget.release(1)
+        budget.release(1)
+        # Cores freed go to the next solve
+        assert budget.acquire(2) == 1
+        budget.release(1)
+        budget.release(1)
+        assert budget.acquire(2) == 2
+
+    def test_max_per_solve(self):
+        """Test that no solve takes more than its share"""
+        budget = CoreBudget(total=8, max_per_solve=2)
+        with budget.reserve(6) as threads:
+            assert threads == 2
+            assert budget.free == 6
+        assert budget.free == 8
+
+    def test_concurrent_reserves(self):
+        """Test that reserves from many threads keep the count consistent"""
+        budget = CoreBudget(total=4)
+
+        def solve():
+            for _ in range(200):
+                with budget.reserve(2):
+                    pass
+
+        workers = [threading.Thread(target=solve) for _ in range(8)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        assert budget.used == 0
+
+
+class TestSolveThreads:
+    """Tests for the threads of Model.solve"""
+
+    @pytest.fixture
+    def budget(self, monkeypatch):
+        budget = CoreBudget(total=4)
+        monkeypatch.setattr(cores_module, "cores", budget)
+        return budget
+
+    def test_requested_threads(self, budget):
+        """Test that solves run on the threads granted, and give them back"""
+        result = _knapsack().solve(threads=2)
+        assert result.status == "optimal"
+        assert result.solver_info.threads == 2
+        assert budget.used == 0
+
+    def test_busy_budget(self, budget):
+        """Test that solves get a single thread when the cores are taken"""
+        budget.acquire(4)
+        result = _knapsack().solve(threads=4)
+        assert result.solver_info.threads == 1
+
+    def test_explicit_option(self, budget):
+        """Test that thread options set by the caller are asked for"""
+        result = _knapsack().solve(**{"threads": 3})
+        assert result.solver_info.threads == 3
+        assert budget.used == 0
+
+    def test_explicit_option_capped(self, budget, monkeypatch):
+        """Test that thread options are capped to the threads granted"""
+        commands = []
+
+        def command(executable, problem, soln, options):
+            commands.append(options)
+            return solution.cbc_command(executable, problem, soln, options)
+
+        monkeypatch.setitem(solution.COMMANDS, "cbc", command)
+        budget.acquire(3)
+        result = _knapsack().solve(**{"threads": 4})
+        assert result.solver_info.threads == 1
+        assert commands[0]["threads"] == 1
+
+
+class TestParallelWrites:
+    """Tests for solves of LP files written by worker processes"""
+
+    @pytest.fixture
+    def writes(self, monkeypatch):
+        """Processes of every LP file written, with a process per row."""
+        budget = CoreBudget(total=4)
+        monkeypatch.setattr(cores_module, "cores", budget)
+        monkeypatch.setattr(driver_module, "cores", budget)
+        monkeypatch.setattr(cores_module, "ROWS_PER_WRITER", 1)
+        writes = []
+        write = solution.write_lp
+
+        def write_lp(data, out, processes=None, cache=None):
+            writes.append(processes)
+            return write(data, out, processes, cache)
+
+        monkeypatch.setattr(solution, "write_lp", write_lp)
+        return writes
+
+    def test_solve(self, writes):
+        """Test that Model.solve writes large models in parallel"""
+        # With every core taken, the file is written by the solving process
+        cores_module.cores.acquire(4)
+        serial = _capped().solve()
+        cores_module.cores.release(4)
+        parallel = _capped().solve()
+        assert writes == [None, 4]
+        assert parallel.objective.value == serial.objective.value == 2
+        assert parallel.variables["y"].values == serial.variables["y"].values
+        assert parallel.solver_info.threads == 1
+        assert cores_module.cores.used == 0
+
+    def test_solver_process(self, writes):
+        """Test that solver processes write large models in parallel"""
+        result = asyncio.run(SolverProcess(_capped()).run())
+        assert writes == [4]
+        assert result.status == "optimal"
+        assert result.objective.value == 2
+        assert result.solver_info.threads == 1
+        assert cores_module.cores.used == 0
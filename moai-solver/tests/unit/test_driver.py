@@ -0,0 +1,279 @@
+"""Tests for the asynchronous solver driver"""
+
+import asyncio
+import inspect
+import os
+import random
+
+import pyomo.environ as pyo
+import pytest
+from pyomo.opt.solver import SystemCallSolver
+
+from moai import driver as driver_module
+from moai import solution
+from moai.builders import binop, eq, index_var, param, var
+from moai.constraints import Constraint, Quantifier
+from moai.driver import PluginSolve, SolverProcess
+from moai.expressions import AggregationExpression, IndexBinding
+from moai.model import Model
+from moai.objectives import Objective
+from moai.parameters import IndexElement, Parameter
+from moai.results import ModelResult
+from moai.sets import Set
+from moai.solution import LPSolve
+from moai.variables import Variable
+
+from .test_cores import _knapsack
+from .test_progress import requires_cbc_log
+
+
+def _markshare(rows: int = 6, columns: int = 60) -> Model:
+    """A small MIP that CBC takes minutes to prove optimal."""
+    rng = random.Random(1)
+    weights = {(i, j): rng.randint(0, 99) for i in range(rows) for j in range(columns)}
+    targets = {i: sum(weights[i, j] for j in range(columns)) // 2 for i in range(rows)}
+    picked = AggregationExpression.create(
+        "sum",
+        binop(
+            param("a", [index_var("i"), index_var("j")]),
+            var("x", [index_var("j")]),
+            "mul",
+        ),
+        [IndexBinding.create("j", "J")],
+    )
+    slack = binop(var("up", [index_var("i")]), var("down", [index_var("i")]), "add")
+    return (
+        Model(name="Markshare")
+        .add_set(Set.create_range("I", 0, rows))
+        .add_set(Set.create_range("J", 0, columns))
+        .add_parameter(
+            Parameter.create(
+                "a",
+                [IndexElement(index=[i, j], value=w) for (i, j), w in weights.items()],
+                ["I", "J"],
+            )
+        )
+        .add_parameter(
+            Parameter.create(
+                "b",
+                [IndexElement(index=[i], value=t) for i, t in targets.items()],
+                ["I"],
+            )
+        )
+        .add_variable(Variable.create("x", indices=["J"], domain="Binary"))
+        .add_variable(Variable.create("up", indices=["I"]))
+        .add_variable(Variable.create("down", indices=["I"]))
+        .add_constraint(
+            Constraint.create(
+                "share",
+                eq(
+                    binop(
+                        binop(picked, var("up", [index_var("i")]), "add"),
+                        var("down", [index_var("i")]),
+                        "sub",
+                    ),
+                    param("b", [index_var("i")]),
+                ),
+                [Quantifier.create("i", "I")],
+            )
+        )
+        .set_objective(
+            Objective(
+                name="gap",
+                sense="min",
+                expr=AggregationExpression.create(
+                    "sum", slack, [IndexBinding.create("i", "I")]
+                ),
+            )
+        )
+    )
+
+
+def _integral(result: ModelResult) -> bool:
+    return all(min(v, 1 - v) < 1e-6 for v in result.variables["x"].values.values())
+
+
+def _temp_files(process: SolverProcess) -> list[str]:
+    return [process._lp.directory]
+
+
+class TestSolverProcess:
+    """Tests for solves run by a solver subprocess"""
+
+    def test_solve(self):
+        """Test that solves return the same results as Model.solve"""
+        process = SolverProcess(_knapsack())
+        result = asyncio.run(process.run())
+        assert result.status == "optimal"
+        assert result.objective.value == pytest.approx(2)
+        assert result.solver_info.threads == 1
+        assert any("Optimal" in line for line in process.log)
+
+    def test_unsupported_solver(self):
+        """Test that solvers not run as executables are rejected"""
+        with pytest.raises(ValueError, match="does not run as an executable"):
+            SolverProcess(_knapsack(), solver_name="appsi_highs")
+
+    def test_time_limit(self):
+        """Test that solves stopped by their time limit keep the best solution"""
+        process = SolverProcess(_markshare(), time_limit=1)
+        result = asyncio.run(process.run())
+        assert result.status == "stopped"
+        assert _integral(result)
+        assert result.objective.value == pytest.approx(process.progress.incumbent)
+        assert result.solver_info.solve_time < 1 + driver_module.STOP_GRACE
+
+    def test_stop(self):
+        """Test that stopped solves return the incumbent"""
+        process = SolverProcess(_markshare())
+
+        async def solve():
+            task = asyncio.create_task(process.run())
+            await asyncio.sleep(1.5)
+            process.stop()
+            return await task
+
+        result = asyncio.run(solve())
+        assert result.status == "stopped"
+        assert _integral(result)
+        assert process.elapsed < 1.5 + driver_module.STOP_GRACE
+
+    def test_stop_before_start(self):
+        """Test that solves stopped before the solver starts stop at once"""
+        process = SolverProcess(_markshare())
+        process.stop()
+        result = asyncio.run(process.run())
+        assert result.status in ("stopped", "error")
+        assert process.elapsed < driver_module.STOP_GRACE
+
+    def test_cancel(self):
+        """Test that cancelled solves kill the solver and remove its files"""
+        process = SolverProcess(_markshare())
+
+        async def solve():
+            task = asyncio.create_task(process.run())
+            await asyncio.sleep(1)
+            files = _temp_files(process)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return files
+
+        files = asyncio.run(solve())
+        assert process._process.returncode is not None
+        assert files and not any(os.path.exists(name) for name in files)
+
+    def test_kill_after_grace(self, monkeypatch):
+        """Test that solvers not exiting once interrupted are killed"""
+        monkeypatch.setattr(driver_module, "STOP_GRACE", 0.2)
+        process = SolverProcess(_markshare())
+
+        async def solve():
+            task = asyncio.create_task(process.run())
+            await asyncio.sleep(1)
+            # Ignored interrupts leave the solver running until killed
+            process._process.send_signal = lambda signal: None
+            process.stop()
+            return await task
+
+        result = asyncio.run(solve())
+        assert result.status == "error"
+        assert process._process.returncode < 0
+
+    def test_updates(self):
+        """Test that the progress of the search is followed until the end"""
+        process = SolverProcess(_markshare(), time_limit=2)
+
+        async def follow():
+            task = asyncio.create_task(process.run())
+            updates = [progress async for progress in process.updates(0.5)]
+            return updates, await task
+
+        updates, result = asyncio.run(follow())
+        # Rate limited, not one per line of the log
+        assert 2 <= len(updates) <= 2 / 0.5 + 3
+        assert updates[-1] == process.progress
+        assert updates[-1].incumbent == pytest.approx(result.objective.value)
+        assert updates[-1].bound <= updates[-1].incumbent
+        assert updates[-1].nodes > 0
+
+    @requires_cbc_log
+    def test_updates_while_running(self):
+        """Test that progress is read as the solver logs it, not at exit"""
+        process = SolverProcess(_markshare(), time_limit=2)
+
+        async def follow():
+            task = asyncio.create_task(process.run())
+            updates = [progress async for progress in process.updates(0.1)]
+            await task
+            return updates
+
+        searched = [u.elapsed for u in asyncio.run(follow()) if u.nodes]
+        # Block buffered logs arrive in a burst as the time limit ends
+        assert searched[0] < 1.0
+        assert len(searched) > 3
+
+    def test_failed_build(self, monkeypatch):
+        """Test that models failing to build fail their solve with the error
+        of the build"""
+        monkeypatch.delitem(solution.SOLUTION_READERS, "cbc")
+        builds = []
+
+        def build(model):
+            builds.append(model)
+            raise ValueError(f"Build {len(builds)} failed")
+
+        monkeypatch.setattr(Model, "build", build)
+        process = SolverProcess(_knapsack().to_data())
+        with pytest.raises(ValueError, match="Build 1 failed"):
+            asyncio.run(process.run())
+        assert len(builds) == 1
+
+    def test_failed_cleanup(self, monkeypatch, caplog):
+        """Test that solves whose files cannot be removed are logged"""
+
+        def cleanup(solve):
+            raise OSError("Read-only file system")
+
+        monkeypatch.setattr(LPSolve, "cleanup", cleanup)
+        result = asyncio.run(SolverProcess(_knapsack()).run())
+        assert result.status == "optimal"
+        assert "Could not clean up a solve of" in caplog.text
+
+    def test_memory_limit(self):
+        """Test that solvers out of memory fail without a solution"""
+        result = asyncio.run(SolverProcess(_markshare(), memory_limit_mb=1).run())
+        assert result.status == "error"
+
+    def test_memory_limit_wrapper(self):
+        """Test that the memory limit is set by the solver process itself"""
+        process = SolverProcess(_markshare(), memory_limit_mb=64)
+        command = ["sh", "-c", "ulimit -v"]
+        asyncio.run(process._execute(command))
+        assert process.log == [f"{64 * 1024}\n"]
+
+
+class TestPluginSolve:
+    """Tests for solves by the Pyomo plugins of solvers"""
+
+    def test_pyomo_members(self):
+        """Test that the private members of Pyomo solves by plugins go through
+        are still those of the installed Pyomo"""
+        opt = pyo.SolverFactory("cbc")
+        plugin = PluginSolve(opt)
+        command, _, _ = plugin.write(_knapsack())
+        for name in ("_command", "_smap_id", "_soln_file", "_log_file"):
+            assert hasattr(opt, name), name
+        assert command[0] == opt.executable()
+        # Set by the driver in place of _apply_solver, and read by plugins
+        source = inspect.getsource(SystemCallSolver._apply_solver)
+        assert "self._rc, self._log = " in source
+        plugin.cleanup()
+        assert not plugin._files
+
+    def test_missing_member(self):
+        """Test that Pyomo versions without a member fail loudly"""
+        plugin = PluginSolve(object())  # type: ignore[arg-type]
+        with pytest.raises(RuntimeError, match="no object._presolve"):
+            plugin.write(_knapsack())
+        plugin.cleanup()
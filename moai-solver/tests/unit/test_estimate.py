@@ -0,0 +1,141 @@
+"""Tests for model size estimates"""
+
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moai.app import app
+from moai.builders import binop, eq, ge, index_var, le, num, param, string, var
+from moai.constraints import Constraint, Quantifier
+from moai.estimate import estimate_size
+from moai.expressions import IndexComparisonExpr
+from moai.model import ModelData
+from moai.variables import Variable
+from moai.writer import write_lp
+
+from .cases import CASES, network_model, sum_over
+
+LINEAR = [case for case in CASES if case != "non-linear"]
+
+
+def _constraint(name: str, expr, quantifiers=None):
+    return network_model().add_constraint(Constraint.create(name, expr, quantifiers))
+
+
+def _missing_set() -> ModelData:
+    data = network_model().to_data()
+    constraint = Constraint.create(
+        "missing",
+        le(var("s", [index_var("t")]), num(1)),
+        [Quantifier.create("t", "U")],
+    )
+    return data.model_copy(update={"constraints": [*data.constraints, constraint]})
+
+
+class TestEstimate:
+    """Tests for the counts of an estimate"""
+
+    def test_variables(self):
+        """Test that variables count their index product, or their support"""
+        model = network_model().add_variable(
+            Variable.create("open", indices=["P"], domain="Binary")
+        )
+        estimate = model.estimate_size()
+        # x[P, Q] 9, s[T] 4, z 1, flow over A 3 arcs, open[P] 3
+        assert estimate.variables == 9 + 4 + 1 + 3 + 3
+        assert estimate.integer_variables == 3
+
+    def test_rows_and_nonzeros(self):
+        """Test that rows and nonzeros of a sum over a set are exact"""
+        model = _constraint(
+            "linear_sum",
+            le(
+                sum_over(
+                    binop(
+                        param("c", [index_var("p"), index_var("q")]),
+                        var("x", [index_var("p"), index_var("q")]),
+                        "mul",
+                    ),
+                    [("q", "Q")],
+                ),
+                num(10),
+            ),
+            [Quantifier.create("p", "P")],
+        )
+        estimate = model.estimate_size()
+        assert (estimate.rows, estimate.nonzeros, estimate.exact) == (3, 9, True)
+        assert estimate.constraints[0].name == "linear_sum"
+
+    def test_sparse_variables(self):
+        """Test that sparse variables count by the density of their support"""
+        model = _constraint(
+            "arcs",
+            le(
+                sum_over(var("flow", [index_var("p"), index_var("q")]), [("q", "Q")]),
+                num(1),
+            ),
+            [Quantifier.create("p", "P")],
+        )
+        estimate = model.estimate_size()
+        # 3 rows of 3 terms, of which 3 of 9 combinations are arcs
+        assert estimate.nonzeros == 3
+
+    def test_condition_selectivity(self):
+        """Test that conditions scale rows and sums by their selectivity"""
+        model = _constraint(
+            "diagonal",
+            ge(
+                sum_over(
+                    var("x", [index_var("p"), index_var("q")]),
+                    [("q", "Q")],
+                    IndexComparisonExpr.create(index_var("q"), index_var("p"), "ne"),
+                ),
+                num(1),
+            ),
+            [Quantifier.create("p", "P", eq(index_var("p"), string("north")))],
+        )
+        estimate = model.estimate_size()
+        # One of three rows kept, two of three terms kept per row
+        assert (estimate.rows, estimate.nonzeros, estimate.exact) == (1, 2, False)
+
+    def test_missing_set(self):
+        """Test that estimates of constraints over missing sets are not exact"""
+        estimate = estimate_size(_missing_set())
+        assert (estimate.rows, estimate.exact) == (0, False)
+
+    @pytest.mark.parametrize("name", LINEAR)
+    def test_bounds_written_rows(self, name):
+        """Test that written nonzeros never exceed unconditional estimates"""
+        constraint = CASES[name]
+        data = network_model().add_constraint(constraint).to_data()
+        estimate = estimate_size(data)
+        out = io.StringIO()
+        names = write_lp(data, out)
+        lines = out.getvalue().split("s.t.")[1].split("bounds")[0].splitlines()
+        written = sum(line.count(" x") for line in lines)
+        assert estimate.variables == names.size
+        if estimate.exact:
+            assert estimate.rows == len(names.rows[constraint.name])
+            assert estimate.nonzeros >= written
+
+
+class TestEstimateEndpoint:
+    """Tests for the estimate endpoint"""
+
+    def test_estimate(self):
+        """Test that the endpoint returns the estimate of a model"""
+        data = network_model().to_data()
+        response = TestClient(app).post(
+            "/api/model/estimate", content=data.model_dump_json()
+        )
+        assert response.status_code == 200
+        assert response.json() == estimate_size(data).model_dump()
+
+    def test_invalid(self):
+        """Test that invalid models are a 400, as they are to /validate"""
+        response = TestClient(app).post(
+            "/api/model/estimate", content=_missing_set().model_dump_json()
+        )
+        assert response.status_code == 400
+        assert "Set U not found" in response.json()["detail"]
@@ -1,8 +1,14 @@
+import pytest
+from pydantic import ValidationError
+
 from moai.expressions import (
+    AggregationExpression,
     BinaryOp,
     ComparisonExpression,
     Expression,
+    IndexBinding,
     IndexExpression,
+    IndexShiftExpr,
     IndexVariableExpr,
     NumberExpr,
     ParameterExpr,
@@ -804,3 +810,85 @@ class TestComparisonExpression:
         assert comp.type == "comparison"
         assert comp.op == "eq"
         assert comp.display() == "5 = 5"
+
+
+class TestDiscriminatedUnion:
+    """Tests for the `type` discriminated expression unions"""
+
+    def test_unknown_type_reports_tag_error(self):
+        """Test that an unknown node type fails on the tag, not on every member"""
+        with pytest.raises(ValidationError) as exc_info:
+            Expression.model_validate({"type": "bogus"})
+        errors = exc_info.value.errors()
+        assert len(errors) == 1
+        assert errors[0]["type"] == "union_tag_invalid"
+
+    def test_nested_error_location(self):
+        """Test that nested errors point at the offending node"""
+        with pytest.raises(ValidationError) as exc_info:
+            Expression.model_validate(
+                {
+                    "type": "binary_op",
+                    "op": "add",
+                    "left": {"type": "number", "value": 1},
+                    "right": {"type": "variable", "name": 3, "index_expr": None},
+                }
+            )
+        errors = exc_info.value.errors()
+        assert len(errors) == 1
+        assert errors[0]["loc"] == ("binary_op", "right", "variable", "name")
+
+    def test_json_round_trip(self):
+        """Test that a nested tree serializes and validates back unchanged"""
+        expr = BinaryOp.create(
+            "mul",
+            ParameterExpr.create("p", [IndexVariableExpr.create("i")]),
+            UnaryOp.create("sub", VariableExpr.create("x", [StringExpr.create("a")])),
+        )
+        raw = Expression(expr).model_dump_json()
+        assert Expression.model_validate_json(raw).root == expr
+
+
+class TestIndexShiftExpr:
+    """Tests for predecessor/successor index expressions"""
+
+    def test_display(self):
+        """Test display of shifts in an index expression"""
+        x = VariableExpr.create(
+            "x",
+            [
+                IndexShiftExpr.create("t", "T", -1),
+                IndexShiftExpr.create("m", "M", 1, cyclic=True),
+                IndexShiftExpr.create("t", "T", -2),
+            ],
+        )
+        assert (
+            Expression(x).display()
+            == "x[prev(t in T), nextw(m in M), shift(t in T, -2)]"
+        )
+
+    def test_validate_in_index(self):
+        """Test that shifts validate as index expressions"""
+        x = VariableExpr.model_validate(
+            {
+                "type": "variable",
+                "name": "inv",
+                "index_expr": [
+                    {"type": "index_shift", "index": "t", "set_name": "T", "offset": -1}
+                ],
+            }
+        )
+        assert isinstance(x.index_expr[0], IndexShiftExpr)  # type: ignore
+        assert x.index_expr[0].cyclic is False  # type: ignore
+
+    def test_tuple_binding_display(self):
+        """Test display of an aggregation over a tuple set"""
+        agg = AggregationExpression.create(
+            "sum",
+            VariableExpr.create(
+                "x", [IndexVariableExpr.create("i"), IndexVariableExpr.create("j")]
+            ),
+            [IndexBinding.create(["i", "j"], "Arcs")],
+        )
+        assert Expression(agg).display() == "sum(x[i, j] for (i, j) in Arcs)"
+        assert agg.bindings[0].index_names == ["i", "j"]
@@ -0,0 +1,290 @@
+"""Tests for the history of solves and the choice of solvers"""
+
+import asyncio
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai import history as history_module
+from moai import portfolio as portfolio_module
+from moai.admission import AdmissionController
+from moai.driver import SolverProcess
+from moai.estimate import SizeEstimate
+from moai.history import Recommender, SolveHistory, SolverConfig
+from moai.results import ModelResult
+from moai.templates import fingerprint
+
+from .test_cores import _knapsack
+
+CBC = SolverConfig(solver_name="cbc")
+NOCUTS = SolverConfig(solver_name="cbc", options={"cuts": "off"})
+GLPK = SolverConfig(solver_name="glpk")
+
+
+def _estimate(nonzeros: int = 100) -> SizeEstimate:
+    return SizeEstimate(
+        variables=10,
+        integer_variables=10,
+        rows=5,
+        nonzeros=nonzeros,
+        exact=True,
+        constraints=[],
+    )
+
+
+def _record(
+    history: SolveHistory,
+    config: SolverConfig,
+    seconds: float,
+    status: str = "optimal",
+    nonzeros: int = 100,
+):
+    history.record(
+        "fp", _estimate(nonzeros), config, ModelResult(status=status), seconds
+    )
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = SolveHistory(tmp_path / "history.sqlite")
+    yield history
+    history.close()
+
+
+class TestSolveHistory:
+    """Tests for recording solves"""
+
+    def test_record(self, history):
+        """Test that solves are read back by fingerprint"""
+        _record(history, NOCUTS, 1.5)
+        history.record("other", _estimate(), CBC, ModelResult(status="error"), 2)
+        [record] = history.records("fp")
+        assert record.solver_name == "cbc"
+        assert record.options == {"cuts": "off"}
+        assert record.seconds == 1.5
+        assert record.nonzeros == 100
+        assert record.status == "optimal"
+        assert history.records("missing") == []
+
+    def test_persisted(self, tmp_path):
+        """Test that the history is kept in its database file"""
+        path = tmp_path / "nested" / "history.sqlite"
+        history = SolveHistory(path)
+        _record(history, CBC, 1)
+        history.close()
+        assert len(SolveHistory(path).records("fp")) == 1
+
+    def test_in_memory(self):
+        """Test that histories are kept in memory by default"""
+        assert SolveHistory().path == ":memory:"
+
+    def test_history_path(self, tmp_path, monkeypatch):
+        """Test that the history of the process is kept in memory by default,
+        in the file named by the environment when set"""
+        monkeypatch.delenv(history_module.HISTORY_ENV, raising=False)
+        assert history_module.history_path() == ":memory:"
+        path = str(tmp_path / "history.sqlite")
+        monkeypatch.setenv(history_module.HISTORY_ENV, path)
+        assert history_module.history_path() == path
+
+    def test_retention(self):
+        """Test that the oldest solves are deleted beyond the caps"""
+        history = SolveHistory(max_per_fingerprint=3, max_records=5)
+        for seconds in range(5):
+            _record(history, CBC, seconds)
+        assert [r.seconds for r in history.records("fp")] == [2, 3, 4]
+        for seconds in range(4):
+            history.record(
+                "other", _estimate(), CBC, ModelResult(status="optimal"), seconds
+            )
+        assert [r.seconds for r in history.records("fp")] == [4]
+        assert len(history.records("other")) == 3
+
+    def test_recent_records(self, history):
+        """Test that the most recent solves are read, oldest first"""
+        for seconds in range(4):
+            _record(history, CBC, seconds)
+        assert [r.seconds for r in history.records("fp", 2)] == [2, 3]
+
+
+class TestRecommender:
+    """Tests for choosing solvers from the history of solves"""
+
+    def test_without_history(self, history):
+        """Test that the first configuration is tried first"""
+        recommender = Recommender(history, [NOCUTS, CBC])
+        assert recommender.recommend("fp") == NOCUTS
+
+    def test_unreadable_history(self, tmp_path, caplog):
+        """Test that recommendations without a readable history are logged,
+        and made as for a fingerprint never solved"""
+        (tmp_path / "history.sqlite").mkdir()
+        recommender = Recommender(SolveHistory(tmp_path / "history.sqlite"), [CBC])
+        assert recommender.recommend("fp") == CBC
+        assert "Could not read the history of solves" in caplog.text
+
+    def test_fastest(self, history):
+        """Test that the fastest configuration per nonzero is chosen"""
+        _record(history, CBC, 2, nonzeros=100)
+        _record(history, NOCUTS, 3, nonzeros=1000)
+        recommender = Recommender(history, [CBC, NOCUTS], exploration=0)
+        assert recommender.recommend("fp").options == {"cuts": "off"}
+        assert recommender.rates("fp")[("cbc", "{}")] == pytest.approx(0.02)
+
+    def test_unproven_not_timed(self, history):
+        """Test that solves stopped or failed do not count as fast"""
+        _record(history, CBC, 2)
+        _record(history, NOCUTS, 0.1, status="stopped")
+        _record(history, NOCUTS, 0.1, status="error")
+        recommender = Recommender(history, [CBC, NOCUTS], exploration=0)
+        assert recommender.recommend("fp") == CBC
+
+    def test_history_configs(self, history):
+        """Test that configurations of the history are chosen from"""
+        _record(history, NOCUTS, 1)
+        recommender = Recommender(history, [CBC], exploration=0)
+        assert recommender.recommend("fp").options == {"cuts": "off"}
+
+    def test_exploration(self, history):
+        """Test that untried configurations are explored first, then others"""
+        _record(history, CBC, 1)
+        recommender = Recommender(history, [CBC, NOCUTS, GLPK], exploration=1, seed=0)
+        picks = {recommender.recommend("fp").options.get("cuts") for _ in range(20)}
+        assert picks == {"off", None}
+        assert all(recommender.recommend("fp") != CBC for _ in range(20))
+        _record(history, NOCUTS, 2)
+        _record(history, GLPK, 3)
+        assert all(recommender.recommend("fp") != CBC for _ in range(20))
+        assert Recommender(history, exploration=0.5, seed=0).recommend("fp") in (
+            CBC,
+            NOCUTS,
+            GLPK,
+        )
+
+    def test_limits(self, history):
+        """Test that solvers without an option for a limit are not chosen"""
+        recommender = Recommender(history, [GLPK, CBC])
+        assert recommender.recommend("fp", node_limit=10) == CBC
+        with pytest.raises(ValueError, match="No solver to recommend"):
+            Recommender(history, [GLPK]).recommend("fp", node_limit=10)
+
+    def test_invalid_exploration(self, history):
+        """Test that exploration is a probability"""
+        with pytest.raises(ValueError, match="between 0 and 1"):
+            Recommender(history, exploration=2)
+
+
+class TestAutoSolve:
+    """Tests for Model.solve with the recommended solver"""
+
+    def test_solve(self, solve_history, monkeypatch):
+        """Test that solves are recorded, and explore other solvers"""
+        recommender = Recommender(solve_history, [NOCUTS, CBC], exploration=0)
+        monkeypatch.setattr(history_module, "recommender", recommender)
+        model = _knapsack()
+        results = [model.solve("auto", time_limit=10) for _ in range(2)]
+        assert all(result.status == "optimal" for result in results)
+        records = solve_history.records(fingerprint(model.to_data()))
+        assert [r.options for r in records] == [{"cuts": "off"}] * 2
+        assert records[0].nonzeros > 0
+
+        recommender.exploration = 1
+        model.solve("auto")
+        assert solve_history.records(fingerprint(model.to_data()))[-1].config == CBC
+
+    def test_options(self, solve_history, monkeypatch):
+        """Test that solver options are recorded with the configuration"""
+        recommender = Recommender(solve_history, [CBC], exploration=0)
+        monkeypatch.setattr(history_module, "recommender", recommender)
+        model = _knapsack()
+        model.solve("auto", threads=1, cuts="off")
+        [record] = solve_history.records(fingerprint(model.to_data()))
+        assert record.options == {"cuts": "off"}
+
+    def test_endpoint(self, solve_history, monkeypatch):
+        """Test that solve requests use the recommended solver"""
+        # The first solve is recorded, so the second explores the other
+        recommender = Recommender(solve_history, [CBC, NOCUTS], exploration=1)
+        monkeypatch.setattr(app_module, "recommender", recommender)
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        client = TestClient(app_module.app)
+        data = _knapsack().to_data()
+        for _ in range(2):
+            response = client.post(
+                "/api/model/solve?solver=auto", content=data.model_dump_json()
+            )
+            assert response.status_code == 200
+            assert response.json()["status"] == "optimal"
+        records = solve_history.records(fingerprint(data))
+        assert [r.config for r in records] == [CBC, NOCUTS]
+
+
+class TestRecordedSolves:
+    """Tests for recording every completed solve of the process"""
+
+    def test_model_solve(self, solve_history):
+        """Test that solves of models are recorded"""
+        model = _knapsack()
+        model.solve("cbc", cuts="off")
+        model.solve("appsi_highs")
+        records = solve_history.records(fingerprint(model.to_data()))
+        assert [r.config for r in records] == [
+            NOCUTS,
+            SolverConfig(solver_name="appsi_highs"),
+        ]
+        assert all(r.status == "optimal" and r.seconds > 0 for r in records)
+
+    def test_solver_process(self, solve_history):
+        """Test that solves of solver processes, and of the API, are recorded"""
+        data = _knapsack().to_data()
+        asyncio.run(SolverProcess(data, cuts="off").run())
+        [record] = solve_history.records(fingerprint(data))
+        assert record.config == NOCUTS
+        assert record.objective == pytest.approx(2)
+
+    def test_default_solvers(self):
+        """Test that the portfolio races the solvers recommended by default"""
+        assert portfolio_module.DEFAULT_SOLVERS is history_module.DEFAULT_SOLVERS
+
+    def test_reused_fingerprint(self, solve_history, monkeypatch):
+        """Test that API solves record the fingerprint and size they computed"""
+
+        def computed(*args):
+            raise AssertionError("Computed again")
+
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        monkeypatch.setattr(history_module, "fingerprint", computed)
+        monkeypatch.setattr(history_module, "estimate_size", computed)
+        data = _knapsack().to_data()
+        response = TestClient(app_module.app).post(
+            "/api/model/solve", content=data.model_dump_json()
+        )
+        assert response.status_code == 200
+        assert len(solve_history.records(fingerprint(data))) == 1
+
+    def test_failed_record(self, solve_history, monkeypatch, caplog):
+        """Test that solves whose record fails are logged, and still returned"""
+
+        def record(*args):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(solve_history, "record", record)
+        result = _knapsack().solve("cbc")
+        assert result.status == "optimal"
+        assert "Could not record a solve of" in caplog.text
+
+    def test_persist(self, tmp_path):
+        """Test that the history of the process can be kept in a file"""
+        path = tmp_path / "history.sqlite"
+        previous = history_module.history
+        _record(previous, CBC, 1.0)
+        history = history_module.persist_history(path)
+        assert previous._connection is None
+        assert history_module.history is history
+        assert history_module.recommender.history is history
+        model = _knapsack()
+        model.solve("cbc")
+        history.close()
+        assert len(SolveHistory(path).records(fingerprint(model.to_data()))) == 1
@@ -0,0 +1,147 @@
+"""Tests for the compact expression IR"""
+
+import pickle
+
+import pytest
+
+from moai import ir
+from moai.builders import binop, index_var, num, param, prev_element, string, var
+from moai.expressions import (
+    AggregationExpression,
+    ComparisonExpression,
+    IndexBinding,
+    IndexComparisonExpr,
+)
+
+
+class TestHashConsing:
+    """Tests for structural sharing of IR nodes"""
+
+    def test_identical_trees_lower_to_same_node(self):
+        """Test that structurally equal trees become the same object"""
+        a = binop(param("p", [index_var("i")]), var("x", [index_var("i")]), "mul")
+        b = binop(param("p", [index_var("i")]), var("x", [index_var("i")]), "mul")
+        assert a is not b
+        assert ir.lower(a) is ir.lower(b)
+
+    def test_shared_subtrees(self):
+        """Test that repeated subtrees inside one tree are stored once"""
+        term = binop(num(2), var("x"), "mul")
+        node = ir.lower(binop(term, term.model_copy(deep=True), "add"))
+        _, left, right = node.args
+        assert left is right
+
+    def test_different_trees_are_different_nodes(self):
+        """Test that different operators produce different nodes"""
+        a = ir.lower(binop(var("x"), num(1), "add"))
+        b = ir.lower(binop(var("x"), num(1), "sub"))
+        assert a is not b
+
+    def test_numeric_types_are_not_merged(self):
+        """Test that 1 and 1.0 stay distinct nodes"""
+        assert ir.num(1) is not ir.num(1.0)
+        assert ir.num(1).args[0].__class__ is int
+        assert ir.num(1.0).args[0].__class__ is float
+
+    def test_empty_index_is_scalar(self):
+        """Test that an empty index list lowers like no index"""
+        assert ir.lower(var("x", [])) is ir.lower(var("x"))
+
+    def test_names_are_interned(self):
+        """Test that names are interned strings"""
+        name = "".join(["cap", "acity"])
+        node = ir.lower(param(name))
+        assert node.args[0] is "capacity"  # noqa: F632
+
+
+class TestFreeIndices:
+    """Tests for free index variable analysis"""
+
+    def test_literals_are_closed(self):
+        assert ir.lower(num(1)).free == frozenset()
+        assert ir.lower(string("a")).free == frozenset()
+
+    def test_indexed_reference(self):
+        node = ir.lower(
+            var("x", [index_var("i"), binop(index_var("t"), num(1), "sub")])
+        )
+        assert node.free == {"i", "t"}
+
+    def test_aggregation_binds_indices(self):
+        """Test that aggregation bindings are removed from the free set"""
+        agg = AggregationExpression.create(
+            "sum",
+            var("x", [index_var("i"), index_var("j")]),
+            [IndexBinding.create("j", "J")],
+            IndexComparisonExpr.create(index_var("j"), index_var("k"), "ne"),
+        )
+        assert ir.lower(agg).free == {"i", "k"}
+
+    def test_tuple_binding_binds_all_components(self):
+        """Test that a binding over a tuple set binds every component"""
+        agg = AggregationExpression.create(
+            "sum",
+            var("x", [index_var("i"), index_var("j")]),
+            [IndexBinding.create(["i", "j"], "Arcs")],
+        )
+        node = ir.lower(agg)
+        assert node.args[2] == ((("i", "j"), "Arcs"),)
+        assert node.free == frozenset()
+
+    def test_shift_depends_on_its_index(self):
+        """Test that a shifted index depends on the shifted index variable"""
+        node = ir.lower(var("inv", [prev_element("t", "T")]))
+        assert node.args[1][0].kind == ir.SHIFT
+        assert node.free == {"t"}
+
+    def test_index_prefixed_variable_is_free(self):
+        """Test that `_idx_` variables count as index references"""
+        assert ir.lower(var("_idx_t")).free == {"t"}
+
+
+class TestLowering:
+    """Tests for lowering expression models"""
+
+    def test_lower_comparison(self):
+        comp = ComparisonExpression.create(var("x"), num(3), "le")
+        node = ir.lower(comp)
+        assert node.kind == ir.CMP
+        assert node.args == ("le", ir.lower(var("x")), ir.num(3))
+
+    def test_lower_aggregation(self):
+        agg = AggregationExpression.create(
+            "sum", var("x", [index_var("i")]), [IndexBinding.create("i", "I")]
+        )
+        node = ir.lower(agg)
+        assert node.kind == ir.AGG
+        assert node.args[2] == (("i", "I"),)
+        assert node.args[3] is None
+
+    def test_lower_node_is_identity(self):
+        node = ir.num(5)
+        assert ir.lower(node) is node
+
+    def test_unsupported_kind(self):
+        with pytest.raises(ValueError, match="Unsupported node kind"):
+            ir.make("matrix", 1)
+
+    def test_iter_nodes_visits_shared_nodes_once(self):
+        term = var("x")
+        node = ir.lower(binop(term, term, "add"))
+        assert len(list(ir.iter_nodes(node))) == 2
+
+
+class TestDigest:
+    """Tests for stable structural hashes"""
+
+    def test_digest_is_structural(self):
+        a = ir.lower(binop(var("x", [index_var("i")]), num(1), "add"))
+        b = ir.lower(binop(var("x", [index_var("i")]), num(1), "add"))
+        c = ir.lower(binop(var("x", [index_var("i")]), num(1.0), "add"))
+        assert a.digest == b.digest
+        assert a.digest != c.digest
+
+    def test_pickle_round_trip_keeps_identity(self):
+        """Test that unpickled nodes are re-interned"""
+        node = ir.lower(binop(param("p"), var("y", [string("a")]), "mul"))
+        assert pickle.loads(pickle.dumps(node)) is node
@@ -0,0 +1,156 @@
+"""Tests for solve jobs run in the background of the API"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai.admission import AdmissionConfig, AdmissionController
+
+from .test_cores import _knapsack
+from .test_driver import _markshare
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, "admission", AdmissionController())
+    monkeypatch.setattr(app_module, "jobs", {})
+    # Jobs run on the event loop of the client, kept while in the block
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+def _wait_for(client: TestClient, job_id: str, *statuses: str) -> dict:
+    for _ in range(200):
+        info = client.get(f"/api/jobs/{job_id}").json()
+        if info["status"] in statuses:
+            return info
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} is still {info['status']}")
+
+
+class TestJobEndpoints:
+    """Tests for starting, following and stopping solve jobs"""
+
+    def test_solve(self, client):
+        """Test that solves return their results"""
+        response = client.post(
+            "/api/model/solve", content=_knapsack().to_data().model_dump_json()
+        )
+        assert response.status_code == 200
+        assert response.json()["status"] == "optimal"
+
+    def test_job(self, client):
+        """Test that jobs finish with the result of their solve"""
+        response = client.post(
+            "/api/jobs", content=_knapsack().to_data().model_dump_json()
+        )
+        assert response.status_code == 202
+        info = _wait_for(client, response.json()["id"], "done", "failed")
+        assert info["status"] == "done"
+        assert info["result"]["objective"]["value"] == pytest.approx(2)
+
+    def test_time_limit(self, client):
+        """Test that jobs stopped by their time limit keep the incumbent"""
+        response = client.post(
+            "/api/jobs?time_limit=1", content=_markshare().to_data().model_dump_json()
+        )
+        info = _wait_for(client, response.json()["id"], "done", "failed")
+        assert info["result"]["status"] == "stopped"
+
+    def test_stop(self, client):
+        """Test that stopped jobs finish with the best solution found"""
+        response = client.post(
+            "/api/jobs", content=_markshare().to_data().model_dump_json()
+        )
+        job_id = response.json()["id"]
+        _wait_for(client, job_id, "running")
+        time.sleep(1)
+        info = client.post(f"/api/jobs/{job_id}/stop").json()
+        assert info["status"] == "done"
+        assert info["result"]["status"] == "stopped"
+        assert info["result"]["objective"]["value"] is not None
+
+    def test_delete(self, client):
+        """Test that deleted jobs are cancelled and forgotten"""
+        response = client.post(
+            "/api/jobs", content=_markshare().to_data().model_dump_json()
+        )
+        job_id = response.json()["id"]
+        _wait_for(client, job_id, "running")
+        info = client.delete(f"/api/jobs/{job_id}").json()
+        assert info["status"] == "cancelled"
+        assert client.get(f"/api/jobs/{job_id}").status_code == 404
+        assert app_module.admission.running == 0
+
+    def test_concurrent_deletes(self, client):
+        """Test that concurrent deletes of a job all return it"""
+        response = client.post(
+            "/api/jobs", content=_markshare().to_data().model_dump_json()
+        )
+        job_id = response.json()["id"]
+        _wait_for(client, job_id, "running")
+        with ThreadPoolExecutor(2) as executor:
+            responses = list(
+                executor.map(lambda _: client.delete(f"/api/jobs/{job_id}"), range(2))
+            )
+        assert [r.status_code for r in responses] == [200, 200]
+        assert client.get(f"/api/jobs/{job_id}").status_code == 404
+
+    def test_progress(self, client):
+        """Test that progress is streamed as Server-Sent Events"""
+        response = client.post(
+            "/api/jobs?time_limit=1", content=_markshare().to_data().model_dump_json()
+        )
+        job_id = response.json()["id"]
+        with client.stream(
+            "GET", f"/api/jobs/{job_id}/progress?interval=0.2"
+        ) as stream:
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            events = [
+                (event.split("\n")[0], json.loads(event.split("data: ")[1]))
+                for event in stream.read().decode().strip().split("\n\n")
+            ]
+        kinds = [kind for kind, _ in events]
+        assert kinds[-1] == "event: status"
+        assert set(kinds[:-1]) == {"event: progress"}
+        assert events[-2][1]["incumbent"] is not None
+        assert events[-1][1]["status"] == "done"
+
+    def test_rejected(self, client, monkeypatch):
+        """Test that jobs rejected by admission fail"""
+        controller = AdmissionController(AdmissionConfig(max_memory_mb=1))
+        monkeypatch.setattr(app_module, "admission", controller)
+        response = client.post(
+            "/api/jobs", content=_knapsack().to_data().model_dump_json()
+        )
+        info = _wait_for(client, response.json()["id"], "failed")
+        assert "over the limit" in info["error"]
+
+    def test_finished_jobs_expire(self, client, monkeypatch):
+        """Test that finished jobs are forgotten after their time to live"""
+        monkeypatch.setattr(app_module, "JOB_TTL", 0.0)
+        content = _knapsack().to_data().model_dump_json()
+        first = client.post("/api/jobs", content=content).json()["id"]
+        _wait_for(client, first, "done")
+        second = client.post("/api/jobs", content=content).json()["id"]
+        assert client.get(f"/api/jobs/{first}").status_code == 404
+        assert client.get(f"/api/jobs/{second}").status_code == 200
+
+    def test_finished_jobs_capped(self, client, monkeypatch):
+        """Test that the oldest finished jobs are forgotten beyond the cap"""
+        monkeypatch.setattr(app_module, "MAX_FINISHED_JOBS", 2)
+        content = _knapsack().to_data().model_dump_json()
+        ids = []
+        for _ in range(4):
+            ids.append(client.post("/api/jobs", content=content).json()["id"])
+            _wait_for(client, ids[-1], "done")
+        assert list(app_module.jobs) == ids[1:]
+
+    def test_unknown_job(self, client):
+        """Test that unknown jobs are a 404"""
+        assert client.get("/api/jobs/missing").status_code == 404
+        assert client.post("/api/jobs/missing/stop").status_code == 404
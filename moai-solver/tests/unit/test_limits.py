@@ -0,0 +1,150 @@
+"""Tests for the limits of solves"""
+
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai.admission import AdmissionController
+from moai.builders import binop, index_var, le, num, param, var
+from moai.constraints import Constraint
+from moai.expressions import AggregationExpression, IndexBinding
+from moai.limits import limit_options
+from moai.model import Model
+from moai.objectives import Objective
+from moai.parameters import IndexElement, Parameter
+from moai.sets import Set
+from moai.variables import Variable
+
+from .test_cores import _knapsack
+from .test_driver import _integral, _markshare
+
+
+def _items(items: int = 60) -> Model:
+    """A knapsack of many items, with a gap between its first solutions and bound."""
+    rng = random.Random(3)
+    weights = {j: rng.randint(10, 99) for j in range(items)}
+    volumes = {j: rng.randint(10, 99) for j in range(items)}
+    values = {j: w + 10 for j, w in weights.items()}
+
+    def total(name: str):
+        return AggregationExpression.create(
+            "sum",
+            binop(param(name, [index_var("j")]), var("x", [index_var("j")]), "mul"),
+            [IndexBinding.create("j", "J")],
+        )
+
+    def by_item(name: str, numbers: dict[int, int]) -> Parameter:
+        elements = [IndexElement(index=[j], value=n) for j, n in numbers.items()]
+        return Parameter.create(name, elements, ["J"])
+
+    return (
+        Model(name="Items")
+        .add_set(Set.create_range("J", 0, items))
+        .add_parameter(by_item("w", weights))
+        .add_parameter(by_item("u", volumes))
+        .add_parameter(by_item("v", values))
+        .add_variable(Variable.create("x", indices=["J"], domain="Binary"))
+        .add_constraint(
+            Constraint.create(
+                "weight", le(total("w"), num(sum(weights.values()) // 2 + 1))
+            )
+        )
+        .add_constraint(
+            Constraint.create("volume", le(total("u"), num(sum(volumes.values()) // 2)))
+        )
+        .set_objective(Objective(name="value", sense="max", expr=total("v")))
+    )
+
+
+class TestLimitOptions:
+    """Tests for mapping limits to the options of solvers"""
+
+    def test_cbc(self):
+        """Test that CBC limits wall-clock time"""
+        options = limit_options("cbc", time_limit=2.5, mip_gap=0.01, node_limit=100)
+        assert options == {
+            "sec": 2.5,
+            "timeMode": "elapsed",
+            "ratioGap": 0.01,
+            "maxNodes": 100,
+        }
+
+    def test_other_solvers(self):
+        """Test that limits are set through the options of each solver"""
+        assert limit_options("gurobi", time_limit=2, mip_gap=0.1) == {
+            "TimeLimit": 2,
+            "MIPGap": 0.1,
+        }
+        assert limit_options("highs", node_limit=10) == {"mip_max_nodes": 10}
+        assert limit_options("glpk", time_limit=0.2) == {"tmlim": 1}
+        assert limit_options("glpk") == {}
+
+    def test_unsupported_limit(self):
+        """Test that limits a solver has no option for are rejected"""
+        with pytest.raises(ValueError, match="glpk has no node_limit option"):
+            limit_options("glpk", node_limit=10)
+
+
+class TestSolveLimits:
+    """Tests for Model.solve within limits"""
+
+    def test_time_limit(self):
+        """Test that solves at their time limit are stopped with the incumbent"""
+        result = _markshare().solve(time_limit=1)
+        assert result.status == "stopped"
+        assert _integral(result)
+        info = result.solver_info
+        assert info.bound <= result.objective.value
+        assert info.gap == pytest.approx(
+            (result.objective.value - info.bound) / result.objective.value
+        )
+
+    def test_node_limit(self):
+        """Test that solves at their node limit are stopped with the incumbent"""
+        result = _markshare().solve(node_limit=100)
+        assert result.status == "stopped"
+        assert result.objective.value is not None
+
+    def test_mip_gap(self):
+        """Test that solves stop once within their gap"""
+        result = _items().solve(mip_gap=0.05)
+        assert result.objective.value < _items().solve().objective.value
+        assert 0 < result.solver_info.gap <= 0.05
+        assert result.solver_info.bound > result.objective.value
+
+    def test_optimal(self):
+        """Test that optimal solves have no gap"""
+        result = _knapsack().solve()
+        assert result.status == "optimal"
+        assert result.solver_info.bound == result.objective.value
+        assert result.solver_info.gap == 0
+
+
+class TestLimitEndpoints:
+    """Tests for the limits of solves through the API"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        return TestClient(app_module.app)
+
+    def test_time_limit(self, client):
+        """Test that solves stop at the time limit of the request"""
+        response = client.post(
+            "/api/model/solve?time_limit=1",
+            content=_markshare().to_data().model_dump_json(),
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["status"] == "stopped"
+        assert result["solver_info"]["gap"] is not None
+
+    def test_invalid_limit(self, client):
+        """Test that limits out of range are rejected"""
+        response = client.post(
+            "/api/model/solve?time_limit=0",
+            content=_knapsack().to_data().model_dump_json(),
+        )
+        assert response.status_code == 422
@@ -0,0 +1,68 @@
+"""Tests for linear forms of Pyomo expressions"""
+
+from typing import cast
+
+import pyomo.environ as pyo
+from pyomo.core.expr.numeric_expr import LinearExpression, MonomialTermExpression
+
+from moai.linear import linear_expression, linear_sum, linear_terms, scale
+
+
+def _model() -> pyo.ConcreteModel:
+    model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+    model.x = pyo.Var()
+    model.y = pyo.Var()
+    model.p = pyo.Param(initialize=4)
+    model.q = pyo.Param(initialize=4, mutable=True)
+    return model
+
+
+class TestLinearTerms:
+    """Tests for recognizing affine operands"""
+
+    def test_affine_operands(self):
+        """Test numbers, variables, monomials and immutable parameters"""
+        model = _model()
+        monomial = MonomialTermExpression((2, model.x))
+        assert linear_terms(3) == [3]
+        assert linear_terms(model.x) == [model.x]
+        assert linear_terms(monomial) == [monomial]
+        assert linear_terms(model.p) == [4]
+        assert linear_terms(LinearExpression([1, model.x])) == [1, model.x]
+
+    def test_non_affine_operands(self):
+        """Test that products and mutable parameters are not affine"""
+        model = _model()
+        assert linear_terms(model.x * model.y) is None
+        assert linear_terms(model.q) is None
+
+
+class TestLinearExpression:
+    """Tests for building linear expressions"""
+
+    def test_scale(self):
+        """Test that variables and monomials are scaled into monomials"""
+        model = _model()
+        terms = scale([1, model.x, MonomialTermExpression((2, model.y))], -3)
+        assert terms[0] == -3
+        assert terms[1].args == (-3, model.x)
+        assert terms[2].args == (-6, model.y)
+
+    def test_constants_are_folded(self):
+        """Test that terms without variables become a number"""
+        assert linear_expression([1, 2.5]) == 3.5
+
+    def test_linear_sum(self):
+        """Test that affine values are summed into one linear expression"""
+        model = _model()
+        inner = LinearExpression([1, model.x])
+        expr = linear_sum([inner, MonomialTermExpression((2, model.y)), model.x])
+        assert type(expr) is LinearExpression
+        assert expr.nargs() == 4
+        model.x.value, model.y.value = 1, 2
+        assert pyo.value(expr) == 7
+
+    def test_linear_sum_non_affine(self):
+        """Test that sums with a non-linear value are not linear"""
+        model = _model()
+        assert linear_sum([model.x, model.x * model.y]) is None
@@ -1,16 +1,33 @@
 """Tests for Model class"""
 
-from moai.constraints import Constraint
+import json
+import re
+
+import pyomo.environ as pyo
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from moai.app import app
+from moai.constraints import Constraint, Quantifier
 from moai.expressions import (
+    AggregationExpression,
+    BinaryOp,
     ComparisonExpression,
+    IndexBinding,
+    IndexComparisonExpr,
+    IndexShiftExpr,
+    IndexVariableExpr,
     NumberExpr,
+    ParameterExpr,
+    StringExpr,
     VariableExpr,
 )
-from moai.model import Model
+from moai.model import Model, ModelData, decode_model_data
 from moai.objectives import Objective
 from moai.parameters import IndexElement, Parameter
 from moai.sets import Set
-from moai.variables import Variable
+from moai.variables import Variable, VariableSupport
 
 
 class TestModelBasics:
@@ -639,3 +656,706 @@ class TestModelIntegration:
         assert len(model.variables) == 1
         assert model.sets[0].elements == [1, 2, 3, 4, 5]
         assert model.variables[0].domain == "Reals"
+
+
+class TestModelDataDecoding:
+    """Tests for decoding ModelData payloads"""
+
+    RAW = (
+        b'{"name": "Decoded", "sets": [{"name": "I", "elements": [1, 2]}],'
+        b' "variables": [{"name": "x", "indices": ["I"], "domain": "Binary"}]}'
+    )
+
+    def test_decode_raw_json(self):
+        """Test decoding raw JSON bytes"""
+        data = decode_model_data(self.RAW)
+        assert isinstance(data, ModelData)
+        assert data.name == "Decoded"
+        assert data.variables[0].indices == ["I"]
+
+    def test_decode_dict(self):
+        """Test decoding an already parsed dict"""
+        data = decode_model_data({"name": "Decoded"})
+        assert data.name == "Decoded"
+        assert data.constraints == []
+
+    def test_decode_instance_is_passthrough(self):
+        """Test that validated instances are not revalidated"""
+        data = ModelData(name="Decoded")
+        assert decode_model_data(data) is data
+
+    def test_decode_invalid_payload(self):
+        """Test that invalid payloads raise a ValidationError"""
+        with pytest.raises(ValidationError):
+            decode_model_data(b'{"name": "Decoded", "unknown": 1}')
+
+    def test_from_data_accepts_raw_json(self):
+        """Test building a model straight from raw JSON"""
+        model = Model.from_data(self.RAW)
+        assert model.get_set_names() == ["I"]
+        assert model.get_variable_names() == ["x"]
+
+    def test_to_data_round_trip(self):
+        """Test that to_data output serializes back to the same model"""
+        model = Model.from_data(self.RAW)
+        data = decode_model_data(model.to_data().model_dump_json())
+        assert data.sets[0].elements == [1, 2]
+        assert data.variables[0].domain == "Binary"
+
+    def test_from_data_builds_when_used(self):
+        """Test that the Pyomo model of a model from data is built when used"""
+        model = Model.from_data(self.RAW)
+        assert model._model is None
+        model.add_set(Set.create("J", ["a"]))
+        assert model._model is None
+        assert model.codec.decode_index(tuple(model.pyomo_model.J)) == ("a",)
+        assert len(model.pyomo_model.x) == 2
+
+    def test_from_data_invalid(self):
+        """Test that from_data raises on data referencing missing components"""
+        data = decode_model_data(self.RAW)
+        data.sets = []
+        with pytest.raises(ValueError, match="Set I not found"):
+            Model.from_data(data)
+
+    def test_failed_build(self):
+        """Test that a failed build raises again when the model is used"""
+        model = Model.from_data(self.RAW).remove_set("I")
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Set I not found"):
+                model.build()
+        assert model._model is None
+
+    def test_lp_solve_without_build(self):
+        """Test that solvers reading LP files solve without the Pyomo model"""
+        model = Model.from_data(self.RAW)
+        model.set_objective(
+            Objective(
+                name="total",
+                sense="max",
+                expr=AggregationExpression.create(
+                    "sum",
+                    VariableExpr.create("x", [IndexVariableExpr.create("i")]),
+                    [IndexBinding.create("i", "I")],
+                ),
+            )
+        )
+        result = model.solve("cbc")
+        assert result.objective.value == 2
+        assert model._model is None
+
+    def test_lp_solve_values(self):
+        """Test that LP solves set the values of the Pyomo model"""
+        objective = Objective(
+            name="total",
+            sense="max",
+            expr=AggregationExpression.create(
+                "sum",
+                VariableExpr.create("x", [IndexVariableExpr.create("i")]),
+                [IndexBinding.create("i", "I")],
+            ),
+        )
+        built = Model.from_data(self.RAW).set_objective(objective).build()
+        unbuilt = Model.from_data(self.RAW).set_objective(objective)
+        for model in (built, unbuilt):
+            model.solve("cbc")
+            assert model.component("x")[1].value == 1
+            assert [v.value for v in model.pyomo_model.x.values()] == [1, 1]
+
+    def test_documented_bodies(self):
+        """Test that endpoints decoding raw bodies document their schema"""
+        document = TestClient(app).get("/openapi.json").json()
+        bodies = {
+            ("/api/model/validate", "ModelData"),
+            ("/api/model/estimate", "ModelData"),
+            ("/api/model/solve", "ModelData"),
+            ("/api/jobs", "ModelData"),
+            ("/api/templates", "TemplateData"),
+            ("/api/templates/{template_id}/solve", "Dataset"),
+        }
+        for path, model in bodies:
+            body = document["paths"][path]["post"]["requestBody"]
+            schema = body["content"]["application/json"]["schema"]
+            assert schema == {"$ref": f"#/components/schemas/{model}"}
+            assert body["required"]
+        # Every reference resolves, those of the schemas of the bodies too
+        schemas = document["components"]["schemas"]
+        refs = re.findall(
+            r'"\$ref": "#/components/schemas/([^"]+)"', json.dumps(document)
+        )
+        assert {"ModelData", "Set", "Constraint"} <= set(refs)
+        assert set(refs) <= set(schemas)
+
+
+class TestModelSharedSubexpressions:
+    """Tests for common-subexpression sharing when building from data"""
+
+    @staticmethod
+    def _data() -> ModelData:
+        def row_sum():
+            return AggregationExpression.create(
+                "sum",
+                VariableExpr.create(
+                    "x", [IndexVariableExpr.create("i"), IndexVariableExpr.create("j")]
+                ),
+                [IndexBinding.create("j", "J")],
+            )
+
+        i = [Quantifier.create("i", "I")]
+        return ModelData(
+            name="Shared",
+            sets=[Set.create("I", [1, 2, 3]), Set.create("J", ["a", "b"])],
+            parameters=[
+                Parameter.create(
+                    "cap",
+                    [IndexElement(index=[i], value=10 * i) for i in [1, 2, 3]],
+                    ["I"],
+                )
+            ],
+            variables=[Variable.create("x", indices=["I", "J"])],
+            constraints=[
+                Constraint.create(
+                    "capacity",
+                    ComparisonExpression.create(
+                        row_sum(),
+                        ParameterExpr.create("cap", [IndexVariableExpr.create("i")]),
+                        "le",
+                    ),
+                    i,
+                ),
+                Constraint.create(
+                    "minimum",
+                    ComparisonExpression.create(row_sum(), NumberExpr.create(1), "ge"),
+                    i,
+                ),
+            ],
+            objective=Objective(
+                name="total",
+                sense="max",
+                expr=AggregationExpression.create(
+                    "sum", row_sum(), [IndexBinding.create("i", "I")]
+                ),
+            ),
+        )
+
+    def test_from_data_emits_shared_expression(self):
+        """Test that the repeated row sum is emitted once for every row"""
+        model = Model.from_data(self._data())
+        pyomo_model = model.pyomo_model
+        assert len(pyomo_model._cse_0) == 3
+        code = model.codec.encode(2)
+        assert pyomo_model.capacity[code].body is pyomo_model._cse_0[code]
+
+    def test_shared_solution_matches_unshared(self):
+        """Test that sharing does not change the optimal solution"""
+        data = self._data()
+        unshared = Model(name="Unshared")
+        for s in data.sets:
+            unshared.add_set(s)
+        for p in data.parameters:
+            unshared.add_parameter(p)
+        for v in data.variables:
+            unshared.add_variable(v)
+        for c in data.constraints:
+            unshared.add_constraint(c)
+        unshared.set_objective(data.objective)
+
+        shared_result = Model.from_data(data).solve()
+        unshared_result = unshared.solve()
+        assert shared_result.status == unshared_result.status == "optimal"
+        assert shared_result.objective.value == unshared_result.objective.value == 60
+
+
+class TestModelLabelCodes:
+    """Tests for building the Pyomo model on codes of the set elements"""
+
+    @staticmethod
+    def _model() -> Model:
+        return (
+            Model(name="Codes")
+            .add_set(Set.create("Cities", ["NYC", "LA", "Chicago"]))
+            .add_set(Set.create("T", [1, 2, 3]))
+            .add_parameter(
+                Parameter.create(
+                    "demand",
+                    [
+                        IndexElement(index=["NYC"], value=3),
+                        IndexElement(index=["LA"], value=2),
+                        IndexElement(index=["Chicago"], value=1),
+                    ],
+                    ["Cities"],
+                )
+            )
+            .add_variable(
+                Variable.create("x", domain="NonNegativeReals", indices=["Cities"])
+            )
+            .add_variable(
+                Variable.create("y", domain="NonNegativeReals", indices=["T"])
+            )
+        )
+
+    def test_pyomo_sets_hold_codes(self):
+        """Test that Pyomo sets are built on the codes of their elements"""
+        model = self._model()
+        assert tuple(model.pyomo_model.Cities) == model.codec.encode_index(
+            ["NYC", "LA", "Chicago"]
+        )
+        assert model.codec.decode_index(tuple(model.pyomo_model.T)) == (1, 2, 3)
+
+    def test_parameters_are_encoded(self):
+        """Test that parameter values are stored under encoded indices"""
+        model = self._model()
+        code = model.codec.encode("LA")
+        assert model.pyomo_model.demand[code] == 2
+
+    def test_results_are_decoded(self):
+        """Test that solve results are keyed by the original set elements"""
+        model = (
+            self._model()
+            .add_constraint(
+                Constraint.create(
+                    "meet_demand",
+                    ComparisonExpression.create(
+                        VariableExpr.create("x", [IndexVariableExpr.create("c")]),
+                        ParameterExpr.create("demand", [IndexVariableExpr.create("c")]),
+                        "ge",
+                    ),
+                    [Quantifier.create("c", "Cities")],
+                )
+            )
+            .set_objective(
+                Objective(
+                    name="total",
+                    expr=AggregationExpression.create(
+                        "sum",
+                        VariableExpr.create("x", [IndexVariableExpr.create("c")]),
+                        [IndexBinding.create("c", "Cities")],
+                    ),
+                )
+            )
+        )
+        result = model.solve()
+        assert result.variables["x"]["NYC"] == 3
+        assert result.constraints["meet_demand"]["Chicago"] == 1
+
+    def test_conditions_compare_labels(self):
+        """Test that conditions on string indices compare the labels, not codes"""
+        model = self._model().add_constraint(
+            Constraint.create(
+                "after_la",
+                ComparisonExpression.create(
+                    VariableExpr.create("x", [IndexVariableExpr.create("c")]),
+                    NumberExpr.create(0),
+                    "le",
+                ),
+                [
+                    Quantifier.create(
+                        "c",
+                        "Cities",
+                        condition=ComparisonExpression.create(
+                            IndexVariableExpr.create("c"),
+                            StringExpr.create("LA"),
+                            "gt",
+                        ),
+                    )
+                ],
+            )
+        )
+        rows = model.pyomo_model.after_la
+        assert sorted(model.codec.decode_index(idx)[0] for idx in rows) == ["NYC"]
+
+    def test_index_arithmetic_uses_labels(self):
+        """Test that index arithmetic like t - 1 is evaluated on labels"""
+        model = self._model().add_constraint(
+            Constraint.create(
+                "increasing",
+                ComparisonExpression.create(
+                    VariableExpr.create(
+                        "y",
+                        [
+                            BinaryOp.create(
+                                "sub",
+                                IndexVariableExpr.create("t"),
+                                NumberExpr.create(1),
+                            )
+                        ],
+                    ),
+                    VariableExpr.create("y", [IndexVariableExpr.create("t")]),
+                    "le",
+                ),
+                [
+                    Quantifier.create(
+                        "t",
+                        "T",
+                        condition=ComparisonExpression.create(
+                            IndexVariableExpr.create("t"),
+                            NumberExpr.create(1),
+                            "gt",
+                        ),
+                    )
+                ],
+            )
+        )
+        pyomo_model = model.pyomo_model
+        row = pyomo_model.increasing[model.codec.encode(3)]
+        y2, y3 = row.expr.args
+        assert y2 is pyomo_model.y[model.codec.encode(2)]
+        assert y3 is pyomo_model.y[model.codec.encode(3)]
+
+    def test_string_literal_index(self):
+        """Test that string literals used as indices are encoded"""
+        model = self._model().add_constraint(
+            Constraint.create(
+                "nyc_cap",
+                ComparisonExpression.create(
+                    VariableExpr.create("x", [StringExpr.create("NYC")]),
+                    VariableExpr.create("y", [IndexVariableExpr.create("t")]),
+                    "le",
+                ),
+                [Quantifier.create("t", "T")],
+            )
+        )
+        pyomo_model = model.pyomo_model
+        x_nyc, _ = pyomo_model.nyc_cap[model.codec.encode(1)].expr.args
+        assert x_nyc is pyomo_model.x[model.codec.encode("NYC")]
+
+    def test_component_by_labels(self):
+        """Test that Model.component indexes components by set elements"""
+        model = self._model().add_parameter(Parameter.create("scale", 2))
+        demand = model.component("demand")
+        assert demand["LA"] == 2
+        assert dict(demand.items()) == {"NYC": 3, "LA": 2, "Chicago": 1}
+        assert (
+            model.component("x")["NYC"]
+            is model.pyomo_model.x[model.codec.encode("NYC")]
+        )
+        assert model.component("scale") is model.pyomo_model.scale
+
+    def test_component_not_found(self):
+        """Test that unknown components are rejected"""
+        with pytest.raises(ValueError, match="Component w not found"):
+            self._model().component("w")
+
+
+class TestModelSetKinds:
+    """Tests for range, tuple and ordered sets in a model"""
+
+    ARCS = [["s", "a"], ["s", "b"], ["a", "b"], ["a", "t"], ["b", "t"]]
+
+    @staticmethod
+    def _flow(i: str, j: str) -> VariableExpr:
+        return VariableExpr.create(
+            "flow", [IndexVariableExpr.create(i), IndexVariableExpr.create(j)]
+        )
+
+    def _max_flow(self) -> Model:
+        """Max flow from s to t on a sparse set of arcs"""
+
+        def arcs_at(end: str) -> AggregationExpression:
+            # Sum of the flow on arcs whose `end` component is node n
+            return AggregationExpression.create(
+                "sum",
+                self._flow("i", "j"),
+                [IndexBinding.create(["i", "j"], "Arcs")],
+                IndexComparisonExpr.create(
+                    IndexVariableExpr.create(end), IndexVariableExpr.create("n"), "eq"
+                ),
+            )
+
+        return (
+            Model(name="MaxFlow")
+            .add_set(Set.create("Inner", ["a", "b"]))
+            .add_set(Set.create("Arcs", self.ARCS))
+            .add_parameter(
+                Parameter.create(
+                    "cap",
+                    [
+                        IndexElement(index=arc, value=v)  # type: ignore
+                        for arc, v in zip(self.ARCS, [4, 3, 2, 2, 5], strict=True)
+                    ],
+                    ["Arcs"],
+                )
+            )
+            .add_variable(
+                Variable.create("flow", domain="NonNegativeReals", indices=["Arcs"])
+            )
+            .add_constraint(
+                Constraint.create(
+                    "capacity",
+                    ComparisonExpression.create(
+                        self._flow("i", "j"),
+                        ParameterExpr.create(
+                            "cap",
+                            [
+                                IndexVariableExpr.create("i"),
+                                IndexVariableExpr.create("j"),
+                            ],
+                        ),
+                        "le",
+                    ),
+                    [Quantifier.create(["i", "j"], "Arcs")],
+                )
+            )
+            .add_constraint(
+                Constraint.create(
+                    "balance",
+                    ComparisonExpression.create(arcs_at("j"), arcs_at("i"), "eq"),
+                    [Quantifier.create("n", "Inner")],
+                )
+            )
+            .set_objective(
+                Objective(
+                    name="throughput",
+                    sense="max",
+                    expr=AggregationExpression.create(
+                        "sum",
+                        self._flow("i", "j"),
+                        [IndexBinding.create(["i", "j"], "Arcs")],
+                        IndexComparisonExpr.create(
+                            IndexVariableExpr.create("j"), StringExpr.create("t"), "eq"
+                        ),
+                    ),
+                )
+            )
+        )
+
+    def test_variable_lives_on_sparse_set(self):
+        """Test that a variable over a tuple set only has its declared pairs"""
+        model = self._max_flow()
+        assert len(model.pyomo_model.flow) == len(self.ARCS)
+        assert len(model.pyomo_model.capacity) == len(self.ARCS)
+
+    def test_max_flow_solution(self):
+        """Test solving a model over tuple sets and decoding pair indices"""
+        result = self._max_flow().solve()
+        assert result.status == "optimal"
+        assert result.objective is not None
+        assert result.objective.value == 7
+        assert result.variables["flow"][("s", "a")] == 4  # type: ignore
+
+    def test_dimension_mismatch(self):
+        """Test that binding one index to a set of pairs is an error"""
+        model = self._max_flow()
+        with pytest.raises(ValueError, match="dimension 2"):
+            model.add_constraint(
+                Constraint.create(
+                    "bad",
+                    ComparisonExpression.create(
+                        VariableExpr.create("flow", [IndexVariableExpr.create("a")]),
+                        NumberExpr.create(1),
+                        "le",
+                    ),
+                    [Quantifier.create("a", "Arcs")],
+                )
+            )
+
+    def test_range_set_is_range(self):
+        """Test that range sets build a Pyomo RangeSet over their codes"""
+        model = Model(name="Horizon").add_set(Set.create_range("T", 1, 10001))
+        horizon = model.pyomo_model.T
+        assert isinstance(horizon, pyo.RangeSet)
+        assert len(horizon) == 10000
+        assert model.codec.decode(horizon.last()) == 10000
+
+    def test_shared_labels_fall_back_to_explicit_set(self):
+        """Test that a set reusing labels of another set is still correct"""
+        model = (
+            Model(name="Overlap")
+            .add_set(Set.create_range("T", 1, 5))
+            .add_set(Set.create("Even", [2, 4]))
+        )
+        even = model.pyomo_model.Even
+        assert model.codec.decode_index(tuple(even)) == (2, 4)
+
+    @staticmethod
+    def _inventory(offset_expr) -> Model:
+        inv = VariableExpr.create("inv", [IndexVariableExpr.create("m")])
+        previous = VariableExpr.create("inv", [offset_expr])
+        return (
+            Model(name="Inventory")
+            .add_set(Set.create("M", ["jan", "feb", "mar"]))
+            .add_variable(
+                Variable.create("inv", domain="NonNegativeReals", indices=["M"])
+            )
+            .add_constraint(
+                Constraint.create(
+                    "grow",
+                    ComparisonExpression.create(
+                        inv,
+                        BinaryOp.create("add", previous, NumberExpr.create(1)),
+                        "ge",
+                    ),
+                    [
+                        Quantifier.create(
+                            "m",
+                            "M",
+                            ComparisonExpression.create(
+                                IndexVariableExpr.create("m"),
+                                StringExpr.create("jan"),
+                                "ne",
+                            ),
+                        )
+                    ],
+                )
+            )
+            .set_objective(
+                Objective(
+                    name="stock",
+                    expr=AggregationExpression.create(
+                        "sum", inv, [IndexBinding.create("m", "M")]
+                    ),
+                )
+            )
+        )
+
+    def test_predecessor_in_ordered_set(self):
+        """Test indexing the previous element of an ordered string set"""
+        result = self._inventory(IndexShiftExpr.create("m", "M", -1)).solve()
+        assert result.status == "optimal"
+        inv = result.variables["inv"]
+        assert (inv["jan"], inv["feb"], inv["mar"]) == (0, 1, 2)  # type: ignore
+
+    def test_shift_past_end(self):
+        """Test that shifting past the end of a non-cyclic set is an error"""
+        with pytest.raises(ValueError, match="no element 1 positions away"):
+            self._inventory(IndexShiftExpr.create("m", "M", 1))
+
+    def test_cyclic_shift_wraps(self):
+        """Test that cyclic shifts wrap around the ends of the set"""
+        model = self._inventory(IndexShiftExpr.create("m", "M", 1, cyclic=True))
+        pyomo_model = model.pyomo_model
+        row = pyomo_model.grow[model.codec.encode("mar")]
+        # ge rows are stored as rhs <= lhs, the rhs is inv[next(m)] + 1
+        next_inv, _ = row.expr.args[0].args
+        assert next_inv is pyomo_model.inv[model.codec.encode("jan")]
+
+
+class TestModelSparseVariables:
+    """Tests for variables declared on a sparse support"""
+
+    LANES = {("w1", "c1"): 2.0, ("w1", "c2"): 3.0, ("w2", "c2"): 1.0}
+
+    @staticmethod
+    def _ship(w: str = "w", c: str = "c") -> VariableExpr:
+        return VariableExpr.create(
+            "ship", [IndexVariableExpr.create(w), IndexVariableExpr.create(c)]
+        )
+
+    def _model(self, support: VariableSupport, missing="zero") -> Model:
+        return (
+            Model(name="Lanes")
+            .add_set(Set.create("W", ["w1", "w2"]))
+            .add_set(Set.create("C", ["c1", "c2"]))
+            .add_set(Set.create("Lanes", [list(lane) for lane in self.LANES]))
+            .add_parameter(
+                Parameter.create(
+                    "cost",
+                    [
+                        IndexElement(index=list(lane), value=v)
+                        for lane, v in self.LANES.items()
+                    ],
+                    ["W", "C"],
+                )
+            )
+            .add_variable(
+                Variable.create(
+                    "ship", indices=["W", "C"], support=support, missing=missing
+                )
+            )
+        )
+
+    def test_parameter_support(self):
+        """Test that only the lanes with a cost get a variable"""
+        model = self._model(VariableSupport.of_parameter("cost"))
+        ship = model.pyomo_model.ship
+        assert len(ship) == 3
+        assert {model.codec.decode_index(i) for i in ship} == set(self.LANES)
+
+    def test_set_support(self):
+        """Test that only the elements of a tuple set get a variable"""
+        model = self._model(VariableSupport.of_set("Lanes"))
+        assert len(model.pyomo_model.ship) == 3
+
+    def test_support_outside_index_sets(self):
+        """Test that support indices must belong to the variable's index sets"""
+        model = self._model(VariableSupport.of_set("Lanes"))
+        model.add_set(Set.create("C", ["c1"]))
+        with pytest.raises(ValueError, match="not in"):
+            model.add_variable(
+                Variable.create(
+                    "ship",
+                    indices=["W", "C"],
+                    support=VariableSupport.of_set("Lanes"),
+                )
+            )
+
+    def test_missing_indices_compile_to_zero(self):
+        """Test that references outside the support drop out of the model"""
+        model = (
+            self._model(VariableSupport.of_parameter("cost"))
+            .add_constraint(
+                Constraint.create(
+                    "cap",
+                    ComparisonExpression.create(
+                        self._ship(), NumberExpr.create(100), "le"
+                    ),
+                    [Quantifier.create("w", "W"), Quantifier.create("c", "C")],
+                )
+            )
+            .add_constraint(
+                Constraint.create(
+                    "demand",
+                    ComparisonExpression.create(
+                        AggregationExpression.create(
+                            "sum", self._ship(), [IndexBinding.create("w", "W")]
+                        ),
+                        NumberExpr.create(4),
+                        "ge",
+                    ),
+                    [Quantifier.create("c", "C")],
+                )
+            )
+            .set_objective(
+                Objective(
+                    name="total",
+                    expr=AggregationExpression.create(
+                        "sum",
+                        BinaryOp.create(
+                            "mul",
+                            ParameterExpr.create(
+                                "cost",
+                                [
+                                    IndexVariableExpr.create("w"),
+                                    IndexVariableExpr.create("c"),
+                                ],
+                            ),
+                            self._ship(),
+                        ),
+                        [IndexBinding.create(["w", "c"], "Lanes")],
+                    ),
+                )
+            )
+        )
+        # Rows left without variables are skipped
+        assert len(model.pyomo_model.cap) == 3
+
+        result = model.solve()
+        assert result.status == "optimal"
+        assert result.objective is not None
+        assert result.objective.value == 12
+        ship = result.variables["ship"]
+        assert set(ship.values) == set(self.LANES)  # type: ignore
+
+    def test_missing_index_error_policy(self):
+        """Test that references outside the support raise with the error policy"""
+        model = self._model(VariableSupport.of_parameter("cost"), missing="error")
+        with pytest.raises(KeyError):
+            model.add_constraint(
+                Constraint.create(
+                    "cap",
+                    ComparisonExpression.create(
+                        self._ship(), NumberExpr.create(100), "le"
+                    ),
+                    [Quantifier.create("w", "W"), Quantifier.create("c", "C")],
+                )
+            )
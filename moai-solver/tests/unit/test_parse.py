@@ -2,12 +2,16 @@ from typing import cast
 
 import pyomo.environ as pyo
 
-from moai.builders import binop, index_var, le, num, param, var
+from moai import ir
+from moai.builders import binop, ge, index_var, le, lt, negate, num, param, var
 from moai.constraints import Constraint, Quantifier
+from moai.expressions import AggregationExpression, IndexBinding
 from moai.parse import (
     IndexContext,
+    SharedExpressions,
     _parse_expression,
     constraint_to_pyomo,
+    find_shared_aggregations,
     set_to_pyomo,
     var_to_pyomo,
 )
@@ -97,6 +101,32 @@ class TestParseExpression:
         )
         assert isinstance(pyomo_expression, pyo.numeric_expr.NumericExpression)
 
+    def test_affine_expression_is_linear(self):
+        """Test that affine expressions are emitted as linear expressions"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.x = pyo.Var()
+        model.y = pyo.Var()
+        model.p = pyo.Param(initialize=2)
+        moai_expression = binop(
+            binop(param("p"), var("x"), "mul"),
+            negate(binop(var("y"), num(4), "div")),
+            "sub",
+        )
+        pyomo_expression = _parse_expression(model, moai_expression)
+        assert type(pyomo_expression) is pyo.numeric_expr.LinearExpression
+        model.x.value, model.y.value = 3, 8
+        assert pyo.value(pyomo_expression) == 8
+
+    def test_product_of_variables_is_not_linear(self):
+        """Test that non-linear products keep the generic expression"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.x = pyo.Var()
+        model.y = pyo.Var()
+        pyomo_expression = _parse_expression(
+            model, binop(num(1), binop(var("x"), var("y"), "mul"), "add")
+        )
+        assert type(pyomo_expression) is pyo.expr.SumExpression
+
 
 #     def test_parse_expression_with_numbers(self):
 #         model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
@@ -393,3 +423,182 @@ class TestIndexArithmetic:
 
         assert result == 2  # 5 - 3 = 2
         assert isinstance(result, int)
+
+
+class TestParseSharing:
+    """Tests for subtree sharing while building constraints"""
+
+    def test_index_free_subtree_built_once(self):
+        """Test that a subtree independent of the row index is shared by all rows"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.I = pyo.Set(initialize=[1, 2, 3])
+        model.J = pyo.Set(initialize=["a", "b"])
+        model.x = pyo.Var(model.I)
+        model.y = pyo.Var(model.J)
+
+        total = AggregationExpression.create(
+            "sum", var("y", [index_var("j")]), [IndexBinding.create("j", "J")]
+        )
+        moai_constraint = Constraint.create(
+            name="c",
+            expr=le(var("x", [index_var("i")]), total),
+            quantifiers=[Quantifier.create(index="i", over="I")],
+        )
+        model.c = constraint_to_pyomo(moai_constraint, model)
+
+        uppers = [model.c[i].expr.args[1] for i in [1, 2, 3]]
+        assert len(model.c) == 3
+        assert uppers[0] is uppers[1] is uppers[2]
+
+    def test_subtraction_evaluates(self):
+        """Test that x - y builds a valid Pyomo expression"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.x = pyo.Var(initialize=5)
+        model.y = pyo.Var(initialize=2)
+
+        result = _parse_expression(model, binop(var("x"), var("y"), "sub"))
+        assert pyo.value(result) == 3
+
+    def test_unary_negation(self):
+        """Test negation of Pyomo expressions and of index values"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.x = pyo.Var(initialize=4)
+
+        assert pyo.value(_parse_expression(model, negate(var("x")))) == -4
+        assert _parse_expression(model, negate(index_var("t")), {"t": 2}) == -2
+
+
+def _row_sum():
+    """sum(x[i, j] for j in J)"""
+    return AggregationExpression.create(
+        "sum",
+        var("x", [index_var("i"), index_var("j")]),
+        [IndexBinding.create("j", "J")],
+    )
+
+
+class TestSharedAggregations:
+    """Tests for common-subexpression detection and emission"""
+
+    def test_repeated_across_constraints(self):
+        """Test that the same aggregation in two constraints is shared"""
+        constraints = [
+            Constraint.create(
+                "capacity", le(_row_sum(), num(10)), [Quantifier.create("i", "I")]
+            ),
+            Constraint.create(
+                "cost", le(_row_sum(), param("budget")), [Quantifier.create("i", "I")]
+            ),
+        ]
+        assert find_shared_aggregations(constraints) == {ir.lower(_row_sum())}
+
+    def test_single_occurrence_not_shared(self):
+        """Test that an aggregation used once per row is expanded inline"""
+        constraints = [
+            Constraint.create(
+                "capacity", le(_row_sum(), num(10)), [Quantifier.create("i", "I")]
+            )
+        ]
+        assert find_shared_aggregations(constraints) == set()
+
+    def test_nested_under_independent_index(self):
+        """Test that a sum not depending on an enclosing index is shared"""
+        constraints = [
+            Constraint.create(
+                "c",
+                le(_row_sum(), param("cap", [index_var("k")])),
+                [Quantifier.create("i", "I"), Quantifier.create("k", "K")],
+            )
+        ]
+        assert find_shared_aggregations(constraints) == {ir.lower(_row_sum())}
+
+    def test_shared_component_is_built_once(self):
+        """Test that shared sums become one indexed Expression referenced by rows"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.I = pyo.Set(initialize=[1, 2])
+        model.J = pyo.Set(initialize=["a", "b", "c"])
+        model.x = pyo.Var(model.I, model.J)
+        shared = SharedExpressions([ir.lower(_row_sum())])
+
+        quantifiers = [Quantifier.create("i", "I")]
+        model.upper = constraint_to_pyomo(
+            Constraint.create("upper", le(_row_sum(), num(10)), quantifiers),
+            model,
+            shared,
+        )
+        model.lower = constraint_to_pyomo(
+            Constraint.create("lower", ge(_row_sum(), num(1)), quantifiers),
+            model,
+            shared,
+        )
+
+        assert len(model._cse_0) == 2
+        assert model.upper[1].body is model._cse_0[1]
+        assert model.lower[2].body is model._cse_0[2]
+        generated = list(model.component_objects(pyo.Expression))
+        assert len(generated) == 1
+
+    def test_reset_emits_new_component(self):
+        """Test that a reset registry stops reusing previously built expressions"""
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.I = pyo.Set(initialize=[1])
+        model.J = pyo.Set(initialize=["a"])
+        model.x = pyo.Var(model.I, model.J)
+        shared = SharedExpressions([ir.lower(_row_sum())])
+        quantifiers = [Quantifier.create("i", "I")]
+
+        model.c1 = constraint_to_pyomo(
+            Constraint.create("c1", le(_row_sum(), num(1)), quantifiers), model, shared
+        )
+        shared.reset()
+        model.c2 = constraint_to_pyomo(
+            Constraint.create("c2", le(_row_sum(), num(1)), quantifiers), model, shared
+        )
+        assert model.c1[1].body is model._cse_0[1]
+        assert model.c2[1].body is model._cse_1[1]
+
+
+class TestQuantifierDomain:
+    """Tests for pre-filtering quantifier domains with compiled conditions"""
+
+    @staticmethod
+    def _model() -> pyo.ConcreteModel:
+        model = cast(pyo.ConcreteModel, pyo.ConcreteModel())
+        model.I = pyo.Set(initialize=[1, 2, 3, 4])
+        model.x = pyo.Var(model.I, model.I)
+        return model
+
+    def test_only_matching_rows_are_indexed(self):
+        """Test that the constraint is indexed by the rows passing the conditions"""
+        model = self._model()
+        model.c = constraint_to_pyomo(
+            Constraint.create(
+                "c",
+                le(var("x", [index_var("i"), index_var("j")]), num(1)),
+                [
+                    Quantifier.create("i", "I", ge(index_var("i"), num(3))),
+                    Quantifier.create("j", "I", lt(index_var("j"), index_var("i"))),
+                ],
+            ),
+            model,
+        )
+        assert sorted(model.c.keys()) == [(3, 1), (3, 2), (4, 1), (4, 2), (4, 3)]
+        assert len(model.c.index_set()) == 5
+
+    def test_uncompilable_condition_falls_back(self):
+        """Test that conditions on decision variables still use the row rule"""
+        model = self._model()
+        model.c = constraint_to_pyomo(
+            Constraint.create(
+                "c",
+                le(var("x", [index_var("i"), index_var("i")]), num(1)),
+                [
+                    Quantifier.create(
+                        "i", "I", ge(var("x", [index_var("i"), index_var("i")]), num(0))
+                    )
+                ],
+            ),
+            model,
+        )
+        assert model.c.index_set().dimen == 1
+        assert len(model.c.index_set()) == 4
@@ -0,0 +1,174 @@
+"""Tests for races of solvers"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai import portfolio as portfolio_module
+from moai import solution
+from moai.admission import AdmissionController
+from moai.model import Model
+from moai.portfolio import Portfolio, Race, SolverConfig, available
+from moai.templates import fingerprint
+
+from .test_cores import _knapsack
+from .test_driver import _integral, _markshare
+
+CONFIGS = [
+    SolverConfig(solver_name="cbc"),
+    SolverConfig(solver_name="cbc", options={"cuts": "off"}, name="cbc_nocuts"),
+]
+
+
+class TestRace:
+    """Tests for racing solvers on a model"""
+
+    def test_race(self, solve_history):
+        """Test that races return the result of the winner, and record it"""
+        portfolio = Portfolio(CONFIGS)
+        model = _knapsack()
+        race = portfolio.race(model)
+        result = asyncio.run(race.run())
+        assert result.status == "optimal"
+        assert result.objective.value == pytest.approx(2)
+        assert result.solver_info.solver_name == race.winner.label
+        assert result.solver_info.threads == 2
+        records = solve_history.records(fingerprint(model.to_data()))
+        assert race.winner.options in [r.options for r in records]
+        assert {r.status for r in records} == {"optimal"}
+        assert [r.objective for r in records] == pytest.approx([2] * len(records))
+
+    def test_first_proven_wins(self):
+        """Test that the first solver to prove its result wins, and the others
+        are killed"""
+        configs = [
+            SolverConfig(solver_name="cbc", name="slow"),
+            SolverConfig(solver_name="cbc", options={"allowableGap": 1e6}, name="fast"),
+        ]
+        race = Race(_markshare(), configs)
+        result = asyncio.run(race.run())
+        assert race.winner.label == "fast"
+        assert result.solver_info.solver_name == "fast"
+        assert all(p._process.returncode is not None for p in race.processes)
+        assert race.elapsed < 5
+
+    def test_time_limit(self, solve_history):
+        """Test that races at their time limit return the best solution found"""
+        model = _markshare()
+        race = Race(model, CONFIGS, time_limit=1)
+        result = asyncio.run(race.run())
+        assert result.status == "stopped"
+        assert _integral(result)
+        incumbents = [p.progress.incumbent for p in race.processes]
+        assert result.objective.value == pytest.approx(min(incumbents))
+        assert race.progress.incumbent == pytest.approx(min(incumbents))
+        # Every solver finished, and is recorded
+        records = solve_history.records(fingerprint(model.to_data()))
+        assert sorted(r.objective for r in records) == pytest.approx(sorted(incumbents))
+        assert {r.status for r in records} == {"stopped"}
+
+    def test_stop(self):
+        """Test that stopped races return the best solution found"""
+        race = Race(_markshare(), CONFIGS)
+
+        async def solve():
+            task = asyncio.create_task(race.run())
+            await asyncio.sleep(1.5)
+            race.stop()
+            return await task
+
+        result = asyncio.run(solve())
+        assert result.status == "stopped"
+        assert _integral(result)
+
+    def test_pyomo_plugins(self, solve_history, monkeypatch):
+        """Test that solvers solving through Pyomo plugins race on one model"""
+        monkeypatch.delitem(solution.SOLUTION_READERS, "cbc")
+        model = Model.from_data(_knapsack().to_data())
+        race = Race(model, CONFIGS)
+        assert all(p._lp is None for p in race.processes)
+
+        # Problems written at once would share the symbol maps of the model
+        writing = []
+        overlaps = []
+        plugin = type(race.processes[0].solver)
+        presolve = plugin._presolve
+
+        def write(self, *args, **kwargs):
+            writing.append(self)
+            overlaps.append(len(writing) > 1)
+            time.sleep(0.2)
+            try:
+                return presolve(self, *args, **kwargs)
+            finally:
+                writing.remove(self)
+
+        monkeypatch.setattr(plugin, "_presolve", write)
+        result = asyncio.run(race.run())
+        assert overlaps == [False, False]
+        assert result.status == "optimal"
+        assert result.objective.value == pytest.approx(2)
+        assert not model.pyomo_model.solutions.symbol_map
+        records = solve_history.records(fingerprint(model.to_data()))
+        assert {r.status for r in records} == {"optimal"}
+
+    def test_no_solver(self):
+        """Test that races need a solver"""
+        with pytest.raises(ValueError, match="No solver to race"):
+            Race(_knapsack(), [])
+
+    def test_available(self):
+        """Test that only installed solvers run as executables are raced"""
+        configs = [
+            SolverConfig(solver_name="cbc"),
+            SolverConfig(solver_name="appsi_highs"),
+            SolverConfig(solver_name="not_a_solver"),
+        ]
+        assert available(configs) == configs[:1]
+
+
+class TestPortfolioSolve:
+    """Tests for Model.solve with the portfolio"""
+
+    @pytest.fixture(autouse=True)
+    def portfolio(self, monkeypatch):
+        portfolio = Portfolio(CONFIGS)
+        monkeypatch.setattr(portfolio_module, "portfolio", portfolio)
+        monkeypatch.setattr(app_module, "portfolio", portfolio)
+        return portfolio
+
+    def test_solve(self, solve_history):
+        """Test that models are solved by the winner of a race"""
+        model = _knapsack()
+        result = model.solve("portfolio")
+        assert result.status == "optimal"
+        assert result.solver_info.solver_name in {"cbc", "cbc_nocuts"}
+        assert solve_history.records(fingerprint(model.to_data()))
+
+    def test_solve_in_event_loop(self):
+        """Test that models are raced from code running in an event loop"""
+
+        async def solve():
+            return _knapsack().solve("portfolio")
+
+        assert asyncio.run(solve()).status == "optimal"
+
+    def test_options(self):
+        """Test that options of raced solvers are set in the portfolio"""
+        with pytest.raises(ValueError, match="solver configs"):
+            _knapsack().solve("portfolio", cuts="off")
+
+    def test_endpoint(self, solve_history, monkeypatch):
+        """Test that solve requests race the solvers of the portfolio"""
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        client = TestClient(app_module.app)
+        response = client.post(
+            "/api/model/solve?solver=portfolio",
+            content=_knapsack().to_data().model_dump_json(),
+        )
+        assert response.status_code == 200
+        assert response.json()["solver_info"]["solver_name"] in {"cbc", "cbc_nocuts"}
+        assert solve_history.records(fingerprint(_knapsack().to_data()))
@@ -0,0 +1,129 @@
+"""Tests for the progress of solves parsed from solver logs"""
+
+import re
+import subprocess
+
+import pytest
+
+from moai.progress import CBC_LOG_VERSIONS, CbcLogParser, parse_log, relative_gap
+
+CBC_LOG = """\
+Cbc0038I Mini branch and bound did not improve solution (0.09 seconds)
+Cbc0012I Integer solution of 35 found by feasibility pump after 0 iterations and 0 nodes (0.09 seconds)
+Cbc0013I At root node, 2 cuts changed objective from 0 to 0.5 in 100 passes
+Cbc0010I After 1000 nodes, 621 on tree, 35 best solution, best possible 0.5 (0.57 seconds)
+Cbc0004I Integer solution of 20 found after 8761 iterations and 2519 nodes (0.80 seconds)
+Cbc0010I After 3000 nodes, 1858 on tree, 20 best solution, best possible 1 (1.00 seconds)
+Cbc0005I Partial search - best objective 20 (best possible 2), took 37620 iterations and 15483 nodes (3.02 seconds)
+"""
+
+
+def _cbc_version() -> str | None:
+    """Major and minor version of the cbc executable, None without a known one."""
+    try:
+        banner = subprocess.run(
+            ["cbc", "-quit"], capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"Version: (\d+\.\d+)", banner)
+    return match[1] if match is not None else None
+
+
+# Tests reading the progress of a search from the log as CBC writes it
+requires_cbc_log = pytest.mark.skipif(
+    _cbc_version() not in CBC_LOG_VERSIONS,
+    reason="the search log of this cbc version is not parsed",
+)
+
+
+class TestCbcLogParser:
+    """Tests for parsing the progress of CBC solves"""
+
+    def test_progress(self):
+        """Test that the log updates nodes, incumbent, bound and gap"""
+        parser = CbcLogParser()
+        updates = [parser.feed(line) for line in CBC_LOG.splitlines()]
+        assert updates == [False, True, True, True, True, True, True]
+        progress = parser.progress
+        assert progress.nodes == 15483
+        assert progress.incumbent == 20
+        assert progress.bound == 2
+        assert progress.gap == pytest.approx(0.9)
+
+    def test_before_incumbent(self):
+        """Test that searches without a solution have no incumbent nor gap"""
+        parser = CbcLogParser()
+        parser.feed(
+            "Cbc0010I After 0 nodes, 1 on tree, 1e+50 best solution, "
+            "best possible -3.5 (0.25 seconds)"
+        )
+        assert parser.progress.incumbent is None
+        assert parser.progress.bound == -3.5
+        assert parser.progress.gap is None
+
+    def test_maximize(self):
+        """Test that the objective of maximized models is negated back"""
+        parser = CbcLogParser("max")
+        parser.feed(
+            "Cbc0010I After 0 nodes, 1 on tree, -1772 best solution, "
+            "best possible -1773.7273 (0.01 seconds)"
+        )
+        assert parser.progress.incumbent == 1772
+        assert parser.progress.bound == pytest.approx(1773.7273)
+
+    def test_completed(self):
+        """Test that completed searches report their best solution"""
+        parser = CbcLogParser()
+        parser.feed(
+            "Cbc0001I Search completed - best objective -1772, took 194 "
+            "iterations and 28 nodes (0.03 seconds)"
+        )
+        assert parser.progress.nodes == 28
+        assert parser.progress.incumbent == -1772
+
+    def test_summary_bound(self):
+        """Test that the bound of the summary at exit is in the model's sense"""
+        parser = CbcLogParser("max")
+        parser.feed(
+            "Cbc0001I Search completed - best objective -2073, took 0 "
+            "iterations and 0 nodes (0.01 seconds)"
+        )
+        assert parser.feed("Upper bound:                    2083.507")
+        assert parser.progress.bound == pytest.approx(2083.507)
+        assert parser.progress.gap == pytest.approx(10.507 / 2073)
+
+    def test_summary(self):
+        """Test that the summary at exit reports progress in the model's sense"""
+        parser = CbcLogParser("max")
+        assert parser.feed("Objective value:                27.00000000")
+        assert parser.feed("Enumerated nodes:               20015")
+        parser.feed("Lower bound:                    1e+50")
+        assert parser.progress.incumbent == 27
+        assert parser.progress.nodes == 20015
+        assert parser.progress.bound is None
+
+    def test_unknown_layout(self):
+        """Test that logs of unknown layouts are ignored, without progress"""
+        log = (
+            "CBC devel (git:146ce89)\n"
+            "      7839     4764     25              27              0  100.00%\n"
+            "✔ Stopped (time limit) — BestSol: 27   Bound: 0   Nodes: 20.0K\n"
+        )
+        parser = CbcLogParser()
+        assert not any(parser.feed(line) for line in log.splitlines())
+        assert not parser.parsed
+        assert parse_log("cbc", log) is None
+        assert parse_log("cbc", CBC_LOG).nodes == 15483
+
+
+class TestRelativeGap:
+    """Tests for the gap between solutions and bounds"""
+
+    def test_relative_gap(self):
+        """Test that gaps are relative to the solution"""
+        assert relative_gap(10, 8) == pytest.approx(0.2)
+        assert relative_gap(-10, -12) == pytest.approx(0.2)
+        assert relative_gap(0, 0) == 0
+        assert relative_gap(0, 1) == float("inf")
+        assert relative_gap(None, 1) is None
@@ -1,6 +1,9 @@
 """Tests for Set model"""
 
-from moai.sets import Set
+import pytest
+from pydantic import ValidationError
+
+from moai.sets import Set, SetRange
 
 
 class TestSet:
@@ -48,3 +51,39 @@ class TestSet:
         # Note: Set model doesn't enforce uniqueness, it's a list
         assert s.elements == [1, 2, 2, 3, 3, 3]
         assert len(s.elements) == 6
+
+
+class TestSetKinds:
+    """Tests for range and tuple sets"""
+
+    def test_range_set(self):
+        """Test that range sets follow Python range semantics"""
+        s = Set.create_range("T", 1, 7, 2)
+        assert list(s.iter_elements()) == [1, 3, 5]
+        assert s.size == 3
+        assert s.dimen == 1
+
+    def test_range_from_json(self):
+        """Test that a range is declared compactly in JSON"""
+        s = Set.model_validate_json(
+            '{"name": "T", "elements": {"start": 0, "stop": 10000}}'
+        )
+        assert s.elements == SetRange(start=0, stop=10000)
+        assert s.size == 10000
+
+    def test_zero_step(self):
+        """Test that a zero step is rejected"""
+        with pytest.raises(ValidationError):
+            Set.create_range("T", 0, 10, 0)
+
+    def test_tuple_set(self):
+        """Test creating a sparse set of pairs"""
+        s = Set.create("Arcs", [["a", "b"], ["b", "c"]])
+        assert s.is_tuple_set
+        assert s.dimen == 2
+        assert list(s.iter_elements()) == [("a", "b"), ("b", "c")]
+
+    def test_tuple_set_mixed_lengths(self):
+        """Test that tuple elements must all have the same length"""
+        with pytest.raises(ValidationError):
+            Set.create("Arcs", [["a", "b"], ["c"]])
@@ -0,0 +1,338 @@
+"""Tests for reading solutions of written LP files back into results"""
+
+import asyncio
+import io
+from collections import OrderedDict
+
+import pyomo.environ as pyo
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai import writer
+from moai.admission import AdmissionController
+from moai.builders import binop, eq, ge, index_var, le, num, param, var
+from moai.constraints import Constraint, Quantifier
+from moai.driver import SolverProcess
+from moai.model import Model
+from moai.objectives import Objective
+from moai.parameters import IndexElement, Parameter
+from moai.results import ModelResult
+from moai.sets import Set
+from moai.solution import read_cbc_solution
+from moai.templates import fingerprint
+from moai.variables import Variable
+
+from .cases import sum_over
+
+
+def _cover() -> Model:
+    """An LP with a single optimum, x = {a: 3, b: 1}."""
+    return (
+        Model(name="Cover")
+        .add_set(Set.create("I", ["a", "b"]))
+        .add_parameter(
+            Parameter.create(
+                "cap",
+                [
+                    IndexElement(index=["a"], value=3),
+                    IndexElement(index=["b"], value=5),
+                ],
+                ["I"],
+            )
+        )
+        .add_parameter(
+            Parameter.create(
+                "cost",
+                [
+                    IndexElement(index=["a"], value=2),
+                    IndexElement(index=["b"], value=3),
+                ],
+                ["I"],
+            )
+        )
+        .add_variable(Variable.create("x", indices=["I"], domain="NonNegativeReals"))
+        .add_constraint(
+            Constraint.create(
+                "cover",
+                ge(
+                    binop(
+                        sum_over(var("x", [index_var("i")]), [("i", "I")]),
+                        num(1),
+                        "add",
+                    ),
+                    num(5),
+                ),
+            )
+        )
+        .add_constraint(
+            Constraint.create(
+                "limit",
+                le(var("x", [index_var("i")]), param("cap", [index_var("i")])),
+                [Quantifier.create("i", "I")],
+            )
+        )
+        .set_objective(
+            Objective(
+                name="total",
+                sense="min",
+                expr=sum_over(
+                    binop(
+                        param("cost", [index_var("i")]),
+                        var("x", [index_var("i")]),
+                        "mul",
+                    ),
+                    [("i", "I")],
+                ),
+            )
+        )
+    )
+
+
+def _constants() -> Model:
+    """A model with constants on either side of its relations."""
+    x = var("x", [index_var("i")])
+    cap = param("cap", [index_var("i")])
+    over = [Quantifier.create("i", "I")]
+    return (
+        Model(name="Constants")
+        .add_set(Set.create("I", ["a", "b"]))
+        .add_parameter(
+            Parameter.create(
+                "cap",
+                [
+                    IndexElement(index=["a"], value=3),
+                    IndexElement(index=["b"], value=5),
+                ],
+                ["I"],
+            )
+        )
+        .add_variable(Variable.create("x", indices=["I"]))
+        .add_variable(Variable.create("y"))
+        .add_constraint(
+            Constraint.create("upper", le(binop(x, num(2), "add"), cap), over)
+        )
+        .add_constraint(
+            Constraint.create(
+                "lower", le(binop(cap, num(1), "sub"), binop(x, var("y"), "add")), over
+            )
+        )
+        .add_constraint(
+            Constraint.create(
+                "both",
+                le(binop(x, num(1), "add"), binop(var("y"), num(2), "sub")),
+                over,
+            )
+        )
+        .add_constraint(
+            Constraint.create("floor", ge(binop(x, num(3), "add"), cap), over)
+        )
+        .add_constraint(
+            Constraint.create("ceiling", ge(num(10), binop(x, num(1), "sub")), over)
+        )
+        .add_constraint(
+            Constraint.create(
+                "gap", ge(binop(var("y"), num(4), "add"), binop(x, num(1), "add")), over
+            )
+        )
+        .add_constraint(
+            Constraint.create("balance", eq(x, binop(var("y"), cap, "sub")), over)
+        )
+        .add_constraint(
+            Constraint.create("fixed", eq(binop(var("y"), num(1), "add"), num(6)))
+        )
+    )
+
+
+def _read(tmp_path, text: str):
+    """Results of a solution file of the cover model."""
+    data = _cover().to_data()
+    names = writer.write_lp(data, io.StringIO())
+    path = tmp_path / "model.soln"
+    path.write_text(text)
+    return read_cbc_solution(path, names, data)
+
+
+class TestReadCbcSolution:
+    """Tests for reading CBC solution files"""
+
+    def test_solution(self, tmp_path):
+        """Test that values, activities and slacks are read by name"""
+        result = _read(
+            tmp_path,
+            "Optimal - objective value 9.00000000\n"
+            "      0 c0          4         0\n"
+            "**    1 c1          3         0\n"
+            "      2 c2          1         0\n"
+            "      0 x1          1         0\n"
+            "      1 x0          3         0\n",
+        )
+        assert result.status == "optimal"
+        assert result.objective.value == 9
+        assert result.variables["x"].values == {("a",): 3, ("b",): 1}
+        cover = result.constraints["cover"]
+        assert (cover.body_value, cover.slack) == (5, 0)
+        limit = result.constraints["limit"]
+        assert limit.slacks == {("a",): 0, ("b",): 4}
+        assert limit.duals == {("a",): None, ("b",): None}
+
+    @pytest.mark.parametrize(
+        ("header", "status", "condition"),
+        [
+            ("Infeasible - objective value 7.5", "infeasible", "infeasible"),
+            ("Integer infeasible - objective value 0", "infeasible", "infeasible"),
+            ("Unbounded - objective value 0", "unbounded", "unbounded"),
+            ("Stopped on time - objective value 1e+50", "error", "maxTimeLimit"),
+            (
+                "Stopped on time (no integer solution - continuous used) - "
+                "objective value 3",
+                "error",
+                "intermediateNonInteger",
+            ),
+            ("Stopped on difficulties - objective value 3", "error", "solverFailure"),
+        ],
+    )
+    def test_statuses(self, tmp_path, header: str, status: str, condition: str):
+        """Test that solves without a solution have no values"""
+        result = _read(tmp_path, f"{header}\n")
+        assert result.status == status
+        assert result.solver_info.termination_condition == condition
+        assert result.objective is None
+
+    @pytest.mark.parametrize(
+        "header",
+        [
+            "Solved somehow - objective value 3",
+            "Optimal (objective 3)",
+            "Stopped on solutions - objective value 3",
+            "",
+        ],
+    )
+    def test_unknown_header(self, tmp_path, header: str):
+        """Test that unrecognized headers are errors keeping the header"""
+        result = _read(tmp_path, f"{header}\n")
+        assert result.status == "error"
+        assert result.solver_info.termination_condition == "unknown"
+        assert result.solver_info.message == header
+        assert result.objective is None
+
+    def test_body_values_as_pyomo(self, tmp_path):
+        """Test that body values and slacks are those of the Pyomo model"""
+        model = _constants()
+        data = model.to_data()
+        out = io.StringIO()
+        names = writer.write_lp(data, out)
+        values = [1.5 * column - 2 for column in range(names.size)]
+        pyomo_model = model.pyomo_model
+        for v in pyomo_model.component_data_objects(pyo.Var):
+            index = v.index()
+            labels = model.codec.decode_index(index) if index is not None else ()
+            v.value = values[names.column(v.parent_component().name, labels)]
+
+        lines = ["Optimal - objective value 0"]
+        body = out.getvalue().split("s.t.\n")[1].split("bounds\n")[0]
+        for row, block in enumerate(body.strip().split("\n\n")):
+            activity = 0.0
+            for line in block.splitlines()[1:-1]:
+                coef, column = line.split()
+                activity += float(coef) * values[int(column[1:])]
+            lines.append(f"{row} c{row} {activity} 0")
+        lines += [f"{n} x{n} {value} 0" for n, value in enumerate(values)]
+        path = tmp_path / "model.soln"
+        path.write_text("\n".join(lines) + "\n")
+        written = read_cbc_solution(path, names, data)
+        built = ModelResult.from_pyomo("optimal", pyomo_model, data)
+
+        for c in data.constraints:
+            if c.quantifiers:
+                result = written.constraints.indexed[c.name]
+                expected = built.constraints.indexed[c.name]
+                assert result.body_values == pytest.approx(expected.body_values)
+                assert result.slacks == pytest.approx(expected.slacks)
+            else:
+                result = written.constraints.scalar[c.name]
+                expected = built.constraints.scalar[c.name]
+                assert result.body_value == pytest.approx(expected.body_value)
+                assert result.slack == pytest.approx(expected.slack)
+
+    def test_missing_file(self, tmp_path):
+        """Test that solvers exiting without a solution file are errors"""
+        data = _cover().to_data()
+        names = writer.write_lp(data, io.StringIO())
+        result = read_cbc_solution(tmp_path / "missing.soln", names, data)
+        assert result.status == "error"
+
+
+class TestSolveLP:
+    """Tests for solving models written by the LP writer"""
+
+    def test_same_as_pyomo(self):
+        """Test that CBC results read by name match those of a Pyomo solve"""
+        written = _cover().solve("cbc")
+        built = _cover().solve("highs")
+        assert written.status == built.status == "optimal"
+        assert written.objective.value == pytest.approx(built.objective.value)
+        assert written.variables["x"].values == pytest.approx(
+            built.variables["x"].values
+        )
+        assert written.constraints["cover"].body_value == pytest.approx(
+            built.constraints["cover"].body_value
+        )
+        assert written.constraints["cover"].slack == pytest.approx(
+            built.constraints["cover"].slack
+        )
+        assert written.constraints["limit"].slacks == pytest.approx(
+            built.constraints["limit"].slacks
+        )
+        assert written.solver_info.bound == written.objective.value
+
+    def test_not_built(self, monkeypatch):
+        """Test that solves of model data never build the Pyomo model"""
+
+        def build(*args, **kwargs):
+            raise AssertionError("Built the Pyomo model")
+
+        monkeypatch.setattr(Model, "from_data", build)
+        process = SolverProcess(_cover().to_data())
+        result = asyncio.run(process.run())
+        assert result.objective.value == pytest.approx(9)
+
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        response = TestClient(app_module.app).post(
+            "/api/model/solve", content=_cover().to_data().model_dump_json()
+        )
+        assert response.status_code == 200
+        assert response.json()["objective"]["value"] == pytest.approx(9)
+
+    def test_fragment_caches(self, monkeypatch):
+        """Test that solves of a structure by a tenant reuse their LP rows"""
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        monkeypatch.setattr(app_module, "fragment_caches", OrderedDict())
+        monkeypatch.setattr(app_module, "MAX_FRAGMENT_CACHES", 2)
+        client = TestClient(app_module.app)
+        data = _cover().to_data()
+        payload = data.model_dump_json()
+        for tenant in ["a", "a", "b"]:
+            response = client.post(
+                "/api/model/solve", content=payload, headers={"X-Tenant": tenant}
+            )
+            assert response.status_code == 200
+        key = fingerprint(data)
+        caches = app_module.fragment_caches
+        assert list(caches) == [(key, "a"), (key, "b")]
+        assert caches[key, "a"].hits == len(data.constraints) + 1
+        assert caches[key, "b"].hits == 0
+
+        app_module.fragment_cache("other", "a")
+        assert list(caches) == [(key, "b"), ("other", "a")]
+
+    def test_invalid_model(self, monkeypatch):
+        """Test that invalid models are rejected without being built"""
+        monkeypatch.setattr(app_module, "admission", AdmissionController())
+        data = _cover().to_data()
+        data.constraints[1].quantifiers = [Quantifier.create("i", "J")]
+        response = TestClient(app_module.app).post(
+            "/api/model/solve", content=data.model_dump_json()
+        )
+        assert response.status_code == 400
+        assert "J" in response.json()["detail"]
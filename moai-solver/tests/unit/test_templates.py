@@ -0,0 +1,322 @@
+"""Tests for model templates"""
+
+from collections import OrderedDict
+
+import pyomo.environ as pyo
+import pytest
+from fastapi.testclient import TestClient
+
+from moai import app as app_module
+from moai import validation
+from moai.app import app
+from moai.builders import binop, index_var, le, param, var
+from moai.constraints import Constraint, Quantifier
+from moai.expressions import AggregationExpression, IndexBinding
+from moai.model import Model
+from moai.objectives import Objective
+from moai.parameters import IndexElement, Parameter
+from moai.portfolio import Portfolio, SolverConfig
+from moai.sets import Set
+from moai.templates import Dataset, ModelTemplate, TemplateData
+from moai.variables import Variable
+
+
+def _transport() -> TemplateData:
+    """Structure of a transport model: ship from plants to markets"""
+    shipped = AggregationExpression.create(
+        "sum",
+        var("x", [index_var("p"), index_var("m")]),
+        [IndexBinding.create("m", "M")],
+    )
+    cost = AggregationExpression.create(
+        "sum",
+        binop(
+            param("cost", [index_var("p"), index_var("m")]),
+            var("x", [index_var("p"), index_var("m")]),
+            "mul",
+        ),
+        [IndexBinding.create("p", "P"), IndexBinding.create("m", "M")],
+    )
+    received = AggregationExpression.create(
+        "sum",
+        var("x", [index_var("p"), index_var("m")]),
+        [IndexBinding.create("p", "P")],
+    )
+    return TemplateData(
+        name="Transport",
+        variables=[Variable.create("x", indices=["P", "M"])],
+        constraints=[
+            Constraint.create(
+                "ship",
+                le(shipped, param("supply", [index_var("p")])),
+                [Quantifier.create("p", "P")],
+            ),
+            Constraint.create(
+                "receive",
+                le(param("demand", [index_var("m")]), received),
+                [Quantifier.create("m", "M")],
+            ),
+        ],
+        objective=Objective(name="total_cost", expr=cost),
+    )
+
+
+def _dataset(plants: list[str], markets: list[str]) -> Dataset:
+    return Dataset(
+        sets=[Set.create("P", plants), Set.create("M", markets)],
+        parameters=[
+            Parameter.create(
+                "cost",
+                [
+                    IndexElement(index=[p, m], value=float(1 + i + 2 * j))
+                    for i, p in enumerate(plants)
+                    for j, m in enumerate(markets)
+                ],
+                ["P", "M"],
+            ),
+            Parameter.create(
+                "supply", [IndexElement(index=[p], value=10.0) for p in plants], ["P"]
+            ),
+            Parameter.create(
+                "demand", [IndexElement(index=[m], value=5.0) for m in markets], ["M"]
+            ),
+        ],
+    )
+
+
+class TestModelTemplate:
+    """Tests for compiling templates and binding datasets"""
+
+    def test_bind_builds_the_model(self):
+        """Test that a bound template builds the model of its full data"""
+        template = ModelTemplate(_transport())
+        dataset = _dataset(["a", "b"], ["x", "y", "z"])
+        model = template.bind(dataset)
+        expected = Model.from_data(template.to_data(dataset))
+        for name in ("ship", "receive"):
+            rows = getattr(model.pyomo_model, name)
+            expected_rows = getattr(expected.pyomo_model, name)
+            assert [str(r.expr) for r in rows.values()] == [
+                str(r.expr) for r in expected_rows.values()
+            ]
+        assert str(model.pyomo_model.total_cost.expr) == str(
+            expected.pyomo_model.total_cost.expr
+        )
+
+    def test_bind_many_datasets(self):
+        """Test that one template is bound to datasets of different sizes"""
+        template = ModelTemplate(_transport())
+        small = template.bind(_dataset(["a"], ["x"]))
+        large = template.bind(_dataset(["a", "b", "c"], ["x", "y"]).model_dump_json())
+        assert len(small.pyomo_model.ship) == 1
+        assert len(large.pyomo_model.ship) == 3
+        assert pyo.value(large.component("ship")["a"].upper) == 10.0
+
+    def test_solve(self):
+        """Test that a bound template solves"""
+        template = ModelTemplate(_transport())
+        result = template.bind(_dataset(["a", "b"], ["x", "y"])).solve()
+        assert result.status == "optimal"
+        # Plant a is cheapest for both markets
+        assert result.objective.value == pytest.approx(5.0 * 1 + 5.0 * 3)
+
+    def test_solves_reuse_fragments(self):
+        """Test that solves of a template reuse the rows of earlier solves"""
+        template = ModelTemplate(_transport())
+        dataset = _dataset(["a", "b"], ["x", "y"])
+        first = template.bind(dataset).solve("cbc")
+        assert template.cache.hits == 0
+        second = template.bind(dataset).solve("cbc")
+        assert template.cache.hits == template.cache.misses
+        assert second.objective.value == pytest.approx(first.objective.value)
+
+    def test_requirements(self):
+        """Test that templates list the sets and parameters datasets define"""
+        template = ModelTemplate(_transport().model_dump_json())
+        assert template.sets == {"P", "M"}
+        assert template.parameters == {"cost", "supply", "demand"}
+
+    def test_missing_data(self):
+        """Test that datasets missing data are rejected before building"""
+        template = ModelTemplate(_transport())
+        dataset = _dataset(["a"], ["x"])
+        dataset.parameters = dataset.parameters[:1]
+        with pytest.raises(ValueError, match="parameter demand, parameter supply"):
+            template.bind(dataset)
+
+    def test_unknown_variable(self):
+        """Test that constraints on undeclared variables are rejected"""
+        data = _transport()
+        data.variables = []
+        with pytest.raises(ValueError, match="Variable x not found"):
+            ModelTemplate(data)
+
+    def test_set_dimension(self):
+        """Test that datasets whose sets do not fit the structure are rejected"""
+        template = ModelTemplate(_transport())
+        dataset = _dataset(["a"], ["x"])
+        dataset.sets[0] = Set.create("P", [["a", 1]])
+        with pytest.raises(ValueError, match="Set P has elements of dimension 2"):
+            template.bind(dataset)
+
+    def test_bind_checks_the_dataset(self, monkeypatch):
+        """Test that binding checks the dataset without walking the structure"""
+        template = ModelTemplate(_transport())
+
+        def walk(*args):
+            raise AssertionError("structure walked at bind")
+
+        monkeypatch.setattr(validation._Checker, "walk", walk)
+        model = template.bind(_dataset(["a", "b"], ["x"]))
+        assert len(model.pyomo_model.ship) == 2
+
+    def test_id(self):
+        """Test that equal structures have the same id"""
+        first = ModelTemplate(_transport())
+        assert ModelTemplate(_transport().model_dump()).id == first.id
+        other = _transport()
+        other.name = "Other"
+        assert ModelTemplate(other).id != first.id
+
+
+class TestTemplateEndpoints:
+    """Tests for registering and solving templates through the API"""
+
+    def test_register(self):
+        """Test that registering a structure returns its id and data names"""
+        client = TestClient(app)
+        response = client.post("/api/templates", content=_transport().model_dump_json())
+        assert response.status_code == 200
+        info = response.json()
+        assert info["id"] == ModelTemplate(_transport()).id
+        assert info["sets"] == ["M", "P"]
+        assert info["parameters"] == ["cost", "demand", "supply"]
+
+    def test_invalid_template(self):
+        """Test that structures referencing undeclared variables are a 400"""
+        client = TestClient(app)
+        data = _transport()
+        data.variables = []
+        response = client.post("/api/templates", content=data.model_dump_json())
+        assert response.status_code == 400
+
+    def test_unknown_template(self):
+        """Test that solving an unknown template is a 404"""
+        client = TestClient(app)
+        response = client.post("/api/templates/unknown/solve", content="{}")
+        assert response.status_code == 404
+
+    def test_invalid_dataset(self):
+        """Test that datasets missing data are a 400"""
+        client = TestClient(app)
+        info = client.post(
+            "/api/templates", content=_transport().model_dump_json()
+        ).json()
+        response = client.post(f"/api/templates/{info['id']}/solve", content="{}")
+        assert response.status_code == 400
+        assert "missing set M" in response.json()["detail"]
+
+    def test_solves_reuse_fragments(self, monkeypatch):
+        """Test that solves of a registered template by a tenant reuse the
+        rows of its earlier solves, in the bounded caches of the tenant"""
+        monkeypatch.setattr(app_module, "fragment_caches", OrderedDict())
+        client = TestClient(app)
+        info = client.post(
+            "/api/templates", content=_transport().model_dump_json()
+        ).json()
+        template = app_module.templates[info["id"]]
+        dataset = _dataset(["a", "b"], ["x", "y"]).model_dump_json()
+        for tenant in ["a", "a", "b"]:
+            response = client.post(
+                f"/api/templates/{info['id']}/solve",
+                content=dataset,
+                headers={"X-Tenant": tenant},
+            )
+            assert response.status_code == 200
+        caches = app_module.fragment_caches
+        assert list(caches) == [(template.id, "a"), (template.id, "b")]
+        assert caches[template.id, "a"].hits > 0
+        assert caches[template.id, "b"].hits == 0
+        assert all(
+            cache.max_bytes == app_module.FRAGMENT_CACHE_BYTES
+            for cache in caches.values()
+        )
+        assert template.cache.hits == template.cache.misses == 0
+
+        client.delete(f"/api/templates/{info['id']}")
+        assert not caches
+
+    def test_delete_keeps_model_fragments(self, monkeypatch):
+        """Test that deleting a template keeps the caches of the solves of
+        models of its structure"""
+        monkeypatch.setattr(app_module, "fragment_caches", OrderedDict())
+        client = TestClient(app)
+        info = client.post(
+            "/api/templates", content=_transport().model_dump_json()
+        ).json()
+        template = app_module.templates[info["id"]]
+        dataset = _dataset(["a", "b"], ["x", "y"])
+        for path, content in [
+            (f"/api/templates/{info['id']}/solve", dataset.model_dump_json()),
+            ("/api/model/solve", template.to_data(dataset).model_dump_json()),
+        ]:
+            assert client.post(path, content=content).status_code == 200
+        caches = app_module.fragment_caches
+        assert list(caches) == [
+            (template.id, "default"),
+            (template.fingerprint, "default"),
+        ]
+        client.delete(f"/api/templates/{info['id']}")
+        assert list(caches) == [(template.fingerprint, "default")]
+
+    def test_portfolio_solves_reuse_fragments(self, monkeypatch):
+        """Test that raced solves of a template use the caches of the tenant"""
+        monkeypatch.setattr(app_module, "fragment_caches", OrderedDict())
+        configs = [SolverConfig(solver_name="cbc")] * 2
+        monkeypatch.setattr(app_module, "portfolio", Portfolio(configs))
+        client = TestClient(app)
+        info = client.post(
+            "/api/templates", content=_transport().model_dump_json()
+        ).json()
+        template = app_module.templates[info["id"]]
+        dataset = _dataset(["a", "b"], ["x", "y"]).model_dump_json()
+        response = client.post(
+            f"/api/templates/{info['id']}/solve?solver=portfolio",
+            content=dataset,
+            headers={"X-Tenant": "a"},
+        )
+        assert response.status_code == 200
+        cache = app_module.fragment_caches[template.id, "a"]
+        assert cache.misses > 0
+        assert template.cache.hits == template.cache.misses == 0
+
+    def test_delete(self):
+        """Test that deleted templates are forgotten"""
+        client = TestClient(app)
+        info = client.post(
+            "/api/templates", content=_transport().model_dump_json()
+        ).json()
+        response = client.delete(f"/api/templates/{info['id']}")
+        assert response.status_code == 200
+        assert response.json()["id"] == info["id"]
+        assert info["id"] not in app_module.templates
+        assert client.delete(f"/api/templates/{info['id']}").status_code == 404
+
+    def test_least_recently_used(self, monkeypatch):
+        """Test that the least recently used templates are dropped"""
+        monkeypatch.setattr(app_module, "templates", OrderedDict())
+        monkeypatch.setattr(app_module, "MAX_TEMPLATES", 2)
+        client = TestClient(app)
+        ids = []
+        for name in ["a", "b"]:
+            data = _transport()
+            data.name = name
+            ids.append(client.post("/api/templates", content=data.model_dump_json()))
+        first, second = (response.json()["id"] for response in ids)
+        client.post(f"/api/templates/{first}/solve", content="{}")
+        data = _transport()
+        data.name = "c"
+        third = client.post("/api/templates", content=data.model_dump_json()).json()
+        assert list(app_module.templates) == [first, third["id"]]
+        response = client.post(f"/api/templates/{second}/solve", content="{}")
+        assert response.status_code == 404
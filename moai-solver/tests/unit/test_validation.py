@@ -0,0 +1,258 @@
+"""Tests for static checks of model data"""
+
+from fastapi.testclient import TestClient
+
+from moai.app import app
+from moai.builders import index_var, le, num, param, string, var
+from moai.constraints import Constraint, Quantifier
+from moai.expressions import AggregationExpression, IndexBinding
+from moai.model import ModelData
+from moai.parameters import IndexElement, Parameter
+from moai.sets import Set
+from moai.validation import StructureChecks, validate_model_data
+from moai.variables import Variable, VariableSupport
+
+from .cases import CASES, network_model
+
+
+def _messages(data: ModelData) -> list[str]:
+    return [f"{e.location}: {e.message}" for e in validate_model_data(data)]
+
+
+def _data(*constraints: Constraint, **components) -> ModelData:
+    data = network_model().to_data()
+    return data.model_copy(
+        update={"constraints": [*data.constraints, *constraints], **components}
+    )
+
+
+class TestValidModels:
+    """Valid models must pass"""
+
+    def test_constraint_families(self):
+        """Test that every constraint family of the differential tests is valid"""
+        data = _data(*CASES.values())
+        assert validate_model_data(data) == []
+
+
+class TestReferences:
+    """Tests for references to sets, parameters and variables"""
+
+    def test_unknown_names(self):
+        """Test that every unknown name is reported at once"""
+        constraint = Constraint.create(
+            "unknown",
+            le(
+                AggregationExpression.create(
+                    "sum", var("y", [index_var("i")]), [IndexBinding.create("i", "S")]
+                ),
+                param("cap"),
+            ),
+        )
+        assert _messages(_data(constraint)) == [
+            "constraint unknown: Set S not found in model",
+            "constraint unknown: Variable y not found in model",
+            "constraint unknown: Parameter cap not found in model",
+        ]
+
+    def test_arity(self):
+        """Test that references with the wrong number of indices are reported"""
+        constraint = Constraint.create(
+            "arity",
+            le(var("x", [index_var("p")]), param("d", [index_var("p"), num(1)])),
+            [Quantifier.create("p", "P")],
+        )
+        assert _messages(_data(constraint)) == [
+            "constraint arity: Variable x takes 2 indices, got 1",
+            "constraint arity: Parameter d takes 1 indices, got 2",
+        ]
+
+    def test_tuple_set_arity(self):
+        """Test that components of tuple set elements are separate indices"""
+        data = _data(
+            Constraint.create(
+                "arcs",
+                le(var("arc", [index_var("i"), index_var("j")]), num(1)),
+                [Quantifier.create(["i", "j"], "A")],
+            ),
+            variables=[
+                *network_model().variables,
+                Variable.create("arc", indices=["A"]),
+            ],
+        )
+        assert validate_model_data(data) == []
+
+    def test_unbound_index(self):
+        """Test that index variables outside their quantifiers are reported"""
+        constraint = Constraint.create(
+            "unbound",
+            le(var("s", [index_var("t")]), param("d", [index_var("u")])),
+            [Quantifier.create("t", "T")],
+        )
+        assert _messages(_data(constraint)) == [
+            "constraint unbound: Index variable u is not bound"
+        ]
+
+    def test_sum_scope(self):
+        """Test that index variables of a sum are not bound after it"""
+        constraint = Constraint.create(
+            "scope",
+            le(
+                AggregationExpression.create(
+                    "sum", var("s", [index_var("t")]), [IndexBinding.create("t", "T")]
+                ),
+                param("d", [index_var("t")]),
+            ),
+        )
+        assert _messages(_data(constraint)) == [
+            "constraint scope: Index variable t is not bound"
+        ]
+
+    def test_index_literals(self):
+        """Test that literals outside the set at their position are reported"""
+        constraint = Constraint.create(
+            "literals",
+            le(
+                var("x", [string("north"), string("west")]),
+                param("d", [num(9)]),
+            ),
+        )
+        assert _messages(_data(constraint)) == [
+            "constraint literals: Variable x has no index value 'west'",
+            "constraint literals: Parameter d has no index value 9",
+        ]
+
+    def test_binding_dimension(self):
+        """Test that binding the wrong number of index variables is reported"""
+        constraint = Constraint.create(
+            "dimension", le(var("z"), num(1)), [Quantifier.create("p", "A")]
+        )
+        assert _messages(_data(constraint)) == [
+            "constraint dimension: Set A has elements of dimension 2 "
+            "but binds 1 index variables ['p']"
+        ]
+
+
+class TestDeclarations:
+    """Tests for the declarations of components"""
+
+    def test_duplicate_names(self):
+        """Test that names shared by components are reported"""
+        data = _data(Constraint.create("d", le(var("z"), num(1))))
+        assert _messages(data) == [
+            "constraint d: Name d is already used by a parameter"
+        ]
+
+    def test_parameter_values(self):
+        """Test that parameter values outside their index sets are reported"""
+        data = _data(
+            parameters=[
+                Parameter.create(
+                    "bad",
+                    [
+                        IndexElement(index=["north"], value=1.0),
+                        IndexElement(index=["west"], value=1.0),
+                        IndexElement(index=["north", 1], value=1.0),
+                    ],
+                    ["P"],
+                ),
+                Parameter.create("missing", [IndexElement(index=[1], value=1)], ["X"]),
+            ]
+        )
+        assert [m for m in _messages(data) if m.startswith("parameter")] == [
+            "parameter bad: Index ['west'] is not in ['P']",
+            "parameter bad: Index ['north', 1] has 2 values, expected 1",
+            "parameter missing: Set X not found in model",
+        ]
+
+    def test_variable_support(self):
+        """Test that supports of the wrong dimension are reported"""
+        data = _data(
+            variables=[
+                Variable.create(
+                    "flow", indices=["P"], support=VariableSupport.of_set("A")
+                ),
+                Variable.create(
+                    "y", indices=["P"], support=VariableSupport.of_parameter("w")
+                ),
+            ]
+        )
+        messages = [m for m in _messages(data) if m.startswith("variable")]
+        assert messages == [
+            "variable flow: Support set A has elements of dimension 2, expected 1",
+            "variable y: Parameter w not found in model",
+        ]
+
+
+class TestStructureChecks:
+    """Tests for checking datasets against one walk of a structure"""
+
+    def _constraints(self) -> list[Constraint]:
+        return [
+            Constraint.create(
+                "arity",
+                le(var("x", [index_var("p")]), param("d", [index_var("p"), num(1)])),
+                [Quantifier.create("p", "P")],
+            ),
+            Constraint.create(
+                "literals",
+                le(var("x", [string("north"), string("west")]), param("d", [num(9)])),
+            ),
+            Constraint.create(
+                "dimension", le(var("z"), num(1)), [Quantifier.create("p", "A")]
+            ),
+            Constraint.create(
+                "unbound",
+                le(var("s", [index_var("t")]), param("cap", [index_var("u")])),
+                [Quantifier.create("t", "T")],
+            ),
+        ]
+
+    def test_same_issues(self):
+        """Test that checking the walked data reports what validation reports"""
+        data = _data(*self._constraints())
+        assert StructureChecks(data).check(data) == validate_model_data(data)
+
+    def test_other_datasets(self):
+        """Test that checks recorded on one dataset are replayed on another"""
+        data = _data(*self._constraints())
+        checks = StructureChecks(data.model_copy(update={"sets": [], "parameters": []}))
+        assert checks.check(data) == validate_model_data(data)
+        valid = _data(*CASES.values())
+        checks = StructureChecks(valid.model_copy(update={"sets": []}))
+        assert checks.check(valid) == []
+
+
+class TestValidateEndpoint:
+    """Tests for the validation endpoint"""
+
+    def test_report(self):
+        """Test that the endpoint reports every problem of a model"""
+        data = ModelData(
+            name="Invalid",
+            sets=[Set.create("I", ["a"])],
+            constraints=[
+                Constraint.create(
+                    "c",
+                    le(var("x", [index_var("i")]), num(1)),
+                    [Quantifier.create("i", "J")],
+                )
+            ],
+        )
+        response = TestClient(app).post(
+            "/api/model/validate", content=data.model_dump_json()
+        )
+        assert response.status_code == 200
+        report = response.json()
+        assert report["valid"] is False
+        assert [e["message"] for e in report["errors"]] == [
+            "Set J not found in model",
+            "Variable x not found in model",
+        ]
+
+    def test_valid(self):
+        """Test that valid models are reported as such"""
+        response = TestClient(app).post(
+            "/api/model/validate", content=network_model().to_data().model_dump_json()
+        )
+        assert response.json() == {"valid": True, "errors": []}
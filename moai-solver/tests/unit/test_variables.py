@@ -1,6 +1,9 @@
 """Tests for Variable model"""
 
-from moai.variables import Variable
+import pytest
+from pydantic import ValidationError
+
+from moai.variables import Variable, VariableSupport
 
 
 class TestVariable:
@@ -154,3 +157,41 @@ class TestVariable:
 
         v5 = Variable.create("x", domain="Integers")
         assert v5.domain == "Integers"
+
+
+class TestVariableSupport:
+    """Tests for sparse variable domains"""
+
+    def test_dense_by_default(self):
+        """Test that variables are dense unless a support is given"""
+        v = Variable.create("x", indices=["I", "J"])
+        assert v.support is None
+        assert not v.is_sparse
+        assert v.missing == "zero"
+
+    def test_support_of_parameter(self):
+        """Test declaring a variable on the support of a parameter"""
+        v = Variable.create(
+            "ship",
+            indices=["W", "C"],
+            support=VariableSupport.of_parameter("cost"),
+            missing="error",
+        )
+        assert v.is_sparse
+        assert v.support == VariableSupport(parameter="cost")
+        assert v.missing == "error"
+
+    def test_support_from_json(self):
+        """Test validating a sparse variable from JSON"""
+        v = Variable.model_validate_json(
+            '{"name": "ship", "indices": ["W", "C"], "domain": "Reals",'
+            ' "support": {"set": "Lanes"}}'
+        )
+        assert v.support == VariableSupport.of_set("Lanes")
+
+    def test_support_needs_exactly_one_source(self):
+        """Test that a support is either a set or a parameter"""
+        with pytest.raises(ValidationError):
+            VariableSupport()
+        with pytest.raises(ValidationError):
+            VariableSupport(set="Lanes", parameter="cost")
@@ -0,0 +1,440 @@
+"""Tests for streaming models to LP files"""
+
+import io
+import re
+import subprocess
+
+import pytest
+from pyomo.repn import generate_standard_repn
+
+from moai import writer
+from moai.builders import binop, index_var, le, num, param, var
+from moai.constraints import Constraint, Quantifier
+from moai.expressions import ComparisonExpression
+from moai.model import Model, ModelData
+from moai.objectives import Objective
+from moai.parameters import IndexElement, Parameter
+from moai.sets import Set
+from moai.variables import Variable, VariableSupport
+
+from .cases import CASES, network_model, sum_over
+
+LINEAR = [case for case in CASES if case != "non-linear"]
+
+
+def _rows(text: str) -> list[tuple[dict[str, float], str, float]]:
+    """Rows of an LP file, as coefficients by column, relation and rhs."""
+    body = text.split("s.t.\n")[1].split("bounds\n")[0]
+    rows = []
+    for block in body.strip().split("\n\n"):
+        lines = block.splitlines()[1:]
+        coefs = {}
+        for line in lines[:-1]:
+            coef, column = line.split()
+            coefs[column] = float(coef)
+        relation, rhs = lines[-1].split()
+        rows.append((coefs, relation, float(rhs)))
+    return rows
+
+
+def _pyomo_rows(model: Model, name: str, names: writer.LPNames) -> list:
+    """Rows of a Pyomo constraint, in the form of `_rows`."""
+    rows = []
+    for row in getattr(model.pyomo_model, name).values():
+        lhs, rhs = row.expr.args[0], row.expr.args[-1]
+        repn = generate_standard_repn(lhs - rhs)
+        coefs = {}
+        for v, coef in zip(repn.linear_vars, repn.linear_coefs, strict=True):
+            index = v.index() if isinstance(v.index(), tuple) else (v.index(),)
+            labels = model.codec.decode_index(index) if v.index() is not None else ()
+            column = names.column(v.parent_component().name, labels)
+            key = writer.LPNames.name(column)
+            coefs[key] = coefs.get(key, 0) + coef
+        coefs = {k: c for k, c in coefs.items() if c}
+        relation = "=" if row.equality else "<="
+        rows.append((coefs, relation, -repn.constant))
+    return rows
+
+
+def _normalized(rows: list) -> list:
+    """Rows written as `<=` or `=`, as Pyomo stores them."""
+    normalized = []
+    for coefs, relation, rhs in rows:
+        if relation == ">=":
+            coefs = {k: -c for k, c in coefs.items()}
+            relation, rhs = "<=", -rhs
+        normalized.append((coefs, relation, rhs))
+    return normalized
+
+
+def _write(model: Model) -> tuple[str, writer.LPNames]:
+    out = io.StringIO()
+    names = writer.write_lp(model.to_data(), out)
+    return out.getvalue(), names
+
+
+class TestWrittenRows:
+    """Written rows must be the rows of the Pyomo model"""
+
+    @pytest.mark.parametrize("case", LINEAR)
+    def test_rows_match_pyomo(self, case: str):
+        """Test every row of a constraint family against the built model"""
+        model = network_model().add_constraint(CASES[case])
+        text, names = _write(model)
+        name = CASES[case].name
+        written = _rows(text)
+        assert names.rows[name] == range(len(written))
+
+        expected = _pyomo_rows(model, name, names)
+        assert len(written) == len(expected) > 0
+        for (coefs, relation, rhs), (pyomo_coefs, pyomo_relation, pyomo_rhs) in zip(
+            _normalized(written), expected, strict=True
+        ):
+            # Pyomo orders >= rows the other way around
+            if relation == pyomo_relation == "<=" and coefs and pyomo_coefs:
+                if all(coefs[k] == -c for k, c in pyomo_coefs.items()):
+                    pyomo_coefs = {k: -c for k, c in pyomo_coefs.items()}
+                    pyomo_rhs = -pyomo_rhs
+            assert coefs == pytest.approx(pyomo_coefs)
+            assert relation == pyomo_relation
+            assert rhs == pytest.approx(pyomo_rhs)
+
+    def test_non_linear(self):
+        """Test that non-linear rows cannot be written"""
+        model = network_model().add_constraint(CASES["non-linear"])
+        with pytest.raises(ValueError, match="linear"):
+            _write(model)
+
+    @pytest.mark.parametrize("op", ["lt", "gt"])
+    def test_strict_inequality(self, op: str):
+        """Test that strict inequalities are rejected as Pyomo rejects them"""
+        constraint = Constraint.create(
+            "strict", ComparisonExpression.create(var("z"), num(1), op)
+        )
+        data = (
+            network_model().to_data().model_copy(update={"constraints": [constraint]})
+        )
+        with pytest.raises(ValueError, match="Constraint strict is a strict"):
+            writer.write_lp(data, io.StringIO())
+        with pytest.raises(ValueError, match="strict inequality"):
+            Model.from_data(data).build()
+
+    def test_constant_rows(self):
+        """Test that satisfied constant rows are skipped and others kept"""
+        model = network_model()
+        model.add_constraint(
+            Constraint.create(
+                "outside",
+                le(var("flow", [index_var("p"), index_var("p")]), num(1)),
+                [Quantifier.create("p", "P")],
+            )
+        )
+        model.add_constraint(
+            Constraint.create(
+                "infeasible",
+                le(var("flow", [index_var("p"), index_var("p")]), num(-1)),
+                [Quantifier.create("p", "P")],
+            )
+        )
+        text, names = _write(model)
+        assert len(names.rows["outside"]) == 0
+        assert len(names.rows["infeasible"]) == 3
+        assert "+0 ONE_VAR_CONSTANT\n<= -1" in text
+        assert "1 <= ONE_VAR_CONSTANT <= 1" in text
+
+
+class TestNames:
+    """Tests for the names of rows and columns"""
+
+    def test_columns_round_trip(self):
+        """Test that every column decodes to the index it was numbered from"""
+        _, names = _write(network_model())
+        for column in range(names.size):
+            variable, index = names.index(column)
+            assert names.column(variable, index) == column
+
+    def test_sparse_columns(self):
+        """Test that sparse variables only get columns on their support"""
+        _, names = _write(network_model())
+        assert len(names.columns("flow")) == 3
+        assert names.column("flow", ("north", "north")) is None
+        with pytest.raises(KeyError):
+            names.column("flow", ("north", "west"))
+
+    def test_large_sparse_round_trip(self):
+        """Test that columns of large sparse variables are found by index, and
+        that variables without columns are skipped"""
+        n = 20_000
+        data = ModelData(
+            name="Sparse",
+            sets=[
+                Set.create_range("I", 0, n),
+                Set.create("S", [[i, 2 * i % n] for i in range(n)]),
+                Set.create("E", []),
+            ],
+            variables=[
+                Variable.create(
+                    "empty", indices=["I"], support=VariableSupport.of_set("E")
+                ),
+                Variable.create(
+                    "y", indices=["I", "I"], support=VariableSupport.of_set("S")
+                ),
+            ],
+        )
+        names = writer.write_lp(data, io.StringIO())
+        assert names.size == n
+        for column in range(names.size):
+            variable, index = names.index(column)
+            assert variable == "y" and names.column(variable, index) == column
+        with pytest.raises(KeyError):
+            names.index(n)
+
+
+def _pick(weight: str):
+    return binop(param(weight, [index_var("i")]), var("pick", [index_var("i")]), "mul")
+
+
+class TestWriteLP:
+    """Tests for writing whole models"""
+
+    def _model(self) -> Model:
+        return (
+            Model(name="Knapsack")
+            .add_set(Set.create("I", ["a", "b", "c"]))
+            .add_parameter(
+                Parameter.create(
+                    "w",
+                    [
+                        IndexElement(index=[i], value=w)
+                        for i, w in zip("abc", [3, 4, 5], strict=True)
+                    ],
+                    ["I"],
+                )
+            )
+            .add_parameter(
+                Parameter.create(
+                    "v",
+                    [
+                        IndexElement(index=[i], value=v)
+                        for i, v in zip("abc", [4, 5, 7], strict=True)
+                    ],
+                    ["I"],
+                )
+            )
+            .add_variable(Variable.create("pick", indices=["I"], domain="Binary"))
+            .add_variable(Variable.create("extra", domain="NonNegativeIntegers", ub=2))
+            .add_constraint(
+                Constraint.create(
+                    "capacity",
+                    le(
+                        binop(sum_over(_pick("w"), [("i", "I")]), var("extra"), "add"),
+                        num(8),
+                    ),
+                )
+            )
+            .set_objective(
+                Objective(
+                    name="value",
+                    sense="max",
+                    expr=binop(
+                        binop(sum_over(_pick("v"), [("i", "I")]), var("extra"), "add"),
+                        num(1),
+                        "add",
+                    ),
+                )
+            )
+        )
+
+    def test_sections(self):
+        """Test the objective, bounds and integrality sections"""
+        text, names = _write(self._model())
+        assert text.startswith("\\* Problem: Knapsack *\\\n\nmax\nobj:\n")
+        assert "+1 ONE_VAR_CONSTANT\n" in text
+        extra = writer.LPNames.name(names.column("extra", ()))
+        assert f"   0 <= {extra} <= 2\n" in text
+        assert f"general\n  {extra}\n" in text
+        assert "binary\n  x0\n  x1\n  x2\n" in text
+        assert text.endswith("end\n")
+
+    def test_solves_like_the_model(self, tmp_path):
+        """Test that CBC finds the objective of the built model in the file"""
+        model = self._model()
+        path = tmp_path / "knapsack.lp"
+        solution = tmp_path / "knapsack.soln"
+        writer.write_lp(model.to_data(), path)
+        subprocess.run(
+            ["cbc", str(path), "-solve", "-solu", str(solution)],
+            capture_output=True,
+            check=True,
+        )
+        value = re.search(r"objective value (\S+)", solution.read_text())
+        assert float(value.group(1)) == pytest.approx(12)
+        assert model.solve().objective.value == pytest.approx(12)
+
+    def test_missing_set(self):
+        """Test that variables over missing sets are reported"""
+        data = ModelData(
+            name="Missing",
+            variables=[
+                Variable.create("x", indices=["I"], support=VariableSupport.of_set("I"))
+            ],
+        )
+        with pytest.raises(ValueError, match="Set I not found"):
+            writer.write_lp(data, io.StringIO())
+
+
+class TestParallelWrite:
+    """Tests for expanding constraints in worker processes"""
+
+    def _model(self) -> Model:
+        model = network_model()
+        for case in LINEAR:
+            model.add_constraint(CASES[case])
+        return model
+
+    def test_same_file_as_serial(self, monkeypatch):
+        """Test that shards are merged into the file written by one process"""
+        # Split every family into shards of one element of its first set
+        monkeypatch.setattr(writer, "SHARD_ROWS", 1)
+        data = self._model().to_data()
+        serial, parallel = io.StringIO(), io.StringIO()
+        serial_names = writer.write_lp(data, serial)
+        parallel_names = writer.write_lp(data, parallel, processes=2)
+        assert parallel.getvalue() == serial.getvalue()
+        assert parallel_names.rows == serial_names.rows
+
+    def test_shards(self, monkeypatch):
+        """Test that large families are split by ranges of their first set"""
+        monkeypatch.setattr(writer, "SHARD_ROWS", 2)
+        lp = writer.LPWriter(self._model().to_data(), io.StringIO())
+        parts = lp._parts(CASES["nested sum with condition"], processes=1)
+        assert parts == [(0, 1), (1, 2), (2, 3)]
+        # Constraints without quantifiers are a single shard
+        assert lp._parts(Constraint.create("c", le(var("z"), num(1))), 4) == [None]
+
+    def test_bounded_window(self, monkeypatch):
+        """Test that rows are written as shards complete, with only a few
+        shards expanded ahead"""
+        monkeypatch.setattr(writer, "SHARD_ROWS", 1)
+        n, processes = 40, 2
+        data = ModelData(
+            name="Window",
+            sets=[Set.create_range("T", 0, n)],
+            variables=[Variable.create("s", indices=["T"])],
+            constraints=[
+                Constraint.create(
+                    "cap",
+                    le(var("s", [index_var("t")]), num(1)),
+                    [Quantifier.create("t", "T")],
+                )
+            ],
+        )
+        out = io.StringIO()
+        written: list[int] = []
+
+        class Pool(writer.ProcessPoolExecutor):
+            def submit(self, *args, **kwargs):
+                written.append(out.getvalue().count("\nc"))
+                return super().submit(*args, **kwargs)
+
+        monkeypatch.setattr(writer, "ProcessPoolExecutor", Pool)
+        names = writer.write_lp(data, out, processes=processes)
+        assert len(names.rows["cap"]) == n
+        assert len(written) == n
+        window = processes * writer.SHARDS_PER_PROCESS
+        assert all(rows >= i - window for i, rows in enumerate(written))
+
+    def test_worker_errors(self):
+        """Test that errors raised in workers reach the caller"""
+        data = network_model().add_constraint(CASES["non-linear"]).to_data()
+        with pytest.raises(ValueError, match="linear"):
+            writer.write_lp(data, io.StringIO(), processes=2)
+
+
+class TestFragmentCache:
+    """Tests for reusing the rows of unchanged constraint families"""
+
+    def _data(self) -> ModelData:
+        model = network_model()
+        for case in LINEAR:
+            model.add_constraint(CASES[case])
+        return model.to_data()
+
+    def _write(self, data: ModelData, cache: writer.FragmentCache, **kwargs) -> str:
+        out = io.StringIO()
+        writer.write_lp(data, out, cache=cache, **kwargs)
+        return out.getvalue()
+
+    def test_rewrite_hits(self):
+        """Test that writing the same model again reuses every family"""
+        data, cache = self._data(), writer.FragmentCache()
+        first = self._write(data, cache)
+        assert (cache.hits, cache.misses) == (0, len(LINEAR))
+        assert self._write(data, cache) == first
+        assert cache.hits == len(LINEAR)
+
+    def test_edited_parameter(self):
+        """Test that only the families reading an edited parameter are expanded"""
+        data, cache = self._data(), writer.FragmentCache()
+        self._write(data, cache)
+        d = next(p for p in data.parameters if p.name == "d")
+        d.values[0].value = 100.0  # type: ignore[index]
+        edited = self._write(data, cache)
+        # The shift, index arithmetic and closed subexpression families read d
+        assert cache.misses == len(LINEAR) + 3
+        assert edited == self._write(data, writer.FragmentCache())
+
+    def test_moved_columns(self):
+        """Test that families are expanded again when their columns move"""
+        data, cache = self._data(), writer.FragmentCache()
+        self._write(data, cache)
+        # A variable declared first moves the columns of every other variable
+        data.variables.insert(0, Variable.create("w", indices=["P"]))
+        edited = self._write(data, cache)
+        assert cache.hits == 0
+        assert edited == self._write(data, writer.FragmentCache())
+
+    def test_parallel(self):
+        """Test that cached and expanded shards are merged in model order"""
+        data, cache = self._data(), writer.FragmentCache()
+        serial = self._write(data, writer.FragmentCache())
+        data_first = data.model_copy(update={"constraints": data.constraints[:3]})
+        self._write(data_first, cache)
+        assert self._write(data, cache, processes=2) == serial
+
+    def test_least_recently_used(self):
+        """Test that the least recently used families are dropped"""
+        row = ("+1 x0\n<= 1\n", ("p",), 1.0)
+        size = writer.fragment_bytes(([row], False))
+        cache = writer.FragmentCache(max_bytes=2 * size)
+        cache.put("a", ([row], False))
+        cache.put("b", ([row], False))
+        cache.get("a")
+        cache.put("c", ([row], False))
+        assert len(cache) == 2
+        assert cache.bytes == 2 * size
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_bytes(self):
+        """Test that families larger than the cache are not kept"""
+        data, cache = self._data(), writer.FragmentCache()
+        self._write(data, cache)
+        assert 0 < cache.bytes <= cache.max_bytes
+        small = writer.FragmentCache(max_bytes=cache.bytes // len(cache))
+        self._write(data, small)
+        assert 0 < len(small) < len(cache)
+        assert small.bytes <= small.max_bytes
+        small.put("a", (["x" * small.max_bytes], False))
+        assert small.get("a") is None
+
+    def test_objective(self):
+        """Test that the objective is reused while the values it reads are kept"""
+        data, cache = TestWriteLP()._model().to_data(), writer.FragmentCache()
+        self._write(data, cache)
+        w = next(p for p in data.parameters if p.name == "w")
+        w.values[0].value = 1.0  # type: ignore[index]
+        edited = self._write(data, cache)
+        # The objective reads v, the capacity constraint reads w
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert edited == self._write(data, writer.FragmentCache())